@@ -0,0 +1 @@
+"""Synthetic image generator and benchmarks for the diff pipeline"""
@@ -0,0 +1,116 @@
+"""Benchmark image acquisition against the fake Docker API
+
+Times DockerHandler.process_image (pull, create container, get_archive,
+extract) followed by build_tree for a synthetic image under several
+bandwidth / latency settings. ``--modes stream,tar`` compares extracting
+and indexing jars while the archive downloads with saving the tar first.
+
+    python -m benchmarks.bench_acquisition --entries 100k --bandwidth 0,100M,20M --latency 0,0.02
+"""
+import os
+import sys
+import json
+import itertools
+import time
+import shutil
+import platform
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.run_benchmarks import parse_size
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.diff_engine import DiffEngine
+from docker_jar_diff.docker_handler import DockerHandler
+from docker_jar_diff.metrics import Metrics
+
+# Phases recorded by DockerHandler.process_image
+ACQUISITION_PHASES = ('pull', 'create_container', 'get_archive', 'extract', 'archive_prefetch', 'build_tree')
+
+
+def acquire_once(base_url, cache_dir, image_name, compare_dir, stream=True):
+    """Run process_image and build_tree once, returns (seconds, metrics dict)"""
+    metrics = Metrics()
+    cache_manager = CacheManager(cache_dir)
+    handler = DockerHandler(cache_manager, {'docker': {'base_url': base_url, 'tls': False},
+                                            'acquire': {'stream': stream}},
+                            progress=lambda event, **info: None, metrics=metrics)
+    diff_engine = DiffEngine(cache_manager, metrics=metrics)
+    handler.archive_indexer = diff_engine.prefetch_archive
+    try:
+        start_time = time.perf_counter()
+        image_info = handler.process_image(image_name, compare_dir)
+        if image_info.get('error'):
+            raise RuntimeError(image_info['error'])
+        diff_engine.build_tree(image_info['extracted_dir'], compare_dir)
+        seconds = time.perf_counter() - start_time
+    finally:
+        handler.cleanup()
+        cache_manager.cleanup()
+    return seconds, metrics.to_dict()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark acquisition through the fake Docker API")
+    parser.add_argument('--entries', default='10k')
+    parser.add_argument('--compare-dir', default='/app')
+    parser.add_argument('--bandwidth', default='0', help="comma separated, 0 for unlimited (e.g. 0,100M,20M)")
+    parser.add_argument('--latency', default='0', help="comma separated seconds per request")
+    parser.add_argument('--modes', default='stream,tar', help="comma separated: stream, tar")
+    parser.add_argument('--output', default='acquisition_results.json')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="docker_jar_diff_acq_")
+    results = []
+    try:
+        pair = generate_pair(os.path.join(work_dir, "data"), entries=parse_size(args.entries), changed=0)
+        runs = itertools.product(args.bandwidth.split(','), args.latency.split(','), args.modes.split(','))
+        for bandwidth, latency, mode in runs:
+            engine = FakeDockerEngine(os.path.join(work_dir, "engine"), bandwidth=bandwidth,
+                                      latency=float(latency))
+            engine.add_image("synthetic:bench", pair['dir1'])
+            server, base_url = serve_in_thread(engine)
+            try:
+                seconds, metrics = acquire_once(base_url, os.path.join(work_dir, "cache"),
+                                                "synthetic:bench", args.compare_dir, stream=mode == 'stream')
+            finally:
+                server.shutdown()
+                server.server_close()
+            archive_bytes = metrics['phases']['get_archive']['bytes']
+            run = {
+                'mode': mode,
+                'bandwidth': engine.bandwidth,
+                'latency': float(latency),
+                'seconds': seconds,
+                'archive_bytes': archive_bytes,
+                'throughput_mb_s': archive_bytes / seconds / 1024 / 1024 if seconds else None,
+                'requests': len(engine.requests),
+                'phases': {name: metrics['phases'][name] for name in ACQUISITION_PHASES
+                           if name in metrics['phases']}
+            }
+            print(f"⏱️  {mode} bandwidth={bandwidth} latency={latency}: {seconds:.3f}s, "
+                  f"{run['throughput_mb_s']:.1f} MB/s, "
+                  + ', '.join(f"{name} {phase['seconds']:.3f}s" for name, phase in run['phases'].items()))
+            results.append(run)
+            shutil.rmtree(os.path.join(work_dir, "engine"), ignore_errors=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'entries': parse_size(args.entries),
+            'compare_dir': args.compare_dir,
+            'results': results
+        }, f, ensure_ascii=False, indent=2)
+    print(f"✅ Results saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+"""Local stand-in for the Docker Engine API
+
+Serves the endpoints DockerHandler uses from fixture images, so the
+pull -> create -> get_archive -> extract path can be tested and benchmarked
+without a Docker daemon. Images are added from a root filesystem directory
+or loaded from a ``docker save`` tarball. Bandwidth (bytes per second) and
+per-request latency are configurable; tar responses are streamed with
+chunked transfer encoding.
+
+    GET    /version, /_ping
+    GET    /images/<name>/json
+    GET    /images/<name>/get              docker save tarball
+    POST   /images/create?fromImage=&tag=  pull from the fake registry
+    POST   /containers/create
+    GET    /containers/<id>/json
+    GET    /containers/<id>/archive?path=  tar of a path in the image
+    DELETE /containers/<id>
+
+    python -m benchmarks.fake_docker --image app:1=/tmp/image1.tar --port 12375 --bandwidth 50M
+"""
+import os
+import re
+import json
+import time
+import uuid
+import base64
+import shutil
+import tarfile
+import logging
+import tempfile
+import threading
+import socketserver
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic import write_image_tar
+
+logger = logging.getLogger(__name__)
+
+API_VERSION = '1.41'
+
+
+def parse_bandwidth(value):
+    """Parse 50M / 512k / 1000000 into bytes per second, None for unlimited"""
+    if value in (None, '', 0, '0'):
+        return None
+    value = str(value).strip().lower()
+    multiplier = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}.get(value[-1:], 1)
+    return int(float(value.rstrip('kmg')) * multiplier)
+
+
+class FakeDockerEngine:
+    """Images, containers and network settings behind the fake API
+
+    Images added with ``local=False`` are only in the fake registry and
+    must be pulled before ``/images/<name>/json`` finds them.
+    """
+
+    def __init__(self, work_dir=None, bandwidth=None, latency=0.0, chunk_size=64 * 1024):
+        self._own_work_dir = work_dir is None
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="fake_docker_")
+        self.bandwidth = parse_bandwidth(bandwidth)
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.images = {}       # image id -> {'id', 'tags', 'rootfs', 'tar_path', 'local'}
+        self.containers = {}   # container id -> {'Id', 'Image', 'ImageID'}
+        self.requests = []     # (method, path) of every request, for assertions
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def add_image(self, name, rootfs_dir, local=True):
+        """Register a root filesystem directory as an image, returns the image ID"""
+        os.makedirs(os.path.join(self.work_dir, "images"), exist_ok=True)
+        tar_path = os.path.join(self.work_dir, "images", f"{uuid.uuid4().hex}.tar")
+        image_id = write_image_tar(rootfs_dir, tar_path, name)
+        self._register(image_id, [name], rootfs_dir, tar_path, local)
+        return image_id
+
+    def load_image_tar(self, tar_path, local=True, name=None):
+        """Load a docker save tarball, layers are applied into a root filesystem
+
+        Args:
+            name: Extra tag for the images, besides their RepoTags
+
+        Returns:
+            list: Image IDs
+        """
+        image_ids = []
+        with tarfile.open(tar_path, 'r') as tar:
+            manifest = json.load(tar.extractfile("manifest.json"))
+            for entry in manifest:
+                # <digest>.json (classic) or blobs/sha256/<digest> (OCI layout)
+                image_id = 'sha256:' + os.path.basename(entry['Config']).split('.')[0]
+                rootfs = os.path.join(self.work_dir, "rootfs", image_id.split(':')[1][:16])
+                os.makedirs(rootfs, exist_ok=True)
+                for layer_name in entry['Layers']:
+                    with tarfile.open(fileobj=tar.extractfile(layer_name), mode='r|*') as layer:
+                        self._apply_layer(layer, rootfs)
+                tags = (entry.get('RepoTags') or []) + ([name] if name else [])
+                self._register(image_id, tags, rootfs, tar_path, local)
+                image_ids.append(image_id)
+        return image_ids
+
+    @staticmethod
+    def _apply_layer(layer, rootfs):
+        for member in layer:
+            name = os.path.normpath(member.name.lstrip('/'))
+            if name.startswith('..'):
+                continue
+            directory, base = os.path.split(name)
+            # Whiteouts delete files from lower layers
+            if base == '.wh..wh..opq':
+                shutil.rmtree(os.path.join(rootfs, directory), ignore_errors=True)
+                os.makedirs(os.path.join(rootfs, directory), exist_ok=True)
+                continue
+            if base.startswith('.wh.'):
+                target = os.path.join(rootfs, directory, base[len('.wh.'):])
+                if os.path.isdir(target) and not os.path.islink(target):
+                    shutil.rmtree(target, ignore_errors=True)
+                elif os.path.lexists(target):
+                    os.remove(target)
+                continue
+            if member.isdev():
+                continue
+            if hasattr(tarfile, 'data_filter'):
+                layer.extract(member, rootfs, filter='tar')
+            else:
+                layer.extract(member, rootfs)
+
+    def _register(self, image_id, tags, rootfs, tar_path, local):
+        with self._lock:
+            # Like docker, a tag moves to the newest image that claims it
+            for image in self.images.values():
+                image['tags'] = [tag for tag in image['tags'] if tag not in tags]
+            self.images[image_id] = {'id': image_id, 'tags': list(tags), 'rootfs': rootfs,
+                                     'tar_path': tar_path, 'local': local}
+
+    def find_image(self, name, include_registry=False):
+        """Find an image by tag, ID or ID prefix"""
+        if ':' not in name.split('/')[-1] and not name.startswith('sha256:'):
+            name = f"{name}:latest"
+        with self._lock:
+            for image in self.images.values():
+                if not (image['local'] or include_registry):
+                    continue
+                if name in image['tags'] or image['id'] == name or image['id'] == f"sha256:{name}":
+                    return image
+                if len(name) >= 12 and image['id'].split(':')[1].startswith(name.replace('sha256:', '')):
+                    return image
+        return None
+
+    def throttle(self, sent, start_time):
+        """Sleep until `sent` bytes fit the bandwidth budget"""
+        if self.bandwidth:
+            delay = sent / self.bandwidth - (time.monotonic() - start_time)
+            if delay > 0:
+                time.sleep(delay)
+
+    def close(self):
+        if self._own_work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+class _ChunkedWriter:
+    """File-like object writing HTTP chunks at the engine bandwidth"""
+
+    def __init__(self, engine, wfile):
+        self.engine = engine
+        self.wfile = wfile
+        self.buffer = bytearray()
+        self.sent = 0
+        self.start_time = time.monotonic()
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.engine.chunk_size:
+            self._send(bytes(self.buffer[:self.engine.chunk_size]))
+            del self.buffer[:self.engine.chunk_size]
+        return len(data)
+
+    def _send(self, chunk):
+        self.engine.throttle(self.sent + len(chunk), self.start_time)
+        self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.sent += len(chunk)
+
+    def finish(self):
+        if self.buffer:
+            self._send(bytes(self.buffer))
+            self.buffer.clear()
+        self.wfile.write(b"0\r\n\r\n")
+        with self.engine._lock:
+            self.engine.bytes_sent += self.sent
+
+
+class _FakeDockerRequestHandler(BaseHTTPRequestHandler):
+    engine = None  # set by create_server
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        if isinstance(self.client_address, tuple) and self.client_address:
+            return str(self.client_address[0])
+        return 'unix'
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _route(self):
+        url = urlsplit(self.path)
+        path = re.sub(r'^/v[\d.]+', '', unquote(url.path))
+        with self.engine._lock:
+            self.engine.requests.append((self.command, path))
+        if self.engine.latency:
+            time.sleep(self.engine.latency)
+        return path, {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        return json.loads(body) if body else {}
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        if data is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {'message': message})
+
+    def _start_stream(self, content_type, headers=None):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        return _ChunkedWriter(self.engine, self.wfile)
+
+    def do_HEAD(self):
+        path, _ = self._route()
+        if path == '/_ping':
+            self._send_json(200, None)
+        else:
+            self._send_error(404, 'page not found')
+
+    def do_GET(self):
+        path, params = self._route()
+        if path == '/_ping':
+            body = b'OK'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif path == '/version':
+            self._send_json(200, {'ApiVersion': API_VERSION, 'MinAPIVersion': '1.12',
+                                  'Version': '20.10.0-fake', 'Os': 'linux', 'Arch': 'amd64'})
+        elif re.match(r'^/images/.+/json$', path):
+            image = self.engine.find_image(path[len('/images/'):-len('/json')])
+            if image is None:
+                self._send_error(404, f"No such image: {path[len('/images/'):-len('/json')]}")
+            else:
+                self._send_json(200, {'Id': image['id'], 'RepoTags': image['tags'],
+                                      'Os': 'linux', 'Architecture': 'amd64'})
+        elif re.match(r'^/images/.+/get$', path):
+            image = self.engine.find_image(path[len('/images/'):-len('/get')])
+            if image is None:
+                self._send_error(404, 'No such image')
+                return
+            writer = self._start_stream('application/x-tar')
+            with open(image['tar_path'], 'rb') as f:
+                for chunk in iter(lambda: f.read(self.engine.chunk_size), b''):
+                    writer.write(chunk)
+            writer.finish()
+        elif re.match(r'^/containers/[^/]+/json$', path):
+            container = self.engine.containers.get(path.split('/')[2])
+            if container is None:
+                self._send_error(404, 'No such container')
+            else:
+                self._send_json(200, container)
+        elif re.match(r'^/containers/[^/]+/archive$', path):
+            self._get_archive(path.split('/')[2], params.get('path', '/'))
+        else:
+            self._send_error(404, 'page not found')
+
+    def _get_archive(self, container_id, archive_path):
+        container = self.engine.containers.get(container_id)
+        if container is None:
+            self._send_error(404, f"No such container: {container_id}")
+            return
+        rootfs = self.engine.images[container['ImageID']]['rootfs']
+        relative = os.path.normpath(archive_path.strip('/')) if archive_path.strip('/') else ''
+        target = os.path.join(rootfs, relative) if relative else rootfs
+        if relative.startswith('..') or not os.path.lexists(target):
+            self._send_error(404, f"Could not find the file {archive_path} in container {container_id}")
+            return
+
+        stat = os.lstat(target)
+        path_stat = {'name': os.path.basename(relative) or '/', 'size': stat.st_size,
+                     'mode': stat.st_mode, 'mtime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(stat.st_mtime)),
+                     'linkTarget': ''}
+        writer = self._start_stream('application/x-tar', {
+            'X-Docker-Container-Path-Stat': base64.b64encode(json.dumps(path_stat).encode()).decode()
+        })
+        # Like the Docker daemon: the requested directory is the top level
+        # entry, except for / whose children are
+        with tarfile.open(fileobj=writer, mode='w|') as tar:
+            if relative:
+                tar.add(target, arcname=os.path.basename(relative))
+            else:
+                for name in sorted(os.listdir(rootfs)):
+                    tar.add(os.path.join(rootfs, name), arcname=name)
+        writer.finish()
+
+    def do_POST(self):
+        path, params = self._route()
+        if path == '/images/create':
+            name = params.get('fromImage', '')
+            tag = params.get('tag')
+            reference = f"{name}:{tag}" if tag and not tag.startswith('sha256:') else name
+            image = self.engine.find_image(reference, include_registry=True)
+            if image is None:
+                self._read_body()
+                self._send_error(404, f"pull access denied for {name}, repository does not exist or may "
+                                      f"require 'docker login': manifest for {reference} not found")
+                return
+            writer = self._start_stream('application/json')
+            writer.write(json.dumps({'status': f"Pulling from {name}", 'id': tag or 'latest'}).encode() + b"\r\n")
+            with open(image['tar_path'], 'rb') as f:
+                # A pull transfers the image, throttled like any download
+                for chunk in iter(lambda: f.read(self.engine.chunk_size), b''):
+                    writer.write(json.dumps({'status': 'Downloading', 'progressDetail': {
+                        'current': len(chunk)}}).encode() + b"\r\n")
+                    self.engine.throttle(len(chunk), time.monotonic())
+            writer.write(json.dumps({'status': f"Status: Downloaded newer image for {reference}"}).encode() + b"\r\n")
+            writer.finish()
+            image['local'] = True
+        elif path == '/containers/create':
+            body = self._read_body()
+            image = self.engine.find_image(body.get('Image', ''))
+            if image is None:
+                self._send_error(404, f"No such image: {body.get('Image')}")
+                return
+            container_id = uuid.uuid4().hex + uuid.uuid4().hex
+            with self.engine._lock:
+                self.engine.containers[container_id] = {
+                    'Id': container_id,
+                    'Name': params.get('name') or f"/fake_{container_id[:12]}",
+                    'Image': image['id'],
+                    'ImageID': image['id'],
+                    'Config': {'Image': body.get('Image')},
+                    'State': {'Status': 'created', 'Running': False}
+                }
+            self._send_json(201, {'Id': container_id, 'Warnings': []})
+        else:
+            self._read_body()
+            self._send_error(404, 'page not found')
+
+    def do_DELETE(self):
+        path, _ = self._route()
+        match = re.match(r'^/containers/([^/]+)$', path)
+        if match and match.group(1) in self.engine.containers:
+            with self.engine._lock:
+                del self.engine.containers[match.group(1)]
+            self._send_json(204, None)
+        else:
+            self._send_error(404, 'No such container')
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(engine, host='127.0.0.1', port=0, socket_path=None):
+    """Create the HTTP server for an engine, on a Unix socket if socket_path is given
+
+    Returns:
+        (server, base_url): base_url can be used as docker base_url
+    """
+    handler = type('FakeDockerRequestHandler', (_FakeDockerRequestHandler,), {'engine': engine})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return _UnixHTTPServer(socket_path, handler), f"unix://{socket_path}"
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, f"tcp://{host}:{server.server_address[1]}"
+
+
+def serve_in_thread(engine, host='127.0.0.1', port=0, socket_path=None):
+    """Start a server in a daemon thread, stop it with server.shutdown()"""
+    server, base_url = create_server(engine, host, port, socket_path)
+    threading.Thread(target=server.serve_forever, name="fake-docker", daemon=True).start()
+    return server, base_url
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve fixture images through a fake Docker Engine API")
+    parser.add_argument('--image', action='append', default=[],
+                        help="NAME=PATH, a docker save tarball or a root filesystem directory")
+    parser.add_argument('--registry-image', action='append', default=[],
+                        help="NAME=PATH, only available after a pull")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12375)
+    parser.add_argument('--socket', help="listen on a Unix socket instead")
+    parser.add_argument('--bandwidth', help="bytes per second for downloads, e.g. 50M")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    args = parser.parse_args(argv)
+
+    engine = FakeDockerEngine(bandwidth=args.bandwidth, latency=args.latency)
+    for spec, local in [(spec, True) for spec in args.image] + [(spec, False) for spec in args.registry_image]:
+        name, _, path = spec.partition('=')
+        if os.path.isdir(path):
+            engine.add_image(name, path, local=local)
+        else:
+            engine.load_image_tar(path, local=local, name=name)
+    server, base_url = create_server(engine, args.host, args.port, args.socket)
+    print(f"🐳 fake Docker API listening on {base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Benchmark the diff pipeline on synthetic trees
+
+For every size a pair of trees is generated, then the pipeline runs twice:
+once for wall time (per-phase times come from metrics.Metrics) and once
+under tracemalloc for peak memory, unless --no-memory is given.
+
+    python -m benchmarks.run_benchmarks --sizes 10k,100k --output bench.json
+    python -m benchmarks.run_benchmarks --sizes 10k --baseline bench.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from benchmarks.synthetic import DEFAULT_SPEC, generate_pair
+from docker_jar_diff.api import summarize_differences
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.diff_engine import DiffEngine
+from docker_jar_diff.html_generator import HTMLGenerator
+from docker_jar_diff.metrics import Metrics
+
+# Phases reported for every run, see Metrics
+REPORTED_PHASES = ('build_tree', 'archive_index', 'hash', 'sample_hash', 'find_differences', 'text_diff', 'report')
+
+
+def parse_size(value):
+    """Parse 10k / 1M / 2500 into an entry count"""
+    value = value.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(value[-1:], 1)
+    return int(float(value.rstrip('km')) * multiplier)
+
+
+def run_pipeline(dir1, dir2, cache_dir):
+    """Run diff_directories and generate_report once
+
+    Returns:
+        (float, dict): Total seconds and the metrics dict
+    """
+    metrics = Metrics()
+    cache_manager = CacheManager(cache_dir)
+    try:
+        start_time = time.perf_counter()
+        diff_result = DiffEngine(cache_manager, metrics=metrics).diff_directories(dir1, dir2)
+        HTMLGenerator(cache_manager, metrics=metrics).generate_report(diff_result)
+        total = time.perf_counter() - start_time
+        differences = summarize_differences(diff_result['differences'])
+    finally:
+        cache_manager.cleanup()
+    data = metrics.to_dict()
+    data['differences'] = differences
+    return total, data
+
+
+class PeakMemoryTracker:
+    """Peak traced memory per phase, plugs into Metrics.profiler
+
+    Nested phases are handled with tracemalloc.reset_peak() (Python 3.9+),
+    the peak seen by an inner phase is carried over to the outer one.
+    """
+
+    def __init__(self):
+        self.peaks = {}
+        self._stack = []
+
+    def enter(self, name):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            self._stack[-1][2] = max(self._stack[-1][2], peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self._stack.append([name, current, 0])
+        return name
+
+    def exit(self, token):
+        name, start, seen = self._stack.pop()
+        peak = max(seen, tracemalloc.get_traced_memory()[1])
+        self.peaks[name] = max(self.peaks.get(name, 0), peak - start)
+        if self._stack:
+            self._stack[-1][2] = max(self._stack[-1][2], peak)
+
+
+def measure_memory(dir1, dir2, cache_dir):
+    """Peak traced memory overall and per phase, measured in a separate run"""
+    tracker = PeakMemoryTracker()
+    metrics = Metrics()
+    metrics.profiler = tracker
+    cache_manager = CacheManager(cache_dir)
+    tracemalloc.start()
+    try:
+        diff_result = DiffEngine(cache_manager, metrics=metrics).diff_directories(dir1, dir2)
+        HTMLGenerator(cache_manager, metrics=metrics).generate_report(diff_result)
+        peak = max([tracemalloc.get_traced_memory()[1]] + list(tracker.peaks.values()))
+    finally:
+        tracemalloc.stop()
+        cache_manager.cleanup()
+    return {'peak_bytes': peak, 'phase_peak_bytes': tracker.peaks}
+
+
+def benchmark_size(entries, spec, work_dir, memory=True):
+    data_dir = os.path.join(work_dir, f"data_{entries}")
+    start_time = time.perf_counter()
+    pair = generate_pair(data_dir, spec, entries=entries)
+    generate_seconds = time.perf_counter() - start_time
+
+    cache_dir = os.path.join(work_dir, "cache")
+    total, metrics = run_pipeline(pair['dir1'], pair['dir2'], cache_dir)
+    result = {
+        'entries': entries,
+        'spec': pair['spec'],
+        'changes': pair['stats'],
+        'differences': metrics.pop('differences'),
+        'generate_seconds': generate_seconds,
+        'total_seconds': total,
+        'phases': {name: metrics['phases'][name] for name in REPORTED_PHASES if name in metrics['phases']},
+        'caches': metrics['caches']
+    }
+    if memory:
+        result['memory'] = measure_memory(pair['dir1'], pair['dir2'], cache_dir)
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return result
+
+
+def compare_with_baseline(results, baseline_path):
+    """Print the speedup of each phase against a previous results file"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {run['entries']: run for run in json.load(f)['results']}
+    for run in results:
+        old = baseline.get(run['entries'])
+        if not old:
+            continue
+        print(f"\n{run['entries']} entries vs {baseline_path}:")
+        rows = [('total', old['total_seconds'], run['total_seconds'])]
+        rows += [(name, old['phases'][name]['seconds'], phase['seconds'])
+                 for name, phase in run['phases'].items() if name in old.get('phases', {})]
+        for name, before, after in rows:
+            ratio = before / after if after else float('inf')
+            print(f"  {name:<18} {before:9.3f}s -> {after:9.3f}s  x{ratio:.2f}")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the docker-jar-diff pipeline")
+    parser.add_argument('--sizes', default='10k,100k,1M', help="comma separated entry counts (default: 10k,100k,1M)")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="previous results file to compare against")
+    parser.add_argument('--work-dir', help="where trees are generated (default: a temp dir)")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run")
+    for key in ('jar_share', 'members_per_jar', 'nesting', 'depth', 'changed', 'file_size', 'seed'):
+        value = DEFAULT_SPEC[key]
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args(argv)
+
+    spec = {key: getattr(args, key) for key in DEFAULT_SPEC if hasattr(args, key)}
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="docker_jar_diff_bench_")
+    results = []
+    try:
+        for size in args.sizes.split(','):
+            entries = parse_size(size)
+            print(f"⏱️  {entries} entries...")
+            run = benchmark_size(entries, spec, work_dir, memory=not args.no_memory)
+            print(f"   total {run['total_seconds']:.3f}s, "
+                  + ', '.join(f"{name} {phase['seconds']:.3f}s" for name, phase in run['phases'].items()))
+            results.append(run)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    print(f"✅ Results saved: {args.output}")
+
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
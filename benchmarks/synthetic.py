@@ -0,0 +1,231 @@
+"""Generate synthetic extracted image trees and ``docker save`` tarballs
+
+Two trees are written in one pass so that they differ in a controlled
+fraction of entries. An entry is a plain file or a jar member; changed
+entries are mostly modified, the rest are removed from or added to the
+second tree.
+
+    python -m benchmarks.synthetic /tmp/bench --entries 100000 --changed 0.01 --tarball
+"""
+import io
+import os
+import json
+import math
+import random
+import hashlib
+import tarfile
+import zipfile
+
+# Defaults for generate_pair(), every key can be overridden
+DEFAULT_SPEC = {
+    'entries': 10000,          # plain files + jar members (per tree)
+    'jar_share': 0.5,          # fraction of entries that live inside jars
+    'members_per_jar': 200,    # members per jar
+    'nesting': 0,              # jar-in-jar depth (BOOT-INF/lib/*.jar)
+    'depth': 4,                # directory depth of plain files
+    'files_per_dir': 50,       # plain files per leaf directory
+    'changed': 0.01,           # fraction of entries that differ
+    'file_size': 512,          # average plain file / member size in bytes
+    'text_share': 0.3,         # fraction of plain files written as .properties text
+    'seed': 42
+}
+
+# A fixed timestamp keeps jars and tarballs reproducible
+_ZIP_DATE = (2024, 1, 1, 0, 0, 0)
+_MTIME = 1704067200
+
+
+def resolve_spec(spec=None, **overrides):
+    """Merge a partial spec with DEFAULT_SPEC and derive file/jar counts"""
+    resolved = dict(DEFAULT_SPEC)
+    resolved.update(spec or {})
+    resolved.update(overrides)
+    entries = int(resolved['entries'])
+    members = max(1, int(resolved['members_per_jar']))
+    resolved['jars'] = int(entries * resolved['jar_share']) // members
+    resolved['files'] = entries - resolved['jars'] * members
+    return resolved
+
+
+class _PairWriter:
+    """Writes the same entry into both trees, mutated according to the spec"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.rng = random.Random(spec['seed'])
+        self.stats = {'entries': 0, 'modified': 0, 'only_in_1': 0, 'only_in_2': 0}
+
+    def content(self, index, text=False):
+        size = max(1, int(self.rng.expovariate(1.0 / self.spec['file_size'])))
+        if text:
+            line = f"key.{index}=value-{index}\n".encode()
+            return (line * (size // len(line) + 1))[:size]
+        seed = hashlib.md5(str(index).encode()).digest()
+        return (seed * (size // len(seed) + 1))[:size]
+
+    def variants(self, index, text=False):
+        """Return (content1, content2), None means the entry is missing"""
+        data = self.content(index, text)
+        self.stats['entries'] += 1
+        if self.rng.random() >= self.spec['changed']:
+            return data, data
+        roll = self.rng.random()
+        if roll < 0.8:
+            self.stats['modified'] += 1
+            if text:
+                return data, data + f"changed.{index}=true\n".encode()
+            return data, data[:-1] + bytes([(data[-1] + 1) % 256])
+        if roll < 0.9:
+            self.stats['only_in_1'] += 1
+            return data, None
+        self.stats['only_in_2'] += 1
+        return None, data
+
+
+def _leaf_dir(index, spec, fanout):
+    parts = []
+    leaf = index // max(1, spec['files_per_dir'])
+    for _ in range(spec['depth']):
+        parts.append(f"d{leaf % fanout}")
+        leaf //= fanout
+    return os.path.join(*parts) if parts else ''
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    os.utime(path, (_MTIME, _MTIME))
+
+
+def _build_jar(members, nesting, name):
+    """Return the bytes of a jar, optionally wrapping nested jars"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr(zipfile.ZipInfo("META-INF/MANIFEST.MF", _ZIP_DATE),
+                   f"Manifest-Version: 1.0\nImplementation-Title: {name}\n")
+        for member_name, data in members:
+            z.writestr(zipfile.ZipInfo(member_name, _ZIP_DATE), data)
+        if nesting > 0:
+            inner = _build_jar(members[:max(1, len(members) // 4)], nesting - 1, f"{name}-inner")
+            z.writestr(zipfile.ZipInfo(f"BOOT-INF/lib/{name}-inner.jar", _ZIP_DATE), inner)
+    return buffer.getvalue()
+
+
+def generate_pair(output_dir, spec=None, **overrides):
+    """Generate two extracted trees under output_dir/image1 and output_dir/image2
+
+    Returns:
+        dict: dir1, dir2, the resolved spec and change statistics
+    """
+    spec = resolve_spec(spec, **overrides)
+    dir1 = os.path.join(output_dir, "image1")
+    dir2 = os.path.join(output_dir, "image2")
+    writer = _PairWriter(spec)
+
+    # Plain files spread over a tree of the requested depth
+    leaves = max(1, math.ceil(spec['files'] / max(1, spec['files_per_dir'])))
+    fanout = max(2, math.ceil(leaves ** (1.0 / spec['depth']))) if spec['depth'] else 1
+    for index in range(spec['files']):
+        text = writer.rng.random() < spec['text_share']
+        name = f"file{index}.properties" if text else f"file{index}.bin"
+        relative = os.path.join("app", "data", _leaf_dir(index, spec, fanout), name)
+        for target_dir, data in zip((dir1, dir2), writer.variants(index, text)):
+            if data is not None:
+                _write(os.path.join(target_dir, relative), data)
+
+    # Jars, a jar is rewritten in the second tree if any member changed
+    entry = spec['files']
+    for jar_index in range(spec['jars']):
+        members1, members2 = [], []
+        for member_index in range(spec['members_per_jar']):
+            member_name = f"com/acme/p{member_index % 20}/C{member_index}.class"
+            data1, data2 = writer.variants(entry)
+            entry += 1
+            if data1 is not None:
+                members1.append((member_name, data1))
+            if data2 is not None:
+                members2.append((member_name, data2))
+        name = f"lib-{jar_index}"
+        jar1 = _build_jar(members1, spec['nesting'], name)
+        jar2 = jar1 if members1 == members2 else _build_jar(members2, spec['nesting'], name)
+        _write(os.path.join(dir1, "app", "lib", f"{name}.jar"), jar1)
+        _write(os.path.join(dir2, "app", "lib", f"{name}.jar"), jar2)
+
+    return {'dir1': dir1, 'dir2': dir2, 'spec': spec, 'stats': writer.stats}
+
+
+def write_archive_tar(source_dir, tar_path, arcname=None):
+    """Write a tar like the one returned by the Docker container archive API
+
+    The archive holds a single top level entry named after the requested
+    path, like ``GET /containers/<id>/archive?path=/app``.
+    """
+    with tarfile.open(tar_path, 'w') as tar:
+        tar.add(source_dir, arcname=arcname or os.path.basename(source_dir.rstrip(os.sep)) or '.')
+    return tar_path
+
+
+def write_image_tar(rootfs_dir, tar_path, repo_tag='synthetic:latest'):
+    """Write a single layer ``docker save`` style tarball for a root filesystem
+
+    Returns:
+        str: Image ID (sha256 of the config)
+    """
+    layer = io.BytesIO()
+    with tarfile.open(fileobj=layer, mode='w') as layer_tar:
+        for name in sorted(os.listdir(rootfs_dir)):
+            layer_tar.add(os.path.join(rootfs_dir, name), arcname=name)
+    layer_bytes = layer.getvalue()
+    diff_id = 'sha256:' + hashlib.sha256(layer_bytes).hexdigest()
+
+    config = json.dumps({
+        'architecture': 'amd64',
+        'os': 'linux',
+        'config': {'WorkingDir': '/app'},
+        'rootfs': {'type': 'layers', 'diff_ids': [diff_id]}
+    }, sort_keys=True).encode()
+    config_digest = hashlib.sha256(config).hexdigest()
+    layer_dir = diff_id.split(':')[1]
+    manifest = json.dumps([{
+        'Config': f"{config_digest}.json",
+        'RepoTags': [repo_tag],
+        'Layers': [f"{layer_dir}/layer.tar"]
+    }]).encode()
+    repo, _, tag = repo_tag.rpartition(':')
+    repositories = json.dumps({repo: {tag: layer_dir}}).encode()
+
+    with tarfile.open(tar_path, 'w') as tar:
+        for name, data in ((f"{config_digest}.json", config),
+                           (f"{layer_dir}/layer.tar", layer_bytes),
+                           ("manifest.json", manifest),
+                           ("repositories", repositories)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = _MTIME
+            tar.addfile(info, io.BytesIO(data))
+    return f"sha256:{config_digest}"
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a pair of synthetic extracted images")
+    parser.add_argument('output_dir')
+    for key, value in DEFAULT_SPEC.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument('--tarball', action='store_true', help="also write docker save style image1.tar/image2.tar")
+    args = parser.parse_args(argv)
+
+    spec = {key: getattr(args, key) for key in DEFAULT_SPEC}
+    pair = generate_pair(args.output_dir, spec)
+    if args.tarball:
+        for index, image_dir in enumerate((pair['dir1'], pair['dir2']), start=1):
+            image_id = write_image_tar(image_dir, os.path.join(args.output_dir, f"image{index}.tar"),
+                                       f"synthetic:{index}")
+            print(f"image{index}.tar {image_id}")
+    print(json.dumps({'spec': pair['spec'], 'stats': pair['stats']}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
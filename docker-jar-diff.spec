@@ -18,7 +18,9 @@ a = Analysis(
     # 静态资源映射：(源路径, 目标路径)
     datas=[
         ('.config/config.json', '.config'), 
-        ('docker_jar_diff/templates/report_template.html', 'docker_jar_diff/templates')
+        ('docker_jar_diff/templates/report_template.html', 'docker_jar_diff/templates'),
+        ('docker_jar_diff/templates/matrix_template.html', 'docker_jar_diff/templates'),
+        ('docker_jar_diff/templates/live_template.html', 'docker_jar_diff/templates')
     ],
     # 精简hiddenimports：只保留第三方模块，内置模块无需声明
     hiddenimports=[
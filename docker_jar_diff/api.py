@@ -0,0 +1,153 @@
+"""Library API for comparing Docker images without the CLI
+
+Example::
+
+    from docker_jar_diff.api import compare_images
+
+    result = compare_images('app:1.0', 'app:1.1', compare_dir='/app/lib')
+    print(result.summary)
+    for diff in result.iter_differences():
+        print(diff['type'], diff['path'])
+"""
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# progress(event, **info) - events: 'log', 'phase_start', 'phase_end', 'metadata_ready', 'images_ready',
+# 'live_report' and 'progress' (tasks, see progress.ProgressTracker)
+ProgressCallback = Callable[..., None]
+
+
+class DiffError(RuntimeError):
+    """Raised when an image can not be acquired or compared"""
+
+
+@dataclass
+class ImageDiffResult:
+    """Structured result of an image comparison"""
+    image1: str
+    image2: str
+    image1_id: Optional[str]
+    image2_id: Optional[str]
+    # Root of the difference paths, '/' when several directories are compared
+    compare_dir: str
+    task_dir: str
+    compare_dirs: List[str] = field(default_factory=list)
+    diff_json_path: Optional[str] = None
+    report_path: Optional[str] = None
+    # Wall time in seconds per phase: resolve_images, acquire_image1, acquire_image2, metadata_diff,
+    # diff, report
+    timings: Dict[str, float] = field(default_factory=dict)
+    # Number of differences per type, including differences inside archives and
+    # metadata differences (mode_diff, owner_diff, symlink_diff, ...)
+    summary: Dict[str, int] = field(default_factory=dict)
+    # Per-phase counters and cache hit rates, see metrics.Metrics
+    metrics: Dict[str, Any] = field(default_factory=dict, repr=False)
+    metrics_path: Optional[str] = None
+    # Directory with per-phase pstats and allocation reports when profiling
+    profile_dir: Optional[str] = None
+    # Format name -> file written by the --format writers
+    output_paths: Dict[str, str] = field(default_factory=dict)
+    # Differences written by the --format writers that match no expected pattern
+    unexpected_differences: Optional[int] = None
+    # True when diff.json and the report were served from the result cache
+    cached: bool = False
+    diff_result: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @property
+    def total_differences(self):
+        return sum(self.summary.values())
+    
+    @property
+    def metadata_differences(self) -> List[Dict[str, Any]]:
+        """Type, mode, owner and link target differences read from the tar headers"""
+        return self.diff_result.get('metadata_differences', [])
+
+    def iter_differences(self, include_archive_contents=True) -> Iterator[Dict[str, Any]]:
+        """Lazily iterate over differences, depth first
+
+        Differences found inside archives (``archive_diff``) are yielded right
+        after the archive entry they belong to.
+        """
+        stack = [iter(self.diff_result.get('differences', []))]
+        while stack:
+            diff = next(stack[-1], None)
+            if diff is None:
+                stack.pop()
+                continue
+            yield diff
+            if include_archive_contents and diff.get('archive_diff'):
+                stack.append(iter(diff['archive_diff']))
+
+
+@dataclass
+class BatchDiffResult:
+    """Result of comparing several images, see DockerJarDiff.compare_many"""
+    images: List[str]
+    # Image name -> image ID, images sharing an ID were acquired once
+    image_ids: Dict[str, Optional[str]]
+    task_dir: str
+    # One result per requested pair, in the requested order
+    pairs: List[ImageDiffResult] = field(default_factory=list)
+    matrix_json_path: Optional[str] = None
+    matrix_report_path: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    metrics: Dict[str, Any] = field(default_factory=dict, repr=False)
+    metrics_path: Optional[str] = None
+    matrix: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+
+def summarize_differences(differences):
+    """Count differences per type, descending into archive contents"""
+    summary = {}
+    stack = [differences]
+    while stack:
+        for diff in stack.pop():
+            summary[diff['type']] = summary.get(diff['type'], 0) + 1
+            if diff.get('archive_diff'):
+                stack.append(diff['archive_diff'])
+    return summary
+
+
+def summarize_result(diff_result):
+    """Count the differences of a diff result per type, metadata included
+
+    Differences a low memory run left out of the result (see
+    external_sort.read_spool) are counted too.
+    """
+    summary = summarize_differences(diff_result['differences'] + diff_result.get('metadata_differences', []))
+    for diff_type, count in diff_result.get('omitted_differences', {}).items():
+        summary[diff_type] = summary.get(diff_type, 0) + count
+    return summary
+
+
+def compare_images(image1, image2, compare_dir=None, cache_dir=None, config=None,
+                   progress: Optional[ProgressCallback] = None, write_report=True,
+                   use_cache=True, shards=None, metadata_only=False, live=False,
+                   formats=None, output_dir=None, expected=None, low_memory=None) -> ImageDiffResult:
+    """Compare two images and return a structured result
+
+    Nothing is printed, no external tool or browser is launched. Progress
+    messages go to ``progress`` if given. ``compare_dir`` can be a list of
+    directories, they are compared in a single run. With ``use_cache`` a
+    previous result for the same image IDs and options is returned as is.
+    ``shards`` splits the diff over that many worker processes, and
+    ``metadata_only`` compares only what the tar headers say, reading no file.
+    ``live`` writes html_report/live.html, which shows the differences while
+    they are found. ``formats`` streams the differences to JSONL, CSV or
+    JUnit XML files in ``output_dir`` (see writers), where differences
+    matching the ``expected`` patterns do not fail. ``low_memory`` diffs
+    through sorted on-disk indexes, for images with millions of entries.
+
+    Raises:
+        DiffError: If an image can not be processed
+    """
+    from .main import DockerJarDiff
+
+    diff_tool = DockerJarDiff(cache_dir, config=config)
+    try:
+        return diff_tool.compare(image1, image2, compare_dir, progress=progress,
+                                 write_report=write_report, use_cache=use_cache, shards=shards,
+                                 metadata_only=metadata_only, live=live, formats=formats,
+                                 output_dir=output_dir, expected=expected, low_memory=low_memory)
+    finally:
+        diff_tool.close()
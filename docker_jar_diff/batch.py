@@ -0,0 +1,140 @@
+"""Planning and matrix building for comparing several images in one run
+
+Each image is acquired and indexed once, every requested pair is then
+diffed from the shared trees (see DockerJarDiff.compare_many).
+"""
+import os
+import itertools
+
+from .utils import Utils
+
+# 批量比对参数，可通过配置文件的 "batch" 节点覆盖
+DEFAULT_BATCH_OPTIONS = {
+    'workers': 4    # 同时获取和索引的镜像数量
+}
+
+
+def read_pairs_file(pairs_path):
+    """Read image pairs, one 'IMAGE1 IMAGE2' per line, '#' starts a comment
+
+    Raises:
+        ValueError: A line does not have exactly two images
+    """
+    pairs = []
+    with open(pairs_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.replace(',', ' ').split()
+            if len(parts) != 2:
+                raise ValueError(f"{pairs_path}:{line_number}: 每行应为两个镜像名称: {line}")
+            pairs.append((parts[0], parts[1]))
+    return pairs
+
+
+def plan_pairs(images, pairs=None, all_pairs=False):
+    """Get the pairs to compare and the distinct images they need
+
+    Without explicit pairs the first image is the baseline compared with
+    every other image, or every image with every other with all_pairs.
+
+    Returns:
+        (list, list): Images in first-seen order, and (image1, image2) pairs
+    """
+    pairs = [tuple(pair) for pair in pairs or []]
+    if not pairs:
+        images = list(dict.fromkeys(images))
+        if all_pairs:
+            pairs = list(itertools.combinations(images, 2))
+        else:
+            pairs = [(images[0], image) for image in images[1:]]
+    if not pairs:
+        raise ValueError("至少需要两个镜像或一个镜像对")
+    ordered = list(dict.fromkeys(list(images) + [image for pair in pairs for image in pair]))
+    return ordered, list(dict.fromkeys(pairs))
+
+
+_DIRECTORY = {'is_dir': True, 'size': None}
+
+
+def flatten_tree(tree, base_path):
+    """Map every file and directory of a tree to its file info
+
+    Paths are built the same way as the difference paths of DiffEngine, an
+    archive member lives under the path of its archive. Directories, which
+    can differ as a whole (only_in_1/only_in_2), map to {'is_dir': True}.
+    """
+    files = {}
+    stack = [(tree, base_path)]
+    while stack:
+        current, current_path = stack.pop()
+        for key, item in current.items():
+            path = os.path.join(current_path, key).replace('\\', '/')
+            if not isinstance(item, dict):
+                continue
+            if item.get('is_archive'):
+                files[path] = item.get('file_info', item)
+                stack.append((item.get('contents', {}), path))
+            elif 'size' in item and not isinstance(item['size'], dict):
+                files[path] = item
+            else:
+                files[path] = _DIRECTORY
+                stack.append((item, path))
+    return files
+
+
+def _version_key(file_info, algorithm):
+    """Identity of a file version, hashing files whose digest is still unknown"""
+    if file_info.get('is_dir'):
+        return 'dir'
+    if not file_info.get('digest') and file_info.get('path') and os.path.isfile(file_info['path']):
+        file_info['digest'] = Utils.get_file_hash(file_info['path'], algorithm=algorithm)
+    return file_info.get('digest') or f"size:{file_info['size']}"
+
+
+def build_matrix(images, files_by_image, paths, algorithm='md5'):
+    """Build the N-column matrix of paths that differ somewhere
+
+    Args:
+        images: Column headers, dicts with 'name' and 'image_id'
+        files_by_image: One flatten_tree() result per column
+        paths: Paths that differ in at least one compared pair
+
+    Returns:
+        dict: Rows with one version label (A, B, ...) or None per column,
+        equal labels in a row mean identical contents
+    """
+    rows = []
+    for path in sorted(set(paths)):
+        cells = []
+        versions = {}
+        labels = {}
+        for files in files_by_image:
+            file_info = files.get(path)
+            if file_info is None:
+                cells.append(None)
+                continue
+            key = _version_key(file_info, algorithm)
+            label = labels.get(key)
+            if label is None:
+                label = labels[key] = _get_label(len(labels))
+                versions[label] = {'size': file_info['size'], 'digest': file_info.get('digest'),
+                                   'mtime': file_info.get('mtime')}
+            cells.append(label)
+        rows.append({'path': path, 'cells': cells, 'versions': versions})
+    return {
+        'images': images,
+        'digest_algorithm': algorithm,
+        'rows': rows
+    }
+
+
+def _get_label(index):
+    """A, B, ..., Z, AA, AB, ..."""
+    label = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        label = chr(ord('A') + remainder) + label
+    return label
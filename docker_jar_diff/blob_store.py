@@ -0,0 +1,239 @@
+import os
+import stat
+import logging
+import uuid
+import shutil
+import tarfile
+import threading
+
+from .hashing import HASHLIB_ALGORITHMS, new_hasher
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """Content-addressed store for extracted file bodies
+
+    Every regular file extracted from an image tar is written once to
+    ``<cache>/blobs/<xx>/<digest>-<mtime>-<mode>`` and hardlinked into the
+    extracted tree. The mtime and mode are part of the key because hardlinks
+    share them, so the report still shows each image's own timestamps.
+    """
+
+    def __init__(self, blob_dir, algorithm='md5'):
+        self.blob_dir = blob_dir
+        self.algorithm = algorithm
+        # Checksums (crc32, xxh*) only serve equality checks of the same path,
+        # blobs shared by every file are always addressed by a real digest
+        self.address_algorithm = algorithm if algorithm in HASHLIB_ALGORITHMS else 'blake2b'
+        self.tmp_dir = os.path.join(blob_dir, "tmp")
+        self._inode_digests = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def _get_blob_path(self, digest, mtime, mode):
+        return os.path.join(self.blob_dir, digest[:2], f"{digest}-{int(mtime)}-{mode:o}")
+
+    def store(self, fileobj, mtime, mode=0o644, target_path=None):
+        """Store a file body, hashing it while it is written
+
+        With target_path the blob is also linked there before the temporary
+        file is removed, so the blob never has a single link that prune()
+        in another process could take for unused.
+
+        Returns:
+            tuple: (blob_path, digest), the digest uses self.algorithm
+        """
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        hash_func = new_hasher(self.address_algorithm)
+        digest_func = new_hasher(self.algorithm) if self.algorithm != self.address_algorithm else None
+        with open(tmp_path, 'wb') as f:
+            for chunk in iter(lambda: fileobj.read(1024 * 1024), b''):
+                hash_func.update(chunk)
+                if digest_func:
+                    digest_func.update(chunk)
+                f.write(chunk)
+        address = hash_func.hexdigest()
+        digest = digest_func.hexdigest() if digest_func else address
+
+        blob_path = self._get_blob_path(address, mtime, mode)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            os.utime(tmp_path, (mtime, mtime))
+            # Keep blobs readable and removable whatever the original mode was
+            os.chmod(tmp_path, mode | 0o600)
+            while True:
+                try:
+                    # os.link never replaces an existing blob, so concurrent writers
+                    # of the same content all end up sharing the first inode
+                    os.link(tmp_path, blob_path)
+                except FileExistsError:
+                    pass
+                if target_path is None:
+                    break
+                try:
+                    self.link(blob_path, target_path)
+                    break
+                except FileNotFoundError:
+                    if os.path.exists(blob_path):
+                        raise
+                    # The existing blob was pruned before it was linked, store ours
+                    continue
+        finally:
+            os.remove(tmp_path)
+
+        stat = os.stat(blob_path) if target_path is None else os.stat(target_path)
+        with self._lock:
+            self._inode_digests[(stat.st_dev, stat.st_ino)] = digest
+        return blob_path, digest
+
+    def link(self, blob_path, target_path):
+        """Hardlink a blob into an extracted tree, copying if links are unsupported"""
+        if os.path.lexists(target_path):
+            os.remove(target_path)
+        try:
+            os.link(blob_path, target_path, follow_symlinks=False)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copy2(blob_path, target_path, follow_symlinks=False)
+
+    @staticmethod
+    def _link_member(link_source, member_path):
+        """Hard link entry of a tar, never followed through a symlink
+
+        A hard link to a symlink is the symlink itself like GNU tar makes it,
+        following it could copy a host file (a -> /etc/shadow) into the tree.
+        """
+        source_stat = os.lstat(link_source)
+        if os.path.lexists(member_path):
+            os.remove(member_path)
+        if stat.S_ISLNK(source_stat.st_mode):
+            os.symlink(os.readlink(link_source), member_path)
+            return
+        if not stat.S_ISREG(source_stat.st_mode):
+            return
+        try:
+            os.link(link_source, member_path, follow_symlinks=False)
+        except OSError:
+            shutil.copy2(link_source, member_path, follow_symlinks=False)
+
+    def lookup_digest(self, stat_result):
+        """Get the digest of a stored file from its stat result, if known"""
+        return self._inode_digests.get((stat_result.st_dev, stat_result.st_ino))
+
+    def record_digest(self, stat_result, digest):
+        """Remember the digest of a stored file, e.g. one extracted by another process"""
+        with self._lock:
+            self._inode_digests[(stat_result.st_dev, stat_result.st_ino)] = digest
+
+    def extract_tar(self, tar_path, target_dir, on_file=None, on_member=None):
+        """Extract a tar archive, storing regular files in the blob store
+
+        Returns:
+            int: Number of regular files extracted
+        """
+        with tarfile.open(tar_path, 'r:*') as tar:
+            return self._extract_members(tar, target_dir, on_file, on_member)
+
+    def extract_stream(self, fileobj, target_dir, on_file=None, on_member=None):
+        """Extract a tar stream while it is being read, without seeking
+
+        Args:
+            on_file: Called with the extracted path of every regular file as
+                soon as its last byte is stored
+            on_member: Called with the TarInfo of every member, including the
+                ones that are skipped
+
+        Returns:
+            int: Number of regular files extracted
+        """
+        with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+            return self._extract_members(tar, target_dir, on_file, on_member)
+
+    def _extract_members(self, tar, target_dir, on_file=None, on_member=None):
+        os.makedirs(target_dir, exist_ok=True)
+        target_root = os.path.realpath(target_dir)
+        file_count = 0
+        for member in tar:
+            if on_member:
+                on_member(member)
+            member_path = self._get_member_path(target_root, member.name)
+            if member_path is None:
+                logger.warning("跳过不安全的路径: %s", member.name)
+                continue
+
+            if member.isdir():
+                os.makedirs(member_path, exist_ok=True)
+                continue
+
+            os.makedirs(os.path.dirname(member_path), exist_ok=True)
+            if member.isreg():
+                fileobj = tar.extractfile(member)
+                self.store(fileobj, member.mtime, member.mode & 0o777, target_path=member_path)
+                file_count += 1
+                if on_file:
+                    on_file(member_path)
+            elif member.issym():
+                try:
+                    if os.path.lexists(member_path):
+                        os.remove(member_path)
+                    os.symlink(member.linkname, member_path)
+                except OSError as e:
+                    logger.warning("无法创建符号链接 %s: %s", member.name, e)
+            elif member.islnk():
+                link_source = self._get_member_path(target_root, member.linkname)
+                if link_source and os.path.lexists(link_source):
+                    try:
+                        self._link_member(link_source, member_path)
+                    except OSError as e:
+                        logger.warning("无法创建硬链接 %s: %s", member.name, e)
+            # Devices and FIFOs are not needed for diffing
+        return file_count
+
+    @staticmethod
+    def _get_member_path(target_root, name):
+        """Resolve a tar member name inside target_root, None if it escapes
+        
+        The parent directory is resolved with realpath so that a symlink
+        extracted earlier can not redirect writes outside the tree.
+        """
+        member_path = os.path.abspath(os.path.join(target_root, name.lstrip('/')))
+        if member_path == target_root:
+            return member_path
+        parent = os.path.realpath(os.path.dirname(member_path))
+        if parent != target_root and not parent.startswith(target_root + os.sep):
+            return None
+        return os.path.join(parent, os.path.basename(member_path))
+
+    def get_size(self):
+        """Get total size in bytes of stored blobs"""
+        total = 0
+        for root, dirs, files in os.walk(self.blob_dir):
+            for file in files:
+                try:
+                    total += os.lstat(os.path.join(root, file)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def prune(self):
+        """Remove blobs no longer linked into any extracted tree
+
+        Returns:
+            int: Number of bytes freed
+        """
+        freed = 0
+        for root, dirs, files in os.walk(self.blob_dir):
+            if root == self.tmp_dir:
+                continue
+            for file in files:
+                blob_path = os.path.join(root, file)
+                try:
+                    stat = os.lstat(blob_path)
+                    if stat.st_nlink == 1:
+                        os.remove(blob_path)
+                        freed += stat.st_size
+                except OSError:
+                    pass
+        return freed
@@ -1,37 +1,63 @@
 import os
+import logging
+import time
 import uuid
+import threading
 from datetime import datetime
 from .utils import Utils
+from .file_lock import FileLock
+from .blob_store import BlobStore
+from .result_cache import ResultCache
+from .checkpoint import Checkpoint
+from .hashing import validate_algorithm
+
+logger = logging.getLogger(__name__)
+
+# 缓存淘汰默认策略，可通过配置文件的 "cache" 节点覆盖
+DEFAULT_CACHE_OPTIONS = {
+    'max_age_days': 7,            # 超过该天数且未被占用的任务目录会被删除
+    'max_total_size_mb': 10240,   # 缓存总大小上限，超出时从最旧的空闲任务开始删除
+    'dedup': True,                # 解压文件存入内容寻址存储并以硬链接方式共享
+    'results': True               # 相同镜像 ID 和参数的比对直接复用已生成的 diff.json 和报告
+}
+
+# Seconds before a lock file without task directory counts as orphaned
+ORPHAN_LOCK_GRACE = 60
+
 
 class CacheManager:
-    def __init__(self, base_cache_dir=None):
+    def __init__(self, base_cache_dir=None, cache_options=None, hash_algorithm='md5', resume_task=None):
+        """
+        Args:
+            resume_task: Name or path of an existing task directory to continue
+                instead of creating a new one
+        
+        Raises:
+            ValueError: resume_task is not a task directory
+            RuntimeError: resume_task is in use by another process
+        """
         self.task_id = str(uuid.uuid4())[:8]
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.base_cache_dir = base_cache_dir or os.path.join(os.getcwd(), ".compare_cache")
-        
-        # 删除base_cache_dir下的所有旧任务目录，保留最新的几个
-        if os.path.exists(self.base_cache_dir):
-            # 列出所有任务目录
-            task_dirs = []
-            for item in os.listdir(self.base_cache_dir):
-                item_path = os.path.join(self.base_cache_dir, item)
-                if os.path.isdir(item_path) and item.startswith('task_'):
-                    task_dirs.append((os.path.getmtime(item_path), item_path))
-            
-            # 按修改时间排序，保留最新的1个任务目录
-            task_dirs.sort(reverse=True)
-            for i, (_, dir_path) in enumerate(task_dirs[1:]):
-                try:
-                    Utils.remove_dir(dir_path)
-                except Exception as e:
-                    # 如果删除失败，继续处理下一个目录
-                    print(f"清理旧缓存目录失败: {dir_path}, 错误: {e}")
+        self.cache_options = dict(DEFAULT_CACHE_OPTIONS)
+        if cache_options:
+            self.cache_options.update(cache_options)
+        # Digest algorithm of every cached digest in this workspace
+        self.hash_algorithm = validate_algorithm(hash_algorithm)
+        self._cleanup_thread = None
         
         # Create task-specific cache directory
-        self.task_cache_dir = os.path.join(
-            self.base_cache_dir, 
-            f"task_{self.timestamp}_{self.task_id}"
-        )
+        task_name = f"task_{self.timestamp}_{self.task_id}"
+        if resume_task:
+            task_name = self._get_resume_task_name(resume_task)
+            self.timestamp, self.task_id = task_name[len("task_"):].rsplit('_', 1)
+        self.task_cache_dir = os.path.join(self.base_cache_dir, task_name)
+        
+        # Lock the task before its directory exists so eviction in other
+        # processes never sees it unlocked
+        self.task_lock = FileLock(self._get_lock_path(task_name))
+        if not self.task_lock.acquire(blocking=not resume_task):
+            raise RuntimeError(f"任务目录正在被其他进程使用: {self.task_cache_dir}")
         
         # Subdirectories
         self.images_dir = os.path.join(self.task_cache_dir, "images")
@@ -39,9 +65,34 @@ class CacheManager:
         self.content_dir = os.path.join(self.task_cache_dir, "content")
         self.diff_dir = os.path.join(self.task_cache_dir, "diff")
         self.html_report_dir = os.path.join(self.task_cache_dir, "html_report")
+        self.checkpoint_dir = os.path.join(self.task_cache_dir, "checkpoint")
         
         # Create all directories
         self._create_directories()
+        
+        # Shared content-addressed store for extracted file bodies, one per
+        # algorithm so digests are never mixed
+        self.blob_store = None
+        if self.cache_options['dedup']:
+            blob_dir = "blobs" if self.hash_algorithm == 'md5' else f"blobs_{self.hash_algorithm}"
+            self.blob_store = BlobStore(os.path.join(self.base_cache_dir, blob_dir), self.hash_algorithm)
+        
+        # Finished comparisons keyed by image IDs and options
+        self.result_cache = None
+        if self.cache_options['results']:
+            self.result_cache = ResultCache(os.path.join(self.base_cache_dir, "results"))
+    
+    def _get_resume_task_name(self, resume_task):
+        """Name of the task to resume, given as a name or a path in the cache directory"""
+        task_name = os.path.basename(os.path.normpath(resume_task))
+        task_dir = os.path.join(self.base_cache_dir, task_name)
+        if not task_name.startswith('task_') or '_' not in task_name[len("task_"):] or not os.path.isdir(task_dir):
+            raise ValueError(f"缓存目录中没有该任务: {resume_task}（缓存目录: {self.base_cache_dir}）")
+        return task_name
+    
+    def _get_lock_path(self, task_name):
+        """Get lock file path of a task, kept next to the task directory"""
+        return os.path.join(self.base_cache_dir, f"{task_name}.lock")
     
     def _create_directories(self):
         """Create all necessary directories"""
@@ -88,6 +139,110 @@ class CacheManager:
     def cleanup(self):
         """Cleanup cache directory"""
         Utils.remove_dir(self.task_cache_dir)
+        self.task_lock.release(remove=True)
+    
+    def release(self):
+        """Release the task lock so the task directory becomes evictable"""
+        self.task_lock.release()
+    
+    def start_background_cleanup(self):
+        """Evict stale task directories in a background thread"""
+        if self._cleanup_thread is not None:
+            return self._cleanup_thread
+        self._cleanup_thread = threading.Thread(
+            target=self._background_cleanup,
+            name="cache-eviction",
+            daemon=True
+        )
+        self._cleanup_thread.start()
+        return self._cleanup_thread
+    
+    def _background_cleanup(self):
+        try:
+            self.evict_stale_tasks()
+        except Exception as e:
+            logger.warning("清理旧缓存目录失败: %s", e)
+    
+    def evict_stale_tasks(self):
+        """Delete idle task directories by age and total cache size
+        
+        A task is idle when its lock can be acquired, live tasks of other
+        processes are never touched. Interrupted tasks that can still be
+        resumed are only removed by age.
+        
+        Returns:
+            list: Removed task directories
+        """
+        now = time.time()
+        max_age = self.cache_options['max_age_days'] * 86400
+        max_total_size = self.cache_options['max_total_size_mb'] * 1024 * 1024
+        
+        idle_tasks = []
+        total_size = 0
+        for item in os.listdir(self.base_cache_dir):
+            item_path = os.path.join(self.base_cache_dir, item)
+            if item.startswith('task_') and item.endswith('.lock'):
+                self._remove_orphan_lock(item_path, now)
+                continue
+            if not item.startswith('task_') or not os.path.isdir(item_path):
+                continue
+            # Hardlinked blobs are counted once, as part of the blob store
+            size = Utils.get_dir_size(item_path, skip_hardlinks=True)
+            total_size += size
+            if item_path == self.task_cache_dir:
+                continue
+            lock = FileLock(self._get_lock_path(item))
+            if not lock.acquire(blocking=False):
+                continue
+            idle_tasks.append((os.path.getmtime(item_path), size, item_path, lock,
+                               Checkpoint.is_unfinished(item_path)))
+        
+        if self.blob_store:
+            total_size += self.blob_store.get_size()
+        
+        # Cached results are small, they only expire by age
+        if self.result_cache:
+            self.result_cache.evict(max_age)
+            total_size += self.result_cache.get_size()
+        
+        # Oldest first: expired tasks go first, then enough to fit the size limit
+        idle_tasks.sort(key=lambda task: task[0])
+        removed = []
+        for mtime, size, task_dir, lock, unfinished in idle_tasks:
+            if now - mtime > max_age or (total_size > max_total_size and not unfinished):
+                try:
+                    Utils.remove_dir(task_dir)
+                    total_size -= size
+                    removed.append(task_dir)
+                    lock.release(remove=True)
+                    continue
+                except Exception as e:
+                    # 如果删除失败，继续处理下一个目录
+                    logger.warning("清理旧缓存目录失败: %s, 错误: %s", task_dir, e)
+            lock.release()
+        
+        # Drop blobs whose last extracted copy has just been removed
+        if removed and self.blob_store:
+            self.blob_store.prune()
+        
+        return removed
+    
+    def _remove_orphan_lock(self, lock_path, now):
+        """Delete the lock file of a task directory that no longer exists
+        
+        A new task locks before it creates its directory, so recent lock
+        files and locks held by another process are kept.
+        """
+        if os.path.isdir(lock_path[:-len('.lock')]):
+            return
+        try:
+            if now - os.path.getmtime(lock_path) < ORPHAN_LOCK_GRACE:
+                return
+        except OSError:
+            return
+        lock = FileLock(lock_path)
+        if lock.acquire(blocking=False):
+            lock.release(remove=True)
     
     def get_report_path(self):
         """Get path to the main HTML report"""
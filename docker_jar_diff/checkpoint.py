@@ -0,0 +1,218 @@
+"""Checkpoints of a comparison in its task directory, see --resume
+
+Every unit of work is recorded as soon as it is finished: acquired images
+and their directories (with the digests the blob store recorded while
+extracting them), archive indexes, and the differences of each path unit
+(see sharding.diff_by_units). A resumed run skips all of it and goes on
+with the first unfinished unit. Units are diffed in sorted order, so the
+result is the same as an uninterrupted diff.
+"""
+import os
+import json
+import threading
+
+# 检查点参数，可通过配置文件的 "checkpoint" 节点覆盖
+DEFAULT_CHECKPOINT_OPTIONS = {
+    'enabled': False,  # 记录比对进度，中断后可用 --resume 继续；每个单元一次 fsync、每个 jar 索引写一次 JSON
+    'units': 64        # 差异比对至少拆分的单元数，每完成一个单元保存一次
+}
+
+CHECKPOINT_VERSION = 1
+
+
+class Checkpoint:
+    """Progress of the comparison in one task directory"""
+
+    STATE_FILE = "state.json"
+    UNITS_FILE = "units.jsonl"
+    ARCHIVE_DIR = "archives"
+    DIGEST_DIR = "digests"
+
+    def __init__(self, checkpoint_dir):
+        self.checkpoint_dir = checkpoint_dir
+        self.state_path = os.path.join(checkpoint_dir, self.STATE_FILE)
+        self.units_path = os.path.join(checkpoint_dir, self.UNITS_FILE)
+        self.archive_dir = os.path.join(checkpoint_dir, self.ARCHIVE_DIR)
+        self.digest_dir = os.path.join(checkpoint_dir, self.DIGEST_DIR)
+        self._lock = threading.Lock()
+        self.state = self._read_state(self.state_path)
+
+    @classmethod
+    def is_unfinished(cls, task_dir):
+        """Whether a task directory holds an interrupted comparison"""
+        state = cls._read_state(os.path.join(task_dir, "checkpoint", cls.STATE_FILE))
+        return state is not None and not state.get('complete')
+
+    @staticmethod
+    def _read_state(state_path):
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return state if state.get('version') == CHECKPOINT_VERSION else None
+
+    def _write_json(self, data, file_path):
+        """Write a JSON file atomically, a crash leaves the previous version"""
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+
+    def _save_state(self):
+        self._write_json(self.state, self.state_path)
+
+    def get_inputs(self):
+        """Images, image IDs, directories and options of the checkpointed comparison"""
+        return self.state['inputs'] if self.state else None
+
+    def begin(self, inputs):
+        """Continue the checkpoint if it is for the same inputs, start over otherwise
+
+        Returns:
+            bool: True when earlier progress is resumed
+        """
+        with self._lock:
+            if self.state is not None and self.state['inputs'] == inputs and not self.state.get('complete'):
+                return True
+            # Archive indexes are keyed by content and stay valid
+            self.state = {'version': CHECKPOINT_VERSION, 'inputs': inputs, 'images': {},
+                          'directories': {}, 'units': None, 'complete': False}
+            if os.path.exists(self.units_path):
+                os.remove(self.units_path)
+            self._save_state()
+            return False
+
+    def get_image(self, index):
+        """Result of process_image for an image that was fully acquired"""
+        return self.state['images'].get(str(index))
+
+    def complete_image(self, index, image_info):
+        with self._lock:
+            self.state['images'][str(index)] = image_info
+            self._save_state()
+
+    def get_directories(self, index):
+        """Directories of an image that were already fetched and extracted"""
+        return set(self.state['directories'].get(str(index), []))
+
+    def complete_directory(self, index, directory):
+        # Directories of one image are fetched in parallel
+        with self._lock:
+            directories = self.state['directories'].setdefault(str(index), [])
+            if directory not in directories:
+                directories.append(directory)
+            self._save_state()
+
+    def _get_digests_path(self, index, directory):
+        name = directory.strip('/').replace('/', '_') or "root"
+        return os.path.join(self.digest_dir, f"{index}_{name}.json")
+
+    def save_digests(self, index, directory, extracted_dir, blob_store):
+        """Save the digests of an extracted directory known to the blob store
+
+        They only live in memory, without them a resumed run hashes every file
+        of the directory again.
+        """
+        if blob_store is None:
+            return
+        base_dir = os.path.join(extracted_dir, directory.strip('/'))
+        digests = {}
+        for root, dirs, names in os.walk(base_dir):
+            for name in names:
+                file_path = os.path.join(root, name)
+                try:
+                    digest = blob_store.lookup_digest(os.stat(file_path))
+                except OSError:
+                    continue
+                if digest:
+                    digests[os.path.relpath(file_path, extracted_dir)] = digest
+        self._write_json(digests, self._get_digests_path(index, directory))
+
+    def restore_digests(self, index, extracted_dir, blob_store):
+        """Give the blob store the digests of the directories already extracted
+
+        Returns:
+            int: Number of digests restored
+        """
+        if blob_store is None:
+            return 0
+        count = 0
+        for directory in self.get_directories(index):
+            try:
+                with open(self._get_digests_path(index, directory), 'r', encoding='utf-8') as f:
+                    digests = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for rel_path, digest in digests.items():
+                try:
+                    blob_store.record_digest(os.stat(os.path.join(extracted_dir, rel_path)), digest)
+                except OSError:
+                    continue
+                count += 1
+        return count
+
+    def get_units(self):
+        units = self.state['units']
+        return [tuple(unit) for unit in units] if units is not None else None
+
+    def set_units(self, units):
+        with self._lock:
+            self.state['units'] = [list(unit) for unit in units]
+            self._save_state()
+
+    def load_unit_results(self):
+        """Differences and compare stats of every finished unit
+
+        A line cut short by a crash is dropped, its unit runs again.
+        """
+        results = {}
+        if not os.path.exists(self.units_path):
+            return results
+        valid_size = 0
+        with open(self.units_path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                results[tuple(record['unit'])] = (record['differences'], record['compare_stats'])
+                valid_size += len(line)
+        # New records must not be appended to a partial line
+        if valid_size < os.path.getsize(self.units_path):
+            with open(self.units_path, 'r+b') as f:
+                f.truncate(valid_size)
+        return results
+
+    def complete_unit(self, unit, differences, compare_stats):
+        record = json.dumps({'unit': list(unit), 'differences': differences, 'compare_stats': compare_stats},
+                            ensure_ascii=False)
+        with self._lock, open(self.units_path, 'a', encoding='utf-8') as f:
+            f.write(record + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _get_archive_path(self, cache_key):
+        algorithm, digest, size = cache_key
+        return os.path.join(self.archive_dir, f"{algorithm}_{digest}_{size}.json")
+
+    def load_archive(self, cache_key):
+        """Archive index saved by save_archive, None if there is none"""
+        try:
+            with open(self._get_archive_path(cache_key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_archive(self, cache_key, tree):
+        self._write_json(tree, self._get_archive_path(cache_key))
+
+    def finish(self):
+        """Mark the comparison as complete, the task is then evicted like any other"""
+        with self._lock:
+            self.state['complete'] = True
+            self._save_state()
+
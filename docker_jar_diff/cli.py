@@ -1,12 +1,64 @@
+import logging
 import click
-from docker_jar_diff.main import DockerJarDiff
 
-@click.command()
-@click.argument('image1')
-@click.argument('image2')
-@click.option('--compare-dir', '-d', help='指定镜像内要比较的目录')
+
+def setup_logging(log_file=None):
+    """Configure logging for the CLI, DEBUG to a file when --log-file is given"""
+    if log_file:
+        logging.basicConfig(
+            filename=log_file,
+            level=logging.DEBUG,
+            format='%(asctime)s - %(levelname)s - %(message)s'
+        )
+    else:
+        logging.basicConfig(
+            level=logging.WARNING,
+            format='%(levelname)s - %(message)s'
+        )
+
+
+class DefaultCommandGroup(click.Group):
+    """Command group that runs 'diff' when the first argument is not a sub-command
+    
+    Keeps `docker-jar-diff IMAGE1 IMAGE2` working next to the sub-commands.
+    """
+    default_command = 'diff'
+    
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and args[0] not in ctx.help_option_names:
+            args.insert(0, self.default_command)
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultCommandGroup)
+def docker_jar_diff():
+    """Docker镜像差异比较工具，不指定子命令时执行 diff."""
+
+
+@docker_jar_diff.command('diff')
+@click.argument('image1', required=False)
+@click.argument('image2', required=False)
+@click.option('--compare-dir', '-d', multiple=True, help='指定镜像内要比较的目录，可多次指定')
 @click.option('--cache-dir', '-c', help='指定缓存目录')
-def docker_jar_diff(image1, image2, compare_dir=None, cache_dir=None):
+@click.option('--log-file', help='将调试日志写入指定文件')
+@click.option('--prometheus', is_flag=True, help='同时以 Prometheus 文本格式输出性能指标 (metrics.prom)')
+@click.option('--profile', is_flag=True, help='按阶段采集 CPU (cProfile) 和内存 (tracemalloc) 热点')
+@click.option('--no-cache', 'no_cache', is_flag=True, help='不使用之前相同比对的缓存结果，重新比对')
+@click.option('--shards', type=click.IntRange(min=1), help='按路径拆分为多个分片，由多个工作进程并行比对')
+@click.option('--external-shards', is_flag=True, help='不在本机启动分片进程，等待其他主机执行 shard-worker')
+@click.option('--resume', 'resume_task', help='继续被中断的比对任务（任务目录名或路径）')
+@click.option('--checkpoint', is_flag=True, default=None, help='记录比对进度，中断后可用 --resume 继续')
+@click.option('--metadata-only', is_flag=True, help='只比对 tar 头中的文件类型、权限、属主和链接目标，不读取文件内容')
+@click.option('--live', is_flag=True, help='镜像获取完成后立即打开实时报告页面，边比对边显示差异')
+@click.option('--format', 'formats', multiple=True, type=click.Choice(['jsonl', 'csv', 'junit']),
+              help='边比对边输出每条差异，可多次指定')
+@click.option('--output-dir', '-o', help='--format 输出文件所在目录（默认任务目录的 diff 目录）')
+@click.option('--expect', 'expected', multiple=True, help='预期内的差异 "[类型:]路径通配符"，在 JUnit 中不算失败，可多次指定')
+@click.option('--low-memory', is_flag=True, default=None, help='索引排序后写入磁盘逐条比对，内存占用不随镜像大小增长')
+@click.option('--fail-on-unexpected', is_flag=True, help='存在非预期差异时以退出码 1 结束（需要 --format）')
+def diff(image1=None, image2=None, compare_dir=None, cache_dir=None, log_file=None, prometheus=False, profile=False,
+         no_cache=False, shards=None, external_shards=False, resume_task=None, metadata_only=False, live=False,
+         formats=None, output_dir=None, expected=None, low_memory=None, checkpoint=None, fail_on_unexpected=False):
     """对比两个docker镜像.
     
     配置存放于当前目录的 .config/config.json
@@ -26,11 +78,162 @@ def docker_jar_diff(image1, image2, compare_dir=None, cache_dir=None):
     IMAGE2: 第二个镜像 name/tag
     
     Options:
-    --compare-dir, -d: 指定镜像内要比较的目录 (default: /)
+    --compare-dir, -d: 指定镜像内要比较的目录，可多次指定 (default: /)
     --cache-dir, -c: 指定缓存目录 (default: ./cache)
+    --log-file: 调试日志文件 (default: 仅输出警告到终端)
+    --prometheus: 额外输出 Prometheus 格式的性能指标
+    --profile: 输出各阶段的 pstats 和内存分配热点到 html_report/profile
+    --no-cache: 忽略结果缓存（镜像 ID、比对目录和参数都相同时默认直接复用上次的报告）
+    --shards: 分片数，结果与不分片时完全相同
+    --external-shards: 各分片由共享缓存目录的主机执行 shard-worker PLAN INDEX
+    --resume: 继续中断的任务，跳过已获取的镜像、已索引的 jar 和已比对的路径（可省略镜像名称）
+    --checkpoint: 记录比对进度（默认关闭，见配置 checkpoint.enabled），供 --resume 使用
+    --metadata-only: 只比对元数据（权限、属主、符号链接、空目录等），速度最快
+    --live: 在 html_report/live.html 中实时显示已发现的差异，比对完成后链接到完整报告
+    --format: jsonl/csv 每条差异一行，junit 每条非预期差异一个失败用例（differences.jsonl、differences.csv、junit.xml）
+    --output-dir, -o: --format 输出目录
+    --expect: 预期内的差异，例如 "mtime_diff:*"、"/app/lib/app-*.jar"
+    --low-memory: 百万级文件的镜像使用外部排序比对，内存上限见配置 low_memory.memory_mb
+    --fail-on-unexpected: 有 --expect 之外的差异时退出码为 1，供 CI 使用（比对失败时退出码总是 1）
+    """
+    setup_logging(log_file)
+    # Imported here so that --help does not load the diff pipeline
+    from docker_jar_diff.main import DockerJarDiff
+    if external_shards and not shards:
+        raise click.UsageError('--external-shards 需要同时指定 --shards')
+    if fail_on_unexpected and not formats:
+        raise click.UsageError('--fail-on-unexpected 需要同时指定 --format')
+    if not image2 and not (resume_task and not image1):
+        raise click.UsageError('需要指定两个镜像，或使用 --resume 继续之前的任务')
+    try:
+        diff_tool = DockerJarDiff(cache_dir, prometheus_metrics=prometheus, profile=profile, resume_task=resume_task,
+                                  checkpoint=checkpoint)
+    except (ValueError, RuntimeError) as e:
+        raise click.BadParameter(str(e), param_hint='--resume')
+    compare_dir = list(compare_dir) if compare_dir else None
+    if resume_task and not image1:
+        # Same images and directories as the interrupted run
+        inputs = diff_tool.checkpoint.get_inputs() if diff_tool.checkpoint else None
+        if not inputs:
+            diff_tool.close()
+            raise click.BadParameter('该任务没有检查点，请指定两个镜像', param_hint='--resume')
+        image1, image2 = inputs['image1'], inputs['image2']
+        compare_dir = compare_dir or inputs['compare_dirs']
+    exit_code = diff_tool.run_diff(image1, image2, compare_dir, use_cache=not no_cache,
+                                   shards=shards, external_shards=external_shards, metadata_only=metadata_only,
+                                   live=live, formats=list(formats), output_dir=output_dir, expected=list(expected),
+                                   low_memory=low_memory or None, fail_on_unexpected=fail_on_unexpected)
+    if exit_code:
+        raise SystemExit(1)
+
+
+@docker_jar_diff.command('batch')
+@click.argument('images', nargs=-1)
+@click.option('--pairs', 'pairs_file', type=click.Path(exists=True, dir_okay=False),
+              help='镜像对文件，每行 "IMAGE1 IMAGE2"，# 开头为注释')
+@click.option('--all-pairs', is_flag=True, help='两两比对所有镜像（默认第一个镜像与其余镜像比对）')
+@click.option('--compare-dir', '-d', multiple=True, help='指定镜像内要比较的目录，可多次指定')
+@click.option('--workers', type=int, help='同时获取和索引的镜像数量')
+@click.option('--cache-dir', '-c', help='指定缓存目录')
+@click.option('--log-file', help='将调试日志写入指定文件')
+def batch(images, pairs_file=None, all_pairs=False, compare_dir=None, workers=None, cache_dir=None, log_file=None):
+    """批量对比多个镜像，每个镜像只下载和索引一次.
+
+    默认以第一个镜像为基线与其余镜像逐一比对，并生成所有镜像的版本矩阵报告。
+
+    示例: docker-jar-diff batch app:2.0 app:1.9 app:1.8 -d /app/lib
     """
+    setup_logging(log_file)
+    pairs = None
+    if pairs_file:
+        from docker_jar_diff.batch import read_pairs_file
+        try:
+            pairs = read_pairs_file(pairs_file)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--pairs')
+    elif len(images) < 2:
+        raise click.UsageError('至少需要两个镜像，或使用 --pairs 指定镜像对')
+    from docker_jar_diff.main import DockerJarDiff
     diff_tool = DockerJarDiff(cache_dir)
-    diff_tool.run_diff(image1, image2, compare_dir)
+    exit_code = diff_tool.run_batch(list(images), pairs, list(compare_dir) if compare_dir else None,
+                                    all_pairs=all_pairs, workers=workers)
+    if exit_code:
+        raise SystemExit(1)
+
+
+@docker_jar_diff.command('shard-worker')
+@click.argument('plan', type=click.Path(exists=True, dir_okay=False))
+@click.argument('index', type=int)
+@click.option('--log-file', help='将调试日志写入指定文件')
+def shard_worker(plan, index, log_file=None):
+    """执行分片比对计划中的一个分片（由 diff --shards 启动，或在其他主机上手动执行）.
+
+    PLAN: 任务目录下的 shards/plan.json，各主机需以相同路径访问共享缓存目录 \n
+    INDEX: 分片序号，从 0 开始
+    """
+    setup_logging(log_file)
+    from docker_jar_diff.sharding import run_shard
+    result_path = run_shard(plan, index)
+    print(f"✅ 分片 {index} 比对完成: {result_path}")
+
+
+@docker_jar_diff.command('history')
+@click.argument('path')
+@click.option('--cache-dir', '-c', help='指定缓存目录')
+@click.option('--json', 'as_json', is_flag=True, help='以 JSON 输出')
+@click.option('--order', multiple=True, help='按发布顺序排列的镜像名称或 ID，可多次指定（默认按记录顺序）')
+def history(path, cache_dir=None, as_json=False, order=None):
+    """查询路径在已处理的各镜像中的历史，不连接 Docker.
+
+    PATH: 镜像内路径（/app/lib/foo.jar）、某个归档内的成员（/app/lib/foo.jar!/com/acme/Foo.class）
+    或任意归档内的成员（com/acme/Foo.class）
+
+    配置 history.enabled 开启后，比对、批量比对和守护进程获取的每个镜像都会记录到缓存目录的 history.db 中。
+    镜像默认按首次记录的顺序排列，较早的版本后比对时可用 --order 指定发布顺序。
+    """
+    import os
+    import json
+    from docker_jar_diff.config import load_config
+    from docker_jar_diff.history import CHANGE_LABELS, HistoryIndex, format_history, get_history_path, last_change
+    config = load_config()
+    base_cache_dir = cache_dir or os.path.join(os.getcwd(), ".compare_cache")
+    db_path = get_history_path(base_cache_dir, config.get('hash', {}).get('algorithm', 'md5'))
+    if not os.path.exists(db_path):
+        raise click.ClickException(f'没有路径历史: {db_path}，请先比对镜像')
+    entries = HistoryIndex(db_path).query(path, list(order))
+    if as_json:
+        click.echo(json.dumps(entries, ensure_ascii=False, indent=2))
+        return
+    if not any(entry['locations'] for entry in entries):
+        click.echo(f"❔ 已记录的 {len(entries)} 个镜像中没有 {path}")
+        return
+    click.echo(f"📜 {path} 在 {len(entries)} 个镜像中的历史:")
+    for line in format_history(entries):
+        click.echo(line)
+    latest = last_change(entries)
+    if latest is not None:
+        click.echo(f"最近一次变化: {latest['name']}（{CHANGE_LABELS[latest['change']]}）")
+
+
+@docker_jar_diff.command('daemon')
+@click.option('--socket', 'socket_path', help='监听的 Unix socket 路径（不指定时监听本地 HTTP 端口）')
+@click.option('--host', default='127.0.0.1', show_default=True, help='HTTP 监听地址')
+@click.option('--port', default=8765, show_default=True, help='HTTP 监听端口')
+@click.option('--workers', type=int, help='同时执行的比对任务数')
+@click.option('--cache-dir', '-c', help='指定缓存目录')
+@click.option('--log-file', help='将调试日志写入指定文件')
+def daemon(socket_path=None, host='127.0.0.1', port=8765, workers=None, cache_dir=None, log_file=None):
+    """以守护进程方式运行，复用 Docker 连接和镜像索引缓存.
+    
+    POST /diff 提交比对任务，GET /jobs/<id> 查询结果。
+    """
+    setup_logging(log_file)
+    from docker_jar_diff.daemon import serve
+    serve(cache_dir, host=host, port=port, socket_path=socket_path, workers=workers)
+
 
 if __name__ == "__main__":
+    # Text diffs run in worker processes, needed by the PyInstaller build
+    import multiprocessing
+    multiprocessing.freeze_support()
     docker_jar_diff()
\ No newline at end of file
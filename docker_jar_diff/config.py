@@ -0,0 +1,58 @@
+import os
+import sys
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    "docker": {
+        "base_url": "tcp://127.0.0.1:12375",
+        "tls": False
+    },
+    "beyond_compare": {
+        "path": "C:\\Users\\Administrator\\AppData\\Local\\Programs\\Beyond Compare 5\\BCompare.exe"
+    }
+}
+
+_config = None
+
+
+def get_config_path():
+    """Locate .config/config.json - support both development and PyInstaller packaged environments"""
+    # Try to find config in current working directory first
+    config_path = os.path.join(os.getcwd(), '.config', 'config.json')
+
+    # If not found, try in program directory
+    if not os.path.exists(config_path):
+        if hasattr(sys, '_MEIPASS'):
+            # Running from PyInstaller bundle
+            app_dir = os.path.dirname(sys.executable)
+        else:
+            # Running from development environment
+            app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        config_path = os.path.join(app_dir, '.config', 'config.json')
+    return config_path
+
+
+def load_config(reload=False):
+    """Load the configuration once per process, creating the default file if missing"""
+    global _config
+    if _config is not None and not reload:
+        return _config
+
+    config_path = get_config_path()
+
+    # If config file doesn't exist, create default config
+    if not os.path.exists(config_path):
+        # Create config directory if it doesn't exist
+        os.makedirs(os.path.dirname(config_path), exist_ok=True)
+        # Write default config
+        with open(config_path, 'w') as f:
+            json.dump(DEFAULT_CONFIG, f, indent=2)
+        logger.info("Created default config file at: %s", config_path)
+
+    # Load config file
+    with open(config_path, 'r') as f:
+        _config = json.load(f)
+    return _config
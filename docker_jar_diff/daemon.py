@@ -0,0 +1,411 @@
+"""Long-running diff service with warm caches
+
+The daemon keeps one Docker client, an LRU of image manifests (directory
+trees keyed by image ID and compare directory) and an LRU of archive
+indexes keyed by archive MD5. Diff requests are queued and run by a fixed
+number of worker threads, each job is a DockerJarDiff.compare() in a task
+directory of its own with these caches injected, so it gives the same
+result as the CLI (metadata diff, result cache, checkpoint, --format). The
+HTTP API listens on a local TCP port or a Unix socket:
+
+    POST /diff                  {"image1": ..., "image2": ..., "compare_dir": ..., "wait": false}
+                                (compare_dir can be a list of directories, optional
+                                "formats" and "expected" as --format and --expect)
+    GET  /jobs/<id>             job status and summary
+    GET  /jobs/<id>/diff.json   full diff result
+    GET  /jobs/<id>/report      HTML report
+    GET  /health                queue and cache statistics
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+import socketserver
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .config import load_config
+from .cache_manager import CacheManager
+from .docker_handler import DockerHandler
+from .diff_engine import DiffEngine
+from .lru_cache import LRUCache
+from .main import DockerJarDiff
+from .metrics import Metrics
+from .utils import Utils
+
+logger = logging.getLogger(__name__)
+
+# 守护进程默认参数，可通过配置文件的 "daemon" 节点覆盖
+DEFAULT_DAEMON_OPTIONS = {
+    'workers': 2,               # 同时执行的比对任务数
+    'manifest_cache_size': 16,  # 缓存的镜像目录树数量
+    'archive_cache_size': 4096, # 缓存的 jar/zip 索引数量
+    'max_jobs': 1000            # 保留的历史任务数量
+}
+
+
+class DiffDaemon:
+    def __init__(self, base_cache_dir=None, config=None, daemon_options=None):
+        self.config = config if config is not None else load_config()
+        self.options = dict(DEFAULT_DAEMON_OPTIONS)
+        self.options.update(self.config.get('daemon', {}))
+        if daemon_options:
+            self.options.update(daemon_options)
+
+        # One long-lived workspace for the acquired images, its lock keeps it safe from eviction
+        self.cache_manager = CacheManager(base_cache_dir, self.config.get('cache'),
+                                          hash_algorithm=self.config.get('hash', {}).get('algorithm', 'md5'))
+
+        # Cumulative counters over all jobs, exposed by /health
+        self.metrics = Metrics()
+        self.docker_handler = DockerHandler(self.cache_manager, self.config,
+                                            progress=self._log_progress, metrics=self.metrics)
+        self.diff_engine = DiffEngine(
+            self.cache_manager,
+            self.config.get('text_diff'),
+            archive_index_cache=LRUCache(self.options['archive_cache_size']),
+            metrics=self.metrics,
+            compare_options=self.config.get('compare'),
+            normalize_options=self.config.get('normalize')
+        )
+        self.docker_handler.archive_indexer = self.diff_engine.prefetch_archive
+        self.manifest_cache = LRUCache(self.options['manifest_cache_size'],
+                                       on_evict=self._on_manifest_evicted)
+
+        self.jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._acquire_locks = {}
+        self._acquire_locks_lock = threading.Lock()
+        # Manifests in use by running jobs, an evicted manifest keeps its files until released
+        self._pins_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._workers = []
+        self._stopping = threading.Event()
+
+    @staticmethod
+    def _log_progress(event, **info):
+        if event == 'log':
+            logger.info(info['message'])
+
+    def start(self):
+        """Start worker threads and background cache eviction"""
+        self.cache_manager.start_background_cleanup()
+        for index in range(max(1, int(self.options['workers']))):
+            worker = threading.Thread(target=self._worker_loop, name=f"diff-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        """Stop workers and release the workspace"""
+        self._stopping.set()
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self.docker_handler.cleanup()
+        self.cache_manager.release()
+
+    def submit(self, image1, image2, compare_dir=None, formats=None, expected=None):
+        """Queue a diff request, returns the job dict"""
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'status': 'queued',
+            'image1': image1,
+            'image2': image2,
+            'compare_dir': compare_dir or '/',
+            'formats': list(formats or []),
+            'expected': list(expected or []),
+            'submitted': time.time(),
+            'done_event': threading.Event()
+        }
+        dropped = []
+        with self._jobs_lock:
+            self.jobs[job['id']] = job
+            while len(self.jobs) > self.options['max_jobs']:
+                dropped.append(self.jobs.popitem(last=False)[1])
+        for old_job in dropped:
+            # A job still running removes its directory when it finishes
+            old_job['dropped'] = True
+            if old_job['done_event'].is_set():
+                self._remove_job_dir(old_job)
+        self._queue.put(job)
+        return job
+
+    def _remove_job_dir(self, job):
+        job_cache = job.get('cache_manager')
+        # An idle task directory may have been evicted already, or be in use by an eviction
+        if job_cache is None or not job_cache.task_lock.acquire(blocking=False):
+            return
+        try:
+            job_cache.cleanup()
+        except Exception as e:
+            logger.warning("Failed to remove %s: %s", job_cache.task_cache_dir, e)
+
+    def get_job(self, job_id):
+        with self._jobs_lock:
+            return self.jobs.get(job_id)
+
+    @staticmethod
+    def job_to_dict(job):
+        return {key: value for key, value in job.items() if key not in ('done_event', 'cache_manager')}
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'workers': len(self._workers),
+            'manifest_cache': self.manifest_cache.stats(),
+            'archive_cache': self.diff_engine.archive_index_cache.stats(),
+            'metrics': self.metrics.to_dict()
+        }
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            job = self._queue.get()
+            if job is None:
+                break
+            job['status'] = 'running'
+            job['started'] = time.time()
+            try:
+                self._run_job(job)
+                job['status'] = 'done'
+            except Exception as e:
+                logger.exception("Diff job %s failed", job['id'])
+                job['status'] = 'failed'
+                job['error'] = str(e)
+            finally:
+                job['finished'] = time.time()
+                job['done_event'].set()
+                if job.get('dropped'):
+                    self._remove_job_dir(job)
+
+    def _run_job(self, job):
+        """Run a job through DockerJarDiff.compare() with the caches of the daemon
+        
+        The job gets a task directory of its own for diff.json, the report
+        and the --format outputs. Images come from the manifests, their trees
+        and the archive indexes are reused, the Docker client is shared.
+        """
+        diff_tool = DockerJarDiff(self.cache_manager.base_cache_dir, config=self.config)
+        job['cache_manager'] = diff_tool.cache_manager
+        job['task_dir'] = diff_tool.cache_manager.task_cache_dir
+        diff_tool.docker_handler = self.docker_handler
+        diff_tool.diff_engine.archive_index_cache = self.diff_engine.archive_index_cache
+        diff_tool.diff_engine.tree_cache = {}
+        manifests = []
+        
+        def image_source(image, compare_dir):
+            manifest = self._acquire(image, compare_dir)
+            manifests.append(manifest)
+            diff_tool.diff_engine.tree_cache[
+                (manifest['extracted_dir'], tuple(Utils.normalize_compare_dirs(compare_dir)))] = manifest['tree']
+            return {
+                'image_id': manifest['image_id'],
+                'extracted_dir': manifest['extracted_dir'],
+                'metadata_dir': manifest['metadata_dir'],
+                'compare_dirs': Utils.normalize_compare_dirs(compare_dir)
+            }
+        
+        diff_tool.image_source = image_source
+        try:
+            result = diff_tool.compare(job['image1'], job['image2'], job['compare_dir'], progress=self._log_progress,
+                                       formats=job['formats'], expected=job['expected'])
+        finally:
+            # Files are read until the report is written
+            for manifest in manifests:
+                self._release(manifest)
+            # The shared Docker client stays open, only the task is released
+            diff_tool.cache_manager.release()
+        job['image1_id'] = result.image1_id
+        job['image2_id'] = result.image2_id
+        job['diff_json_path'] = result.diff_json_path
+        job['report_path'] = result.report_path
+        job['output_paths'] = result.output_paths
+        job['unexpected_differences'] = result.unexpected_differences
+        job['cached'] = result.cached
+        job['summary'] = result.summary
+    
+    def _acquire(self, image_name, compare_dir):
+        """Get the manifest of an image, extracting it only on a cache miss
+
+        The manifest is pinned, its extracted files stay on disk until
+        _release() even if it is evicted in between.
+        """
+        image_id = self.docker_handler.get_image_id(image_name)
+        # Digests are only comparable within one algorithm
+        algorithm = self.cache_manager.hash_algorithm
+        key = (algorithm, image_id, tuple(Utils.normalize_compare_dirs(compare_dir)))
+
+        # Jobs that need the same image wait for a single acquisition
+        with self._acquire_locks_lock:
+            lock = self._acquire_locks.setdefault(key, threading.Lock())
+        with lock:
+            manifest = self.manifest_cache.get(key)
+            # Evicted and removed between get() and pinning: acquire it again
+            if manifest is not None and self._pin(manifest):
+                self.metrics.cache_hit('manifest')
+                return manifest
+            self.metrics.cache_miss('manifest')
+
+            cache_key = f"{image_id.replace('sha256:', '')[:16]}_{uuid.uuid4().hex[:6]}"
+            image_info = self.docker_handler.process_image(image_name, compare_dir, cache_key=cache_key)
+            if image_info.get('error'):
+                raise RuntimeError(image_info['error'])
+            # The tar has been extracted, only the tree and the tar headers are needed from now on
+            for name in os.listdir(image_info['image_cache_dir']):
+                path = os.path.join(image_info['image_cache_dir'], name)
+                if path != image_info['metadata_dir']:
+                    Utils.remove_dir(path) if os.path.isdir(path) else os.remove(path)
+
+            manifest = {
+                'image_id': image_id,
+                'digest_algorithm': algorithm,
+                'image_cache_dir': image_info['image_cache_dir'],
+                'extracted_dir': image_info['extracted_dir'],
+                'metadata_dir': image_info['metadata_dir'],
+                'tree': self.diff_engine.build_tree(image_info['extracted_dir'], compare_dir),
+                'pins': 1,
+                'evicted': False
+            }
+            self.manifest_cache.put(key, manifest)
+            return manifest
+
+    def _pin(self, manifest):
+        """Mark a manifest in use, False if its files are already gone"""
+        with self._pins_lock:
+            if manifest['evicted'] and manifest['pins'] == 0:
+                return False
+            manifest['pins'] += 1
+            return True
+
+    def _release(self, manifest):
+        """Unpin a manifest, the files of an evicted one go with its last job"""
+        with self._pins_lock:
+            manifest['pins'] -= 1
+            remove = manifest['evicted'] and manifest['pins'] == 0
+        if remove:
+            self._remove_manifest_files(manifest)
+
+    def _remove_manifest_files(self, manifest):
+        for path in (manifest['extracted_dir'], manifest['image_cache_dir']):
+            try:
+                Utils.remove_dir(path)
+            except Exception as e:
+                logger.warning("Failed to remove %s: %s", path, e)
+
+    def _on_manifest_evicted(self, key, manifest):
+        # Evicted manifests take their extracted files with them, once no job uses them
+        with self._pins_lock:
+            manifest['evicted'] = True
+            remove = manifest['pins'] == 0
+        if remove:
+            self._remove_manifest_files(manifest)
+        with self._acquire_locks_lock:
+            self._acquire_locks.pop(key, None)
+
+
+class _DaemonRequestHandler(BaseHTTPRequestHandler):
+    daemon = None  # set by create_server
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        if isinstance(self.client_address, tuple) and self.client_address:
+            return str(self.client_address[0])
+        return 'unix'
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, path, content_type):
+        if not path or not os.path.exists(path):
+            self._send_json(404, {'error': 'not found'})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                self.wfile.write(chunk)
+
+    def do_GET(self):
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if parts == ['health']:
+            self._send_json(200, {'status': 'ok', **self.daemon.stats()})
+            return
+        if len(parts) >= 2 and parts[0] == 'jobs':
+            job = self.daemon.get_job(parts[1])
+            if job is None:
+                self._send_json(404, {'error': 'unknown job'})
+            elif len(parts) == 2:
+                self._send_json(200, self.daemon.job_to_dict(job))
+            elif parts[2:] == ['diff.json']:
+                self._send_file(job.get('diff_json_path'), 'application/json; charset=utf-8')
+            elif parts[2:] == ['report']:
+                self._send_file(job.get('report_path'), 'text/html; charset=utf-8')
+            else:
+                self._send_json(404, {'error': 'not found'})
+            return
+        self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path.split('?')[0].rstrip('/') != '/diff':
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            image1 = request['image1']
+            image2 = request['image2']
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {'error': f'invalid request: {e}'})
+            return
+
+        job = self.daemon.submit(image1, image2, request.get('compare_dir'), request.get('formats'),
+                                 request.get('expected'))
+        if request.get('wait'):
+            job['done_event'].wait(request.get('timeout'))
+            self._send_json(200, self.daemon.job_to_dict(job))
+        else:
+            self._send_json(202, self.daemon.job_to_dict(job))
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(daemon, host='127.0.0.1', port=8765, socket_path=None):
+    """Create the HTTP server for a daemon, on a Unix socket if socket_path is given"""
+    handler = type('DaemonRequestHandler', (_DaemonRequestHandler,), {'daemon': daemon})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return _UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(base_cache_dir=None, host='127.0.0.1', port=8765, socket_path=None, workers=None):
+    """Run the daemon until interrupted"""
+    daemon = DiffDaemon(base_cache_dir, daemon_options={'workers': workers} if workers else None)
+    server = create_server(daemon, host, port, socket_path)
+    daemon.start()
+    print(f"🚀 docker-jar-diff daemon listening on {socket_path or f'http://{host}:{port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.stop()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
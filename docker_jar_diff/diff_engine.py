@@ -1,37 +1,262 @@
 import os
-import difflib
+import time
 import zipfile
 import io
+import logging
 import tempfile
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from .utils import Utils
+from .hashing import new_hasher
 from .cache_manager import CacheManager
+from .lru_cache import LRUCache
+from .metrics import Metrics
+from .progress import ProgressTracker
+from .normalizers import DEFAULT_NORMALIZE_OPTIONS, build_normalizers
+
+logger = logging.getLogger(__name__)
+
+# 文本差异默认限制，可通过配置文件的 "text_diff" 节点覆盖
+DEFAULT_TEXT_DIFF_OPTIONS = {
+    'enabled': True,
+    'extensions': ['.properties', '.yml', '.yaml', '.xml', '.json', '.conf', '.cfg',
+                   '.ini', '.txt', '.sh', '.env', '.sql', '.toml', '.xsd', '.policy'],
+    'max_file_size': 1024 * 1024,   # 单个文件最大字节数
+    'max_lines': 20000,             # 单个文件最大行数
+    'max_hunk_lines': 2000,         # 每个文件保存的最大差异行数
+    'context_lines': 3,
+    'timeout': 5,                   # 单个文件超时时间（秒）
+    'total_timeout': 120,           # 整个文本差异阶段超时时间（秒）
+    'workers': 4
+}
+
+
+# 文件内容比较参数，可通过配置文件的 "compare" 节点覆盖
+DEFAULT_COMPARE_OPTIONS = {
+    'lazy_hash': True,                  # 构建目录树时不计算普通文件的摘要，需要时再算
+    'tiered': True,                     # 大小 -> 首尾采样 -> 完整摘要 逐级比较
+    'sample_size': 64 * 1024,           # 首、尾各采样的字节数
+    'min_tiered_size': 1024 * 1024      # 小于该大小的文件直接计算完整摘要
+}
+
+
+class TextDiffTimeout(Exception):
+    """Raised when a single text diff exceeds its deadline"""
+
 
 class DiffEngine:
-    def __init__(self, cache_manager: CacheManager):
+    def __init__(self, cache_manager: CacheManager, text_diff_options=None, archive_index_cache=None,
+                 metrics=None, compare_options=None, normalize_options=None):
         self.cache_manager = cache_manager
+        # Digests in trees, caches and the blob store all use the workspace algorithm
+        self.hash_algorithm = cache_manager.hash_algorithm
+        self.metrics = metrics or Metrics()
+        self.text_diff_options = dict(DEFAULT_TEXT_DIFF_OPTIONS)
+        if text_diff_options:
+            self.text_diff_options.update(text_diff_options)
+        self.compare_options = dict(DEFAULT_COMPARE_OPTIONS)
+        if compare_options:
+            self.compare_options.update(compare_options)
+        # Build noise removed before a second comparison, see normalizers
+        self.normalize_options = dict(DEFAULT_NORMALIZE_OPTIONS)
+        if normalize_options:
+            self.normalize_options.update(normalize_options)
+        self.normalizers = build_normalizers(self.normalize_options)
+        # Normalized digests keyed by (raw digest, normalizer names), the same content is normalized once
+        self.normalized_digests = LRUCache(self.normalize_options['memo_size'])
+        # Archive contents keyed by (algorithm, digest, size), identical jars are indexed once
+        self.archive_index_cache = archive_index_cache if archive_index_cache is not None else LRUCache(1024)
+        # Optional checkpoint.Checkpoint, archive indexes are saved to it and survive a crash
+        self.checkpoint = None
+        # Optional trees built before, keyed by (extracted_dir, compare dirs), see daemon
+        self.tree_cache = None
+        # Worker pool and seconds of total_timeout left of the run of this thread, see text_diff_run
+        self._text_diff_run = threading.local()
+        # Files and bytes hashed, units diffed
+        self.progress_tracker = ProgressTracker()
     
+    def get_result_options(self):
+        """Settings that change the diff output, part of the result cache key"""
+        return {
+            'digest_algorithm': self.hash_algorithm,
+            'text_diff': self.text_diff_options,
+            'compare': self.compare_options,
+            'normalize': self.normalize_options
+        }
+
     def diff_directories(self, dir1, dir2, compare_dir=None):
         """Diff two directories"""
-        if compare_dir:
-            # Only compare specific directory
-            dir1 = os.path.join(dir1, compare_dir.lstrip('/'))
-            dir2 = os.path.join(dir2, compare_dir.lstrip('/'))
+        tree1 = self.build_tree(dir1, compare_dir)
+        tree2 = self.build_tree(dir2, compare_dir)
+        return self.diff_trees(tree1, tree2, dir1, dir2, compare_dir)
+    
+    def build_tree(self, extracted_dir, compare_dir=None):
+        """Build the directory tree of an extracted image, limited to compare_dir
+        
+        compare_dir can also be a list, the trees of all directories are then
+        merged under their paths relative to the image root.
+        """
+        if self.tree_cache is not None:
+            tree = self.tree_cache.get((extracted_dir, tuple(Utils.normalize_compare_dirs(compare_dir))))
+            if tree is not None:
+                return tree
+        with self.metrics.phase('build_tree'):
+            compare_dir = self._resolve_compare_dir(compare_dir)
+            if not isinstance(compare_dir, list):
+                return self._build_directory_tree(self._get_compare_root(extracted_dir, compare_dir))
+            
+            tree = {}
+            for directory in compare_dir:
+                subtree = self._build_directory_tree(self._get_compare_root(extracted_dir, directory))
+                if not subtree:
+                    continue
+                parts = directory.strip('/').split('/')
+                current = tree
+                for part in parts[:-1]:
+                    current = current.setdefault(part, {})
+                current[parts[-1]] = subtree
+            return tree
+    
+    def diff_trees(self, tree1, tree2, dir1, dir2, compare_dir=None):
+        """Diff two directory trees built by build_tree"""
+        compare_dir = self._resolve_compare_dir(compare_dir)
         
-        # Create directory trees
-        tree1 = self._build_directory_tree(dir1)
-        tree2 = self._build_directory_tree(dir2)
+        # Find differences, the progress counts the files of both trees
+        compare_stats = self.new_compare_stats()
+        self.seed_hash_total(tree1, tree2)
+        progress = self.progress_tracker.task('diff', total_files=self._count_files(tree1) + self._count_files(tree2))
+        with self.metrics.phase('find_differences'):
+            diffs = self._find_differences(tree1, tree2, self._get_root_dir(compare_dir), compare_stats, progress)
+        self.metrics.add('find_differences', bytes=compare_stats['bytes_read'])
+        progress.finish()
         
-        # Find differences
-        diffs = self._find_differences(tree1, tree2, compare_dir or '/')
+        # Attach line diffs for changed text files
+        with self.metrics.phase('text_diff'):
+            self.attach_text_diffs(diffs)
         
+        return self.assemble_result(dir1, dir2, compare_dir, compare_stats, diffs)
+    
+    def assemble_result(self, dir1, dir2, compare_dir, compare_stats, diffs):
+        """Build the diff result dict, also used to merge sharded runs"""
+        compare_dir = self._resolve_compare_dir(compare_dir)
+        multiple = isinstance(compare_dir, list)
+        compare_stats['bytes_saved'] = max(0, compare_stats['bytes_full'] - compare_stats['bytes_read'])
         return {
-            'dir1': dir1,
-            'dir2': dir2,
-            'compare_dir': compare_dir or '/',
+            'dir1': dir1 if multiple else self._get_compare_root(dir1, compare_dir),
+            'dir2': dir2 if multiple else self._get_compare_root(dir2, compare_dir),
+            'compare_dir': self._get_root_dir(compare_dir),
+            'compare_dirs': compare_dir if multiple else Utils.normalize_compare_dirs(compare_dir),
+            'compare_stats': compare_stats,
+            'digest_algorithm': self.hash_algorithm,
             'differences': diffs
         }
     
+    def get_view(self, extracted_dir, compare_dir=None):
+        """Root on disk of the compared view and its directories as path tuples
+        
+        A single compare_dir is the root itself (one empty tuple), several
+        directories are placed under the image root like build_tree does.
+        """
+        compare_dir = self._resolve_compare_dir(compare_dir)
+        if isinstance(compare_dir, list):
+            return extracted_dir, [tuple(directory.strip('/').split('/')) for directory in compare_dir]
+        return self._get_compare_root(extracted_dir, compare_dir), [()]
+    
+    def list_view_files(self, extracted_dir, compare_dir=None):
+        """Path tuples of every file name build_tree walks, without indexing them"""
+        view_root, view_dirs = self.get_view(extracted_dir, compare_dir)
+        files = []
+        for view_dir in view_dirs:
+            base_dir = os.path.join(view_root, *view_dir)
+            for root, dirs, names in os.walk(base_dir):
+                rel_parts = () if root == base_dir else tuple(os.path.relpath(root, base_dir).split(os.sep))
+                files.extend(view_dir + rel_parts + (name,) for name in names)
+        return files
+    
+    def iter_view_entries(self, extracted_dir, compare_dir=None):
+        """(path tuple, tree entry) of every file build_tree holds, in walk order"""
+        view_root, view_dirs = self.get_view(extracted_dir, compare_dir)
+        for view_dir in view_dirs:
+            base_dir = os.path.join(view_root, *view_dir)
+            for root, dirs, names in os.walk(base_dir):
+                rel_parts = () if root == base_dir else tuple(os.path.relpath(root, base_dir).split(os.sep))
+                for name in names:
+                    entry = self._build_file_entry(os.path.join(root, name), name)
+                    if entry:
+                        yield view_dir + rel_parts + (name,), entry
+    
+    def build_view_item(self, extracted_dir, compare_dir, unit):
+        """Tree entry at a path of the compared view, None if build_tree has none
+        
+        The entry is exactly what build_tree would hold at that path, so a
+        view can be diffed unit by unit (see sharding).
+        """
+        view_root, view_dirs = self.get_view(extracted_dir, compare_dir)
+        unit = tuple(unit)
+        if any(unit[:len(view_dir)] == view_dir for view_dir in view_dirs):
+            path = os.path.join(view_root, *unit)
+            if os.path.islink(path) and os.path.isdir(path):
+                # os.walk does not follow directory links
+                return None
+            if os.path.isdir(path):
+                subtree = self._build_directory_tree(path)
+                # Like build_tree, a directory only exists once a file name was walked
+                if subtree or any(names for _, _, names in os.walk(path)):
+                    return subtree
+                return None
+            if os.path.exists(path):
+                return self._build_file_entry(path, unit[-1])
+            return None
+        
+        # An ancestor of several compare directories holds their merged trees
+        tree = {}
+        for view_dir in view_dirs:
+            if view_dir[:len(unit)] != unit:
+                continue
+            subtree = self._build_directory_tree(os.path.join(view_root, *view_dir))
+            if not subtree:
+                continue
+            current = tree
+            for part in view_dir[len(unit):-1]:
+                current = current.setdefault(part, {})
+            current[view_dir[-1]] = subtree
+        return tree or None
+    
+    def diff_unit(self, unit, item1, item2, compare_dir, compare_stats):
+        """Differences of one path of the view, as a full diff would list them"""
+        base_path = self._get_root_dir(self._resolve_compare_dir(compare_dir))
+        for part in unit[:-1]:
+            base_path = os.path.join(base_path, part).replace('\\', '/')
+        tree1 = {unit[-1]: item1} if item1 is not None else {}
+        tree2 = {unit[-1]: item2} if item2 is not None else {}
+        self.seed_hash_total(tree1, tree2)
+        with self.metrics.phase('find_differences'):
+            diffs = self._find_differences(tree1, tree2, base_path, compare_stats)
+        with self.metrics.phase('text_diff'):
+            self.attach_text_diffs(diffs)
+        return diffs
+    
+    @staticmethod
+    def _resolve_compare_dir(compare_dir):
+        """A list of several directories stays a (normalized) list, anything else a single path"""
+        if isinstance(compare_dir, (list, tuple)):
+            compare_dirs = Utils.normalize_compare_dirs(compare_dir)
+            return compare_dirs if len(compare_dirs) > 1 else compare_dirs[0]
+        return compare_dir
+    
+    @staticmethod
+    def _get_root_dir(compare_dir):
+        """Base of the difference paths, merged trees are rooted at the image root"""
+        return '/' if isinstance(compare_dir, list) else compare_dir or '/'
+    
+    @staticmethod
+    def _get_compare_root(extracted_dir, compare_dir):
+        if compare_dir:
+            # Only compare specific directory
+            return os.path.join(extracted_dir, compare_dir.lstrip('/'))
+        return extracted_dir
+    
     def _build_directory_tree(self, root_dir):
         """Build directory tree structure"""
         tree = {}
@@ -39,62 +264,179 @@ class DiffEngine:
         if not os.path.exists(root_dir):
             return tree
         
-        for root, dirs, files in os.walk(root_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                rel_path = os.path.relpath(file_path, root_dir)
-                
-                # Add to tree
-                current = tree
-                path_parts = rel_path.split(os.sep)
-                
-                for part in path_parts[:-1]:
-                    if part not in current:
-                        current[part] = {}
-                    current = current[part]
-                
-                # Check if it's a JAR or ZIP file
-                filename = path_parts[-1]
-                if Utils.is_jar_file(filename) or filename.lower().endswith('.zip'):
-                    # Extract JAR/ZIP contents to temporary directory
-                    temp_dir = Utils.create_temp_dir()
-                    extracted_tree = {}
-                    
-                    try:
-                        # Extract the archive and get original timestamps
-                        with zipfile.ZipFile(file_path, 'r') as z:
-                            z.extractall(temp_dir)
-                            
-                            # Build directory tree with original timestamps from ZIP file
-                            extracted_tree = self._build_archive_tree(z, temp_dir)
-                        
-                        # Add file info as a special entry with extracted content
-                        file_info = Utils.get_file_info(file_path)
-                        if file_info:
-                            # Create a special entry for the archive file
-                            archive_entry = {
-                                'file_info': file_info,
-                                'is_archive': True,
-                                'contents': extracted_tree
-                            }
-                            current[filename] = archive_entry
-                    except Exception as e:
-                        # If extraction fails, just add it as a regular file
-                        print(f"Error extracting archive {file_path}: {e}")
-                        file_info = Utils.get_file_info(file_path)
-                        if file_info:
-                            current[filename] = file_info
-                    finally:
-                        # Clean up
-                        Utils.remove_dir(temp_dir)
-                else:
-                    # Add as regular file
-                    file_info = Utils.get_file_info(file_path)
-                    if file_info:
-                        current[filename] = file_info
+        file_paths = [os.path.join(root, file) for root, dirs, files in os.walk(root_dir) for file in files]
+        if self.progress_tracker.listener is not None:
+            self._seed_build_hash_total(file_paths)
+        for file_path in file_paths:
+            rel_path = os.path.relpath(file_path, root_dir)
+            
+            # Add to tree
+            current = tree
+            path_parts = rel_path.split(os.sep)
+            
+            for part in path_parts[:-1]:
+                if part not in current:
+                    current[part] = {}
+                current = current[part]
+            
+            filename = path_parts[-1]
+            entry = self._build_file_entry(file_path, filename)
+            if entry:
+                current[filename] = entry
+                self.metrics.add('build_tree', files=1)
         
         return tree
     
+    def _seed_build_hash_total(self, file_paths):
+        """Add the files building their entries will hash to the total of the hash task"""
+        hash_all = not self.compare_options['lazy_hash']
+        blob_store = self.cache_manager.blob_store
+        total_bytes = total_files = 0
+        for file_path in file_paths:
+            if not hash_all and not Utils.is_archive_file(file_path):
+                continue
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            if blob_store and blob_store.lookup_digest(stat) is not None:
+                continue
+            total_bytes += stat.st_size
+            total_files += 1
+        if total_files:
+            self.progress_tracker.task('hash').add_total(bytes=total_bytes, files=total_files)
+    
+    def seed_hash_total(self, tree1, tree2):
+        """Add the same-size pairs without digests that a diff of the trees may hash to the hash task
+        
+        An upper bound: tiered comparison stops at the samples when they differ.
+        """
+        total_bytes = total_files = 0
+        stack = [(tree1, tree2)]
+        while stack:
+            current1, current2 = stack.pop()
+            for key in current1.keys() & current2.keys():
+                item1, item2 = current1[key], current2[key]
+                if not isinstance(item1, dict) or not isinstance(item2, dict):
+                    continue
+                info1 = item1.get('file_info', item1) if item1.get('is_archive') else item1
+                info2 = item2.get('file_info', item2) if item2.get('is_archive') else item2
+                is_file1, is_file2 = 'size' in info1, 'size' in info2
+                if not is_file1 and not is_file2:
+                    stack.append((item1, item2))
+                elif is_file1 and is_file2 and info1['size'] == info2['size']:
+                    for info in (info1, info2):
+                        if not info.get('digest'):
+                            total_bytes += info['size']
+                            total_files += 1
+        if total_files:
+            self.progress_tracker.task('hash').add_total(bytes=total_bytes, files=total_files)
+    
+    @staticmethod
+    def _count_files(item):
+        """Files and archives of a tree entry, archive members are not counted"""
+        count = 0
+        stack = [item]
+        while stack:
+            current = stack.pop()
+            if not isinstance(current, dict):
+                continue
+            if current.get('is_archive') or ('size' in current and not isinstance(current['size'], dict)):
+                count += 1
+            else:
+                stack.extend(current.values())
+        return count
+    
+    def _build_file_entry(self, file_path, filename):
+        """Tree entry of a file: an indexed archive or plain file info"""
+        # Check if it's a JAR or ZIP file
+        if Utils.is_archive_file(filename):
+            return self._index_archive(file_path)
+        # Add as regular file, its digest is computed when a comparison needs it
+        return self._get_file_info(file_path, hash_content=not self.compare_options['lazy_hash'])
+    
+    def prefetch_archive(self, file_path):
+        """Index an archive ahead of build_tree, which then finds it in the cache
+        
+        Safe to call from several threads while the image is still being
+        extracted, see DockerHandler.archive_indexer.
+        """
+        self._index_archive(file_path)
+    
+    def _index_archive(self, file_path):
+        """Index a JAR/ZIP file, returns an archive entry with its contents"""
+        file_info = self._get_file_info(file_path)
+        if not file_info:
+            return None
+        
+        cache_key = (self.hash_algorithm, file_info['digest'], file_info['size'])
+        extracted_tree = self.archive_index_cache.get(cache_key)
+        if extracted_tree is None and self.checkpoint is not None:
+            extracted_tree = self.checkpoint.load_archive(cache_key)
+            if extracted_tree is not None:
+                self.metrics.cache_hit('checkpoint_archive')
+                self.archive_index_cache.put(cache_key, extracted_tree)
+        if extracted_tree is not None:
+            self.metrics.cache_hit('archive_index')
+        else:
+            self.metrics.cache_miss('archive_index')
+            # Extract JAR/ZIP contents to temporary directory
+            temp_dir = Utils.create_temp_dir()
+            try:
+                # Extract the archive and get original timestamps
+                with self.metrics.phase('archive_index'), zipfile.ZipFile(file_path, 'r') as z:
+                    members = [info for info in z.infolist() if not info.is_dir()]
+                    self.progress_tracker.task('hash').add_total(bytes=sum(info.file_size for info in members),
+                                                                 files=len(members))
+                    z.extractall(temp_dir)
+                    
+                    # Build directory tree with original timestamps from ZIP file
+                    extracted_tree = self._build_archive_tree(z, temp_dir)
+                    self.metrics.add('archive_index', bytes=file_info['size'], files=len(z.infolist()))
+            except Exception as e:
+                # If extraction fails, just add it as a regular file
+                logger.warning("Error extracting archive %s: %s", file_path, e)
+                return file_info
+            finally:
+                # Clean up
+                Utils.remove_dir(temp_dir)
+            # Normalized once here, cached trees are shared between threads and never written again
+            if self.normalizers:
+                self._normalize_archive(file_path, extracted_tree)
+            self.archive_index_cache.put(cache_key, extracted_tree)
+            if self.checkpoint is not None:
+                self.checkpoint.save_archive(cache_key, extracted_tree)
+        
+        # Create a special entry for the archive file
+        return {
+            'file_info': file_info,
+            'is_archive': True,
+            'contents': extracted_tree
+        }
+    
+    def _get_file_info(self, file_path, hash_content=True):
+        """Get file info, reusing the digest recorded by the blob store"""
+        digest = None
+        blob_store = self.cache_manager.blob_store
+        if blob_store:
+            try:
+                digest = blob_store.lookup_digest(os.stat(file_path))
+            except OSError:
+                pass
+        if digest is not None:
+            self.metrics.cache_hit('blob_digest')
+            return Utils.get_file_info(file_path, digest=digest)
+        
+        self.metrics.cache_miss('blob_digest')
+        if not hash_content:
+            return Utils.get_file_info(file_path, hash_content=False)
+        with self.metrics.phase('hash'):
+            file_info = Utils.get_file_info(file_path, algorithm=self.hash_algorithm)
+        if file_info:
+            self.metrics.add('hash', bytes=file_info['size'], files=1)
+            self.progress_tracker.task('hash').advance(bytes=file_info['size'], files=1)
+        return file_info
+    
     def _build_archive_tree(self, zip_file, temp_dir):
         """Build directory tree structure from extracted archive with original timestamps"""
         tree = {}
@@ -123,27 +465,37 @@ class DiffEngine:
             abs_file_path = os.path.abspath(file_path)
             stat = os.stat(abs_file_path)
             
-            # Calculate MD5
-            md5 = Utils.get_file_hash(abs_file_path, algorithm='md5')
+            # Calculate the digest
+            with self.metrics.phase('hash'):
+                digest = Utils.get_file_hash(abs_file_path, algorithm=self.hash_algorithm)
+            self.metrics.add('hash', bytes=stat.st_size, files=1)
+            self.progress_tracker.task('hash').advance(bytes=stat.st_size, files=1)
             
             # Get original timestamp from ZIP file
             original_mtime = datetime(*zip_info.date_time)
             
             file_info = {
                 'name': path_parts[-1],
-                'path': abs_file_path,
+                # The extraction directory is temporary, members are named
+                # relative to their archive so results do not depend on it
+                'path': f"!/{filename}",
                 'size': stat.st_size,
                 'mtime': original_mtime.isoformat(),
                 'is_dir': False,
-                'md5': md5
+                'digest': digest
             }
             
             current[path_parts[-1]] = file_info
         
         return tree
     
-    def _find_differences(self, tree1, tree2, base_path):
-        """Find differences between two directory trees"""
+    def _find_differences(self, tree1, tree2, base_path, compare_stats=None, progress=None):
+        """Find differences between two directory trees
+        
+        compare_stats, if given, collects the comparison tier reached and the
+        bytes read, see _compare_contents. progress, if given, is a
+        ProgressTask advanced by the files and archives of both trees.
+        """
         diffs = []
         
         # Get all keys from both trees
@@ -173,69 +525,81 @@ class DiffEngine:
                 
                 if not item1_is_file and not item2_is_file:
                     # Both are directories or archive contents, recurse
-                    sub_diffs = self._find_differences(item1_contents, item2_contents, path)
+                    sub_diffs = self._find_differences(item1_contents, item2_contents, path, compare_stats, progress)
                     diffs.extend(sub_diffs)
+                elif item1_is_file != item2_is_file:
+                    # A file and a directory are not compared
+                    if progress is not None:
+                        progress.advance(files=self._count_files(item1) + self._count_files(item2))
                 elif item1_is_file and item2_is_file:
+                    if progress is not None:
+                        progress.advance(files=2)
                     # Both are files or archive files, compare them
                     diff_type = 'identical'
                     
+                    compare_tier = 'size'
+                    
                     if item1_file_info['size'] != item2_file_info['size']:
                         diff_type = 'size_diff'
+                        self._count_tier(compare_stats, 'size')
                     else:
-                        # Same size, check MD5 content
+                        # Same size, compare content digests tier by tier
                         try:
-                            # Use the MD5 already calculated in get_file_info
-                            md5_1 = item1_file_info.get('md5')
-                            md5_2 = item2_file_info.get('md5')
-                            
-                            # If MD5 is not available, calculate it
-                            if md5_1 is None:
-                                md5_1 = Utils.get_file_hash(item1_file_info['path'], algorithm='md5')
-                            if md5_2 is None:
-                                md5_2 = Utils.get_file_hash(item2_file_info['path'], algorithm='md5')
-                            
-                            if md5_1 != md5_2:
-                                diff_type = 'content_diff'
-                            else:
-                                # Same size and MD5, files are identical
-                                diff_type = 'identical'
+                            identical, compare_tier = self._compare_contents(
+                                item1_file_info, item2_file_info, compare_stats)
+                            diff_type = 'identical' if identical else 'content_diff'
                         except Exception as e:
-                            # Log the error but still check if MD5 values are available
-                            print(f"Error calculating MD5: {e}")
-                            # If MD5 values are already available, use them
-                            md5_1 = item1_file_info.get('md5')
-                            md5_2 = item2_file_info.get('md5')
-                            if md5_1 and md5_2 and md5_1 == md5_2:
+                            # Log the error but still check if digests are available
+                            logger.warning("Error calculating digest: %s", e)
+                            # If digests are already available, use them
+                            digest1 = item1_file_info.get('digest')
+                            digest2 = item2_file_info.get('digest')
+                            if digest1 and digest2 and digest1 == digest2:
                                 diff_type = 'identical'
                             else:
                                 diff_type = 'error'
                     
+                    if diff_type in ('size_diff', 'content_diff') and self.normalizers \
+                            and not item1_is_archive and not item2_is_archive \
+                            and self._normalized_equal(item1_file_info, item2_file_info, path):
+                        # Only build noise differs
+                        diff_type = 'identical'
+                        self._count_normalized(compare_stats)
+                    
                     if diff_type != 'identical':
                         diff_item = {
                             'path': path,
                             'type': diff_type,
                             'item1': item1_file_info,
                             'item2': item2_file_info,
-                            'is_archive': item1_is_archive and item2_is_archive
+                            'is_archive': item1_is_archive and item2_is_archive,
+                            'compare_tier': compare_tier
                         }
                         
                         # If both are archive files and have different contents, diff their extracted contents
                         if item1_is_archive and item2_is_archive:
                             try:
-                                archive_diff = self._find_differences(item1_contents, item2_contents, path)
+                                normalized = compare_stats.get('normalized', 0) if compare_stats is not None else None
+                                archive_diff = self._find_differences(item1_contents, item2_contents, path, compare_stats)
                                 if archive_diff:
                                     diff_item['archive_diff'] = archive_diff
+                                elif self.normalizers and self.normalize_options['archives'] \
+                                        and normalized is not None and compare_stats['normalized'] > normalized:
+                                    # Every member is identical, some only after normalization
+                                    diff_type = 'identical'
+                                    self._count_normalized(compare_stats)
                             except Exception as e:
-                                print(f"Error diffing archive contents: {e}")
+                                logger.warning("Error diffing archive contents: %s", e)
                         # For backward compatibility, keep JAR diff logic
                         elif Utils.is_jar_file(item1_file_info['path']) and Utils.is_jar_file(item2_file_info['path']):
                             try:
                                 jar_diff = self._diff_jar_files(item1_file_info['path'], item2_file_info['path'], path)
                                 diff_item['jar_diff'] = jar_diff
                             except Exception as e:
-                                print(f"Error checking JAR file: {e}")
+                                logger.warning("Error checking JAR file: %s", e)
                         
-                        diffs.append(diff_item)
+                        if diff_type != 'identical':
+                            diffs.append(diff_item)
             elif key in tree1:
                 # Only in tree1
                 item1 = tree1[key]
@@ -243,6 +607,9 @@ class DiffEngine:
                 item1_file_info = item1.get('file_info', item1) if item1_is_archive else item1
                 item1_contents = item1.get('contents', {}) if item1_is_archive else item1
                 
+                if progress is not None:
+                    progress.advance(files=self._count_files(item1))
+                
                 # Add entry for item only in tree1
                 diffs.append({
                     'path': path,
@@ -255,11 +622,11 @@ class DiffEngine:
                 # If it's an archive, add its contents to the diff
                 if item1_is_archive:
                     try:
-                        archive_diff = self._find_differences(item1_contents, {}, path)
+                        archive_diff = self._find_differences(item1_contents, {}, path, compare_stats)
                         if archive_diff:
                             diffs.extend(archive_diff)
                     except Exception as e:
-                        print(f"Error processing archive contents: {e}")
+                        logger.warning("Error processing archive contents: %s", e)
             else:
                 # Only in tree2
                 item2 = tree2[key]
@@ -267,6 +634,9 @@ class DiffEngine:
                 item2_file_info = item2.get('file_info', item2) if item2_is_archive else item2
                 item2_contents = item2.get('contents', {}) if item2_is_archive else item2
                 
+                if progress is not None:
+                    progress.advance(files=self._count_files(item2))
+                
                 # Add entry for item only in tree2
                 diffs.append({
                     'path': path,
@@ -279,17 +649,199 @@ class DiffEngine:
                 # If it's an archive, add its contents to the diff
                 if item2_is_archive:
                     try:
-                        archive_diff = self._find_differences({}, item2_contents, path)
+                        archive_diff = self._find_differences({}, item2_contents, path, compare_stats)
                         if archive_diff:
                             diffs.extend(archive_diff)
                     except Exception as e:
-                        print(f"Error processing archive contents: {e}")
+                        logger.warning("Error processing archive contents: %s", e)
         
         return diffs
     
+    @staticmethod
+    def new_compare_stats():
+        return {
+            # Pairs decided at each tier: 'size', 'known' (both digests already
+            # known), 'sample' (head/tail samples differ), 'digest' (full digest)
+            'tiers': {'size': 0, 'known': 0, 'sample': 0, 'digest': 0},
+            'bytes_read': 0,
+            # Bytes a full digest of every undecided same-size pair would read
+            'bytes_full': 0,
+            # Pairs that only differ in build noise, see normalizers
+            'normalized': 0
+        }
+    
+    @staticmethod
+    def add_compare_stats(total, compare_stats):
+        """Add the compare stats of a part of a diff (a unit or shard) to total"""
+        for tier, count in compare_stats['tiers'].items():
+            total['tiers'][tier] += count
+        total['bytes_read'] += compare_stats['bytes_read']
+        total['bytes_full'] += compare_stats['bytes_full']
+        total['normalized'] += compare_stats.get('normalized', 0)
+    
+    @staticmethod
+    def _count_tier(compare_stats, tier, bytes_read=0, bytes_full=0):
+        if compare_stats is not None:
+            compare_stats['tiers'][tier] += 1
+            compare_stats['bytes_read'] += bytes_read
+            compare_stats['bytes_full'] += bytes_full
+    
+    @staticmethod
+    def _count_normalized(compare_stats):
+        if compare_stats is not None:
+            compare_stats['normalized'] = compare_stats.get('normalized', 0) + 1
+    
+    def _compare_contents(self, file_info1, file_info2, compare_stats=None):
+        """Compare two files of the same size
+        
+        Digests already known (blob store, archive members, earlier
+        comparisons) are used as is. Otherwise large files first compare a
+        hash of their head and tail, and the full streaming digest is only
+        computed when the samples match. Computed digests are stored in the
+        file info for later comparisons.
+        
+        Returns:
+            (bool, str): Whether the contents are identical, and the tier reached
+        """
+        digest1 = file_info1.get('digest')
+        digest2 = file_info2.get('digest')
+        if digest1 and digest2:
+            self._count_tier(compare_stats, 'known')
+            return digest1 == digest2, 'known'
+        
+        size = file_info1['size']
+        bytes_full = (0 if digest1 else size) + (0 if digest2 else size)
+        bytes_read = 0
+        if self.compare_options['tiered'] and size >= self.compare_options['min_tiered_size']:
+            sample1, read1 = self._get_sample_digest(file_info1)
+            sample2, read2 = self._get_sample_digest(file_info2)
+            bytes_read += read1 + read2
+            if sample1 != sample2:
+                self._count_tier(compare_stats, 'sample', bytes_read, bytes_full)
+                return False, 'sample'
+        
+        for file_info in (file_info1, file_info2):
+            if not file_info.get('digest'):
+                self._hash_file_info(file_info)
+                bytes_read += file_info['size']
+        self._count_tier(compare_stats, 'digest', bytes_read, bytes_full)
+        return file_info1['digest'] == file_info2['digest'], 'digest'
+    
+    def _hash_file_info(self, file_info):
+        """Compute the missing full digest of a file info in place"""
+        with self.metrics.phase('hash'):
+            file_info['digest'] = Utils.get_file_hash(file_info['path'], algorithm=self.hash_algorithm)
+        self.metrics.add('hash', bytes=file_info['size'], files=1)
+        self.progress_tracker.task('hash').advance(bytes=file_info['size'], files=1)
+    
+    def _get_normalizers(self, path):
+        return tuple(normalizer for normalizer in self.normalizers if normalizer.matches(path))
+    
+    def _normalized_digest(self, raw_digest, normalizers, read_data):
+        """Digest of the normalized content, memoised by raw digest"""
+        key = (raw_digest, tuple(normalizer.name for normalizer in normalizers))
+        digest = self.normalized_digests.get(key)
+        if digest is not None:
+            self.metrics.cache_hit('normalize')
+            return digest
+        self.metrics.cache_miss('normalize')
+        with self.metrics.phase('normalize'):
+            data = read_data()
+            self.metrics.add('normalize', bytes=len(data), files=1)
+            for normalizer in normalizers:
+                data = normalizer.normalize(data)
+            hash_func = new_hasher(self.hash_algorithm)
+            hash_func.update(data)
+            digest = hash_func.hexdigest()
+        self.normalized_digests.put(key, digest)
+        return digest
+    
+    def _get_normalized_digest(self, file_info, path):
+        """Normalized digest of a file, None when no normalizer applies
+        
+        Archive members are normalized when their archive is indexed, the
+        other files here, where their difference path is known.
+        """
+        if 'normalized_digest' in file_info:
+            return file_info['normalized_digest']
+        if file_info['path'].startswith('!/') or file_info['size'] > self.normalize_options['max_size']:
+            return None
+        normalizers = self._get_normalizers(path)
+        if not normalizers:
+            return None
+        if not file_info.get('digest'):
+            self._hash_file_info(file_info)
+        
+        def read_data():
+            with open(file_info['path'], 'rb') as f:
+                return f.read()
+        file_info['normalized_digest'] = self._normalized_digest(file_info['digest'], normalizers, read_data)
+        return file_info['normalized_digest']
+    
+    def _normalized_equal(self, file_info1, file_info2, path):
+        digest1 = self._get_normalized_digest(file_info1, path)
+        if digest1 is None:
+            return False
+        return digest1 == self._get_normalized_digest(file_info2, path)
+    
+    def _normalize_archive(self, file_path, tree):
+        """Add the normalized digest to the members a normalizer applies to"""
+        zip_file = None
+        try:
+            stack = [tree]
+            while stack:
+                current = stack.pop()
+                for item in current.values():
+                    if not isinstance(item, dict):
+                        continue
+                    if 'size' not in item or isinstance(item['size'], dict):
+                        stack.append(item)
+                        continue
+                    if not item.get('digest') or item['size'] > self.normalize_options['max_size']:
+                        continue
+                    normalizers = self._get_normalizers(item['path'])
+                    if not normalizers:
+                        continue
+                    
+                    def read_data(name=item['path'][2:]):
+                        nonlocal zip_file
+                        if zip_file is None:
+                            zip_file = zipfile.ZipFile(file_path, 'r')
+                        return zip_file.read(name)
+                    item['normalized_digest'] = self._normalized_digest(item['digest'], normalizers, read_data)
+        except Exception as e:
+            logger.warning("Error normalizing archive %s: %s", file_path, e)
+        finally:
+            if zip_file is not None:
+                zip_file.close()
+    
+    def _get_sample_digest(self, file_info):
+        """Digest of the first and last sample_size bytes of a file
+        
+        Returns:
+            (str, int): Sample digest and the bytes read (0 when cached)
+        """
+        if file_info.get('sample_digest'):
+            return file_info['sample_digest'], 0
+        sample_size = self.compare_options['sample_size']
+        size = file_info['size']
+        hash_func = new_hasher(self.hash_algorithm)
+        with self.metrics.phase('sample_hash'), open(file_info['path'], 'rb') as f:
+            head = f.read(sample_size)
+            hash_func.update(head)
+            bytes_read = len(head)
+            if size > sample_size:
+                f.seek(max(sample_size, size - sample_size))
+                tail = f.read(sample_size)
+                hash_func.update(tail)
+                bytes_read += len(tail)
+        self.metrics.add('sample_hash', bytes=bytes_read, files=1)
+        file_info['sample_digest'] = hash_func.hexdigest()
+        return file_info['sample_digest'], bytes_read
+    
     def _diff_jar_files(self, jar1, jar2, jar_path):
         """Diff two JAR files"""
-        print(f"Diffing JAR files: {jar_path}")
+        logger.debug("Diffing JAR files: %s", jar_path)
         
         # Extract JAR contents to temporary directories
         temp_dir1 = Utils.create_temp_dir()
@@ -314,36 +866,321 @@ class DiffEngine:
             Utils.remove_dir(temp_dir1)
             Utils.remove_dir(temp_dir2)
     
+    @contextmanager
+    def text_diff_run(self):
+        """One worker pool and one total_timeout for all attach_text_diffs calls of a run in this thread"""
+        run = self._text_diff_run
+        run.pool = TextDiffPool(self.text_diff_options)
+        run.budget = self.text_diff_options['total_timeout']
+        try:
+            yield
+        finally:
+            run.pool.close()
+            run.pool = run.budget = None
+    
+    def attach_text_diffs(self, diffs):
+        """Compute bounded line diffs for changed text files in worker processes
+        
+        Only top-level files with type content_diff/size_diff and a text
+        extension are considered. Each result is stored as ``text_diff`` on
+        the corresponding diff item. A file still running after the per-file
+        timeout, or after the stage timeout, gets status 'timeout' and its
+        worker process is killed. Inside text_diff_run the stage timeout is
+        shared by all calls.
+        """
+        options = self.text_diff_options
+        if not options.get('enabled', True):
+            return
+        
+        candidates = [diff for diff in diffs if self._is_text_diff_candidate(diff)]
+        if not candidates:
+            return
+        
+        tasks = [(diff['item1']['path'], diff['item2']['path']) for diff in candidates]
+        run = self._text_diff_run
+        if getattr(run, 'pool', None) is None:
+            pool = TextDiffPool(options)
+            try:
+                results = pool.run(tasks)
+            finally:
+                pool.close()
+        else:
+            started = time.monotonic()
+            results = run.pool.run(tasks, total_timeout=run.budget)
+            run.budget = max(0, run.budget - (time.monotonic() - started))
+        for diff, result in zip(candidates, results):
+            if result and result.get('type') == 'text':
+                diff['text_diff'] = {
+                    key: value for key, value in result.items()
+                    if key not in ('type', 'files', 'diff')
+                }
+    
+    def _is_text_diff_candidate(self, diff):
+        """Check whether a diff item should get a line diff"""
+        if diff.get('type') not in ('content_diff', 'size_diff') or diff.get('is_archive'):
+            return False
+        item1 = diff.get('item1') or {}
+        item2 = diff.get('item2') or {}
+        path1 = item1.get('path')
+        path2 = item2.get('path')
+        if not path1 or not path2:
+            return False
+        extensions = tuple(ext.lower() for ext in self.text_diff_options['extensions'])
+        if not diff['path'].lower().endswith(extensions):
+            return False
+        return os.path.isfile(path1) and os.path.isfile(path2)
+    
     def diff_files(self, file1, file2):
-        """Diff two files and return the diff content"""
-        if not os.path.exists(file1) or not os.path.exists(file2):
-            return None
+        """Diff two files and return compact hunks, see TextDiffer.diff_files"""
+        return TextDiffer(self.text_diff_options).diff_files(file1, file2)
+
+
+class TextDiffer:
+    """Bounded line diff of two files, runs in a TextDiffPool worker process"""
+    
+    def __init__(self, options):
+        self.options = options
+    
+    def read_text_lines(self, file_path, deadline):
+        """Read a file as text lines within the configured caps
         
-        # Check if both files are text files
-        if not Utils.is_text_file(file1) or not Utils.is_text_file(file2):
-            # For binary files, just return that they're different
-            return {
-                'type': 'binary',
-                'files': [file1, file2]
-            }
+        Returns:
+            tuple: (status, lines) where status is 'ok', 'binary',
+            'too_large' or 'too_many_lines'
+        """
+        options = self.options
+        if os.path.getsize(file_path) > options['max_file_size']:
+            return 'too_large', None
         
-        # Read both files
-        with open(file1, 'r', encoding='utf-8', errors='ignore') as f1:
-            lines1 = f1.readlines()
+        with open(file_path, 'rb') as f:
+            data = f.read(options['max_file_size'] + 1)
+        if len(data) > options['max_file_size']:
+            return 'too_large', None
+        if not Utils.is_text_data(data):
+            return 'binary', None
+        if time.monotonic() > deadline:
+            raise TextDiffTimeout()
         
-        with open(file2, 'r', encoding='utf-8', errors='ignore') as f2:
-            lines2 = f2.readlines()
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError:
+            text = data.decode('latin-1')
+        
+        lines = text.splitlines()
+        if len(lines) > options['max_lines']:
+            return 'too_many_lines', None
+        return 'ok', lines
+    
+    def build_hunks(self, lines1, lines2, deadline):
+        """Build compact hunks from two lists of lines"""
+        import difflib
         
-        # Generate diff
-        diff = difflib.unified_diff(
-            lines1, lines2,
-            fromfile=os.path.basename(file1),
-            tofile=os.path.basename(file2),
-            lineterm=''
-        )
+        options = self.options
+        max_hunk_lines = options['max_hunk_lines']
+        matcher = difflib.SequenceMatcher(None, lines1, lines2, autojunk=False)
+        
+        hunks = []
+        added = removed = emitted = 0
+        truncated = False
+        for group in matcher.get_grouped_opcodes(options['context_lines']):
+            if time.monotonic() > deadline:
+                raise TextDiffTimeout()
+            
+            hunk_lines = []
+            for tag, i1, i2, j1, j2 in group:
+                if tag == 'equal':
+                    hunk_lines.extend(' ' + line for line in lines1[i1:i2])
+                    continue
+                if tag in ('replace', 'delete'):
+                    hunk_lines.extend('-' + line for line in lines1[i1:i2])
+                    removed += i2 - i1
+                if tag in ('replace', 'insert'):
+                    hunk_lines.extend('+' + line for line in lines2[j1:j2])
+                    added += j2 - j1
+            
+            if truncated:
+                continue
+            if emitted + len(hunk_lines) > max_hunk_lines:
+                hunk_lines = hunk_lines[:max(0, max_hunk_lines - emitted)]
+                truncated = True
+            emitted += len(hunk_lines)
+            
+            first, last = group[0], group[-1]
+            hunks.append({
+                'old_start': first[1] + 1,
+                'old_lines': last[2] - first[1],
+                'new_start': first[3] + 1,
+                'new_lines': last[4] - first[3],
+                'lines': hunk_lines
+            })
+        
+        return hunks, added, removed, truncated
+    
+    def diff_files(self, file1, file2):
+        """Diff two files and return compact hunks
+        
+        Files larger than the configured size or line caps are not diffed,
+        and the diff is abandoned once the per-file timeout is reached.
+        """
+        if not os.path.exists(file1) or not os.path.exists(file2):
+            return None
+        
+        deadline = time.monotonic() + self.options['timeout']
+        try:
+            status1, lines1 = self.read_text_lines(file1, deadline)
+            status2, lines2 = self.read_text_lines(file2, deadline)
+            
+            if 'binary' in (status1, status2):
+                # For binary files, just return that they're different
+                return {
+                    'type': 'binary',
+                    'files': [file1, file2]
+                }
+            for status in (status1, status2):
+                if status != 'ok':
+                    return {'type': 'text', 'status': status, 'files': [file1, file2]}
+            
+            hunks, added, removed, truncated = self.build_hunks(lines1, lines2, deadline)
+        except TextDiffTimeout:
+            return {'type': 'text', 'status': 'timeout', 'files': [file1, file2]}
+        
+        # Unified diff text kept for callers that expect it
+        diff_lines = [f"--- {os.path.basename(file1)}", f"+++ {os.path.basename(file2)}"]
+        for hunk in hunks:
+            diff_lines.append(
+                f"@@ -{hunk['old_start']},{hunk['old_lines']} +{hunk['new_start']},{hunk['new_lines']} @@"
+            )
+            diff_lines.extend(hunk['lines'])
         
         return {
             'type': 'text',
-            'diff': ''.join(diff),
+            'status': 'ok',
+            'hunks': hunks,
+            'added': added,
+            'removed': removed,
+            'truncated': truncated,
+            'diff': '\n'.join(diff_lines),
             'files': [file1, file2]
-        }
\ No newline at end of file
+        }
+
+
+def _text_diff_worker(connection, options):
+    """Worker process loop: (index, file1, file2) in, (index, result) out, None stops"""
+    differ = TextDiffer(options)
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        index, file1, file2 = task
+        try:
+            result = differ.diff_files(file1, file2)
+        except Exception as e:
+            result = {'type': 'text', 'status': 'error', 'error': str(e)}
+        connection.send((index, result))
+
+
+class TextDiffPool:
+    """Text diffs in worker processes that are killed when a file runs past its timeout
+    
+    difflib holds the GIL and can not be interrupted once SequenceMatcher
+    runs, so each diff runs in its own process: one file at a time per
+    worker, started as soon as it is handed over, so the per-file deadline
+    is exact. A killed worker is replaced for the remaining files. Idle
+    workers are kept for the next run() until close().
+    
+    Workers are spawned, not forked: the engine runs next to indexer, fetch
+    and eviction threads whose locks a forked child could inherit held.
+    """
+    
+    START_METHOD = 'spawn'
+    
+    def __init__(self, options):
+        self.options = options
+        self._idle = []
+    
+    def _start_worker(self, context):
+        connection, child_connection = context.Pipe()
+        process = context.Process(target=_text_diff_worker, args=(child_connection, self.options),
+                                  name="text-diff", daemon=True)
+        process.start()
+        child_connection.close()
+        return {'process': process, 'connection': connection, 'index': None, 'deadline': None}
+    
+    @staticmethod
+    def _stop_worker(worker, kill=False):
+        process = worker['process']
+        if not kill:
+            try:
+                worker['connection'].send(None)
+            except (OSError, ValueError):
+                kill = True
+            process.join(1)
+        if kill or process.is_alive():
+            process.kill()
+            process.join()
+        worker['connection'].close()
+    
+    def run(self, tasks, total_timeout=None):
+        """Diff (file1, file2) pairs, returns one result per pair in the same order
+        
+        total_timeout: Seconds for all pairs, default the total_timeout option
+        """
+        import multiprocessing
+        from multiprocessing.connection import wait
+        
+        timeout = self.options['timeout']
+        if total_timeout is None:
+            total_timeout = self.options['total_timeout']
+        if total_timeout <= 0:
+            return [{'type': 'text', 'status': 'timeout'} for _ in tasks]
+        total_deadline = time.monotonic() + total_timeout
+        context = multiprocessing.get_context(self.START_METHOD)
+        results = [None] * len(tasks)
+        pending = list(range(len(tasks) - 1, -1, -1))
+        idle, busy = self._idle, []
+        try:
+            while pending or busy:
+                while pending and len(busy) < max(1, int(self.options['workers'])):
+                    worker = idle.pop() if idle else self._start_worker(context)
+                    index = pending.pop()
+                    worker['connection'].send((index,) + tuple(tasks[index]))
+                    worker.update(index=index, deadline=time.monotonic() + timeout)
+                    busy.append(worker)
+                
+                wake_up = min([total_deadline] + [worker['deadline'] for worker in busy])
+                ready = wait([worker['connection'] for worker in busy], max(0, wake_up - time.monotonic()))
+                for worker in list(busy):
+                    if worker['connection'] not in ready:
+                        continue
+                    busy.remove(worker)
+                    try:
+                        index, result = worker['connection'].recv()
+                        results[index] = result
+                        idle.append(worker)
+                    except (EOFError, OSError):
+                        results[worker['index']] = {'type': 'text', 'status': 'error',
+                                                    'error': "text diff worker exited"}
+                        self._stop_worker(worker, kill=True)
+                
+                now = time.monotonic()
+                for worker in list(busy):
+                    if now >= worker['deadline'] or now >= total_deadline:
+                        busy.remove(worker)
+                        results[worker['index']] = {'type': 'text', 'status': 'timeout'}
+                        self._stop_worker(worker, kill=True)
+                if now >= total_deadline:
+                    for index in pending:
+                        results[index] = {'type': 'text', 'status': 'timeout'}
+                    pending = []
+        finally:
+            for worker in busy:
+                self._stop_worker(worker, kill=True)
+        return results
+    
+    def close(self):
+        """Stop the idle workers"""
+        while self._idle:
+            self._stop_worker(self._idle.pop())
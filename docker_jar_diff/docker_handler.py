@@ -1,57 +1,111 @@
+import io
 import os
+import tarfile
 import platform
 import logging
-from re import split
-import shutil
-import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import json
 from .utils import Utils
 from .cache_manager import CacheManager
-import docker
-
-# Set up logging to file
-logging.basicConfig(
-    filename='docker_handler.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+from .config import load_config
+from .metrics import Metrics
+from .metadata import TarMetadata
+from .progress import ProgressTracker
+
+# Logging is configured by the CLI, importing this module has no side effects
 logger = logging.getLogger(__name__)
 
+# 镜像目录获取方式，可通过配置文件的 "acquire" 节点覆盖
+DEFAULT_ACQUIRE_OPTIONS = {
+    'stream': True,        # 边下载边解压，不再先保存完整的 tar 包（需要开启 cache.dedup）
+    'index_workers': 2     # 下载过程中并行索引已解压 jar/zip 的线程数
+}
+
+
+class _ChunkReader(io.RawIOBase):
+    """Read-only file object over the chunk iterator returned by get_archive"""
+
+    def __init__(self, chunks, on_read=None):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b'')
+        self.bytes_read = 0
+        # Called with the size of every read, for transfer progress
+        self._on_read = on_read
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        self.bytes_read += size
+        if self._on_read:
+            self._on_read(size)
+        return size
+
+
 class DockerHandler:
-    def __init__(self, cache_manager: CacheManager):
+    def __init__(self, cache_manager: CacheManager, config=None, progress=None, metrics=None):
         self.cache_manager = cache_manager
-        # Load configuration - support both development and PyInstaller packaged environments
-        import sys
-        
-        # Try to find config in current working directory first
-        config_path = os.path.join(os.getcwd(), '.config', 'config.json')
-        
-        # If not found, try in program directory
-        if not os.path.exists(config_path):
-            if hasattr(sys, '_MEIPASS'):
-                # Running from PyInstaller bundle
-                app_dir = os.path.dirname(sys.executable)
-            else:
-                # Running from development environment
-                app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            config_path = os.path.join(app_dir, '.config', 'config.json')
-        
-        with open(config_path, 'r') as f:
-            config = json.load(f)
-        
-        # Initialize Docker client from config
-        try:
-            docker_config = config.get('docker', {})
-            base_url = docker_config.get('base_url', 'tcp://127.0.0.1:12375')
-            tls = docker_config.get('tls', False)
-            self.client = docker.DockerClient(base_url=base_url, tls=tls)
-            print("Docker client initialized successfully")
-        except docker.errors.DockerException as e:
-            raise RuntimeError(f"Failed to initialize Docker client: {e}")
+        self.config = config if config is not None else load_config()
+        self.progress = progress
+        self.metrics = metrics or Metrics()
+        self.acquire_options = dict(DEFAULT_ACQUIRE_OPTIONS)
+        self.acquire_options.update(self.config.get('acquire', {}))
+        # Called with the path of every jar/zip as soon as it is extracted, in
+        # worker threads while the rest of the stream is still arriving
+        self.archive_indexer = None
+        # Jars are indexed and directories fetched in the calling thread, for
+        # --profile which only profiles that thread
+        self.single_thread = False
+        # Bytes and files of the transfer, extraction and jar indexing
+        self.progress_tracker = ProgressTracker()
+        self._client = None
+    
+    def _report(self, message):
+        """Send a progress message to the callback, or print it"""
+        if self.progress:
+            self.progress('log', message=message)
+        else:
+            print(message)
     
-    def extract_image(self, image_tar , extract_path):
+    @property
+    def client(self):
+        """Docker client, created on first use"""
+        if self._client is None:
+            # docker is imported lazily, it dominates startup time
+            import docker
+            
+            # Initialize Docker client from config
+            try:
+                docker_config = self.config.get('docker', {})
+                base_url = docker_config.get('base_url', 'tcp://127.0.0.1:12375')
+                tls = docker_config.get('tls', False)
+                self._client = docker.DockerClient(base_url=base_url, tls=tls)
+                self._report("Docker client initialized successfully")
+            except docker.errors.DockerException as e:
+                raise RuntimeError(f"Failed to initialize Docker client: {e}")
+        return self._client
+    
+    def extract_image(self, image_tar , extract_path, on_member=None):
         os.makedirs(extract_path, exist_ok=True)
+        blob_store = self.cache_manager.blob_store
+        if blob_store:
+            # 文件内容写入共享的内容寻址存储，再以硬链接方式放入解压目录
+            file_count = blob_store.extract_tar(str(image_tar), str(extract_path), on_member=on_member)
+            self._report(f"✅ 已解压 {file_count} 个文件（相同内容仅存储一份）")
+            return file_count
+        if on_member:
+            # tar 命令解压前只读取 tar 头
+            with tarfile.open(str(image_tar), 'r:*') as tar:
+                for member in tar:
+                    on_member(member)
         Utils.run_tar_command(
             operation="extract",
             tar_path=str(image_tar),
@@ -61,17 +115,24 @@ class DockerHandler:
         )
 
     def _check_and_pull_image(self, image_name):
-        """Check if image exists locally, pull from Docker Hub if not"""
+        """Check if image exists locally, pull from Docker Hub if not
+        
+        Returns:
+            str: Image ID
+        """
+        import docker
         try:
             # 检查本地是否已存在镜像
-            self.client.images.get(image_name)
-            print(f"✅ 镜像 {image_name} 已存在于本地")
+            image = self.client.images.get(image_name)
+            self._report(f"✅ 镜像 {image_name} 已存在于本地")
+            return image.id
         except docker.errors.ImageNotFound:
             # 本地不存在，从Docker Hub拉取
-            print(f"⏳ 镜像 {image_name} 本地不存在，开始从Docker Hub拉取...")
+            self._report(f"⏳ 镜像 {image_name} 本地不存在，开始从Docker Hub拉取...")
             try:
-                self.client.images.pull(image_name)
-                print(f"✅ 镜像 {image_name} 拉取成功")
+                image = self.client.images.pull(image_name)
+                self._report(f"✅ 镜像 {image_name} 拉取成功")
+                return image.id
             except docker.errors.APIError as e:
                 # 拉取失败，可能是远程镜像不存在
                 if "not found" in str(e).lower():
@@ -88,9 +149,10 @@ class DockerHandler:
 
     def _get_container_directory(self, container, directory):
         """Get the tar archive of a directory from a container"""
+        import docker
         try:
             bits, _ = container.get_archive(directory)
-            print(f"✅ 容器中目录 {directory} 存在并成功获取")
+            self._report(f"✅ 容器中目录 {directory} 存在并成功获取")
             return bits
         except docker.errors.NotFound as e:
             # 捕获目录不存在的异常
@@ -103,80 +165,280 @@ class DockerHandler:
         """Save the tar archive bits to a local file"""
         os.makedirs(save_dir, exist_ok=True)
         save_path = os.path.join(save_dir, filename)
+        transfer = self.progress_tracker.task('transfer')
         with open(save_path, 'wb') as f:
             for chunk in bits:
                 f.write(chunk)
-        print(f"✅ 临时 tar 包已保存：{save_path}")
-        print(f"📦 tar 包大小：{os.path.getsize(save_path) / 1024 / 1024:.2f} MB")
+                transfer.advance(bytes=len(chunk))
+        self._report(f"✅ 临时 tar 包已保存：{save_path}")
+        self._report(f"📦 tar 包大小：{os.path.getsize(save_path) / 1024 / 1024:.2f} MB")
         return save_path
 
-    def _extract_tar_archive(self, tar_path, extract_dir, source_dir):
-        """Extract the tar archive to the specified directory"""
-
+    @staticmethod
+    def _get_extract_target(extract_dir, source_dir):
+        """Directory the archive of source_dir is extracted into
+        
+        get_archive puts the directory itself at the top of the tar, so a
+        sub-directory is extracted into its parent.
+        """
         tmpPath = Path(os.path.join(extract_dir,source_dir.rstrip('/').lstrip('/') ))
-        print(f"[4/4] 解压 tar 包 to {str(tmpPath.parent)}...")
-
         if source_dir.rstrip('/').lstrip('/')!='' :
-          self.extract_image(tar_path, tmpPath.parent)
-        else:
-          self.extract_image(tar_path, tmpPath)
+            return tmpPath.parent
         return tmpPath
 
-    def process_image(self, image_name, compare_dir):
-        """Process an image: pull, save, extract, and extract jar/class files"""
-        image_cache_dir = self.cache_manager.get_image_cache_dir(image_name)
-        extracted_dir = self.cache_manager.get_extracted_dir(image_name)
-        content_dir = self.cache_manager.get_content_dir(image_name)
+    def _extract_tar_archive(self, tar_path, extract_dir, source_dir, on_member=None):
+        """Extract the tar archive to the specified directory"""
+
+        target = self._get_extract_target(extract_dir, source_dir)
+        self._report(f"[4/4] 解压 tar 包 to {str(target)}...")
+
+        with self.metrics.phase('extract'):
+            file_count = self.extract_image(tar_path, target, on_member)
+        self.metrics.add('extract', bytes=os.path.getsize(tar_path), files=file_count or 0)
+        return Path(os.path.join(extract_dir, source_dir.strip('/')))
+
+    def _stream_directory(self, container, directory, extracted_dir, on_file=None, on_member=None):
+        """Extract a directory of a container while its archive is downloaded
+        
+        Every file goes straight from the HTTP stream into the blob store, no
+        tar is written to disk. on_file is called for each extracted file.
+        
+        Returns:
+            int: Number of files extracted
+        """
+        target = self._get_extract_target(extracted_dir, directory)
+        self._report(f"[4/4] 边下载边解压到 {target}...")
+        transfer = self.progress_tracker.task('transfer')
+        with self.metrics.phase('get_archive'):
+            bits = self._get_container_directory(container, directory)
+            reader = _ChunkReader(bits, lambda size: transfer.advance(bytes=size))
+            with self.metrics.phase('extract'):
+                file_count = self.cache_manager.blob_store.extract_stream(
+                    io.BufferedReader(reader, buffer_size=1024 * 1024), str(target), on_file, on_member)
+        self.metrics.add('get_archive', bytes=reader.bytes_read)
+        self.metrics.add('extract', bytes=reader.bytes_read, files=file_count)
+        self._report(f"✅ 已解压 {file_count} 个文件，下载 {reader.bytes_read / 1024 / 1024:.2f} MB")
+        return file_count
+
+    def get_image_id(self, image_name):
+        """Get the ID of an image, pulling it first if needed"""
+        return self._check_and_pull_image(image_name)
+
+    def _fetch_directory(self, container, directory, image_cache_dir, extracted_dir, tar_name, on_file=None):
+        """Download one directory of a container and extract it
+        
+        The tar headers are saved to the metadata directory of the image on
+        the way, see metadata.TarMetadata.
+        
+        Returns:
+            str: Path of the saved tar, None when the archive was streamed
+        """
+        metadata = TarMetadata(directory)
+        extract = self.progress_tracker.task('extract')
+        
+        def on_member(member):
+            metadata.add(member)
+            if member.isreg():
+                extract.advance(bytes=member.size, files=1)
+        
+        if self.acquire_options['stream'] and self.cache_manager.blob_store:
+            self._stream_directory(container, directory, extracted_dir, on_file, on_member)
+            metadata.save(self.get_metadata_dir(image_cache_dir))
+            return None
+        
+        with self.metrics.phase('get_archive'):
+            bits = self._get_container_directory(container, directory)
+            
+            # 4. 保存 tar 包到本地
+            tar_path = self._save_tar_archive(bits, image_cache_dir, tar_name)
+        self.metrics.add('get_archive', bytes=os.path.getsize(tar_path))
+        
+        # 5. 解压 tar 包，tar 包大小即解压进度的总量
+        extract.add_total(bytes=os.path.getsize(tar_path))
+        self._extract_tar_archive(tar_path, extracted_dir, directory, on_member)
+        metadata.save(self.get_metadata_dir(image_cache_dir))
+        return tar_path
+    
+    @staticmethod
+    def get_metadata_dir(image_cache_dir):
+        """Directory with the tar header entries of an image"""
+        return os.path.join(image_cache_dir, "metadata")
+    
+    def read_metadata(self, image_name, compare_dir, cache_key=None):
+        """Read only the tar headers of the compared directories, no file is extracted
+        
+        Returns:
+            dict: Like process_image, with extracted_dir None
+        """
+        cache_key = cache_key or image_name
+        image_cache_dir = self.cache_manager.get_image_cache_dir(cache_key)
+        compare_dirs = Utils.normalize_compare_dirs(compare_dir)
         temp_container = None
-        temp_tar_path = None
-        docker_client = None
+        try:
+            self._report(f"[1/3] 检查镜像 {image_name}...")
+            with self.metrics.phase('pull'):
+                image_id = self._check_and_pull_image(image_name)
+            self._report(f"[2/3] 创建临时容器...")
+            with self.metrics.phase('create_container'):
+                temp_container = self._create_temp_container(image_name)
+            self._report(f"[3/3] 读取目录元数据 {', '.join(compare_dirs)}...")
+            for directory in compare_dirs:
+                metadata = TarMetadata(directory)
+                transfer = self.progress_tracker.task('transfer')
+                with self.metrics.phase('get_archive'):
+                    reader = _ChunkReader(self._get_container_directory(temp_container, directory),
+                                          lambda size: transfer.advance(bytes=size))
+                    entry_count = metadata.read(io.BufferedReader(reader, buffer_size=1024 * 1024))
+                self.metrics.add('get_archive', bytes=reader.bytes_read, files=entry_count)
+                metadata.save(self.get_metadata_dir(image_cache_dir))
+                self._report(f"✅ {directory}: {entry_count} 个条目")
+        except Exception as e:
+            self._report(f"Error processing image {image_name}: {e}")
+            return {'error': str(e)}
+        finally:
+            self.progress_tracker.finish('transfer')
+            if temp_container:
+                self._report("\n🧹 清理临时容器...")
+                try:
+                    temp_container.remove(v=True)
+                except Exception:
+                    pass
+        return {
+            'image_id': image_id,
+            'image_cache_dir': image_cache_dir,
+            'extracted_dir': None,
+            'metadata_dir': self.get_metadata_dir(image_cache_dir),
+            'compare_dirs': compare_dirs
+        }
+
+    def process_image(self, image_name, compare_dir, cache_key=None, skip_dirs=None, on_directory=None):
+        """Process an image: pull, save, extract, and extract jar/class files
+        
+        Args:
+            compare_dir: Directory to fetch, or a list of directories which are
+                all fetched in parallel from one temporary container
+            cache_key: Name of the cache directories, defaults to the image name
+            skip_dirs: Directories already extracted by an interrupted run, the
+                others are fetched again from scratch
+            on_directory: Called with each directory once it is fully extracted
+        """
+        cache_key = cache_key or image_name
+        image_cache_dir = self.cache_manager.get_image_cache_dir(cache_key)
+        extracted_dir = self.cache_manager.get_extracted_dir(cache_key)
+        content_dir = self.cache_manager.get_content_dir(cache_key)
+        temp_container = None
+        image_id = None
+        compare_dirs = Utils.normalize_compare_dirs(compare_dir)
         
-        if not compare_dir:
-            compare_dir = '/'
+        # Jars are indexed as soon as they are extracted, overlapping the download
+        indexer = None
+        index_futures = []
+        on_file = None
+        if self.archive_indexer and self.acquire_options['stream'] and self.cache_manager.blob_store:
+            if not self.single_thread:
+                indexer = ThreadPoolExecutor(max_workers=max(1, int(self.acquire_options['index_workers'])),
+                                             thread_name_prefix="archive-index")
+            
+            index_progress = self.progress_tracker.task('archive_index')
+            
+            def on_file(file_path):
+                if Utils.is_archive_file(file_path):
+                    index_progress.add_total(files=1)
+                    if indexer is None:
+                        self.archive_indexer(file_path)
+                        index_progress.advance(files=1)
+                        return
+                    future = indexer.submit(self.archive_indexer, file_path)
+                    future.add_done_callback(lambda future: index_progress.advance(files=1))
+                    index_futures.append(future)
             
         try:
             # 1. 检查并拉取镜像
-            print(f"[1/4] 检查镜像 {image_name}...")
-            self._check_and_pull_image(image_name)
+            self._report(f"[1/4] 检查镜像 {image_name}...")
+            with self.metrics.phase('pull'):
+                image_id = self._check_and_pull_image(image_name)
             
             # 2. 创建临时容器
-            print(f"[2/4] 创建临时容器...")
-            temp_container = self._create_temp_container(image_name)
+            self._report(f"[2/4] 创建临时容器...")
+            with self.metrics.phase('create_container'):
+                temp_container = self._create_temp_container(image_name)
             
             # 3. 获取容器目录的 tar 包
-            print(f"[3/4] 下载镜像目录 {compare_dir}...")
-            bits = self._get_container_directory(temp_container, compare_dir)
-            
-            # 4. 保存 tar 包到本地
-            temp_tar_path = self._save_tar_archive(bits, image_cache_dir)
+            fetch_dirs = compare_dirs
+            if skip_dirs is not None:
+                fetch_dirs = [directory for directory in compare_dirs if directory not in skip_dirs]
+                if len(fetch_dirs) < len(compare_dirs):
+                    self._report(f"♻️ 已解压的目录: {', '.join(sorted(set(compare_dirs) - set(fetch_dirs)))}")
+                # Whatever an interrupted run left of the other directories is incomplete
+                for directory in fetch_dirs:
+                    Utils.remove_dir(os.path.join(extracted_dir, directory.strip('/')))
+            self._report(f"[3/4] 下载镜像目录 {', '.join(fetch_dirs)}...")
+            if len(compare_dirs) == 1 and fetch_dirs:
+                directory = compare_dir if compare_dir and isinstance(compare_dir, str) else compare_dirs[0]
+                self._fetch_directory(temp_container, directory, image_cache_dir, extracted_dir, "image.tar", on_file)
+                if on_directory:
+                    on_directory(compare_dirs[0])
+            elif fetch_dirs and self.single_thread:
+                for directory in fetch_dirs:
+                    self._fetch_directory(temp_container, directory, image_cache_dir, extracted_dir,
+                                          f"image_{directory.strip('/').replace('/', '_')}.tar", on_file)
+                    if on_directory:
+                        on_directory(directory)
+            elif fetch_dirs:
+                # 同一个临时容器，多个目录并行下载和解压
+                with ThreadPoolExecutor(max_workers=len(fetch_dirs)) as executor:
+                    futures = {
+                        executor.submit(self._fetch_directory, temp_container, directory, image_cache_dir,
+                                        extracted_dir, f"image_{directory.strip('/').replace('/', '_')}.tar",
+                                        on_file): directory
+                        for directory in fetch_dirs
+                    }
+                    for future, directory in futures.items():
+                        future.result()
+                        if on_directory:
+                            on_directory(directory)
             
-            # 5. 解压 tar 包
-            self._extract_tar_archive(temp_tar_path, extracted_dir, compare_dir)
+            # Wait for the jars still being indexed, build_tree then only hits the cache
+            if index_futures:
+                with self.metrics.phase('archive_prefetch'):
+                    for future in index_futures:
+                        future.result()
+                self.metrics.add('archive_prefetch', files=len(index_futures))
             
             # Extract jar and class files
             #self.extract_jar_class_files(image_name, content_dir)
         except Exception as e:
-            print(f"Error processing image {image_name}: {e}")
+            self._report(f"Error processing image {image_name}: {e}")
             return {'error':str(e)}
         finally:
+            if indexer:
+                indexer.shutdown(wait=True)
+            for name in ('transfer', 'extract', 'archive_index'):
+                self.progress_tracker.finish(name)
             if temp_container:
-                print("\n🧹 清理临时容器...")
+                self._report("\n🧹 清理临时容器...")
             try:
                 temp_container.remove(v=True)
             except:
                 pass
-            self.cleanup()
+            # The Docker client stays open for the next image, cleanup() closes it
     
         return {
+            'image_id': image_id,
             'image_cache_dir': image_cache_dir,
             'extracted_dir': extracted_dir,
-            'content_dir': content_dir
+            'content_dir': content_dir,
+            'metadata_dir': self.get_metadata_dir(image_cache_dir),
+            'compare_dirs': compare_dirs
         }
         
     def cleanup(self):
         """Cleanup Docker client resources"""
+        if self._client is None:
+            return
         try:
-            self.client.close()
-            print("Docker client closed successfully")
+            client, self._client = self._client, None
+            client.close()
+            self._report("Docker client closed successfully")
         except Exception as e:
-            print(f"Error closing Docker client: {e}")
\ No newline at end of file
+            self._report(f"Error closing Docker client: {e}")
\ No newline at end of file
@@ -0,0 +1,314 @@
+"""Bounded-memory diff through sorted on-disk indexes, see --low-memory
+
+The files of each image are indexed one by one into records keyed by their
+path parts joined with NUL, which sorts exactly like the sorted-key
+recursion of DiffEngine._find_differences. Records are kept in memory until
+``memory_mb`` is reached, then sorted and spilled to a run file. The runs
+are merged (in several passes above ``merge_fan_in`` runs) and both sorted
+streams are walked side by side. Only the entry at hand is given to
+_find_differences, so the differences are the same as those of
+diff_directories while the trees of both images never exist in memory.
+The one exception is a directory only one image has: its files are
+reported one by one instead of one difference holding the whole subtree.
+Differences are spooled to disk while the indexes are walked and read back
+for the result once the runs are closed. At most ``max_differences`` of them
+are read back, the others only reach the on_unit callback (--format, --live)
+and are counted per type in ``omitted_differences`` of the result.
+"""
+import os
+import json
+import logging
+import heapq
+import shutil
+import tempfile
+
+from .api import summarize_differences
+
+# 低内存比对参数，可通过配置文件的 "low_memory" 节点覆盖
+DEFAULT_LOW_MEMORY_OPTIONS = {
+    'enabled': False,      # 用外部排序逐条比对，内存占用不再随镜像大小增长（--low-memory）
+    'memory_mb': 256,      # 每个镜像的索引记录在内存中的上限，超过后排序写入磁盘
+    'merge_fan_in': 64,    # 每次归并的最大分段数，更多分段时分多轮归并
+    'archive_cache': 32,   # 内存中保留的归档索引数
+    'batch_size': 1000,    # 每比对多少条记录通知一次实时报告和输出文件
+    'max_differences': 100000  # 读回 diff.json 和报告的差异数上限，其余只写入 --format 输出，0 为不限
+}
+
+SEPARATOR = '\x00'
+# Rough per-record overhead of the tuple and strings kept in memory
+RECORD_OVERHEAD = 160
+
+logger = logging.getLogger(__name__)
+
+
+class ExternalSorter:
+    """Sort (key, seq, entry) records with a memory ceiling, spilling sorted runs to disk"""
+
+    def __init__(self, run_dir, memory_limit, fan_in=64, metrics=None):
+        self.run_dir = run_dir
+        self.memory_limit = max(1, int(memory_limit))
+        self.fan_in = max(2, int(fan_in))
+        self.metrics = metrics
+        self.count = 0
+        self.runs = []
+        self._buffer = []
+        self._buffer_size = 0
+        os.makedirs(run_dir, exist_ok=True)
+
+    def add(self, key, seq, entry):
+        line = json.dumps([key, seq, entry])
+        self._buffer.append((key, line))
+        self._buffer_size += len(line) + len(key) + RECORD_OVERHEAD
+        self.count += 1
+        if self._buffer_size >= self.memory_limit:
+            self._spill()
+
+    def _spill(self):
+        if not self._buffer:
+            return
+        self._buffer.sort(key=lambda item: item[0])
+        self.runs.append(self._write_run(line for _, line in self._buffer))
+        self._buffer = []
+        self._buffer_size = 0
+
+    def _write_run(self, lines):
+        fd, path = tempfile.mkstemp(prefix='run_', suffix='.jsonl', dir=self.run_dir)
+        size = 0
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line + '\n')
+                size += len(line) + 1
+        if self.metrics is not None:
+            self.metrics.add('external_sort', bytes=size, files=1)
+        return path
+
+    @staticmethod
+    def _read_run(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def _merge_runs(self, paths):
+        return heapq.merge(*(self._read_run(path) for path in paths), key=lambda record: record[0])
+
+    def __iter__(self):
+        """Records [key, seq, entry] in key order"""
+        if not self.runs:
+            self._buffer.sort(key=lambda item: item[0])
+            return (json.loads(line) for _, line in self._buffer)
+        self._spill()
+        # Merge groups of runs until one pass can open all of them
+        while len(self.runs) > self.fan_in:
+            merged = []
+            for start in range(0, len(self.runs), self.fan_in):
+                group = self.runs[start:start + self.fan_in]
+                merged.append(self._write_run(json.dumps(record) for record in self._merge_runs(group)))
+                for path in group:
+                    os.remove(path)
+            self.runs = merged
+        return self._merge_runs(self.runs)
+
+    def close(self):
+        self._buffer = []
+        for path in self.runs:
+            if os.path.exists(path):
+                os.remove(path)
+        self.runs = []
+
+
+class _Cursor:
+    """Sorted records of one image, looked at one ahead"""
+
+    def __init__(self, records):
+        self._records = iter(records)
+        self.count = 0
+        self._advance()
+
+    def _advance(self):
+        record = next(self._records, None)
+        self.head = None if record is None else (tuple(record[0].split(SEPARATOR)), record[1], record[2])
+
+    def peek(self, prefix):
+        """The next record if it lies below prefix"""
+        head = self.head
+        if head is not None and head[0][:len(prefix)] == prefix:
+            return head
+        return None
+
+    def take(self, prefix):
+        while self.peek(prefix) is not None:
+            head = self.head
+            self._advance()
+            self.count += 1
+            yield head
+
+
+def index_view(diff_engine, extracted_dir, compare_dir, sorter):
+    """Add a record per tree entry build_tree would hold, the walk order is the seq"""
+    for seq, (parts, entry) in enumerate(diff_engine.iter_view_entries(extracted_dir, compare_dir)):
+        sorter.add(SEPARATOR.join(parts), seq, entry)
+        diff_engine.metrics.add('build_tree', files=1)
+    return sorter
+
+
+class ExternalDiff:
+    """Walk two sorted indexes side by side, see the module docstring"""
+
+    def __init__(self, diff_engine, compare_stats, on_batch=None, batch_size=1000):
+        self.diff_engine = diff_engine
+        self.compare_stats = compare_stats
+        self.on_batch = on_batch
+        self.batch_size = max(1, int(batch_size))
+        self._pending = []
+        self._reported = 0
+
+    def run(self, records1, records2, base_path):
+        """Walk both streams, the differences are only handed to on_batch"""
+        self.cursor1 = _Cursor(records1)
+        self.cursor2 = _Cursor(records2)
+        self._merge((), base_path)
+        self._flush()
+
+    def _merge(self, prefix, base_path):
+        depth = len(prefix)
+        cursor1, cursor2 = self.cursor1, self.cursor2
+        while True:
+            head1 = cursor1.peek(prefix)
+            head2 = cursor2.peek(prefix)
+            if head1 is None and head2 is None:
+                return
+            key1 = head1[0][depth] if head1 is not None else None
+            key2 = head2[0][depth] if head2 is not None else None
+            key = min(k for k in (key1, key2) if k is not None)
+            path_prefix = prefix + (key,)
+            if key1 == key2:
+                is_file1 = len(head1[0]) == depth + 1
+                is_file2 = len(head2[0]) == depth + 1
+                if not is_file1 and not is_file2:
+                    # Both are directories, recurse like _find_differences
+                    self._merge(path_prefix, os.path.join(base_path, key).replace('\\', '/'))
+                    continue
+                if is_file1 != is_file2:
+                    # A file in one image and a directory in the other, _find_differences lists neither
+                    for _ in cursor1.take(path_prefix):
+                        pass
+                    for _ in cursor2.take(path_prefix):
+                        pass
+                    self._advanced()
+                    continue
+            elif len((head1 if key1 == key else head2)[0]) > depth + 1:
+                # A directory only one image has, its files are streamed one by one
+                self._take_one_sided(cursor1 if key1 == key else cursor2, path_prefix, base_path, key1 == key)
+                continue
+            tree1 = {key: next(cursor1.take(path_prefix))[2]} if key1 == key else {}
+            tree2 = {key: next(cursor2.take(path_prefix))[2]} if key2 == key else {}
+            self.diff_engine.seed_hash_total(tree1, tree2)
+            self._pending.extend(self.diff_engine._find_differences(tree1, tree2, base_path, self.compare_stats))
+            self._advanced()
+
+    def _take_one_sided(self, cursor, path_prefix, base_path, in_first):
+        """only_in differences of each file below path_prefix, without rebuilding the subtree"""
+        depth = len(path_prefix) - 1
+        for parts, _, entry in cursor.take(path_prefix):
+            parent = base_path
+            for part in parts[depth:-1]:
+                parent = os.path.join(parent, part).replace('\\', '/')
+            tree = {parts[-1]: entry}
+            trees = (tree, {}) if in_first else ({}, tree)
+            self._pending.extend(self.diff_engine._find_differences(*trees, parent, self.compare_stats))
+            self._advanced()
+
+    def _advanced(self):
+        done = self.cursor1.count + self.cursor2.count
+        if done - self._reported >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        done = self.cursor1.count + self.cursor2.count
+        self.diff_engine.progress_tracker.task('diff').advance(files=done - self._reported)
+        self._reported = done
+        diffs, self._pending = self._pending, []
+        with self.diff_engine.metrics.phase('text_diff'):
+            self.diff_engine.attach_text_diffs(diffs)
+        if self.on_batch:
+            self.on_batch(diffs, done)
+
+
+def diff_external(diff_engine, dir1, dir2, compare_dir=None, work_dir=None, options=None, on_unit=None):
+    """Diff two directories through sorted on-disk indexes
+
+    Args:
+        work_dir: Directory of the sorted runs, removed afterwards
+        options: See DEFAULT_LOW_MEMORY_OPTIONS
+        on_unit: Optional callback on_unit(unit, differences, done, total)
+            like sharding.diff_by_units, called every ``batch_size`` records
+            with the records walked so far as done
+
+    Returns:
+        dict: The result of DiffEngine.diff_directories, with the files of a
+            directory only one image has listed one by one. Differences past
+            ``max_differences`` are left out and counted per type in
+            ``omitted_differences``
+    """
+    settings = dict(DEFAULT_LOW_MEMORY_OPTIONS)
+    if options:
+        settings.update(options)
+    metrics = diff_engine.metrics
+    work_dir = tempfile.mkdtemp(prefix='sort_', dir=work_dir)
+    memory_limit = int(settings['memory_mb'] * 1024 * 1024)
+    sorters = [ExternalSorter(os.path.join(work_dir, str(index)), memory_limit, settings['merge_fan_in'], metrics)
+               for index in (1, 2)]
+    try:
+        with metrics.phase('build_tree'):
+            for sorter, extracted_dir in zip(sorters, (dir1, dir2)):
+                index_view(diff_engine, extracted_dir, compare_dir, sorter)
+        total = sorters[0].count + sorters[1].count
+        diff_engine.progress_tracker.task('diff', total_files=total)
+
+        spool_path = os.path.join(work_dir, 'differences.jsonl')
+        compare_stats = diff_engine.new_compare_stats()
+        with open(spool_path, 'w', encoding='utf-8') as spool:
+            def on_batch(diffs, done):
+                for diff in diffs:
+                    spool.write(json.dumps(diff) + '\n')
+                if on_unit:
+                    on_unit(None, diffs, done, total)
+
+            walker = ExternalDiff(diff_engine, compare_stats, on_batch, settings['batch_size'])
+            base_path = diff_engine._get_root_dir(diff_engine._resolve_compare_dir(compare_dir))
+            with metrics.phase('find_differences'), diff_engine.text_diff_run():
+                walker.run(iter(sorters[0]), iter(sorters[1]), base_path)
+        metrics.add('find_differences', bytes=compare_stats['bytes_read'])
+        diff_engine.progress_tracker.finish('diff')
+        for sorter in sorters:
+            sorter.close()
+        diffs, omitted = read_spool(spool_path, int(settings['max_differences']))
+        result = diff_engine.assemble_result(dir1, dir2, compare_dir, compare_stats, diffs)
+        if omitted:
+            logger.warning("差异过多，结果中只保留前 %d 条，其余 %d 条只写入 --format 输出",
+                           len(diffs), sum(omitted.values()))
+            result['omitted_differences'] = omitted
+        return result
+    finally:
+        for sorter in sorters:
+            sorter.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def read_spool(spool_path, limit):
+    """Differences of the spool, at most ``limit`` of them (0 for all)
+
+    Returns:
+        tuple: (differences, {type: count} of the differences left out,
+            archive contents included like api.summarize_differences)
+    """
+    diffs = []
+    omitted = {}
+    with open(spool_path, 'r', encoding='utf-8') as spool:
+        for line in spool:
+            if not limit or len(diffs) < limit:
+                diffs.append(json.loads(line))
+                continue
+            for diff_type, count in summarize_differences([json.loads(line)]).items():
+                omitted[diff_type] = omitted.get(diff_type, 0) + count
+    return diffs, omitted
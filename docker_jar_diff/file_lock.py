@@ -0,0 +1,80 @@
+import os
+import platform
+
+if platform.system() == "Windows":
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    """Advisory inter-process lock backed by a lock file
+
+    Uses fcntl.flock on Linux/macOS and msvcrt.locking on Windows. The lock
+    is released automatically by the OS when the owning process exits, so a
+    crashed task never blocks eviction forever.
+    """
+
+    def __init__(self, lock_path):
+        self.lock_path = lock_path
+        self._fd = None
+
+    @property
+    def locked(self):
+        return self._fd is not None
+
+    def acquire(self, blocking=True):
+        """Acquire the lock, returns False if non-blocking and held elsewhere"""
+        if self._fd is not None:
+            return True
+
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if platform.system() == "Windows":
+                mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, mode, 1)
+            else:
+                flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                fcntl.flock(fd, flags)
+        except OSError:
+            os.close(fd)
+            return False
+
+        # Record the owner for debugging, the lock itself is the OS lock
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self, remove=False):
+        """Release the lock and optionally delete the lock file"""
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            if remove and platform.system() != "Windows":
+                # Unlink while still holding the lock so no one locks a stale file
+                os.remove(self.lock_path)
+            if platform.system() == "Windows":
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+        if remove and platform.system() == "Windows":
+            try:
+                os.remove(self.lock_path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
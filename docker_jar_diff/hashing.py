@@ -0,0 +1,107 @@
+import os
+import mmap
+import zlib
+import hashlib
+import threading
+
+# 摘要算法配置，可通过配置文件的 "hash" 节点覆盖
+DEFAULT_HASH_OPTIONS = {
+    'algorithm': 'md5'
+}
+
+# Cryptographic digests from hashlib, plus non-cryptographic checksums that
+# are only meant for equality checks
+HASHLIB_ALGORITHMS = ('md5', 'sha1', 'sha256', 'blake2b', 'blake2s')
+CHECKSUM_ALGORITHMS = ('crc32', 'xxh64', 'xxh3_64', 'xxh128')
+SUPPORTED_ALGORITHMS = HASHLIB_ALGORITHMS + CHECKSUM_ALGORITHMS
+
+# Files at least this large are hashed straight from an mmap
+MMAP_THRESHOLD = 8 * 1024 * 1024
+BUFFER_SIZE = 1024 * 1024
+
+_buffers = threading.local()
+
+
+class _Crc32:
+    """hashlib-like wrapper around zlib.crc32"""
+    name = 'crc32'
+
+    def __init__(self):
+        self._value = 0
+
+    def update(self, data):
+        self._value = zlib.crc32(data, self._value)
+
+    def hexdigest(self):
+        return f"{self._value & 0xffffffff:08x}"
+
+
+def validate_algorithm(algorithm):
+    """Check that an algorithm is supported and available
+
+    Raises:
+        ValueError: Unknown algorithm, or xxhash is not installed
+    """
+    if algorithm not in SUPPORTED_ALGORITHMS:
+        raise ValueError(f"不支持的摘要算法: {algorithm}，可选: {', '.join(SUPPORTED_ALGORITHMS)}")
+    if algorithm.startswith('xxh'):
+        try:
+            import xxhash  # noqa: F401
+        except ImportError:
+            raise ValueError(f"摘要算法 {algorithm} 需要安装 xxhash (pip install xxhash)")
+    return algorithm
+
+
+def new_hasher(algorithm='md5'):
+    """Create an object with update() and hexdigest() for an algorithm"""
+    if algorithm == 'crc32':
+        return _Crc32()
+    if algorithm.startswith('xxh'):
+        import xxhash
+        return getattr(xxhash, algorithm)()
+    if algorithm == 'blake2b':
+        # 32 byte digests are as strong as needed here and shorter in reports
+        return hashlib.blake2b(digest_size=32)
+    return hashlib.new(algorithm)
+
+
+def _get_buffer():
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _buffers.buffer = bytearray(BUFFER_SIZE)
+    return buffer
+
+
+def hash_file(file_path, algorithm='md5'):
+    """Hash a file without per-chunk allocations
+
+    Large files are hashed from an mmap, the hash function reads the pages
+    directly. Smaller files are read with readinto() into a per-thread
+    buffer that is reused across calls.
+    """
+    hasher = new_hasher(algorithm)
+    with open(file_path, 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    hasher.update(mapped)
+                return hasher.hexdigest()
+            except (OSError, ValueError):
+                # Not mappable (special files, some network filesystems)
+                f.seek(0)
+                hasher = new_hasher(algorithm)
+        buffer = _get_buffer()
+        view = memoryview(buffer)
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            hasher.update(view[:count])
+    return hasher.hexdigest()
+
+
+def hash_bytes(data, algorithm='md5'):
+    hasher = new_hasher(algorithm)
+    hasher.update(data)
+    return hasher.hexdigest()
@@ -0,0 +1,319 @@
+"""Path history across every image processed in a cache directory
+
+After an image is acquired its manifest (every file of the compared
+directories and every member of their jar/zip files, with its digest) is
+added to an inverted index in ``<cache>/history.db``, keyed by path. The
+``history`` command answers "in which image did this path last change?"
+from the index alone, without Docker.
+
+Paths and images are stored once and referenced by number, entries are a
+clustered (path, archive, image) key with the raw digest bytes, so a query
+is a single index range scan. An image is recorded once per directory,
+directories recorded by an earlier run are skipped.
+
+Recording is opt-in: every file digest that lazy or tiered hashing skipped
+is computed when the image is recorded. Images are listed in the order they
+were first recorded, which is not their release order when an older
+release is compared later; query() accepts an explicit order.
+"""
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+from .utils import Utils
+
+# 路径历史索引参数，可通过配置文件的 "history" 节点覆盖
+DEFAULT_HISTORY_OPTIONS = {
+    'enabled': False,    # 记录每个处理过的镜像的文件清单，供 history 命令查询；未计算的摘要会在记录时计算
+    'archives': True,    # 同时记录 jar/zip 内的成员
+    'batch_size': 5000   # 每批写入的条目数
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    image_id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    recorded_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS image_dirs (
+    image INTEGER NOT NULL,
+    dir TEXT NOT NULL,
+    PRIMARY KEY (image, dir)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS paths (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS entries (
+    path INTEGER NOT NULL,
+    archive INTEGER NOT NULL,
+    image INTEGER NOT NULL,
+    digest BLOB,
+    size INTEGER,
+    PRIMARY KEY (path, archive, image)
+) WITHOUT ROWID;
+"""
+
+# archive of the entries that are not inside an archive
+NO_ARCHIVE = 0
+ARCHIVE_SEPARATOR = '!/'
+
+
+def get_history_path(base_cache_dir, algorithm='md5'):
+    """Index file of a cache directory, one per digest algorithm like the blob store"""
+    name = "history.db" if algorithm == 'md5' else f"history_{algorithm}.db"
+    return os.path.join(base_cache_dir, name)
+
+
+def _pack_digest(digest):
+    if not digest:
+        return None
+    try:
+        return bytes.fromhex(digest)
+    except ValueError:
+        return digest.encode('utf-8')
+
+
+def _unpack_digest(digest):
+    return digest.hex() if digest is not None else None
+
+
+def _dir_covers(directory, path):
+    directory = directory.rstrip('/')
+    return not directory or path == directory or path.startswith(directory + '/')
+
+
+def iter_archive_members(contents, prefix=''):
+    """(member path, file info) of an archive index built by DiffEngine"""
+    stack = [(contents, prefix)]
+    while stack:
+        current, current_path = stack.pop()
+        for key, item in current.items():
+            if not isinstance(item, dict):
+                continue
+            path = f"{current_path}/{key}" if current_path else key
+            if 'size' in item and not isinstance(item['size'], dict):
+                yield path, item
+            else:
+                stack.append((item, path))
+
+
+class HistoryIndex:
+    """Inverted index path -> (image, digest) in a SQLite file"""
+
+    def __init__(self, db_path, options=None):
+        self.db_path = db_path
+        self.options = dict(DEFAULT_HISTORY_OPTIONS)
+        if options:
+            self.options.update(options)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=60)
+        connection.executescript(SCHEMA)
+        return connection
+
+    def get_recorded_dirs(self, image_id):
+        if not os.path.exists(self.db_path):
+            return []
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT dir FROM image_dirs JOIN images ON images.id = image_dirs.image WHERE image_id = ?",
+                (image_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def get_missing_dirs(self, image_id, compare_dir=None):
+        """Compared directories of an image that are not in the index yet"""
+        recorded = self.get_recorded_dirs(image_id)
+        return [directory for directory in Utils.normalize_compare_dirs(compare_dir)
+                if not any(_dir_covers(done, directory) for done in recorded)]
+
+    def record(self, image_name, image_id, compare_dir, diff_engine, extracted_dir):
+        """Add the files of an acquired image, skipping directories recorded before
+
+        Digests still unknown after acquisition (lazy hashing without the
+        blob store) are computed here.
+
+        Returns:
+            int: Number of entries added
+        """
+        directories = self.get_missing_dirs(image_id, compare_dir)
+        if not directories:
+            return 0
+        batch_size = max(1, int(self.options['batch_size']))
+        count = 0
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("INSERT OR IGNORE INTO images (image_id, name, recorded_at) VALUES (?, ?, ?)",
+                                   (image_id, image_name, datetime.now().isoformat(timespec='seconds')))
+                image = connection.execute("SELECT id FROM images WHERE image_id = ?", (image_id,)).fetchone()[0]
+            path_ids = {}
+
+            def path_id(path):
+                cached = path_ids.get(path)
+                if cached is not None:
+                    return cached
+                connection.execute("INSERT OR IGNORE INTO paths (path) VALUES (?)", (path,))
+                cached = path_ids[path] = connection.execute(
+                    "SELECT id FROM paths WHERE path = ?", (path,)).fetchone()[0]
+                return cached
+
+            for directory in directories:
+                rows = []
+                for parts, entry in diff_engine.iter_view_entries(extracted_dir, directory):
+                    path = os.path.join(directory, *parts).replace('\\', '/')
+                    file_info = entry.get('file_info', entry) if entry.get('is_archive') else entry
+                    digest = file_info.get('digest')
+                    if digest is None:
+                        hashed = diff_engine._get_file_info(file_info['path'])
+                        digest = hashed['digest'] if hashed else None
+                    file_id = path_id(path)
+                    rows.append((file_id, NO_ARCHIVE, image, _pack_digest(digest), file_info['size']))
+                    if entry.get('is_archive') and self.options['archives']:
+                        for member_path, member_info in iter_archive_members(entry.get('contents', {})):
+                            rows.append((path_id(member_path), file_id, image,
+                                         _pack_digest(member_info.get('digest')), member_info['size']))
+                    if len(rows) >= batch_size:
+                        count += self._insert(connection, rows)
+                        rows = []
+                count += self._insert(connection, rows)
+                # Only a directory recorded to the end is skipped next time
+                with connection:
+                    connection.execute("INSERT OR IGNORE INTO image_dirs (image, dir) VALUES (?, ?)",
+                                       (image, directory))
+        finally:
+            connection.close()
+        return count
+
+    @staticmethod
+    def _insert(connection, rows):
+        with connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO entries (path, archive, image, digest, size) VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def images(self, order=None):
+        """Recorded images in recording order
+
+        order: Optional image names or IDs in release order, the images it
+            lists come first in that order, the others follow in recording order
+        """
+        if not os.path.exists(self.db_path):
+            return []
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT id, image_id, name, recorded_at FROM images ORDER BY id").fetchall()
+            dirs = {}
+            for image, directory in connection.execute("SELECT image, dir FROM image_dirs"):
+                dirs.setdefault(image, []).append(directory)
+        images = [{'id': row[0], 'image_id': row[1], 'name': row[2], 'recorded_at': row[3],
+                   'compare_dirs': sorted(dirs.get(row[0], []))} for row in rows]
+        if order:
+            rank = {key: index for index, key in enumerate(order)}
+            images.sort(key=lambda image: min(rank.get(image['name'], len(rank)),
+                                              rank.get(image['image_id'], len(rank))))
+        return images
+
+    def query(self, path, order=None):
+        """History of a path over the recorded images, in recording order or ``order`` (see images)
+
+        ``path`` is an image path (/app/lib/foo.jar), a member of one archive
+        (/app/lib/foo.jar!/com/acme/Foo.class) or a member path in any
+        archive (com/acme/Foo.class).
+
+        Returns:
+            list: One dict per image that covers the path: name, image_id,
+            recorded_at, locations (archive, digest, size) and change, one of
+            'added', 'changed', 'unchanged', 'removed' or 'absent'
+        """
+        archive_path = None
+        if ARCHIVE_SEPARATOR in path:
+            archive_path, path = path.split(ARCHIVE_SEPARATOR, 1)
+        elif not path.startswith('/'):
+            archive_path = ''
+        path = path.rstrip('/') if path != '/' else path
+
+        images = self.images(order)
+        if not images:
+            return []
+        with closing(self._connect()) as connection:
+            path_row = connection.execute("SELECT id FROM paths WHERE path = ?", (path,)).fetchone()
+            rows = []
+            if path_row is None:
+                pass
+            elif archive_path is None:
+                rows = connection.execute(
+                    "SELECT image, NULL, digest, size FROM entries WHERE path = ? AND archive = ?",
+                    (path_row[0], NO_ARCHIVE)).fetchall()
+            elif archive_path:
+                archive_row = connection.execute("SELECT id FROM paths WHERE path = ?",
+                                                 (archive_path.rstrip('/'),)).fetchone()
+                if archive_row is not None:
+                    rows = connection.execute(
+                        "SELECT image, ?, digest, size FROM entries WHERE path = ? AND archive = ?",
+                        (archive_path.rstrip('/'), path_row[0], archive_row[0])).fetchall()
+            else:
+                rows = connection.execute(
+                    "SELECT entries.image, paths.path, entries.digest, entries.size FROM entries "
+                    "JOIN paths ON paths.id = entries.archive WHERE entries.path = ? AND entries.archive != ?",
+                    (path_row[0], NO_ARCHIVE)).fetchall()
+
+        locations = {}
+        for image, archive, digest, size in rows:
+            locations.setdefault(image, []).append(
+                {'archive': archive, 'digest': _unpack_digest(digest), 'size': size})
+
+        # Images whose recorded directories do not include the path say nothing about it
+        covering_path = archive_path if archive_path else path
+        history = []
+        previous = None
+        for image in images:
+            found = sorted(locations.get(image['id'], []), key=lambda location: location['archive'] or '')
+            if not found and archive_path != '' and \
+                    not any(_dir_covers(directory, covering_path) for directory in image['compare_dirs']):
+                continue
+            digests = sorted({location['digest'] or '' for location in found})
+            if not found:
+                change = 'removed' if previous else 'absent'
+            elif not previous:
+                change = 'added'
+            else:
+                change = 'unchanged' if digests == previous else 'changed'
+            previous = digests
+            history.append({'name': image['name'], 'image_id': image['image_id'],
+                            'recorded_at': image['recorded_at'], 'locations': found, 'change': change})
+        return history
+
+
+def last_change(history):
+    """The latest entry of a query() result where the path was added, changed or removed"""
+    for entry in reversed(history):
+        if entry['change'] in ('added', 'changed', 'removed'):
+            return entry
+    return None
+
+
+CHANGE_LABELS = {
+    'added': '新增',
+    'changed': '变化',
+    'unchanged': '相同',
+    'removed': '删除',
+    'absent': '不存在'
+}
+
+
+def format_history(history):
+    """Text lines of a query() result, one per image and location"""
+    width = max((len(entry['name']) for entry in history), default=0)
+    lines = []
+    for entry in history:
+        label = CHANGE_LABELS.get(entry['change'], entry['change'])
+        prefix = f"  {entry['name']:<{width}}  {entry['recorded_at']}  {label}"
+        if not entry['locations']:
+            lines.append(prefix)
+        for location in entry['locations']:
+            digest = (location['digest'] or '-')[:12]
+            where = f"  {location['archive']}" if location['archive'] else ''
+            lines.append(f"{prefix}  {digest}  {location['size']} B{where}")
+    return lines
@@ -1,12 +1,13 @@
 import os
 import sys
-import json
 from datetime import datetime
 from .utils import Utils
+from .metrics import Metrics
 
 class HTMLGenerator:
-    def __init__(self, cache_manager):
+    def __init__(self, cache_manager, metrics=None):
         self.cache_manager = cache_manager
+        self.metrics = metrics or Metrics()
         self.timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         # 获取模板文件路径，兼容开发环境和PyInstaller打包环境
         if getattr(sys, 'frozen', False):
@@ -16,27 +17,68 @@ class HTMLGenerator:
             # 运行在开发环境
             base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.template_path = os.path.join(base_path, 'docker_jar_diff', 'templates', 'report_template.html')
+        self.matrix_template_path = os.path.join(base_path, 'docker_jar_diff', 'templates', 'matrix_template.html')
+        self.live_template_path = os.path.join(base_path, 'docker_jar_diff', 'templates', 'live_template.html')
     
-    def generate_report(self, diff_result):
-        """Generate the main HTML report"""
-        # 读取模板文件
-        with open(self.template_path, 'r', encoding='utf-8') as f:
-            template_content = f.read()
-        
-        # 替换模板中的占位符
-        html_content = template_content.replace('{{timestamp}}', self.timestamp)
-        # 将diff数据直接嵌入到HTML中，避免CORS问题
-        html_content = html_content.replace('{{diff_data}}', json.dumps(diff_result))
+    def generate_report(self, diff_result, report_path=None):
+        """Generate the main HTML report, by default at the task report path"""
+        with self.metrics.phase('report'):
+            # 读取模板文件
+            with open(self.template_path, 'r', encoding='utf-8') as f:
+                template_content = f.read()
+            
+            # 替换模板中的占位符
+            html_content = template_content.replace('{{timestamp}}', self.timestamp)
+            # 将diff数据直接嵌入到HTML中，避免CORS问题
+            html_content = html_content.replace('{{diff_data}}', Utils.to_script_json(diff_result))
+            
+            # 写入报告文件
+            report_path = report_path or self.cache_manager.get_report_path()
+            os.makedirs(os.path.dirname(report_path), exist_ok=True)
+            with open(report_path, 'w', encoding='utf-8') as f:
+                f.write(html_content)
         
-        # 写入报告文件
-        report_path = self.cache_manager.get_report_path()
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        self.metrics.add('report', bytes=os.path.getsize(report_path), files=1)
+        return report_path
+    
+    def generate_matrix_report(self, matrix, report_path):
+        """Generate the N-column version matrix of a batch comparison"""
+        with self.metrics.phase('report'):
+            with open(self.matrix_template_path, 'r', encoding='utf-8') as f:
+                template_content = f.read()
+            
+            # Pair reports are linked relative to the matrix report
+            report_dir = os.path.dirname(report_path)
+            matrix = dict(matrix, pairs=[
+                dict(pair, report_link=os.path.relpath(pair['report_path'], report_dir).replace(os.sep, '/')
+                     if pair.get('report_path') else None)
+                for pair in matrix.get('pairs', [])
+            ])
+            html_content = template_content.replace('{{timestamp}}', self.timestamp)
+            html_content = html_content.replace('{{matrix_data}}', Utils.to_script_json(matrix))
+            
+            os.makedirs(report_dir, exist_ok=True)
+            with open(report_path, 'w', encoding='utf-8') as f:
+                f.write(html_content)
         
+        self.metrics.add('report', bytes=os.path.getsize(report_path), files=1)
         return report_path
     
     def generate_diff_page(self, file1, file2):
         """Generate a diff page for two files"""
         # This would be implemented to generate a proper diff page
         # For now, we'll just return a placeholder
-        return None
\ No newline at end of file
+        return None
+    
+    def generate_live_report(self, live_info, page_path):
+        """Generate the page that polls the differences of a running diff, see live_report"""
+        with open(self.live_template_path, 'r', encoding='utf-8') as f:
+            template_content = f.read()
+        
+        html_content = template_content.replace('{{timestamp}}', self.timestamp)
+        html_content = html_content.replace('{{live_info}}', Utils.to_script_json(live_info))
+        
+        os.makedirs(os.path.dirname(page_path), exist_ok=True)
+        with open(page_path, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        return page_path
@@ -0,0 +1,106 @@
+"""Report page that shows differences while the diff is still running
+
+The page is written as soon as both images are acquired. Differences are
+appended to numbered chunk files and the counters to a progress file, both
+as small scripts calling back into the page: a page opened from file:// can
+not fetch JSON, but it can load scripts, so it polls without any server.
+The full report replaces the page once the diff is done.
+"""
+import os
+import json
+import time
+import threading
+
+# 实时报告参数，可通过配置文件的 "live" 节点覆盖
+DEFAULT_LIVE_OPTIONS = {
+    'poll_interval': 1.0,   # 页面检查新差异的间隔秒数
+    'batch_size': 200       # 攒够多少条差异写一个数据文件（每个单元结束时也会写出）
+}
+
+
+class LiveReport:
+    """Live page and its append-only data files in the report directory"""
+
+    PAGE_FILE = "live.html"
+    DATA_DIR = "live"
+    PROGRESS_FILE = "progress.js"
+
+    def __init__(self, report_dir, html_generator, options=None):
+        self.report_dir = report_dir
+        self.html_generator = html_generator
+        self.options = dict(DEFAULT_LIVE_OPTIONS)
+        if options:
+            self.options.update(options)
+        self.page_path = os.path.join(report_dir, self.PAGE_FILE)
+        self.data_dir = os.path.join(report_dir, self.DATA_DIR)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._start_time = time.monotonic()
+        self.progress = {'phase': None, 'units_done': 0, 'units_total': 0, 'differences': 0, 'chunks': 0,
+                         'elapsed': 0.0, 'done': False, 'error': None, 'report': None}
+
+    def _write_script(self, content, file_path):
+        """Write a data file atomically, the page never loads half of one"""
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, file_path)
+
+    def _write_progress(self):
+        self.progress['elapsed'] = round(time.monotonic() - self._start_time, 1)
+        self._write_script(f"liveReport.progress({json.dumps(self.progress)});\n",
+                           os.path.join(self.data_dir, self.PROGRESS_FILE))
+
+    def _flush(self):
+        for kind, records in self._pending.items():
+            if not records:
+                continue
+            self.progress['chunks'] += 1
+            index = self.progress['chunks']
+            self._write_script(f"liveReport.addChunk({index}, {json.dumps(kind)}, {json.dumps(records)});\n",
+                               os.path.join(self.data_dir, f"chunk_{index:06d}.js"))
+        self._pending = {}
+
+    def start(self, info):
+        """Write the page, info holds the image names and compared directories
+
+        Returns:
+            str: Path of the page
+        """
+        os.makedirs(self.data_dir, exist_ok=True)
+        # Data of an earlier run of the same task is stale
+        for name in os.listdir(self.data_dir):
+            os.remove(os.path.join(self.data_dir, name))
+        with self._lock:
+            self._write_progress()
+        self.html_generator.generate_live_report(dict(info, data_dir=self.DATA_DIR,
+                                                      poll_interval=self.options['poll_interval']),
+                                                 self.page_path)
+        return self.page_path
+
+    def add(self, differences, kind='content'):
+        """Queue differences for the page, kind is 'content' or 'metadata'"""
+        if not differences:
+            return
+        with self._lock:
+            self._pending.setdefault(kind, []).extend(differences)
+            self.progress['differences'] += len(differences)
+            if sum(len(records) for records in self._pending.values()) >= self.options['batch_size']:
+                self._flush()
+                self._write_progress()
+
+    def update(self, **progress):
+        """Update the counters, queued differences are written first"""
+        with self._lock:
+            self.progress.update(progress)
+            self._flush()
+            self._write_progress()
+
+    def finish(self, report_path=None, error=None):
+        """Point the page to the full report, or show why the diff stopped"""
+        with self._lock:
+            self._flush()
+            self.progress.update({'done': True, 'error': error, 'phase': None})
+            if report_path:
+                self.progress['report'] = os.path.relpath(report_path, self.report_dir).replace(os.sep, '/')
+            self._write_progress()
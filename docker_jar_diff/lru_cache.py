@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache with hit/miss counters
+
+    Args:
+        maxsize: Maximum number of entries
+        on_evict: Optional callback on_evict(key, value) for evicted entries
+        fallback: Optional cache read on a miss, what it returns is not copied
+            into this one
+    """
+
+    def __init__(self, maxsize=128, on_evict=None, fallback=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self.fallback = fallback
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        if self.fallback is not None:
+            return self.fallback.get(key, default)
+        return default
+
+    def put(self, key, value):
+        evicted = []
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False))
+        # Callbacks run outside the lock, they may do slow I/O
+        if self.on_evict:
+            for evicted_key, evicted_value in evicted:
+                self.on_evict(evicted_key, evicted_value)
+
+    def clear(self):
+        with self._lock:
+            evicted = list(self._data.items())
+            self._data.clear()
+        if self.on_evict:
+            for key, value in evicted:
+                self.on_evict(key, value)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """Get cache statistics"""
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -1,152 +1,812 @@
 import os
-import json
+import time
+from contextlib import contextmanager
+from .config import load_config
 from .cache_manager import CacheManager
 from .docker_handler import DockerHandler
 from .diff_engine import DiffEngine
 from .html_generator import HTMLGenerator
+from .checkpoint import Checkpoint, DEFAULT_CHECKPOINT_OPTIONS
+from .metadata import DEFAULT_METADATA_OPTIONS, METADATA_DIFF_TYPES, load_metadata, diff_metadata, drop_covered
+from .sharding import diff_by_units
+from .external_sort import DEFAULT_LOW_MEMORY_OPTIONS, diff_external
+from .metrics import Metrics
+from .lru_cache import LRUCache
+from .progress import DEFAULT_PROGRESS_OPTIONS, ProgressTracker
+from .history import DEFAULT_HISTORY_OPTIONS, HistoryIndex, get_history_path
 from .utils import Utils
 
 class DockerJarDiff:
-    def __init__(self, base_cache_dir=None):
-        # Load configuration - support both development and PyInstaller packaged environments
-        import sys
-        
-        # Try to find config in current working directory first
-        config_path = os.path.join(os.getcwd(), '.config', 'config.json')
-        
-        # If not found, try in program directory
-        if not os.path.exists(config_path):
-            if hasattr(sys, '_MEIPASS'):
-                # Running from PyInstaller bundle
-                app_dir = os.path.dirname(sys.executable)
-            else:
-                # Running from development environment
-                app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            config_path = os.path.join(app_dir, '.config', 'config.json')
-        
-        # If config file doesn't exist, create default config
-        if not os.path.exists(config_path):
-            default_config = {
-                "docker": {
-                    "base_url": "tcp://127.0.0.1:12375",
-                    "tls": False
-                },
-                "beyond_compare": {
-                    "path": "C:\\Users\\Administrator\\AppData\\Local\\Programs\\Beyond Compare 5\\BCompare.exe"
-                }
-            }
-            # Create config directory if it doesn't exist
-            config_dir = os.path.dirname(config_path)
-            if not os.path.exists(config_dir):
-                os.makedirs(config_dir)
-            # Write default config
-            with open(config_path, 'w') as f:
-                json.dump(default_config, f, indent=2)
-            print(f"Created default config file at: {config_path}")
-        
-        # Load config file
-        with open(config_path, 'r') as f:
-            self.config = json.load(f)
-        
-        self.cache_manager = CacheManager(base_cache_dir)
+    def __init__(self, base_cache_dir=None, config=None, prometheus_metrics=False, profile=False,
+                 resume_task=None, checkpoint=None):
+        # Configuration is resolved once and shared with the Docker handler
+        self.config = config if config is not None else load_config()
+        
+        # Shared instrumentation, written to metrics.json in the task directory
+        self.metrics = Metrics()
+        self.prometheus_metrics = prometheus_metrics or self.config.get('metrics', {}).get('prometheus', False)
+        
+        self.cache_manager = CacheManager(base_cache_dir, self.config.get('cache'),
+                                          hash_algorithm=self.config.get('hash', {}).get('algorithm', 'md5'),
+                                          resume_task=resume_task)
         
         # Record current task cache directory for cleanup later
         self.current_task_cache_dir = self.cache_manager.task_cache_dir
         
-        # Get list of all task directories for potential cleanup
-        self.all_task_dirs = []
-        base_cache_dir = self.cache_manager.base_cache_dir
-        if os.path.exists(base_cache_dir):
-            for dir_name in os.listdir(base_cache_dir):
-                dir_path = os.path.join(base_cache_dir, dir_name)
-                if os.path.isdir(dir_path) and dir_name.startswith('task_'):
-                    self.all_task_dirs.append(dir_path)
-        self.docker_handler = DockerHandler(self.cache_manager)
-        self.diff_engine = DiffEngine(self.cache_manager)
-        self.html_generator = HTMLGenerator(self.cache_manager)
-    
-    def run_diff(self, image1, image2, compare_dir=None):
-        """Run the complete diff process"""
-        import traceback
+        # --profile: cProfile/tracemalloc per phase, saved next to the report
+        if profile:
+            from .profiling import Profiler
+            self.metrics.profiler = Profiler(os.path.join(self.cache_manager.html_report_dir, "profile"))
+        
+        self.docker_handler = DockerHandler(self.cache_manager, self.config, metrics=self.metrics)
+        self.diff_engine = DiffEngine(self.cache_manager, self.config.get('text_diff'), metrics=self.metrics,
+                                      compare_options=self.config.get('compare'),
+                                      normalize_options=self.config.get('normalize'))
+        self.html_generator = HTMLGenerator(self.cache_manager, metrics=self.metrics)
+        # Jars are indexed while the rest of the image is still downloading
+        self.docker_handler.archive_indexer = self.diff_engine.prefetch_archive
+        # The profiler only sees its own thread, so jars are not indexed by worker threads
+        self.docker_handler.single_thread = bool(profile)
+        # Optional image_source(image, compare_dir) returning the image_info of an image
+        # acquired elsewhere (the manifests of the daemon), used instead of process_image
+        self.image_source = None
+        
+        # Progress of compare() in the task directory, continued with resume_task
+        self.checkpoint_options = dict(DEFAULT_CHECKPOINT_OPTIONS)
+        self.checkpoint_options.update(self.config.get('checkpoint', {}))
+        if checkpoint is not None:
+            self.checkpoint_options['enabled'] = checkpoint
+        self.checkpoint = None
+        if self.checkpoint_options['enabled'] or resume_task:
+            self.checkpoint = Checkpoint(self.cache_manager.checkpoint_dir)
+            self.diff_engine.checkpoint = self.checkpoint
+        
+        # Types, modes, owners and link targets from the tar headers
+        self.metadata_options = dict(DEFAULT_METADATA_OPTIONS)
+        self.metadata_options.update(self.config.get('metadata', {}))
+        
+        # Bytes and files of every step, sent to the progress callback as 'progress' events
+        self.progress_options = dict(DEFAULT_PROGRESS_OPTIONS)
+        self.progress_options.update(self.config.get('progress', {}))
+        self.progress_tracker = ProgressTracker(interval=self.progress_options['interval'])
+        self.docker_handler.progress_tracker = self.progress_tracker
+        self.diff_engine.progress_tracker = self.progress_tracker
+        
+        # Sorted on-disk indexes instead of in-memory trees, see external_sort
+        self.low_memory_options = dict(DEFAULT_LOW_MEMORY_OPTIONS)
+        self.low_memory_options.update(self.config.get('low_memory', {}))
+        
+        # Every acquired image is added to the path history of the cache directory
+        history_options = dict(DEFAULT_HISTORY_OPTIONS)
+        history_options.update(self.config.get('history', {}))
+        self.history_index = None
+        if history_options['enabled']:
+            self.history_index = HistoryIndex(get_history_path(self.cache_manager.base_cache_dir,
+                                                               self.cache_manager.hash_algorithm), history_options)
+    
+    def get_result_options(self, metadata_only=False, low_memory=False):
+        """Settings that change diff.json, part of the result cache and checkpoint keys"""
+        options = self.diff_engine.get_result_options()
+        options['metadata'] = self.metadata_options
+        if metadata_only:
+            options['metadata_only'] = True
+        elif low_memory:
+            # Files of a directory only one image has are listed one by one, up to max_differences
+            options['low_memory'] = True
+            options['max_differences'] = self.low_memory_options['max_differences']
+        return options
+    
+    def compare(self, image1, image2, compare_dir=None, progress=None, write_report=True, use_cache=True,
+                shards=None, external_shards=False, metadata_only=False, live=False, formats=None,
+                output_dir=None, expected=None, low_memory=None):
+        """Compare two images without printing or launching external tools
+        
+        Args:
+            compare_dir: Directory to compare, or a list of directories that are
+                fetched from one container per image and merged into one result
+            progress: Optional callback progress(event, **info). Events are
+                'log' (message), 'phase_start'/'phase_end' (phase),
+                'metadata_ready' (differences), 'images_ready'
+                (extracted_dir1, extracted_dir2), 'live_report' (path) and
+                'progress' (tasks, see progress.ProgressTracker) at most
+                every progress interval
+            write_report: Also write diff.json and the HTML report
+            use_cache: Serve diff.json and the report of an earlier run with the
+                same image IDs, directories and options. The result is stored
+                for later runs either way.
+            shards: Split the diff into this many shards run by worker
+                processes, the result is the same as without shards. Finished
+                shards of a resumed task are kept
+            external_shards: Do not start the workers, wait for
+                ``shard-worker`` runs on other hosts sharing the cache directory
+            metadata_only: Only compare types, modes, owners and link targets
+                read from the tar headers, no file is extracted or read
+            live: Write a page next to the report as soon as both images are
+                acquired, it shows the differences while they are found
+            formats: Output writers ('jsonl', 'csv', 'junit', see writers)
+                that stream one record per difference while the diff runs
+            output_dir: Directory of the formats, the task diff directory by default
+            expected: "[type:]glob" patterns of expected differences, added
+                to those of the "output" config node
+            low_memory: Diff through sorted on-disk indexes (see
+                external_sort) so that memory does not grow with the image,
+                the "low_memory" config node decides when None. Finished
+                paths are not checkpointed in this mode
+        
+        Returns:
+            ImageDiffResult
+        
+        Raises:
+            DiffError: If an image can not be processed
+        """
+        if low_memory is None:
+            low_memory = self.low_memory_options['enabled']
+        return self._compare(image1, image2, compare_dir, progress, write_report, use_cache, shards,
+                             external_shards, metadata_only, live, formats, output_dir, expected, low_memory)
+    
+    @contextmanager
+    def _low_memory_archive_cache(self):
+        """Small archive cache of its own for the diff of a low memory run
+        
+        Indexed jars are read back from the sorted runs, only a few stay in
+        memory. Acquisition keeps the shared cache, so the jars prefetched
+        while the images are extracted are still found there by the diff,
+        jars indexed by the diff only go to the small cache.
+        """
+        shared_cache = self.diff_engine.archive_index_cache
+        self.diff_engine.archive_index_cache = LRUCache(
+            min(shared_cache.maxsize, max(1, int(self.low_memory_options['archive_cache']))),
+            fallback=shared_cache)
         try:
-            print(f"Starting Docker image diff between {image1} and {image2}")
-            print(f"比对目录: {compare_dir or '/'}")
-            
-            # Step 1: Process both images (download and extract)
-            print("\nStep 1: Processing images...")
-            print(f"处理第1个镜像文件: {image1}")
-            image1_info = self.docker_handler.process_image(image1,compare_dir)
-            error = image1_info.get('error')
-            if error:
-                #print(f"Error processing image {image1}: {error}")
-                return -1
+            yield
+        finally:
+            self.diff_engine.archive_index_cache = shared_cache
+    
+    def _compare(self, image1, image2, compare_dir, progress, write_report, use_cache, shards, external_shards,
+                 metadata_only, live, formats, output_dir, expected, low_memory):
+        """compare() once low_memory is decided"""
+        from .api import DiffError, ImageDiffResult, summarize_result
+        
+        def notify(event, **info):
+            if progress:
+                progress(event, **info)
+        
+        timings = {}
+        
+        def run_phase(name, func, *args):
+            notify('phase_start', phase=name)
+            start_time = time.monotonic()
+            try:
+                return func(*args)
+            finally:
+                timings[name] = time.monotonic() - start_time
+                notify('phase_end', phase=name, seconds=timings[name])
+        
+        # Evict stale task directories without delaying the diff
+        self.cache_manager.start_background_cleanup()
+        self.metrics.labels.update({'image1': image1, 'image2': image2})
+        
+        self.docker_handler.progress = progress or (lambda event, **info: None)
+        self.progress_tracker.listener = progress if self.progress_options['enabled'] else None
+        
+        # Step 0: Resolve both images to their IDs and look for a finished result
+        result_cache = self.cache_manager.result_cache if write_report else None
+        checkpoint = self.checkpoint if not metadata_only else None
+        result_options = self.get_result_options(metadata_only, low_memory)
+        result_key = None
+        if result_cache is not None or checkpoint is not None:
+            image_ids = run_phase('resolve_images', self._resolve_image_ids, image1, image2)
+        if result_cache is not None:
+            result_key = result_cache.make_key(image_ids[0], image_ids[1],
+                                               Utils.normalize_compare_dirs(compare_dir), result_options)
+            cached = result_cache.get(result_key) if use_cache else None
+            if cached is not None:
+                self.metrics.cache_hit('result')
+                result = self._cached_result(image1, image2, image_ids, cached, timings)
+                if formats:
+                    outputs = self._open_outputs(formats, output_dir, expected, image1, image2, compare_dir)
+                    outputs.add(result.diff_result['differences'])
+                    outputs.add(result.metadata_differences, kind='metadata')
+                    outputs.close()
+                    result.output_paths = outputs.paths
+                    result.unexpected_differences = outputs.unexpected
+                return result
+            self.metrics.cache_miss('result')
+        
+        # Progress of an interrupted run of this task with the same inputs is kept
+        if checkpoint is not None:
+            resumed = checkpoint.begin({'image1': image1, 'image2': image2, 'image_ids': image_ids,
+                                        'compare_dirs': Utils.normalize_compare_dirs(compare_dir),
+                                        'options': result_options})
+            if resumed:
+                notify('log', message=f"♻️ 从检查点继续比对: {self.cache_manager.task_cache_dir}")
+        
+        # Step 1: Process both images (download and extract)
+        images_info = []
+        for index, image in enumerate((image1, image2), start=1):
+            if metadata_only:
+                image_info = run_phase(f'acquire_image{index}', self.docker_handler.read_metadata, image,
+                                       compare_dir)
             else:
-                extracted_dir1 = image1_info['extracted_dir']
-                content_dir1 = image1_info['content_dir']
-                print(f"✅第1个镜像文件解压成功: {extracted_dir1}")
-            
-            print(f"\n处理第2个镜像文件: {image2}")
-            image2_info = self.docker_handler.process_image(image2,compare_dir)
-            extracted_dir2 = image2_info['extracted_dir']
-            content_dir2 = image2_info['content_dir']
-            error = image1_info.get('error')
+                image_info = run_phase(f'acquire_image{index}', self._acquire_image, index, image, compare_dir,
+                                       notify)
+            error = image_info.get('error')
             if error:
-                #print(f"Error processing image {image1}: {error}")
-                return -1
-            else:
-                print(f"✅第2个镜像文件解压成功: {extracted_dir2}")
-            
-            # Step 2: Perform directory diff
-            print("\nStep 2: 开始对比目录差异...")
-
-            beyond_compare_path = self.config.get('beyond_compare', {}).get('path', None)
-            if beyond_compare_path:
-                try:
-                    Utils.launch_beyond_compare_5(extracted_dir1, extracted_dir2, beyond_compare_path)
-                    print(f"✅ Beyond Compare 5 已启动，正在比较两个镜像文件")
-                except Exception as e:
-                    print(f"❌ 没有成功运行 Beyond Compare 5，将继续生成差异报告")
-                    print(f"   错误信息：{e}")
-                    print(f"   目录1：{extracted_dir1}")
-                    print(f"   目录2：{extracted_dir2}")
+                raise DiffError(f"Error processing image {image}: {error}")
+            images_info.append(image_info)
+        
+        # First pass: metadata from the tar headers, no file content is read
+        metadata_diffs = None
+        if metadata_only or self.metadata_options['enabled']:
+            metadata_diffs = run_phase('metadata_diff', self._diff_metadata, images_info, compare_dir)
+            notify('metadata_ready', differences=metadata_diffs)
+        
+        if not metadata_only and self.history_index is not None:
+            run_phase('history', self._record_history, (image1, image2), images_info, compare_dir, notify)
+        
+        extracted_dir1 = images_info[0]['extracted_dir']
+        extracted_dir2 = images_info[1]['extracted_dir']
+        if not metadata_only:
+            notify('images_ready', extracted_dir1=extracted_dir1, extracted_dir2=extracted_dir2)
+        
+        # Differences are written to the outputs and shown on the live page while the diff runs
+        sinks = []
+        outputs = None
+        if formats:
+            outputs = self._open_outputs(formats, output_dir, expected, image1, image2, compare_dir)
+            sinks.append(outputs)
+        live_report = None
+        if live and not metadata_only:
+            live_report = self._start_live_report(image1, image2, compare_dir)
+            notify('live_report', path=live_report.page_path)
+            sinks.append(live_report)
+        if metadata_diffs:
+            # Missing entries wait for the content diff, see drop_covered
+            for sink in sinks:
+                sink.add([diff for diff in metadata_diffs if diff['type'] in METADATA_DIFF_TYPES], kind='metadata')
+        if live_report is not None:
+            live_report.update(phase='diff')
+        
+        on_unit = None
+        if sinks:
+            def on_unit(unit, differences, done, total):
+                for sink in sinks:
+                    sink.add(differences)
+                if live_report is not None:
+                    live_report.update(units_done=done, units_total=total)
+        
+        # Step 2: Perform directory diff
+        try:
+            if metadata_only:
+                diff_result = self._metadata_only_result(compare_dir)
+            elif shards and shards > 1:
+                diff_result = run_phase('diff', self._sharded_diff, extracted_dir1, extracted_dir2, compare_dir,
+                                        shards, not external_shards, progress, on_unit)
+            elif low_memory:
+                with self._low_memory_archive_cache():
+                    diff_result = run_phase('diff', diff_external, self.diff_engine, extracted_dir1,
+                                            extracted_dir2, compare_dir, self.cache_manager.task_cache_dir,
+                                            self.low_memory_options, on_unit)
+            elif checkpoint is not None or on_unit is not None:
+                # Unit by unit for the checkpoint and live results
+                diff_result = run_phase('diff', diff_by_units, self.diff_engine, extracted_dir1, extracted_dir2,
+                                        compare_dir, self.checkpoint_options['units'], checkpoint, on_unit)
             else:
-                print(f"ℹ️  未配置 Beyond Compare 5 路径，将直接生成差异报告")
-            
-            # 无论 Beyond Compare 是否成功，都继续生成差异报告
-            print("\nStep 3: 生成差异报告...")
-            diff_result = self.diff_engine.diff_directories(extracted_dir1, extracted_dir2, compare_dir)
-            
-            # 添加原始镜像名称信息
-            diff_result['image1_name'] = image1
-            diff_result['image2_name'] = image2
-            
-            # Save diff result to JSON file in diff directory
-            diff_json_path = os.path.join(self.cache_manager.diff_dir, "diff.json")
-            Utils.save_json(diff_result, diff_json_path)
-            print(f"✅ 差异结果已保存为 JSON 文件: {diff_json_path}")
+                diff_result = run_phase('diff', self.diff_engine.diff_directories,
+                                        extracted_dir1, extracted_dir2, compare_dir)
+        except BaseException as e:
+            self.progress_tracker.finish('hash')
+            if outputs is not None:
+                outputs.abort()
+            if live_report is not None:
+                live_report.finish(error=repr(e))
+            raise
+        
+        self.progress_tracker.finish('hash')
+        if metadata_diffs is not None:
+            diff_result['metadata_differences'] = drop_covered(metadata_diffs, diff_result['differences'])
+            # Missing entries only the tar headers show, the rest was written before the diff
+            for sink in sinks:
+                sink.add([diff for diff in diff_result['metadata_differences']
+                          if diff['type'] not in METADATA_DIFF_TYPES], kind='metadata')
+        if outputs is not None:
+            outputs.close()
+        
+        # 添加原始镜像名称信息
+        diff_result['image1_name'] = image1
+        diff_result['image2_name'] = image2
+        
+        result = ImageDiffResult(
+            image1=image1,
+            image2=image2,
+            image1_id=images_info[0].get('image_id'),
+            image2_id=images_info[1].get('image_id'),
+            compare_dir=diff_result['compare_dir'],
+            compare_dirs=diff_result['compare_dirs'],
+            task_dir=self.cache_manager.task_cache_dir,
+            timings=timings,
+            summary=summarize_result(diff_result),
+            diff_result=diff_result
+        )
+        if outputs is not None:
+            result.output_paths = outputs.paths
+            result.unexpected_differences = outputs.unexpected
+        
+        # Step 3: Save diff result to JSON file in diff directory and generate report
+        if live_report is not None:
+            live_report.update(phase='report')
+        if write_report:
+            def write_outputs():
+                result.diff_json_path = os.path.join(self.cache_manager.diff_dir, "diff.json")
+                Utils.save_json(diff_result, result.diff_json_path)
+                result.report_path = self.html_generator.generate_report(diff_result)
+            run_phase('report', write_outputs)
+            if result_key is not None:
+                # Extracted files are evicted with the task, the cached entry does not point to them
+                portable = result_cache.make_portable(diff_result, self.cache_manager.task_cache_dir)
+                result_cache.put(result_key, {'image1_id': result.image1_id, 'image2_id': result.image2_id,
+                                              'compare_dirs': result.compare_dirs}, portable,
+                                 lambda report_path: self.html_generator.generate_report(portable, report_path))
+        if checkpoint is not None:
+            checkpoint.finish()
+        if live_report is not None:
+            live_report.finish(result.report_path)
+        
+        result.metrics = self.metrics.to_dict()
+        result.metrics_path = self.write_metrics()
+        if self.metrics.profiler is not None:
+            result.profile_dir = self.metrics.profiler.save()
+        return result
+    
+    def _record_history(self, images, images_info, compare_dir, notify):
+        """Add acquired images to the path history, a failure does not stop the diff"""
+        for image, image_info in zip(images, images_info):
+            if not image_info.get('image_id'):
+                continue
+            try:
+                with self.metrics.phase('history'):
+                    count = self.history_index.record(image, image_info['image_id'], compare_dir,
+                                                      self.diff_engine, image_info['extracted_dir'])
+                self.metrics.add('history', files=count)
+            except Exception as e:
+                notify('log', message=f"⚠️ 记录路径历史失败 {image}: {e}")
+    
+    def _diff_metadata(self, images_info, compare_dir):
+        """Metadata differences of two acquired images"""
+        entries = [load_metadata(image_info['metadata_dir']) for image_info in images_info]
+        diffs = diff_metadata(entries[0], entries[1], Utils.normalize_compare_dirs(compare_dir),
+                              compare_owner=self.metadata_options['owner'])
+        self.metrics.add('metadata_diff', files=len(entries[0]) + len(entries[1]))
+        return diffs
+    
+    def _start_live_report(self, image1, image2, compare_dir):
+        """Write the live page, see live_report"""
+        from .live_report import LiveReport
+        live_report = LiveReport(self.cache_manager.html_report_dir, self.html_generator, self.config.get('live'))
+        live_report.start({'image1': image1, 'image2': image2,
+                           'compare_dirs': Utils.normalize_compare_dirs(compare_dir)})
+        return live_report
+    
+    def _open_outputs(self, formats, output_dir, expected, image1, image2, compare_dir):
+        """Open the --format writers, see writers.OutputWriters"""
+        from .writers import OutputWriters
+        options = dict(self.config.get('output', {}))
+        options['expected'] = list(options.get('expected', [])) + list(expected or [])
+        outputs = OutputWriters(formats, output_dir or self.cache_manager.diff_dir, options)
+        outputs.open({'image1': image1, 'image2': image2,
+                      'compare_dirs': Utils.normalize_compare_dirs(compare_dir)})
+        return outputs
+    
+    def _metadata_only_result(self, compare_dir):
+        """Diff result without content differences, for metadata_only"""
+        compare_dirs = Utils.normalize_compare_dirs(compare_dir)
+        return {
+            'dir1': None,
+            'dir2': None,
+            'compare_dir': compare_dirs[0] if len(compare_dirs) == 1 else '/',
+            'compare_dirs': compare_dirs,
+            'compare_stats': self.diff_engine.new_compare_stats(),
+            'digest_algorithm': self.diff_engine.hash_algorithm,
+            'metadata_only': True,
+            'differences': []
+        }
+    
+    def _acquire_image(self, index, image, compare_dir, notify):
+        """process_image, skipping what the checkpoint already has"""
+        if self.image_source is not None:
+            return self.image_source(image, compare_dir)
+        checkpoint = self.checkpoint
+        if checkpoint is None:
+            return self.docker_handler.process_image(image, compare_dir)
+        blob_store = self.cache_manager.blob_store
+        extracted_dir = self.cache_manager.get_extracted_dir(image)
+        checkpoint.restore_digests(index, extracted_dir, blob_store)
+        image_info = checkpoint.get_image(index)
+        if image_info is not None:
+            notify('log', message=f"♻️ 镜像 {image} 已获取，跳过下载: {image_info['extracted_dir']}")
+            return image_info
+        
+        def on_directory(directory):
+            checkpoint.save_digests(index, directory, extracted_dir, blob_store)
+            checkpoint.complete_directory(index, directory)
+        
+        image_info = self.docker_handler.process_image(image, compare_dir, skip_dirs=checkpoint.get_directories(index),
+                                                       on_directory=on_directory)
+        if not image_info.get('error'):
+            checkpoint.complete_image(index, image_info)
+        return image_info
+    
+    def _sharded_diff(self, dir1, dir2, compare_dir, shards, launch, progress=None, on_unit=None):
+        """Diff two directories with shard workers, see sharding.ShardCoordinator"""
+        from .api import DiffError
+        from .sharding import ShardCoordinator
+        coordinator = ShardCoordinator(self.diff_engine,
+                                       os.path.join(self.cache_manager.task_cache_dir, "shards"), shards,
+                                       self.config.get('shard'), metrics=self.metrics, progress=progress,
+                                       on_unit=on_unit)
+        try:
+            return coordinator.run(dir1, dir2, compare_dir, launch=launch)
+        except RuntimeError as e:
+            raise DiffError(f"分片比对失败: {e}")
+    
+    def _resolve_image_ids(self, *images):
+        """Get the IDs of images, pulling them if needed"""
+        from .api import DiffError
+        image_ids = []
+        for image in images:
+            try:
+                image_ids.append(self.docker_handler.get_image_id(image))
+            except RuntimeError as e:
+                raise DiffError(f"Error processing image {image}: {e}")
+        return image_ids
+    
+    def _cached_result(self, image1, image2, image_ids, cached, timings):
+        """Build the result of a comparison served from the result cache"""
+        from .api import ImageDiffResult, summarize_result
+        diff_result = Utils.load_json(cached['diff_json_path'])
+        diff_result['image1_name'] = image1
+        diff_result['image2_name'] = image2
+        result = ImageDiffResult(
+            image1=image1,
+            image2=image2,
+            image1_id=image_ids[0],
+            image2_id=image_ids[1],
+            compare_dir=diff_result['compare_dir'],
+            compare_dirs=diff_result.get('compare_dirs') or [diff_result['compare_dir']],
+            task_dir=self.cache_manager.task_cache_dir,
+            diff_json_path=cached['diff_json_path'],
+            report_path=cached['report_path'],
+            timings=timings,
+            summary=summarize_result(diff_result),
+            cached=True,
+            diff_result=diff_result
+        )
+        result.metrics = self.metrics.to_dict()
+        result.metrics_path = self.write_metrics()
+        return result
+    
+    def compare_many(self, images, pairs=None, compare_dir=None, all_pairs=False, progress=None, workers=None):
+        """Compare several images, acquiring and indexing each image only once
+        
+        Args:
+            images: Image names. Without pairs the first one is the baseline
+                compared with each of the others
+            pairs: Explicit (image1, image2) pairs to compare
+            all_pairs: Compare every image with every other image
+            progress: Optional callback, events as in compare() plus
+                'pair_done' (index, image1, image2, result)
+            workers: Images acquired in parallel, defaults to batch.workers
+        
+        Returns:
+            BatchDiffResult
+        
+        Raises:
+            DiffError: If an image can not be processed
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from .api import BatchDiffResult, DiffError, ImageDiffResult, summarize_differences
+        from .batch import DEFAULT_BATCH_OPTIONS, build_matrix, flatten_tree, plan_pairs
+        
+        def notify(event, **info):
+            if progress:
+                progress(event, **info)
+        
+        timings = {}
+        
+        def run_phase(name, func, *args):
+            notify('phase_start', phase=name)
+            start_time = time.monotonic()
+            try:
+                return func(*args)
+            finally:
+                timings[name] = time.monotonic() - start_time
+                notify('phase_end', phase=name, seconds=timings[name])
+        
+        batch_options = dict(DEFAULT_BATCH_OPTIONS)
+        batch_options.update(self.config.get('batch', {}))
+        workers = max(1, int(workers or batch_options['workers']))
+        if self.docker_handler.single_thread:
+            workers = 1
+        try:
+            images, pairs = plan_pairs(images, pairs, all_pairs)
+        except ValueError as e:
+            raise DiffError(str(e))
+        
+        self.cache_manager.start_background_cleanup()
+        self.metrics.labels.update({'images': str(len(images)), 'pairs': str(len(pairs))})
+        self.docker_handler.progress = progress or (lambda event, **info: None)
+        
+        # Step 0: Images with the same ID (several tags) are acquired once
+        image_ids = dict(zip(images, run_phase('resolve_images', self._resolve_image_ids, *images)))
+        names_by_id = {}
+        for image in images:
+            names_by_id.setdefault(image_ids[image], image)
+        
+        # Step 1: Acquire and index every distinct image, a few at a time
+        def acquire(image_id):
+            image = names_by_id[image_id]
+            cache_key = image_id.replace('sha256:', '')[:16]
+            image_info = self.docker_handler.process_image(image, compare_dir, cache_key=cache_key)
+            if image_info.get('error'):
+                raise DiffError(f"Error processing image {image}: {image_info['error']}")
+            image_info['tree'] = self.diff_engine.build_tree(image_info['extracted_dir'], compare_dir)
+            return image_id, image_info
+        
+        def acquire_all():
+            if workers == 1:
+                # --profile, see DockerHandler.single_thread
+                return dict(map(acquire, names_by_id))
+            with ThreadPoolExecutor(max_workers=min(workers, len(names_by_id))) as executor:
+                return dict(executor.map(acquire, names_by_id))
+        
+        acquired = run_phase('acquire', acquire_all)
+        if self.history_index is not None:
+            run_phase('history', self._record_history, list(names_by_id.values()),
+                      [acquired[image_id] for image_id in names_by_id], compare_dir, notify)
+        
+        # Step 2: Diff every pair from the shared trees
+        batch_dir = os.path.join(self.cache_manager.task_cache_dir, "batch")
+        
+        def diff_pairs():
+            results = []
+            for index, (image1, image2) in enumerate(pairs, start=1):
+                info1, info2 = acquired[image_ids[image1]], acquired[image_ids[image2]]
+                start_time = time.monotonic()
+                diff_result = self.diff_engine.diff_trees(info1['tree'], info2['tree'], info1['extracted_dir'],
+                                                          info2['extracted_dir'], compare_dir)
+                diff_result['image1_name'] = image1
+                diff_result['image2_name'] = image2
+                
+                pair_dir = os.path.join(batch_dir, f"{index:03d}_{self._safe_name(image1)}_vs_{self._safe_name(image2)}")
+                os.makedirs(pair_dir, exist_ok=True)
+                diff_json_path = os.path.join(pair_dir, "diff.json")
+                Utils.save_json(diff_result, diff_json_path)
+                result = ImageDiffResult(
+                    image1=image1,
+                    image2=image2,
+                    image1_id=image_ids[image1],
+                    image2_id=image_ids[image2],
+                    compare_dir=diff_result['compare_dir'],
+                    compare_dirs=diff_result['compare_dirs'],
+                    task_dir=self.cache_manager.task_cache_dir,
+                    diff_json_path=diff_json_path,
+                    report_path=self.html_generator.generate_report(diff_result, os.path.join(pair_dir, "index.html")),
+                    timings={'diff': time.monotonic() - start_time},
+                    summary=summarize_differences(diff_result['differences']),
+                    diff_result=diff_result
+                )
+                results.append(result)
+                notify('pair_done', index=index, image1=image1, image2=image2, result=result)
+            return results
+        
+        pair_results = run_phase('diff', diff_pairs)
+        
+        # Step 3: One column per image for every path that differs in any pair
+        def write_matrix():
+            changed_paths = {diff['path'] for result in pair_results for diff in result.iter_differences()}
+            with self.metrics.phase('matrix'):
+                matrix = build_matrix(
+                    [{'name': image, 'image_id': image_ids[image]} for image in images],
+                    [flatten_tree(acquired[image_ids[image]]['tree'], pair_results[0].compare_dir)
+                     for image in images],
+                    changed_paths,
+                    self.diff_engine.hash_algorithm
+                )
+            matrix['compare_dirs'] = pair_results[0].compare_dirs
+            matrix['pairs'] = [{'image1': result.image1, 'image2': result.image2, 'summary': result.summary,
+                                'report_path': result.report_path} for result in pair_results]
+            matrix_json_path = os.path.join(batch_dir, "matrix.json")
+            Utils.save_json(matrix, matrix_json_path)
+            matrix_report_path = self.html_generator.generate_matrix_report(
+                matrix, os.path.join(batch_dir, "matrix.html"))
+            return matrix, matrix_json_path, matrix_report_path
+        
+        matrix, matrix_json_path, matrix_report_path = run_phase('matrix', write_matrix)
+        
+        batch_result = BatchDiffResult(
+            images=images,
+            image_ids=image_ids,
+            task_dir=self.cache_manager.task_cache_dir,
+            pairs=pair_results,
+            matrix_json_path=matrix_json_path,
+            matrix_report_path=matrix_report_path,
+            timings=timings,
+            matrix=matrix
+        )
+        batch_result.metrics = self.metrics.to_dict()
+        batch_result.metrics_path = self.write_metrics()
+        return batch_result
+    
+    @staticmethod
+    def _safe_name(image_name):
+        return image_name.replace("/", "_").replace(":", "_")
+    
+    def run_batch(self, images, pairs=None, compare_dir=None, all_pairs=False, workers=None):
+        """Run a batch comparison and print where the reports are"""
+        from .api import DiffError
+        
+        def on_progress(event, **info):
+            if event == 'log':
+                print(info['message'])
+            elif event == 'phase_start':
+                phase = info['phase']
+                if phase == 'acquire':
+                    print("\nStep 1: 获取并索引各镜像（每个镜像只处理一次）...")
+                elif phase == 'diff':
+                    print("\nStep 2: 对比各镜像对...")
+                elif phase == 'matrix':
+                    print("\nStep 3: 生成版本矩阵...")
+            elif event == 'pair_done':
+                result = info['result']
+                print(f"✅ [{info['index']}] {info['image1']} ↔ {info['image2']}: "
+                      f"{result.total_differences} 处差异，报告: {result.report_path}")
+        
+        try:
+            print(f"比对目录: {', '.join(Utils.normalize_compare_dirs(compare_dir))}")
+            try:
+                result = self.compare_many(images, pairs, compare_dir, all_pairs=all_pairs,
+                                           progress=on_progress, workers=workers)
+            except DiffError as e:
+                print(f"❌ {e}")
+                self._print_resume_hint()
+                return -1
             
-            report_path = self.html_generator.generate_report(diff_result)
-            print(f"✅ 差异报告已生成: {report_path}")
+            print(f"✅ 版本矩阵已生成: {result.matrix_report_path}")
+            print(f"✅ 版本矩阵 JSON: {result.matrix_json_path}")
+            print(f"📊 性能指标已保存: {result.metrics_path}")
+            return 0
+        finally:
+            print("\n🧹 Cleaning up resources...")
+            self.close()
+    
+    def write_metrics(self):
+        """Write metrics.json (and metrics.prom if enabled) to the task directory"""
+        metrics_path = os.path.join(self.cache_manager.task_cache_dir, "metrics.json")
+        self.metrics.write_json(metrics_path)
+        if self.prometheus_metrics:
+            self.metrics.write_prometheus(os.path.join(self.cache_manager.task_cache_dir, "metrics.prom"))
+        return metrics_path
+    
+    def run_diff(self, image1, image2, compare_dir=None, use_cache=True, shards=None, external_shards=False,
+                 metadata_only=False, live=False, formats=None, output_dir=None, expected=None, low_memory=None,
+                 fail_on_unexpected=False):
+        """Run the complete diff process
+        
+        Returns:
+            int: 0 on success, -1 when an image can not be compared, 1 with
+                fail_on_unexpected when the --format writers got differences
+                matching no expected pattern
+        """
+        from .api import DiffError, summarize_differences
+        from .progress import ProgressPrinter
+        printer = ProgressPrinter(log_interval=self.progress_options['log_interval'])
+        
+        def on_progress(event, **info):
+            if event == 'progress':
+                printer.update(info['tasks'])
+                return
+            printer.clear()
+            if event == 'log':
+                print(info['message'])
+            elif event == 'phase_start':
+                phase = info['phase']
+                if phase == 'resolve_images':
+                    print("\nStep 0: 解析镜像 ID，检查结果缓存...")
+                elif phase == 'acquire_image1':
+                    print("\nStep 1: Processing images...")
+                    print(f"处理第1个镜像文件: {image1}")
+                elif phase == 'acquire_image2':
+                    print(f"\n处理第2个镜像文件: {image2}")
+                elif phase == 'diff':
+                    print("\nStep 3: 生成差异报告...")
+            elif event == 'metadata_ready':
+                summary = summarize_differences(info['differences'])
+                details = ', '.join(f"{diff_type}: {count}" for diff_type, count in sorted(summary.items()))
+                print(f"🔎 元数据比对完成（类型/权限/属主/链接）: {details or '无差异'}")
+            elif event == 'images_ready':
+                print(f"✅第1个镜像文件解压成功: {info['extracted_dir1']}")
+                print(f"✅第2个镜像文件解压成功: {info['extracted_dir2']}")
+                print("\nStep 2: 开始对比目录差异...")
+                self._launch_beyond_compare(info['extracted_dir1'], info['extracted_dir2'])
+            elif event == 'live_report':
+                print(f"📡 实时报告页面: {info['path']}")
+                self._open_report(info['path'])
+        
+        try:
+            print(f"Starting Docker image diff between {image1} and {image2}")
+            print(f"比对目录: {', '.join(Utils.normalize_compare_dirs(compare_dir))}")
             
-            # 使用默认浏览器打开报告
-            import webbrowser
             try:
-                webbrowser.open(f"file://{report_path}")
-                print(f"✅ 差异报告已在默认浏览器中打开")
-            except Exception as e:
-                print(f"⚠️ 无法打开浏览器: {e}")
-                print("您可以手动打开以下文件查看报告:")
-                print(f"   {report_path}")
-
-            return 0;
+                result = self.compare(image1, image2, compare_dir, progress=on_progress, use_cache=use_cache,
+                                      shards=shards, external_shards=external_shards, metadata_only=metadata_only,
+                                      live=live, formats=formats, output_dir=output_dir, expected=expected,
+                                      low_memory=low_memory)
+            except DiffError as e:
+                print(f"❌ {e}")
+                return -1
             
-        except Exception as e:
-            print(f"❌ Error during diff process: {e}")
+            if result.cached:
+                print("♻️ 镜像 ID 和比对参数与之前的比对相同，直接使用缓存的结果（--no-cache 可重新比对）")
+            print(f"✅ 差异结果已保存为 JSON 文件: {result.diff_json_path}")
+            print(f"✅ 差异报告已生成: {result.report_path}")
+            for name, path in result.output_paths.items():
+                print(f"✅ {name} 输出已保存: {path}")
+            print(f"📊 性能指标已保存: {result.metrics_path}")
+            if result.profile_dir:
+                print(f"🔬 性能剖析结果已保存: {result.profile_dir}")
+            if live and not result.cached and not metadata_only:
+                print("✅ 实时报告页面已链接到完整报告")
+            else:
+                self._open_report(result.report_path)
+            if fail_on_unexpected and result.unexpected_differences:
+                print(f"❌ 存在 {result.unexpected_differences} 条非预期差异（见 --expect）")
+                return 1
+            return 0
+            
+        except BaseException as e:
+            print(f"❌ Error during diff process: {e!r}")
+            self._print_resume_hint()
             raise
         finally:
             # Clean up Docker resources
             print("\n🧹 Cleaning up resources...")
-            self.docker_handler.cleanup()
+            self.close()
+    
+    def _print_resume_hint(self):
+        if self.checkpoint is not None:
+            task_name = os.path.basename(self.cache_manager.task_cache_dir)
+            print(f"💾 已完成的进度保存在任务目录中，可使用 --resume {task_name} 继续比对")
+    
+    def _launch_beyond_compare(self, extracted_dir1, extracted_dir2):
+        """Launch Beyond Compare on the extracted directories if configured"""
+        beyond_compare_path = self.config.get('beyond_compare', {}).get('path', None)
+        if beyond_compare_path:
+            try:
+                Utils.launch_beyond_compare_5(extracted_dir1, extracted_dir2, beyond_compare_path)
+                print(f"✅ Beyond Compare 5 已启动，正在比较两个镜像文件")
+            except Exception as e:
+                print(f"❌ 没有成功运行 Beyond Compare 5，将继续生成差异报告")
+                print(f"   错误信息：{e}")
+                print(f"   目录1：{extracted_dir1}")
+                print(f"   目录2：{extracted_dir2}")
+        else:
+            print(f"ℹ️  未配置 Beyond Compare 5 路径，将直接生成差异报告")
+    
+    def _open_report(self, report_path):
+        """使用默认浏览器打开报告"""
+        import webbrowser
+        try:
+            webbrowser.open(f"file://{report_path}")
+            print(f"✅ 差异报告已在默认浏览器中打开")
+        except Exception as e:
+            print(f"⚠️ 无法打开浏览器: {e}")
+            print("您可以手动打开以下文件查看报告:")
+            print(f"   {report_path}")
+    
+    def close(self):
+        """Close the Docker client and release the task directory lock"""
+        self.docker_handler.cleanup()
+        self.cache_manager.release()
     
     def cleanup(self):
-        """Cleanup all resources"""
+        """Cleanup all resources"""
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""File metadata from the get_archive tar headers
+
+The headers carry what os.walk based trees lose: file types, permissions,
+ownership, symlink and hardlink targets, empty directories and links to
+directories. They are recorded while a directory is extracted, or read on
+their own without any file content for a metadata-only diff.
+"""
+import os
+import glob
+import json
+import tarfile
+import posixpath
+from datetime import datetime
+
+# 元数据比对参数，可通过配置文件的 "metadata" 节点覆盖
+DEFAULT_METADATA_OPTIONS = {
+    'enabled': True,   # 比对文件类型、权限、属主和链接目标（来自 tar 头，不读取文件内容）
+    'owner': True      # 比对属主 uid/gid
+}
+
+METADATA_DIFF_TYPES = ('type_mismatch', 'mode_diff', 'owner_diff', 'symlink_diff', 'hardlink_diff')
+
+
+def _get_member_type(member):
+    if member.isdir():
+        return 'directory'
+    if member.issym():
+        return 'symlink'
+    if member.islnk():
+        return 'hardlink'
+    if member.isreg():
+        return 'file'
+    if member.ischr() or member.isblk():
+        return 'device'
+    if member.isfifo():
+        return 'fifo'
+    return 'other'
+
+
+class TarMetadata:
+    """Header entries of the get_archive tar of one directory, keyed by image path"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        # get_archive puts the directory itself at the top of the tar
+        self._parent = posixpath.dirname(directory.rstrip('/')) or '/'
+        self.entries = {}
+
+    def _get_image_path(self, name):
+        return posixpath.normpath(posixpath.join(self._parent, name.lstrip('/'))).replace('//', '/')
+
+    def add(self, member):
+        """Record one tar member, usable as an extraction callback"""
+        path = self._get_image_path(member.name)
+        entry = {
+            'name': posixpath.basename(path) or '/',
+            'type': _get_member_type(member),
+            'mode': f"{member.mode & 0o7777:04o}",
+            'uid': member.uid,
+            'gid': member.gid,
+            'uname': member.uname,
+            'gname': member.gname,
+            'size': member.size if member.isreg() else None,
+            'mtime': datetime.fromtimestamp(member.mtime).isoformat(),
+            'is_dir': member.isdir()
+        }
+        if member.issym():
+            entry['linkname'] = member.linkname
+        elif member.islnk():
+            entry['linkname'] = self._get_image_path(member.linkname)
+        self.entries[path] = entry
+
+    def read(self, fileobj):
+        """Record the headers of a tar stream, skipping over the file contents
+
+        Returns:
+            int: Number of members
+        """
+        with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+            for member in tar:
+                self.add(member)
+        return len(self.entries)
+
+    def save(self, metadata_dir):
+        """Save the entries next to those of the other directories of the image"""
+        os.makedirs(metadata_dir, exist_ok=True)
+        name = self.directory.strip('/').replace('/', '_') or "root"
+        file_path = os.path.join(metadata_dir, f"{name}.json")
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+        return file_path
+
+
+def load_metadata(metadata_dir):
+    """All entries saved for an image, empty when none were recorded"""
+    entries = {}
+    for file_path in sorted(glob.glob(os.path.join(metadata_dir, "*.json"))):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            entries.update(json.load(f))
+    return entries
+
+
+def _in_compare_dirs(path, compare_dirs):
+    return any(directory == '/' or path == directory or path.startswith(directory + '/')
+               for directory in compare_dirs)
+
+
+def _has_ancestor(path, paths):
+    parent = posixpath.dirname(path)
+    while parent not in ('/', ''):
+        if parent in paths:
+            return True
+        parent = posixpath.dirname(parent)
+    return False
+
+
+def diff_metadata(entries1, entries2, compare_dirs, compare_owner=True):
+    """Metadata differences of two images, in path order
+
+    Types: type_mismatch, mode_diff, owner_diff, symlink_diff, hardlink_diff,
+    and only_in_1/only_in_2 for the topmost entry missing on one side.
+    Symlink modes are meaningless and never compared.
+    """
+    diffs = []
+    only_in = {'only_in_1': set(), 'only_in_2': set()}
+    for path in sorted(set(entries1) | set(entries2)):
+        if not _in_compare_dirs(path, compare_dirs):
+            continue
+        entry1 = entries1.get(path)
+        entry2 = entries2.get(path)
+        if entry1 is None or entry2 is None:
+            diff_type = 'only_in_2' if entry1 is None else 'only_in_1'
+            if not _has_ancestor(path, only_in[diff_type]):
+                diffs.append({'path': path, 'type': diff_type, 'item1': entry1, 'item2': entry2})
+            only_in[diff_type].add(path)
+            continue
+
+        types = {entry1['type'], entry2['type']}
+        if len(types) > 1:
+            # A hardlink is a regular file whose content is shared
+            if types != {'file', 'hardlink'}:
+                diffs.append({'path': path, 'type': 'type_mismatch', 'item1': entry1, 'item2': entry2})
+                continue
+        if entry1['type'] == 'symlink':
+            if entry1['linkname'] != entry2['linkname']:
+                diffs.append({'path': path, 'type': 'symlink_diff', 'item1': entry1, 'item2': entry2})
+        else:
+            if entry1['type'] == entry2['type'] == 'hardlink' and entry1['linkname'] != entry2['linkname']:
+                diffs.append({'path': path, 'type': 'hardlink_diff', 'item1': entry1, 'item2': entry2})
+            if entry1['mode'] != entry2['mode']:
+                diffs.append({'path': path, 'type': 'mode_diff', 'item1': entry1, 'item2': entry2})
+        if compare_owner and (entry1['uid'], entry1['gid']) != (entry2['uid'], entry2['gid']):
+            diffs.append({'path': path, 'type': 'owner_diff', 'item1': entry1, 'item2': entry2})
+    return diffs
+
+
+def drop_covered(metadata_diffs, differences):
+    """Drop the missing entries the content diff already reports
+
+    Only empty directories, links to directories and other entries the
+    content diff can not see stay as only_in_1/only_in_2. A directory the
+    content diff lists file by file (see external_sort) is covered by its
+    files.
+    """
+    covered = {diff['path'] for diff in differences if diff['type'] in ('only_in_1', 'only_in_2')}
+    # Directories above a missing file, a missing directory of the metadata diff is one of them
+    parents = set()
+    for path in covered:
+        parent = posixpath.dirname(path)
+        while parent not in ('/', '') and parent not in parents:
+            parents.add(parent)
+            parent = posixpath.dirname(parent)
+    return [diff for diff in metadata_diffs
+            if diff['type'] not in ('only_in_1', 'only_in_2')
+            or (diff['path'] not in covered and diff['path'] not in parents
+                and not _has_ancestor(diff['path'], covered))]
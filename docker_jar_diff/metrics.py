@@ -0,0 +1,109 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Per-phase wall time, byte and file counters plus cache hit rates
+
+    Phase times are inclusive: a phase that runs inside another one (for
+    example ``archive_index`` inside ``build_tree``) is counted in both.
+    """
+
+    PROMETHEUS_PREFIX = 'docker_jar_diff'
+
+    def __init__(self):
+        self.phases = {}
+        self.caches = {}
+        self.labels = {}
+        # Optional profiling.Profiler, scoped to the same phases
+        self.profiler = None
+        self._lock = threading.Lock()
+
+    def _get_phase(self, name):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = {'seconds': 0.0, 'calls': 0, 'bytes': 0, 'files': 0}
+        return phase
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block of work as one call of the named phase"""
+        profiler = self.profiler
+        token = profiler.enter(name) if profiler is not None else None
+        start_time = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start_time
+            if token is not None:
+                profiler.exit(token)
+            with self._lock:
+                phase = self._get_phase(name)
+                phase['seconds'] += elapsed
+                phase['calls'] += 1
+
+    def add(self, name, bytes=0, files=0):
+        """Add processed bytes and files to a phase"""
+        with self._lock:
+            phase = self._get_phase(name)
+            phase['bytes'] += bytes
+            phase['files'] += files
+
+    def cache_hit(self, name, count=1):
+        with self._lock:
+            self.caches.setdefault(name, {'hits': 0, 'misses': 0})['hits'] += count
+
+    def cache_miss(self, name, count=1):
+        with self._lock:
+            self.caches.setdefault(name, {'hits': 0, 'misses': 0})['misses'] += count
+
+    def to_dict(self):
+        with self._lock:
+            caches = {}
+            for name, cache in self.caches.items():
+                total = cache['hits'] + cache['misses']
+                caches[name] = dict(cache, hit_rate=cache['hits'] / total if total else None)
+            return {
+                'labels': dict(self.labels),
+                'phases': {name: dict(phase) for name, phase in self.phases.items()},
+                'caches': caches
+            }
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def to_prometheus(self):
+        """Render metrics in the Prometheus text exposition format"""
+        data = self.to_dict()
+        prefix = self.PROMETHEUS_PREFIX
+        base_labels = ''.join(f',{key}="{self._escape(value)}"' for key, value in data['labels'].items())
+        lines = []
+        for field, help_text in (('seconds', 'Wall time spent in the phase'),
+                                 ('calls', 'Number of times the phase ran'),
+                                 ('bytes', 'Bytes processed by the phase'),
+                                 ('files', 'Files processed by the phase')):
+            metric = f"{prefix}_phase_{field}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for name, phase in sorted(data['phases'].items()):
+                lines.append(f'{metric}{{phase="{name}"{base_labels}}} {phase[field]}')
+        for field in ('hits', 'misses', 'hit_rate'):
+            metric = f"{prefix}_cache_{field}"
+            lines.append(f"# TYPE {metric} gauge")
+            for name, cache in sorted(data['caches'].items()):
+                if cache[field] is not None:
+                    lines.append(f'{metric}{{cache="{name}"{base_labels}}} {cache[field]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        return path
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,170 @@
+"""Content normalizers for build noise, see the "normalize" config node
+
+Rebuilt artifacts differ in bytes nobody cares about: the Build-Time and
+Built-By headers of MANIFEST.MF, the timestamp comment Maven writes into
+pom.properties, the build time and user of git.properties and dates in
+generated XML. A normalizer, selected by a path glob, removes that noise
+before the file is hashed a second time. Two files whose normalized digests
+match are identical, and so is an archive whose members are all identical
+once at least one of them was normalized.
+
+Globs are matched with fnmatch against the difference path of a file, or
+``!/<member name>`` for archive members, ``*`` also matches ``/``.
+"""
+import re
+import fnmatch
+
+# 内容归一化参数，可通过配置文件的 "normalize" 节点覆盖
+DEFAULT_NORMALIZE_OPTIONS = {
+    'enabled': True,      # 比较前去掉构建噪声，只有噪声不同的文件视为相同
+    'builtin': ['manifest', 'pom_properties', 'git_properties', 'build_info'],  # 启用的内置归一化，可加 xml_dates
+    'manifest_headers': ['Build-Time', 'Build-Date', 'Build-Timestamp', 'Built-By', 'Built-Date',
+                         'Bnd-LastModified'],  # MANIFEST.MF 中忽略的头
+    'git_properties_keys': ['git.build.time', 'git.build.host', 'git.build.user.name',
+                            'git.build.user.email'],  # git.properties 中忽略的键
+    'xml_date_attributes': ['date', 'time', 'timestamp', 'generated', 'created', 'buildDate', 'buildTime',
+                            'build-date', 'build-time'],  # xml_dates 中值为日期时忽略的属性（完整属性名）
+    'rules': [],          # 自定义规则，例如 {"glob": "*.conf", "pattern": "^# generated .*$", "replace": ""}
+    'archives': True,     # 归档内成员归一化后全部相同时，归档本身也视为相同
+    'max_size': 1024 * 1024,  # 超过该大小的文件不做归一化
+    'memo_size': 65536    # 按原始摘要缓存的归一化摘要数量
+}
+
+# Dates and times like 2024-05-01, 2024-05-01T10:00:00.123+02:00 or 20240501-1000
+DATE_PATTERN = re.compile(rb'\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?'
+                          rb'|\d{8}[-T]\d{4,6}')
+XML_COMMENT_PATTERN = re.compile(rb'<!--.*?-->', re.S)
+# name="value" of an XML attribute, the name with its namespace prefix
+XML_ATTRIBUTE_PATTERN = re.compile(rb'''(?<![\w.:-])(?:[\w.-]+:)?([\w.-]+)(\s*=\s*)(?:"([^"]*)"|'([^']*)')''')
+
+
+class Normalizer:
+    """Removes noise from the bytes of the files matching its globs"""
+
+    def __init__(self, name, globs):
+        self.name = name
+        self.globs = list(globs)
+
+    def matches(self, path):
+        return any(fnmatch.fnmatchcase(path, glob) for glob in self.globs)
+
+    def normalize(self, data):
+        raise NotImplementedError
+
+
+class ManifestNormalizer(Normalizer):
+    """Drops MANIFEST.MF headers, continuation lines included"""
+
+    def __init__(self, headers):
+        super().__init__('manifest', ['*META-INF/MANIFEST.MF'])
+        self.headers = {header.lower().encode('utf-8') for header in headers}
+
+    def normalize(self, data):
+        lines = []
+        skipping = False
+        for line in data.replace(b'\r\n', b'\n').split(b'\n'):
+            if line.startswith(b' '):
+                if not skipping:
+                    lines.append(line)
+                continue
+            skipping = line.split(b':', 1)[0].strip().lower() in self.headers
+            if not skipping:
+                lines.append(line)
+        return b'\n'.join(lines)
+
+
+class PropertiesNormalizer(Normalizer):
+    """Drops the comments and the given keys of a .properties file"""
+
+    def __init__(self, name, globs, keys=(), comments=False):
+        super().__init__(name, globs)
+        self.keys = {key.encode('utf-8') for key in keys}
+        self.comments = comments
+
+    def normalize(self, data):
+        lines = []
+        for line in data.replace(b'\r\n', b'\n').split(b'\n'):
+            stripped = line.lstrip()
+            if self.comments and stripped[:1] in (b'#', b'!'):
+                continue
+            if self.keys and re.split(rb'\s*[=:]\s*|\s+', stripped, 1)[0] in self.keys:
+                continue
+            lines.append(line)
+        return b'\n'.join(lines)
+
+
+class XmlDateNormalizer(Normalizer):
+    """Masks dates in XML comments and date values of the given attributes
+
+    Attribute names match as a whole and case-insensitively, only a value
+    that is a date as a whole is masked: timeout="30" or time="x" are kept.
+    """
+
+    def __init__(self, attributes):
+        super().__init__('xml_dates', ['*.xml'])
+        self.attributes = {attribute.lower().encode('utf-8') for attribute in attributes}
+
+    def _mask_attribute(self, match):
+        value = match.group(3) if match.group(3) is not None else match.group(4)
+        if match.group(1).lower() not in self.attributes or not DATE_PATTERN.fullmatch(value.strip()):
+            return match.group(0)
+        return match.group(0)[:match.end(2) - match.start(0)] + b'"<date>"'
+
+    def normalize(self, data):
+        data = XML_COMMENT_PATTERN.sub(lambda match: DATE_PATTERN.sub(b'<date>', match.group(0)), data)
+        return XML_ATTRIBUTE_PATTERN.sub(self._mask_attribute, data)
+
+
+class RegexNormalizer(Normalizer):
+    """User rule from the config: pattern replaced in every matching file, line by line (re.M)"""
+
+    def __init__(self, name, globs, pattern, replace=''):
+        super().__init__(name, globs)
+        self.pattern = re.compile(pattern.encode('utf-8'), re.M)
+        self.replace = replace.encode('utf-8')
+
+    def normalize(self, data):
+        return self.pattern.sub(self.replace, data)
+
+
+def _builtin_normalizers(options):
+    return {
+        'manifest': lambda: ManifestNormalizer(options['manifest_headers']),
+        # Maven writes "#Generated by Maven" and a "#<date>" comment
+        'pom_properties': lambda: PropertiesNormalizer('pom_properties', ['*META-INF/maven/*pom.properties'],
+                                                       comments=True),
+        'git_properties': lambda: PropertiesNormalizer('git_properties', ['*git.properties'],
+                                                       keys=options['git_properties_keys'], comments=True),
+        # Spring Boot build info
+        'build_info': lambda: PropertiesNormalizer('build_info', ['*META-INF/build-info.properties'],
+                                                   keys=['build.time'], comments=True),
+        # Opt-in, XML attributes are configuration more often than build noise
+        'xml_dates': lambda: XmlDateNormalizer(options['xml_date_attributes'])
+    }
+
+
+def build_normalizers(options):
+    """Normalizers of the resolved "normalize" options, in the order they apply
+
+    Raises:
+        ValueError: Unknown built-in or invalid rule
+    """
+    if not options.get('enabled'):
+        return []
+    builtins = _builtin_normalizers(options)
+    normalizers = []
+    for name in options.get('builtin') or []:
+        if name not in builtins:
+            raise ValueError(f"未知的内置归一化: {name}，可选: {', '.join(builtins)}")
+        normalizers.append(builtins[name]())
+    for index, rule in enumerate(options.get('rules') or []):
+        globs = rule.get('glob') or rule.get('globs')
+        if not globs or 'pattern' not in rule:
+            raise ValueError(f"归一化规则 {index} 需要 glob 和 pattern: {rule}")
+        try:
+            normalizers.append(RegexNormalizer(rule.get('name') or f"rule{index}",
+                                               [globs] if isinstance(globs, str) else globs,
+                                               rule['pattern'], rule.get('replace', '')))
+        except re.error as e:
+            raise ValueError(f"归一化规则 {index} 的正则无效: {e}")
+    return normalizers
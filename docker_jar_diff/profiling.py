@@ -0,0 +1,133 @@
+import io
+import os
+import json
+import pstats
+import cProfile
+import threading
+import tracemalloc
+
+# Metrics phase -> function it wraps, used for the summary
+PROFILED_PHASES = {
+    'build_tree': 'DiffEngine._build_directory_tree',
+    'archive_index': 'DiffEngine._build_archive_tree',
+    'find_differences': 'DiffEngine._find_differences',
+    'text_diff': 'DiffEngine.attach_text_diffs',
+    'extract': 'DockerHandler._extract_tar_archive',
+    'report': 'HTMLGenerator.generate_report'
+}
+
+
+class Profiler:
+    """CPU (cProfile) and memory (tracemalloc) profiles scoped per phase
+
+    Each phase gets its own cProfile.Profile. When phases nest, the outer
+    profile is paused so time is attributed to the innermost phase only.
+    Allocation sites are sampled for the first ``max_snapshots`` calls of
+    each phase, since a tracemalloc snapshot is expensive for phases that
+    run once per jar.
+
+    Only the thread that created the profiler is profiled, DockerJarDiff
+    with profile=True therefore acquires the images in that thread (see
+    DockerHandler.single_thread).
+    """
+
+    def __init__(self, output_dir, phases=None, top=30, max_snapshots=3):
+        self.output_dir = output_dir
+        self.phases = set(phases or PROFILED_PHASES)
+        self.top = top
+        self.max_snapshots = max_snapshots
+        self._owner = threading.get_ident()
+        self._profiles = {}
+        self._stack = []
+        self._allocations = {}
+        self._calls = {}
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start(10)
+
+    def enter(self, name):
+        """Start profiling a phase, returns a token for exit()"""
+        if name not in self.phases or threading.get_ident() != self._owner:
+            return None
+
+        if self._stack:
+            self._profiles[self._stack[-1]].disable()
+        profile = self._profiles.setdefault(name, cProfile.Profile())
+        self._stack.append(name)
+
+        calls = self._calls[name] = self._calls.get(name, 0) + 1
+        snapshot = tracemalloc.take_snapshot() if calls <= self.max_snapshots else None
+        profile.enable()
+        return (name, snapshot)
+
+    def exit(self, token):
+        if token is None:
+            return
+        name, snapshot = token
+        self._profiles[name].disable()
+        self._stack.pop()
+
+        if snapshot is not None:
+            after = tracemalloc.take_snapshot().filter_traces(self._trace_filters())
+            sites = self._allocations.setdefault(name, {})
+            for stat in after.compare_to(snapshot.filter_traces(self._trace_filters()), 'lineno'):
+                if stat.size_diff <= 0:
+                    continue
+                frame = stat.traceback[0]
+                key = f"{frame.filename}:{frame.lineno}"
+                site = sites.setdefault(key, {'size_diff': 0, 'count_diff': 0})
+                site['size_diff'] += stat.size_diff
+                site['count_diff'] += stat.count_diff
+
+        if self._stack:
+            self._profiles[self._stack[-1]].enable()
+
+    @staticmethod
+    def _trace_filters():
+        return [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+        ]
+
+    def save(self):
+        """Write <phase>.pstats, <phase>.txt and profile_summary.json
+
+        Returns:
+            str: Output directory
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        summary = {'phases': {}}
+        for name, profile in self._profiles.items():
+            pstats_path = os.path.join(self.output_dir, f"{name}.pstats")
+            profile.dump_stats(pstats_path)
+
+            stream = io.StringIO()
+            stats = pstats.Stats(profile, stream=stream)
+            stream.write(f"Phase {name} ({PROFILED_PHASES.get(name, name)}), {self._calls.get(name, 0)} calls\n\n")
+            stats.sort_stats('cumulative').print_stats(self.top)
+
+            sites = sorted(self._allocations.get(name, {}).items(),
+                           key=lambda item: item[1]['size_diff'], reverse=True)[:self.top]
+            stream.write(f"\nTop allocation sites (first {self.max_snapshots} calls):\n")
+            for site, site_stats in sites:
+                stream.write(f"{site_stats['size_diff'] / 1024:12.1f} KiB {site_stats['count_diff']:8d} blocks  {site}\n")
+            with open(os.path.join(self.output_dir, f"{name}.txt"), 'w', encoding='utf-8') as f:
+                f.write(stream.getvalue())
+
+            summary['phases'][name] = {
+                'function': PROFILED_PHASES.get(name, name),
+                'calls': self._calls.get(name, 0),
+                'pstats': os.path.basename(pstats_path),
+                'top_allocations': [dict(site=site, **site_stats) for site, site_stats in sites[:10]]
+            }
+
+        current, peak = tracemalloc.get_traced_memory()
+        summary['traced_memory'] = {'current': current, 'peak': peak}
+        with open(os.path.join(self.output_dir, "profile_summary.json"), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return self.output_dir
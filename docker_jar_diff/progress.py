@@ -0,0 +1,207 @@
+"""Byte and file progress of the long running steps, with rate and ETA
+
+Tasks count what is done: bytes streamed from get_archive, bytes and files
+extracted, jars indexed, files hashed and units diffed. Totals are set
+where they are known in advance (a saved tar, the jars found so far, the
+files to hash and to diff, the diff units), those tasks get an ETA. Counting is cheap, listeners are only
+called every ``interval`` seconds and when a task finishes.
+"""
+import sys
+import time
+import threading
+
+# 进度显示参数，可通过配置文件的 "progress" 节点覆盖
+DEFAULT_PROGRESS_OPTIONS = {
+    'enabled': True,      # 显示下载、解压、索引、摘要计算和比对的进度
+    'interval': 0.5,      # 终端进度条的刷新间隔秒数
+    'log_interval': 10.0  # 输出不是终端时，每隔多少秒打印一行进度
+}
+
+TASK_LABELS = {
+    'transfer': '下载',
+    'extract': '解压',
+    'archive_index': '索引归档',
+    'hash': '摘要',
+    'diff': '比对'
+}
+
+
+class ProgressTask:
+    """Counters of one step, updated from any thread"""
+
+    def __init__(self, tracker, name, total_bytes=None, total_files=None):
+        self.tracker = tracker
+        self.name = name
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.bytes = 0
+        self.files = 0
+        self.done = False
+        self.start_time = time.monotonic()
+
+    def advance(self, bytes=0, files=0):
+        with self.tracker.lock:
+            self.bytes += bytes
+            self.files += files
+        self.tracker.changed()
+
+    def add_total(self, bytes=0, files=0):
+        """Grow the totals of a task whose work is discovered as it goes"""
+        with self.tracker.lock:
+            if bytes:
+                self.total_bytes = (self.total_bytes or 0) + bytes
+            if files:
+                self.total_files = (self.total_files or 0) + files
+
+    def finish(self):
+        self.done = True
+        self.tracker.changed(force=True)
+
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.start_time, 1e-6)
+        byte_rate = self.bytes / elapsed
+        file_rate = self.files / elapsed
+        eta = None
+        if self.done:
+            eta = 0.0
+        elif self.total_bytes and byte_rate > 0:
+            eta = max(0.0, (self.total_bytes - self.bytes) / byte_rate)
+        elif self.total_files and file_rate > 0:
+            eta = max(0.0, (self.total_files - self.files) / file_rate)
+        return {
+            'name': self.name,
+            'bytes': self.bytes,
+            'files': self.files,
+            'total_bytes': self.total_bytes,
+            'total_files': self.total_files,
+            'bytes_per_second': byte_rate,
+            'files_per_second': file_rate,
+            'elapsed': elapsed,
+            'eta': eta,
+            'done': self.done
+        }
+
+
+class ProgressTracker:
+    """The tasks of one comparison and the listener that is told about them
+
+    The listener is called like the progress callback of compare(), with
+    ``listener('progress', tasks=[...])`` and one snapshot per running task
+    (tasks that just finished included).
+    """
+
+    def __init__(self, listener=None, interval=0.5):
+        self.listener = listener
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self._next_emit = 0.0
+
+    def task(self, name, total_bytes=None, total_files=None):
+        """Start a task, or continue the running task of that name"""
+        with self.lock:
+            task = self.tasks.get(name)
+            if task is None or task.done:
+                task = self.tasks[name] = ProgressTask(self, name, total_bytes, total_files)
+            elif total_bytes or total_files:
+                task.total_bytes = (task.total_bytes or 0) + (total_bytes or 0) or None
+                task.total_files = (task.total_files or 0) + (total_files or 0) or None
+        return task
+
+    def finish(self, name):
+        """Finish the task of that name if it is running"""
+        task = self.tasks.get(name)
+        if task is not None and not task.done:
+            task.finish()
+
+    def changed(self, force=False):
+        if self.listener is None:
+            return
+        now = time.monotonic()
+        if not force and now < self._next_emit:
+            return
+        with self.lock:
+            if not force and now < self._next_emit:
+                return
+            self._next_emit = now + self.interval
+            snapshots = [task.snapshot() for task in self.tasks.values()]
+            # Finished tasks are reported once
+            self.tasks = {name: task for name, task in self.tasks.items() if not task.done}
+        self.listener('progress', tasks=snapshots)
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}" if seconds >= 3600 \
+        else f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def format_task(task, bar_width=0):
+    """One line of text for a task snapshot, with a bar when the total is known"""
+    label = TASK_LABELS.get(task['name'], task['name'])
+    ratio = None
+    if task['total_bytes']:
+        ratio = task['bytes'] / task['total_bytes']
+    elif task['total_files']:
+        ratio = task['files'] / task['total_files']
+    if bar_width and ratio is not None:
+        filled = int(min(1.0, 1.0 if task['done'] else ratio) * bar_width)
+        label += f" [{'#' * filled}{'.' * (bar_width - filled)}]"
+    if task['total_bytes']:
+        text = f"{label} {format_bytes(task['bytes'])}/{format_bytes(task['total_bytes'])}"
+    elif task['total_files']:
+        text = f"{label} {task['files']}/{task['total_files']}"
+    else:
+        text = f"{label} {format_bytes(task['bytes'])}" if task['bytes'] else f"{label} {task['files']} 个文件"
+    if task['bytes']:
+        text += f" {format_bytes(task['bytes_per_second'])}/s"
+    if task['done']:
+        text += " ✓"
+    elif task['eta'] is not None:
+        text += f" 剩余 {format_seconds(task['eta'])}"
+    return text
+
+
+class ProgressPrinter:
+    """Shows progress events as a bar on a terminal, or as periodic log lines"""
+
+    MAX_WIDTH = 200
+    BAR_WIDTH = 10
+
+    def __init__(self, stream=None, log_interval=10.0):
+        self.stream = stream or sys.stdout
+        self.is_tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self.log_interval = log_interval
+        self._last_log = 0.0
+        self._line_width = 0
+
+    def update(self, tasks):
+        line = ' | '.join(format_task(task, self.BAR_WIDTH if self.is_tty else 0) for task in tasks)
+        if not line:
+            return
+        if self.is_tty:
+            self.clear()
+            line = line[:self.MAX_WIDTH]
+            self.stream.write(line)
+            self._line_width = len(line)
+            self.stream.flush()
+        else:
+            now = time.monotonic()
+            if now - self._last_log >= self.log_interval or any(task['done'] for task in tasks):
+                self._last_log = now
+                self.stream.write(f"⏳ {line}\n")
+                self.stream.flush()
+
+    def clear(self):
+        """Remove the bar before other output is printed"""
+        if self.is_tty and self._line_width:
+            self.stream.write('\r' + ' ' * self._line_width + '\r')
+            self.stream.flush()
+            self._line_width = 0
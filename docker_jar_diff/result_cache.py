@@ -0,0 +1,162 @@
+import os
+import json
+import logging
+import time
+import uuid
+import hashlib
+
+from . import __version__
+from .utils import Utils
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever diff.json or the report change in a way older entries
+# can not be served for:
+# 2 - metadata_differences (types, modes, owners and link targets)
+# 3 - compare_stats.normalized and archives identical after normalization
+# 4 - no paths into task directories in cached entries
+# 5 - archives identical only when a member was normalized
+RESULT_FORMAT_VERSION = 5
+
+
+class ResultCache:
+    """Finished diff.json and report per comparison key
+
+    Entries live in ``<cache>/results/<key>/`` and are never modified once
+    published. The key hashes everything that decides the output (image IDs,
+    compare directories, diff options, digest algorithm and tool version), so
+    a change of any of them simply misses and old entries age out.
+    """
+
+    DIFF_FILE = "diff.json"
+    REPORT_FILE = "index.html"
+    META_FILE = "result.json"
+
+    def __init__(self, result_dir):
+        self.result_dir = result_dir
+        self.tmp_dir = os.path.join(result_dir, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(image1_id, image2_id, compare_dirs, options=None):
+        """Build the cache key of a comparison
+
+        Args:
+            compare_dirs: Normalized compare directories
+            options: JSON-serializable settings that change the diff output
+        """
+        key_parts = {
+            'image1_id': image1_id,
+            'image2_id': image2_id,
+            'compare_dirs': list(compare_dirs),
+            'options': options or {},
+            'tool_version': __version__,
+            'format_version': RESULT_FORMAT_VERSION
+        }
+        encoded = json.dumps(key_parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()[:32]
+
+    def get_entry_dir(self, key):
+        return os.path.join(self.result_dir, key)
+
+    def get(self, key):
+        """Look up a finished comparison
+
+        Returns:
+            dict: Entry metadata plus 'diff_json_path' and 'report_path', or None
+        """
+        entry_dir = self.get_entry_dir(key)
+        meta_path = os.path.join(entry_dir, self.META_FILE)
+        try:
+            meta = Utils.load_json(meta_path)
+        except (OSError, ValueError):
+            return None
+        meta['diff_json_path'] = os.path.join(entry_dir, self.DIFF_FILE)
+        meta['report_path'] = os.path.join(entry_dir, self.REPORT_FILE)
+        if not os.path.exists(meta['diff_json_path']):
+            return None
+        if not os.path.exists(meta['report_path']):
+            meta['report_path'] = None
+        # Recently served entries are the last to be evicted
+        try:
+            os.utime(entry_dir)
+        except OSError:
+            pass
+        return meta
+
+    @staticmethod
+    def make_portable(data, task_dir):
+        """Copy of a diff result without paths into the task directory
+
+        Task directories are evicted long before cached entries expire, so
+        item paths, dir1 and dir2 under task_dir become None.
+        """
+        task_dir = os.path.normpath(task_dir)
+
+        def strip(value):
+            if isinstance(value, dict):
+                return {key: strip(item) for key, item in value.items()}
+            if isinstance(value, list):
+                return [strip(item) for item in value]
+            if isinstance(value, str) and (value == task_dir or value.startswith(task_dir + os.sep)):
+                return None
+            return value
+
+        return strip(data)
+
+    def put(self, key, meta, diff_result, write_report=None):
+        """Publish a finished comparison
+
+        The entry is assembled in a temporary directory and renamed into
+        place, readers never see a partial entry. When another process
+        published the same key first, its entry is kept.
+
+        Args:
+            diff_result: Diff result to store as diff.json, see make_portable
+            write_report: Optional write_report(report_path) writing the
+                report of diff_result
+
+        Returns:
+            str: Entry directory
+        """
+        entry_dir = self.get_entry_dir(key)
+        tmp_entry_dir = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        os.makedirs(tmp_entry_dir)
+        try:
+            Utils.save_json(diff_result, os.path.join(tmp_entry_dir, self.DIFF_FILE))
+            if write_report:
+                write_report(os.path.join(tmp_entry_dir, self.REPORT_FILE))
+            Utils.save_json(dict(meta, key=key, created=time.time()),
+                            os.path.join(tmp_entry_dir, self.META_FILE))
+            try:
+                os.rename(tmp_entry_dir, entry_dir)
+            except OSError:
+                # Already published (rename onto a non-empty directory fails)
+                if not os.path.isdir(entry_dir):
+                    raise
+        finally:
+            Utils.remove_dir(tmp_entry_dir)
+        return entry_dir
+
+    def evict(self, max_age):
+        """Remove entries not served for max_age seconds
+
+        Returns:
+            list: Removed entry directories
+        """
+        now = time.time()
+        removed = []
+        for item in os.listdir(self.result_dir):
+            entry_dir = os.path.join(self.result_dir, item)
+            if item == "tmp" or not os.path.isdir(entry_dir):
+                continue
+            try:
+                if now - os.path.getmtime(entry_dir) > max_age:
+                    Utils.remove_dir(entry_dir)
+                    removed.append(entry_dir)
+            except OSError as e:
+                logger.warning("清理结果缓存失败: %s, 错误: %s", entry_dir, e)
+        return removed
+
+    def get_size(self):
+        return Utils.get_dir_size(self.result_dir)
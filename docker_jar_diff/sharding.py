@@ -0,0 +1,402 @@
+"""Sharded diff across worker processes, possibly on several hosts
+
+The compared view is split into units: paths of at most ``depth`` parts
+that a full diff would recurse into separately. Units are assigned to
+shards, each shard is diffed by ``docker-jar-diff shard-worker`` against the
+extracted images in the shared cache directory, and the coordinator
+concatenates the per-unit differences in sorted unit order. That is the
+order of a single-process diff, so the merged diff.json is byte-identical.
+
+Workers on other hosts must see the cache directory at the same path (for
+example the same NFS mount point), the paths are part of the result.
+"""
+import os
+import sys
+import time
+import zlib
+import itertools
+import subprocess
+
+from .utils import Utils
+from .metrics import Metrics
+from .blob_store import BlobStore
+
+# 分片比对参数，可通过配置文件的 "shard" 节点覆盖
+DEFAULT_SHARD_OPTIONS = {
+    'depth': None,          # 分片单元的最大路径深度，不指定时按分片数自动选择
+    'strategy': 'prefix',   # prefix: 按排序后的路径连续切分；hash: 按路径哈希分配
+    'timeout': 3600,        # 等待所有分片完成的最长秒数
+    'poll_interval': 0.5    # 检查分片结果的间隔秒数
+}
+
+PLAN_FILE = "plan.json"
+PLAN_VERSION = 1
+MAX_AUTO_DEPTH = 8
+
+
+def plan_units(files1, files2, depth):
+    """Group the files of two images into units of at most depth parts
+
+    A path is only split further while it is a directory in both images,
+    exactly where a full diff recurses into it.
+
+    Returns:
+        dict: Unit tuple -> number of files below it
+    """
+    def dir_prefixes(files):
+        prefixes = set()
+        for parts in files:
+            for length in range(1, min(len(parts), depth)):
+                prefixes.add(parts[:length])
+        return prefixes
+
+    shared_dirs = dir_prefixes(files1) & dir_prefixes(files2)
+    units = {}
+    for parts in itertools.chain(files1, files2):
+        length = 1
+        limit = min(len(parts), depth)
+        while length < limit and parts[:length] in shared_dirs:
+            length += 1
+        unit = parts[:length]
+        units[unit] = units.get(unit, 0) + 1
+    return units
+
+
+def choose_units(files1, files2, min_units, depth=None):
+    """Plan units, going deeper until there are at least min_units of them
+
+    Returns:
+        (dict, int): Units with their weights, and the depth used
+    """
+    if depth:
+        return plan_units(files1, files2, depth), depth
+    depth = 1
+    units = plan_units(files1, files2, depth)
+    while len(units) < min_units and depth < MAX_AUTO_DEPTH:
+        # Nothing reaches the current depth, going deeper changes nothing
+        if not any(len(unit) == depth for unit in units):
+            break
+        depth += 1
+        units = plan_units(files1, files2, depth)
+    return units, depth
+
+
+def assign_shards(units, shards, strategy='prefix'):
+    """Assign units to shards
+
+    prefix keeps sorted units together in contiguous, similarly weighted
+    ranges; hash spreads them by a stable hash of their path.
+
+    Returns:
+        list: [unit, shard] in sorted unit order
+    """
+    ordered = sorted(units)
+    if strategy == 'hash':
+        return [[list(unit), zlib.crc32('/'.join(unit).encode('utf-8')) % shards] for unit in ordered]
+    if strategy != 'prefix':
+        raise ValueError(f"不支持的分片方式: {strategy}，可选: prefix, hash")
+    total = sum(units.values()) or 1
+    assignments = []
+    done = 0
+    for unit in ordered:
+        assignments.append([list(unit), min(shards - 1, done * shards // total)])
+        done += units[unit]
+    return assignments
+
+
+def diff_by_units(diff_engine, dir1, dir2, compare_dir=None, min_units=64, checkpoint=None, on_unit=None):
+    """Diff two directories unit by unit in one process
+
+    Args:
+        checkpoint: Optional checkpoint.Checkpoint, finished units are
+            recorded and the units of an interrupted run are not diffed again
+        on_unit: Optional callback on_unit(unit, differences, done, total)
+            after each unit, for results that are shown while the diff runs
+
+    Returns:
+        dict: The same result as DiffEngine.diff_directories
+    """
+    metrics = diff_engine.metrics
+    units = checkpoint.get_units() if checkpoint is not None else None
+    if units is None:
+        with metrics.phase('build_tree'):
+            files1 = diff_engine.list_view_files(dir1, compare_dir)
+            files2 = diff_engine.list_view_files(dir2, compare_dir)
+        units = sorted(choose_units(files1, files2, max(1, int(min_units)))[0])
+        if checkpoint is not None:
+            checkpoint.set_units(units)
+
+    finished = {}
+    if checkpoint is not None:
+        finished = checkpoint.load_unit_results()
+        metrics.add('checkpoint', files=len(finished))
+    compare_stats = diff_engine.new_compare_stats()
+    diffs = []
+    progress = diff_engine.progress_tracker.task('diff', total_files=len(units))
+    with diff_engine.text_diff_run():
+        for done, unit in enumerate(units, start=1):
+            if unit in finished:
+                unit_diffs, unit_stats = finished[unit]
+            else:
+                unit_stats = diff_engine.new_compare_stats()
+                with metrics.phase('build_tree'):
+                    item1 = diff_engine.build_view_item(dir1, compare_dir, unit)
+                    item2 = diff_engine.build_view_item(dir2, compare_dir, unit)
+                unit_diffs = diff_engine.diff_unit(unit, item1, item2, compare_dir, unit_stats)
+                if checkpoint is not None:
+                    checkpoint.complete_unit(unit, unit_diffs, unit_stats)
+            diff_engine.add_compare_stats(compare_stats, unit_stats)
+            diffs.extend(unit_diffs)
+            progress.advance(files=1)
+            if on_unit:
+                on_unit(unit, unit_diffs, done, len(units))
+    progress.finish()
+    return diff_engine.assemble_result(dir1, dir2, compare_dir, compare_stats, diffs)
+
+
+def worker_command(plan_path, index):
+    """Command line of a local shard worker"""
+    if getattr(sys, 'frozen', False):
+        return [sys.executable, 'shard-worker', plan_path, str(index)]
+    return [sys.executable, '-m', 'docker_jar_diff.cli', 'shard-worker', plan_path, str(index)]
+
+
+def _get_result_path(shard_dir, index):
+    return os.path.join(shard_dir, f"shard_{index}.json")
+
+
+class _ShardWorkspace:
+    """The parts of CacheManager a DiffEngine needs, for worker processes"""
+
+    def __init__(self, hash_algorithm, blob_store=None):
+        self.hash_algorithm = hash_algorithm
+        self.blob_store = blob_store
+
+
+class ShardCoordinator:
+    """Plans a sharded diff, runs or waits for its workers and merges the output"""
+
+    def __init__(self, diff_engine, shard_dir, shards, options=None, metrics=None, progress=None,
+                 on_unit=None):
+        self.diff_engine = diff_engine
+        self.shard_dir = shard_dir
+        self.shards = max(1, int(shards))
+        self.options = dict(DEFAULT_SHARD_OPTIONS)
+        if options:
+            self.options.update(options)
+        self.metrics = metrics or Metrics()
+        self.progress = progress
+        # on_unit(unit, differences, done, total) as the results of a shard come in
+        self.on_unit = on_unit
+        self.plan_path = os.path.join(shard_dir, PLAN_FILE)
+
+    def _report(self, message):
+        if self.progress:
+            self.progress('log', message=message)
+
+    def write_plan(self, dir1, dir2, compare_dir=None):
+        """Plan units and shards, export known digests for the workers
+
+        Returns:
+            dict: The plan, also written to plan.json
+        """
+        engine = self.diff_engine
+        os.makedirs(self.shard_dir, exist_ok=True)
+        with self.metrics.phase('shard_plan'):
+            files = [engine.list_view_files(directory, compare_dir) for directory in (dir1, dir2)]
+            units, depth = choose_units(files[0], files[1], self.shards * 4, self.options['depth'])
+
+            # Workers know what the extracting process knew, digests included,
+            # so every comparison ends at the same tier as in a single process
+            digest_paths = []
+            for index, (directory, image_files) in enumerate(zip((dir1, dir2), files), start=1):
+                digest_path = os.path.join(self.shard_dir, f"digests_{index}.json")
+                Utils.save_json(self._export_digests(directory, compare_dir, image_files), digest_path)
+                digest_paths.append(digest_path)
+
+            blob_store = engine.cache_manager.blob_store
+            plan = {
+                'version': PLAN_VERSION,
+                'shards': self.shards,
+                'depth': depth,
+                'strategy': self.options['strategy'],
+                'dir1': dir1,
+                'dir2': dir2,
+                'compare_dir': compare_dir,
+                'hash_algorithm': engine.hash_algorithm,
+                'text_diff': engine.text_diff_options,
+                'compare': engine.compare_options,
+                'normalize': engine.normalize_options,
+                'blob_dir': blob_store.blob_dir if blob_store else None,
+                'digests': digest_paths,
+                'units': assign_shards(units, self.shards, self.options['strategy'])
+            }
+            # A resumed task keeps the shards finished under the same plan
+            if not os.path.exists(self.plan_path) or Utils.load_json(self.plan_path) != plan:
+                for index in range(self.shards):
+                    result_path = _get_result_path(self.shard_dir, index)
+                    if os.path.exists(result_path):
+                        os.remove(result_path)
+                Utils.save_json(plan, self.plan_path)
+        self.metrics.add('shard_plan', files=len(files[0]) + len(files[1]))
+        self._report(f"📋 分片计划: {len(plan['units'])} 个单元（深度 {depth}），{self.shards} 个分片: {self.plan_path}")
+        return plan
+    
+    def get_pending(self):
+        """Shards without a result yet"""
+        return [index for index in range(self.shards)
+                if not os.path.exists(_get_result_path(self.shard_dir, index))]
+
+    def _export_digests(self, directory, compare_dir, image_files):
+        blob_store = self.diff_engine.cache_manager.blob_store
+        if not blob_store:
+            return {}
+        view_root, _ = self.diff_engine.get_view(directory, compare_dir)
+        digests = {}
+        for parts in image_files:
+            try:
+                digest = blob_store.lookup_digest(os.stat(os.path.join(view_root, *parts)))
+            except OSError:
+                continue
+            if digest:
+                digests['/'.join(parts)] = digest
+        return digests
+
+    def launch_local(self, shards=None):
+        """Start one worker process per shard on this host
+
+        Returns:
+            dict: Shard index -> process
+        """
+        env = dict(os.environ)
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+        processes = {}
+        for index in range(self.shards) if shards is None else shards:
+            log_path = os.path.join(self.shard_dir, f"shard_{index}.log")
+            with open(log_path, 'wb') as log_file:
+                processes[index] = subprocess.Popen(worker_command(self.plan_path, index), stdout=log_file,
+                                                    stderr=subprocess.STDOUT, env=env)
+        return processes
+
+    def wait(self, processes=None, plan=None):
+        """Wait until every shard has written its result
+
+        Raises:
+            RuntimeError: A local worker failed or the timeout was reached
+        """
+        deadline = time.monotonic() + self.options['timeout']
+        pending = set(range(self.shards))
+        total = len(plan['units']) if plan else 0
+        done = 0
+        progress = self.diff_engine.progress_tracker.task('diff', total_files=total or None)
+        with self.metrics.phase('shard_wait'):
+            while pending:
+                finished = {index for index in pending
+                            if os.path.exists(_get_result_path(self.shard_dir, index))}
+                pending -= finished
+                if plan:
+                    progress.advance(files=sum(1 for _, shard in plan['units'] if shard in finished))
+                if self.on_unit:
+                    for index in sorted(finished):
+                        for unit_result in Utils.load_json(_get_result_path(self.shard_dir, index))['units']:
+                            done += 1
+                            self.on_unit(tuple(unit_result['unit']), unit_result['differences'], done, total)
+                for index, process in (processes or {}).items():
+                    if index in pending and process.poll() not in (None, 0):
+                        raise RuntimeError(f"分片 {index} 执行失败（返回码 {process.returncode}），"
+                                           f"日志: {os.path.join(self.shard_dir, f'shard_{index}.log')}")
+                if not pending:
+                    break
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"等待分片超时，未完成的分片: {sorted(pending)}")
+                time.sleep(self.options['poll_interval'])
+        progress.finish()
+        for process in (processes or {}).values():
+            process.wait()
+
+    def merge(self, plan):
+        """Merge the shard results into one diff result"""
+        engine = self.diff_engine
+        with self.metrics.phase('shard_merge'):
+            differences_by_unit = {}
+            compare_stats = engine.new_compare_stats()
+            for index in range(plan['shards']):
+                result = Utils.load_json(_get_result_path(self.shard_dir, index))
+                for unit_result in result['units']:
+                    differences_by_unit[tuple(unit_result['unit'])] = unit_result['differences']
+                engine.add_compare_stats(compare_stats, result['compare_stats'])
+
+            diffs = []
+            for unit, _ in plan['units']:
+                diffs.extend(differences_by_unit[tuple(unit)])
+        return engine.assemble_result(plan['dir1'], plan['dir2'], plan['compare_dir'], compare_stats, diffs)
+
+    def run(self, dir1, dir2, compare_dir=None, launch=True):
+        """Plan, run the shards (or wait for external workers) and merge"""
+        plan = self.write_plan(dir1, dir2, compare_dir)
+        pending = self.get_pending()
+        if len(pending) < self.shards:
+            self._report(f"♻️ 复用已完成的分片: {self.shards - len(pending)}/{self.shards}")
+        processes = None
+        if launch:
+            processes = self.launch_local(pending)
+        else:
+            for index in pending:
+                self._report(f"⏳ 等待分片 {index}: docker-jar-diff shard-worker {self.plan_path} {index}")
+        self.wait(processes, plan)
+        return self.merge(plan)
+
+
+def run_shard(plan_path, index, metrics=None):
+    """Diff the units of one shard, the entry point of shard-worker
+
+    Returns:
+        str: Path of the shard result
+    """
+    from .diff_engine import DiffEngine
+
+    plan = Utils.load_json(plan_path)
+    if plan.get('version') != PLAN_VERSION:
+        raise RuntimeError(f"不支持的分片计划版本: {plan.get('version')}")
+    shard_dir = os.path.dirname(os.path.abspath(plan_path))
+    blob_store = BlobStore(plan['blob_dir'], plan['hash_algorithm']) if plan.get('blob_dir') else None
+    engine = DiffEngine(_ShardWorkspace(plan['hash_algorithm'], blob_store), plan['text_diff'],
+                        metrics=metrics, compare_options=plan['compare'],
+                        normalize_options=plan.get('normalize'))
+    compare_dir = plan['compare_dir']
+
+    if blob_store:
+        for directory, digest_path in zip((plan['dir1'], plan['dir2']), plan['digests']):
+            view_root, _ = engine.get_view(directory, compare_dir)
+            for rel_path, digest in Utils.load_json(digest_path).items():
+                try:
+                    blob_store.record_digest(os.stat(os.path.join(view_root, *rel_path.split('/'))), digest)
+                except OSError:
+                    pass
+
+    start_time = time.monotonic()
+    compare_stats = engine.new_compare_stats()
+    units = []
+    # Each shard runs in parallel with its own text diff total_timeout
+    with engine.text_diff_run():
+        for unit, shard in plan['units']:
+            if shard != index:
+                continue
+            unit = tuple(unit)
+            item1 = engine.build_view_item(plan['dir1'], compare_dir, unit)
+            item2 = engine.build_view_item(plan['dir2'], compare_dir, unit)
+            units.append({'unit': list(unit),
+                          'differences': engine.diff_unit(unit, item1, item2, compare_dir, compare_stats)})
+
+    result_path = _get_result_path(shard_dir, index)
+    tmp_path = f"{result_path}.{os.getpid()}.tmp"
+    Utils.save_json({
+        'shard': index,
+        'seconds': time.monotonic() - start_time,
+        'compare_stats': compare_stats,
+        'units': units
+    }, tmp_path)
+    # The coordinator only ever sees complete results
+    os.replace(tmp_path, result_path)
+    return result_path
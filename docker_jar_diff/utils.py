@@ -1,12 +1,16 @@
 import os
+import posixpath
 import shutil
 import tempfile
-import hashlib
 import json
+import logging
 import subprocess
 import platform
 from pathlib import Path
 from datetime import datetime
+from .hashing import hash_file
+
+logger = logging.getLogger(__name__)
 
 class Utils:
     @staticmethod
@@ -52,18 +56,38 @@ class Utils:
                 time.sleep(retry_delay)
                 retry_delay *= 2  # Exponential backoff
     
+    @staticmethod
+    def get_dir_size(dir_path, skip_hardlinks=False):
+        """Get total size in bytes of all files under a directory
+        
+        Args:
+            dir_path: Directory path
+            skip_hardlinks: Do not count files with more than one link
+        """
+        total = 0
+        for root, dirs, files in os.walk(dir_path):
+            for file in files:
+                try:
+                    stat = os.lstat(os.path.join(root, file))
+                except OSError:
+                    continue
+                if skip_hardlinks and stat.st_nlink > 1:
+                    continue
+                total += stat.st_size
+        return total
+    
     @staticmethod
     def get_file_hash(file_path, algorithm='sha256'):
-        """Get file hash"""
-        hash_func = hashlib.new(algorithm)
-        with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b''):
-                hash_func.update(chunk)
-        return hash_func.hexdigest()
+        """Get file hash, see hashing.SUPPORTED_ALGORITHMS"""
+        return hash_file(file_path, algorithm)
     
     @staticmethod
-    def get_file_info(file_path):
-        """Get file information"""
+    def get_file_info(file_path, digest=None, hash_content=True, algorithm='md5'):
+        """Get file information, the digest is only calculated when not given
+        
+        With hash_content=False a missing digest stays None, to be computed
+        later only if it is needed.
+        """
         abs_file_path = os.path.abspath(file_path)
         if not os.path.exists(abs_file_path):
             return None
@@ -71,10 +95,11 @@ class Utils:
         stat = os.stat(abs_file_path)
         is_dir = os.path.isdir(abs_file_path)
         
-        # Only calculate MD5 for files, not directories
-        md5 = None
-        if not is_dir:
-            md5 = Utils.get_file_hash(abs_file_path, algorithm='md5')
+        # Only calculate the digest for files, not directories
+        if is_dir:
+            digest = None
+        elif digest is None and hash_content:
+            digest = Utils.get_file_hash(abs_file_path, algorithm=algorithm)
         
         return {
             'name': os.path.basename(abs_file_path),
@@ -82,7 +107,7 @@ class Utils:
             'size': stat.st_size,
             'mtime': datetime.fromtimestamp(stat.st_mtime).isoformat(),
             'is_dir': is_dir,
-            'md5': md5
+            'digest': digest
         }
     
     @staticmethod
@@ -96,26 +121,62 @@ class Utils:
         """Load data from JSON file"""
         with open(file_path, 'r', encoding='utf-8') as f:
             return json.load(f)
-    
+
+    @staticmethod
+    def to_script_json(data):
+        """JSON to embed in a <script> block, file contents may hold </script> or <!--"""
+        return json.dumps(data).replace('&', '\\u0026').replace('<', '\\u003c').replace('>', '\\u003e')
+
     @staticmethod
     def is_jar_file(file_path):
         """Check if file is a JAR file"""
         return file_path.lower().endswith('.jar')
     
+    @staticmethod
+    def is_archive_file(file_path):
+        """Check if file is a JAR or ZIP archive whose contents are indexed"""
+        return file_path.lower().endswith(('.jar', '.zip'))
+    
     @staticmethod
     def is_text_file(file_path):
         """Check if file is a text file"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                f.read(1024)
-            return True
-        except:
+            with open(file_path, 'rb') as f:
+                return Utils.is_text_data(f.read(8192))
+        except OSError:
             return False
     
+    @staticmethod
+    def is_text_data(data):
+        """Check if a byte sample looks like text (no NUL bytes in the first 8 KB)"""
+        return b'\x00' not in data[:8192]
+    
     @staticmethod
     def get_relative_path(path, base_dir):
         """Get relative path from base directory"""
         return os.path.relpath(path, base_dir)
+
+    @staticmethod
+    def normalize_compare_dirs(compare_dir):
+        """Normalize one or several compare directories into a sorted list
+
+        Paths become absolute POSIX paths, duplicates and directories nested
+        inside another one are dropped. No directory means ['/'].
+        """
+        if not compare_dir:
+            return ['/']
+        if isinstance(compare_dir, str):
+            compare_dir = [compare_dir]
+        dirs = set()
+        for directory in compare_dir:
+            directory = (directory or '').replace('\\', '/').strip('/')
+            dirs.add('/' + posixpath.normpath(directory).lstrip('/') if directory else '/')
+        dirs = {('/' if directory in ('/.', '/') else directory) for directory in dirs}
+        if '/' in dirs:
+            return ['/']
+        return sorted(directory for directory in dirs
+                      if not any(directory.startswith(other + '/') for other in dirs))
+
     @staticmethod
     def run_tar_command(
         operation: str,
@@ -167,7 +228,7 @@ class Utils:
         args.extend(extra_args)
         
         # 3. 执行 tar 命令
-        print(f"📢 执行 tar 命令：{' '.join(args)}")
+        logger.debug("执行 tar 命令：%s", ' '.join(args))
         try:
             # 捕获 stdout 和 stderr，设置超时时间
             result = subprocess.run(
@@ -181,12 +242,11 @@ class Utils:
             
             # 打印执行结果
             if result.returncode == 0:
-                print(f"✅ tar 命令执行成功")
+                logger.debug("tar 命令执行成功")
                 if result.stdout:
-                    print(f"📝 标准输出：\n{result.stdout}")
+                    logger.debug("标准输出：\n%s", result.stdout)
             else:
-                print(f"❌ tar 命令执行失败（返回码：{result.returncode}）")
-                print(f"🚨 错误输出：\n{result.stderr}")
+                logger.error("tar 命令执行失败（返回码：%s）\n错误输出：\n%s", result.returncode, result.stderr)
             
             return (result.returncode, result.stdout, result.stderr)
         
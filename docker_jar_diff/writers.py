@@ -0,0 +1,251 @@
+"""Machine-readable outputs streamed while the diff runs, see --format
+
+Each difference becomes one flat record, differences inside archives
+included, and is written as soon as its unit is diffed. Writers keep no
+records in memory. Differences matching an expected pattern are marked as
+such, JUnit XML reports every other one as a failing test case.
+"""
+import os
+import re
+import csv
+import json
+import fnmatch
+from xml.sax.saxutils import escape, quoteattr
+
+# 流式输出参数，可通过配置文件的 "output" 节点覆盖
+DEFAULT_OUTPUT_OPTIONS = {
+    'expected': [],        # 预期内的差异，"[类型:]路径通配符"，例如 "mtime_diff:*"、"/app/lib/app-*.jar"
+    'csv_delimiter': ','   # CSV 分隔符
+}
+
+RECORD_FIELDS = ('path', 'type', 'source', 'archive', 'expected', 'size1', 'size2', 'digest1', 'digest2',
+                 'mode1', 'mode2', 'owner1', 'owner2', 'link1', 'link2', 'compare_tier', 'lines_added',
+                 'lines_removed')
+
+
+def _owner(item):
+    if item is None or item.get('uid') is None:
+        return None
+    return f"{item['uid']}:{item['gid']}"
+
+
+def iter_records(differences, source='content', archive=None):
+    """Flat records of differences, those inside archives right after their archive"""
+    stack = [(iter(differences), archive)]
+    while stack:
+        diff = next(stack[-1][0], None)
+        if diff is None:
+            stack.pop()
+            continue
+        item1 = diff.get('item1') or None
+        item2 = diff.get('item2') or None
+        text_diff = diff.get('text_diff') or {}
+        yield {
+            'path': diff['path'],
+            'type': diff['type'],
+            'source': source,
+            'archive': stack[-1][1],
+            'expected': False,
+            'size1': item1.get('size') if item1 else None,
+            'size2': item2.get('size') if item2 else None,
+            'digest1': item1.get('digest') if item1 else None,
+            'digest2': item2.get('digest') if item2 else None,
+            'mode1': item1.get('mode') if item1 else None,
+            'mode2': item2.get('mode') if item2 else None,
+            'owner1': _owner(item1),
+            'owner2': _owner(item2),
+            'link1': item1.get('linkname') if item1 else None,
+            'link2': item2.get('linkname') if item2 else None,
+            'compare_tier': diff.get('compare_tier'),
+            'lines_added': text_diff.get('added'),
+            'lines_removed': text_diff.get('removed')
+        }
+        if diff.get('archive_diff'):
+            stack.append((iter(diff['archive_diff']), diff['path']))
+
+
+class ExpectedChanges:
+    """Patterns of expected differences, "[type:]glob" matched against the path"""
+
+    def __init__(self, patterns=None):
+        self.patterns = []
+        for pattern in patterns or []:
+            diff_type, sep, glob = pattern.partition(':')
+            if sep and re.fullmatch(r'[a-z0-9_]+', diff_type):
+                self.patterns.append((diff_type, glob))
+            else:
+                self.patterns.append((None, pattern))
+
+    def match(self, record):
+        return any((diff_type is None or diff_type == record['type']) and fnmatch.fnmatchcase(record['path'], glob)
+                   for diff_type, glob in self.patterns)
+
+
+class OutputWriter:
+    """Base class of the --format writers"""
+
+    file_name = None
+
+    def __init__(self, path, options):
+        self.path = path
+        self.options = options
+        self.count = 0
+        self._file = None
+
+    def open(self, info):
+        """Start the output, info holds the images and compared directories"""
+
+    def write(self, record):
+        raise NotImplementedError
+
+    def flush(self):
+        """Make the records written so far visible to readers of the file"""
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """Finish the output"""
+
+    def abort(self):
+        """The diff failed, records written so far stay readable where the format allows it"""
+        self.close()
+
+
+class JsonlWriter(OutputWriter):
+    """One JSON object per line"""
+
+    file_name = "differences.jsonl"
+
+    def open(self, info):
+        self._file = open(self.path, 'w', encoding='utf-8')
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+class CsvWriter(OutputWriter):
+    """One row per difference, the header lists RECORD_FIELDS"""
+
+    file_name = "differences.csv"
+
+    def open(self, info):
+        self._file = open(self.path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=RECORD_FIELDS,
+                                      delimiter=self.options['csv_delimiter'])
+        self._writer.writeheader()
+
+    def write(self, record):
+        self._writer.writerow(record)
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+class JUnitWriter(OutputWriter):
+    """One test case per difference, unexpected differences fail
+
+    The test suite element carries the totals, so the test cases are
+    streamed to a side file and copied behind it when the diff is done.
+    """
+
+    file_name = "junit.xml"
+
+    def open(self, info):
+        self._name = f"{info['image1']} -> {info['image2']}"
+        self._body_path = f"{self.path}.body.tmp"
+        self._file = open(self._body_path, 'w', encoding='utf-8')
+        self.failures = 0
+
+    def write(self, record):
+        name = quoteattr(record['path'])
+        classname = quoteattr(f"{record['source']}.{record['type']}")
+        if record['expected']:
+            self._file.write(f'    <testcase classname={classname} name={name}/>\n')
+        else:
+            details = '\n'.join(f"{key}: {record[key]}" for key in RECORD_FIELDS if record[key] is not None)
+            message = f"{record['type']}: {record['path']}"
+            self._file.write(f'    <testcase classname={classname} name={name}>\n'
+                             f'      <failure type={quoteattr(record["type"])} message={quoteattr(message)}>'
+                             f'{escape(details)}</failure>\n'
+                             f'    </testcase>\n')
+            self.failures += 1
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f, open(self._body_path, 'r', encoding='utf-8') as body:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write(f'<testsuites tests="{self.count}" failures="{self.failures}">\n')
+            f.write(f'  <testsuite name={quoteattr(self._name)} tests="{self.count}" '
+                    f'failures="{self.failures}" errors="0" skipped="0">\n')
+            while True:
+                chunk = body.read(1024 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+            f.write('  </testsuite>\n</testsuites>\n')
+        os.replace(tmp_path, self.path)
+        os.remove(self._body_path)
+
+    def abort(self):
+        # A truncated test report would hide the failures, leave none
+        self._file.close()
+        os.remove(self._body_path)
+
+
+WRITERS = {
+    'jsonl': JsonlWriter,
+    'csv': CsvWriter,
+    'junit': JUnitWriter
+}
+
+
+class OutputWriters:
+    """The writers of one comparison, fed like the live report"""
+
+    def __init__(self, formats, output_dir, options=None):
+        self.options = dict(DEFAULT_OUTPUT_OPTIONS)
+        if options:
+            self.options.update(options)
+        unknown = [name for name in formats if name not in WRITERS]
+        if unknown:
+            raise ValueError(f"不支持的输出格式: {', '.join(unknown)}，可选: {', '.join(WRITERS)}")
+        self.expected = ExpectedChanges(self.options['expected'])
+        self.writers = {name: WRITERS[name](os.path.join(output_dir, WRITERS[name].file_name), self.options)
+                        for name in dict.fromkeys(formats)}
+        self.output_dir = output_dir
+        # Records not matching an expected pattern, the failures of JUnit XML
+        self.unexpected = 0
+
+    @property
+    def paths(self):
+        return {name: writer.path for name, writer in self.writers.items()}
+
+    def open(self, info):
+        os.makedirs(self.output_dir, exist_ok=True)
+        for writer in self.writers.values():
+            writer.open(info)
+
+    def add(self, differences, kind='content'):
+        for record in iter_records(differences, kind):
+            record['expected'] = self.expected.match(record)
+            if not record['expected']:
+                self.unexpected += 1
+            for writer in self.writers.values():
+                writer.write(record)
+        for writer in self.writers.values():
+            writer.flush()
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def abort(self):
+        for writer in self.writers.values():
+            writer.abort()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the structured result returned by the library API
+"""
+import os
+import sys
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from docker_jar_diff.api import ImageDiffResult, summarize_differences
+
+
+def test_api_result():
+    """
+    Test that differences are iterated lazily, archive contents included, and summarized per type
+    """
+    print("Testing structured diff result...")
+
+    differences = [
+        {"path": "/app/lib/a.jar", "type": "content_diff", "is_archive": True, "archive_diff": [
+            {"path": "/app/lib/a.jar/com/acme/A.class", "type": "content_diff"},
+            {"path": "/app/lib/a.jar/com/acme/B.class", "type": "only_in_2"}
+        ]},
+        {"path": "/app/lib/b.jar", "type": "only_in_1", "is_archive": False},
+    ]
+    result = ImageDiffResult(
+        image1="app:1.0",
+        image2="app:1.1",
+        image1_id="sha256:1",
+        image2_id="sha256:2",
+        compare_dir="/app/lib",
+        task_dir="/tmp/task",
+        summary=summarize_differences(differences),
+        diff_result={"differences": differences}
+    )
+
+    iterator = result.iter_differences()
+    assert next(iterator)['path'] == "/app/lib/a.jar"
+    paths = [diff['path'] for diff in iterator]
+    assert paths == ["/app/lib/a.jar/com/acme/A.class", "/app/lib/a.jar/com/acme/B.class", "/app/lib/b.jar"]
+
+    top_level = [diff['path'] for diff in result.iter_differences(include_archive_contents=False)]
+    assert top_level == ["/app/lib/a.jar", "/app/lib/b.jar"]
+
+    print(f"Summary: {result.summary}")
+    assert result.summary == {"content_diff": 2, "only_in_2": 1, "only_in_1": 1}
+    assert result.total_differences == 4
+
+    print("✅ Structured result works correctly")
+
+
+if __name__ == "__main__":
+    test_api_result()
+    print("\n🎉 All tests passed! Library API result is working correctly.")
+    sys.exit(0)
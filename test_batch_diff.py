@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test script to verify batch comparisons that acquire every image once
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff.batch import plan_pairs, read_pairs_file
+from docker_jar_diff.main import DockerJarDiff
+
+
+def test_plan_pairs():
+    """
+    Test baseline, all-pairs and pairs file planning
+    """
+    assert plan_pairs(['a', 'b', 'c']) == (['a', 'b', 'c'], [('a', 'b'), ('a', 'c')])
+    assert plan_pairs(['a', 'b', 'c'], all_pairs=True)[1] == [('a', 'b'), ('a', 'c'), ('b', 'c')]
+    assert plan_pairs([], [('x', 'y'), ('y', 'z'), ('x', 'y')]) == (['x', 'y', 'z'], [('x', 'y'), ('y', 'z')])
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pairs_path = os.path.join(temp_dir, "pairs.txt")
+        with open(pairs_path, 'w') as f:
+            f.write("# releases\napp:2.0 app:1.9\n\napp:2.0, svc:1.0  # shared base\n")
+        assert read_pairs_file(pairs_path) == [('app:2.0', 'app:1.9'), ('app:2.0', 'svc:1.0')]
+    print("✅ Pairs are planned correctly")
+
+
+def test_batch_diff():
+    """
+    Test that N images are acquired once and the matrix shows every version
+    """
+    print("Testing batch comparison...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=300, members_per_jar=20, changed=0.05)
+        dir3 = os.path.join(temp_dir, "image3")
+        shutil.copytree(pair['dir2'], dir3)
+        with open(os.path.join(dir3, "app", "release.txt"), 'w') as f:
+            f.write("3\n")
+
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("app:1", pair['dir1'])
+        engine.add_image("app:2", pair['dir2'])
+        engine.add_image("app:3", dir3)
+        server, base_url = serve_in_thread(engine)
+        try:
+            diff_tool = DockerJarDiff(os.path.join(temp_dir, "cache"),
+                                      config={'docker': {'base_url': base_url, 'tls': False}})
+            try:
+                result = diff_tool.compare_many(["app:1", "app:2", "app:3"], compare_dir="/app",
+                                                all_pairs=True, workers=2)
+            finally:
+                diff_tool.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        creates = [path for method, path in engine.requests if path == '/containers/create']
+        assert len(creates) == 3, creates
+        assert [(r.image1, r.image2) for r in result.pairs] == [("app:1", "app:2"), ("app:1", "app:3"),
+                                                               ("app:2", "app:3")]
+        assert result.pairs[2].summary == {'only_in_2': 1}
+        for pair_result in result.pairs:
+            assert os.path.exists(pair_result.report_path)
+        assert os.path.exists(result.matrix_report_path)
+
+        rows = {row['path']: row['cells'] for row in result.matrix['rows']}
+        assert rows['/app/release.txt'] == [None, None, 'A']
+        # Paths changed between 1 and 2 have the same version in 2 and 3
+        changed = [cells for path, cells in rows.items() if path != '/app/release.txt']
+        assert changed
+        assert all(cells[1] == cells[2] for cells in changed)
+        assert all(cells[0] != cells[1] for cells in changed)
+        assert len(result.matrix['pairs']) == 3
+
+    print("✅ Every image is acquired once and the matrix shows each version")
+
+
+if __name__ == "__main__":
+    test_plan_pairs()
+    test_batch_diff()
+    print("\n🎉 All tests passed! Batch comparison is working correctly.")
+    sys.exit(0)
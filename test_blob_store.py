@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that identical extracted files are stored once and hardlinked
+"""
+import io
+import os
+import errno
+import sys
+import tarfile
+import hashlib
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from docker_jar_diff import blob_store as blob_store_module
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.diff_engine import DiffEngine
+
+
+def _add_file(tar, name, data, mtime=1700000000):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = mtime
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _create_tar(tar_path, extra_data):
+    with tarfile.open(tar_path, 'w') as tar:
+        _add_file(tar, "lib/shared.jar", b"same jar body" * 1000)
+        _add_file(tar, "lib/app.properties", extra_data)
+        _add_file(tar, "../escape.txt", b"should not be written")
+        link = tarfile.TarInfo("lib/etc")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "/etc"
+        tar.addfile(link)
+        _add_file(tar, "lib/etc/passwd", b"should not be written")
+
+
+def test_blob_store():
+    """
+    Test that two images sharing a file end up with one inode and a known digest
+    """
+    print("Testing hardlink-deduplicated content store...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+        blob_store = cache_manager.blob_store
+        assert blob_store is not None, "Blob store should be enabled by default"
+
+        tar1 = os.path.join(temp_dir, "image1.tar")
+        tar2 = os.path.join(temp_dir, "image2.tar")
+        _create_tar(tar1, b"version=1\n")
+        _create_tar(tar2, b"version=2\n")
+
+        dir1 = os.path.join(cache_manager.extracted_dir, "image1")
+        dir2 = os.path.join(cache_manager.extracted_dir, "image2")
+        assert blob_store.extract_tar(tar1, dir1) == 2
+        assert blob_store.extract_tar(tar2, dir2) == 2
+
+        stat1 = os.stat(os.path.join(dir1, "lib", "shared.jar"))
+        stat2 = os.stat(os.path.join(dir2, "lib", "shared.jar"))
+        print(f"Inodes: {stat1.st_ino} / {stat2.st_ino}, links: {stat1.st_nlink}")
+        assert stat1.st_ino == stat2.st_ino, "Identical files should share one inode"
+        assert stat1.st_nlink == 3, "Expected the blob plus one link per image"
+
+        expected_md5 = hashlib.md5(b"same jar body" * 1000).hexdigest()
+        assert blob_store.lookup_digest(stat1) == expected_md5
+
+        # Unsafe members are skipped
+        assert not os.path.exists(os.path.join(cache_manager.extracted_dir, "escape.txt"))
+        passwd_path = os.path.join(dir1, "lib", "etc", "passwd")
+        if os.path.exists(passwd_path):
+            with open(passwd_path, 'rb') as f:
+                assert f.read() != b"should not be written", "Write escaped through a symlink"
+
+        # Digests come from the store and only the changed file is reported
+        diff_engine = DiffEngine(cache_manager)
+        diff_result = diff_engine.diff_directories(dir1, dir2)
+        paths = [diff['path'] for diff in diff_result['differences']]
+        assert paths == ['/lib/app.properties'], f"Unexpected differences: {paths}"
+
+        # A prune() of another process while a file is stored never removes its blob
+        original_link = blob_store.link
+
+        def link_after_prune(blob_path, target_path):
+            blob_store.prune()
+            original_link(blob_path, target_path)
+            blob_store.prune()
+
+        orphan_path, _ = blob_store.store(io.BytesIO(b"orphan body"), 0)
+        assert os.stat(orphan_path).st_nlink == 1, "Blob without target should have one link"
+        blob_store.link = link_after_prune
+        try:
+            for name in ("orphan.txt", "fresh.txt"):
+                target_path = os.path.join(dir1, name)
+                body = b"orphan body" if name == "orphan.txt" else b"fresh body"
+                blob_path, _ = blob_store.store(io.BytesIO(body), 0, target_path=target_path)
+                with open(target_path, 'rb') as f:
+                    assert f.read() == body
+                assert os.path.exists(blob_path) and os.stat(target_path).st_nlink == 2, name
+        finally:
+            blob_store.link = original_link
+
+        cache_manager.release()
+
+    print("✅ Identical files are written once and shared through hardlinks")
+
+
+def test_hardlink_to_symlink():
+    """
+    Test that a hard link entry to a symlink never copies the file it points to
+    """
+    print("Testing hard links to symlinks...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        secret_path = os.path.join(temp_dir, "secret")
+        with open(secret_path, 'wb') as f:
+            f.write(b"host secret")
+        tar_path = os.path.join(temp_dir, "evil.tar")
+        with tarfile.open(tar_path, 'w') as tar:
+            _add_file(tar, "etc/real.conf", b"real")
+            for name, kind, target in (("etc/a", tarfile.SYMTYPE, secret_path),
+                                       ("etc/b", tarfile.LNKTYPE, "etc/a"),
+                                       ("etc/c", tarfile.LNKTYPE, "etc/real.conf")):
+                info = tarfile.TarInfo(name)
+                info.type = kind
+                info.linkname = target
+                tar.addfile(info)
+
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+        blob_store = cache_manager.blob_store
+        target_dir = os.path.join(temp_dir, "extracted")
+        # Links across devices fail, the copy fallback must not read through the symlink
+        original_link = blob_store_module.os.link
+
+        def cross_device_link(src, dst, **kwargs):
+            if src.startswith(target_dir):
+                raise OSError(errno.EXDEV, "Invalid cross-device link")
+            return original_link(src, dst, **kwargs)
+
+        blob_store_module.os.link = cross_device_link
+        try:
+            blob_store.extract_tar(tar_path, target_dir)
+        finally:
+            blob_store_module.os.link = original_link
+
+        link_path = os.path.join(target_dir, "etc", "b")
+        assert os.path.islink(link_path) and os.readlink(link_path) == secret_path
+        with open(os.path.join(target_dir, "etc", "c"), 'rb') as f:
+            assert f.read() == b"real"
+        for root, _, names in os.walk(target_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                if not os.path.islink(path):
+                    with open(path, 'rb') as f:
+                        assert f.read() != b"host secret", path
+        cache_manager.release()
+
+    print("✅ Hard links to symlinks stay symlinks")
+
+
+if __name__ == "__main__":
+    test_blob_store()
+    test_hardlink_to_symlink()
+    print("\n🎉 All tests passed! Content store is working correctly.")
+    sys.exit(0)
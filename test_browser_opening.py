@@ -32,7 +32,8 @@ def test_browser_opening():
         }
         
         # Generate the HTML report
-        cache_manager = CacheManager()
+        cache_dir = tempfile.TemporaryDirectory()
+        cache_manager = CacheManager(cache_dir.name)
         html_generator = HTMLGenerator(cache_manager)
         report_path = html_generator.generate_report(diff_result)
         
@@ -66,7 +67,7 @@ def test_browser_opening():
             from docker_jar_diff.main import DockerJarDiff
             
             # Create a minimal DockerJarDiff instance
-            diff_tool = DockerJarDiff()
+            diff_tool = DockerJarDiff(cache_dir.name)
             
             # We don't need to run the full diff, just test the browser opening part
             # So we'll simulate what happens after the report is generated
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that cache eviction never removes a live task directory
+"""
+import os
+import sys
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from docker_jar_diff.cache_manager import CacheManager
+
+
+def test_cache_eviction():
+    """
+    Test that idle tasks are evicted by age while locked tasks are kept
+    """
+    print("Testing concurrency-safe cache eviction...")
+
+    with tempfile.TemporaryDirectory() as base_cache_dir:
+        options = {'max_age_days': 0, 'max_total_size_mb': 1024}
+
+        # A concurrently running diff on the same cache directory
+        live_task = CacheManager(base_cache_dir, options)
+        with open(os.path.join(live_task.extracted_dir, "data.bin"), 'wb') as f:
+            f.write(b'x' * 1024)
+
+        # Creating a new task must not delete the live one
+        new_task = CacheManager(base_cache_dir, options)
+        assert os.path.isdir(live_task.task_cache_dir), "Live task was removed on startup"
+
+        removed = new_task.evict_stale_tasks()
+        print(f"Removed while live: {removed}")
+        assert removed == [], "Live task was evicted"
+
+        # Once the first diff is finished its task becomes evictable
+        live_task.release()
+        thread = new_task.start_background_cleanup()
+        thread.join(timeout=10)
+        assert not os.path.exists(live_task.task_cache_dir), "Idle task was not evicted"
+        assert not os.path.exists(f"{live_task.task_cache_dir}.lock"), "Lock of the evicted task was kept"
+        assert os.path.isdir(new_task.task_cache_dir), "Own task was evicted"
+
+        # Lock files left without their task directory are removed once they are old enough
+        orphan_lock = os.path.join(base_cache_dir, "task_20200101_000000_deadbeef.lock")
+        recent_lock = os.path.join(base_cache_dir, "task_20200101_000000_cafebabe.lock")
+        for lock_path in (orphan_lock, recent_lock):
+            open(lock_path, 'w').close()
+        os.utime(orphan_lock, (0, 0))
+        new_task.evict_stale_tasks()
+        assert not os.path.exists(orphan_lock), "Orphan lock file was kept"
+        assert os.path.exists(recent_lock), "Lock of a task being created was removed"
+
+        new_task.release()
+
+    print("✅ Live tasks are kept and idle tasks are evicted in the background")
+
+
+if __name__ == "__main__":
+    test_cache_eviction()
+    print("\n🎉 All tests passed! Cache eviction is working correctly.")
+    sys.exit(0)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that interrupted comparisons resume from their checkpoint
+"""
+import os
+import sys
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff.api import DiffError
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.checkpoint import Checkpoint
+from docker_jar_diff.diff_engine import DiffEngine
+from docker_jar_diff.main import DockerJarDiff
+from docker_jar_diff.utils import Utils
+
+COMPARE_DIRS = ["/app/data", "/app/lib"]
+
+
+class Interrupted(Exception):
+    pass
+
+
+def count_containers(engine):
+    return len([path for method, path in engine.requests if path == '/containers/create'])
+
+
+def make_tool(cache_dir, base_url, resume_task=None, checkpoint=True):
+    config = {'docker': {'base_url': base_url, 'tls': False}, 'cache': {'results': False},
+              'checkpoint': {'units': 16}}
+    return DockerJarDiff(cache_dir, config=config, resume_task=resume_task, checkpoint=checkpoint)
+
+
+def interrupt_after(obj, name, calls):
+    """Make obj.name raise once it has been called `calls` times"""
+    original = getattr(obj, name)
+    counter = {'calls': 0}
+
+    def wrapper(*args, **kwargs):
+        if counter['calls'] >= calls:
+            raise Interrupted(name)
+        counter['calls'] += 1
+        return original(*args, **kwargs)
+    setattr(obj, name, wrapper)
+    return counter
+
+
+def test_resume_diff():
+    """
+    Test resuming in the middle of the diff and in the middle of acquisition
+    """
+    print("Testing checkpoint and resume...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=300, members_per_jar=20, changed=0.1)
+        cache_dir = os.path.join(temp_dir, "cache")
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("synthetic:1", pair['dir1'])
+        engine.add_image("synthetic:2", pair['dir2'])
+        server, base_url = serve_in_thread(engine)
+        try:
+            # Killed while diffing: images and finished units are kept
+            diff_tool = make_tool(cache_dir, base_url)
+            task_name = os.path.basename(diff_tool.cache_manager.task_cache_dir)
+            interrupt_after(diff_tool.diff_engine, 'diff_unit', 5)
+            try:
+                diff_tool.compare("synthetic:1", "synthetic:2", COMPARE_DIRS)
+                assert False, "the diff should have been interrupted"
+            except Interrupted:
+                pass
+            finally:
+                diff_tool.close()
+            assert count_containers(engine) == 2
+            assert Checkpoint.is_unfinished(os.path.join(cache_dir, task_name))
+            checkpoint = Checkpoint(os.path.join(cache_dir, task_name, "checkpoint"))
+            units = checkpoint.get_units()
+            assert len(units) > 5
+            assert len(checkpoint.load_unit_results()) == 5
+            # A record cut short by the crash is dropped
+            with open(checkpoint.units_path, 'a', encoding='utf-8') as f:
+                f.write('{"unit": ["app", "li')
+
+            # An interrupted task is not evicted for size, only by age
+            other = CacheManager(cache_dir, {'max_total_size_mb': 0, 'results': False})
+            assert other.evict_stale_tasks() == []
+            other.cleanup()
+
+            diff_tool = make_tool(cache_dir, base_url, resume_task=task_name)
+            counter = interrupt_after(diff_tool.diff_engine, 'diff_unit', len(units))
+            ready = {}
+            try:
+                result = diff_tool.compare("synthetic:1", "synthetic:2", COMPARE_DIRS,
+                                           progress=lambda event, **info: ready.update(info)
+                                           if event == 'images_ready' else None)
+                assert result.task_dir == os.path.join(cache_dir, task_name)
+                assert count_containers(engine) == 2, "acquired images must not be fetched again"
+                assert counter['calls'] == len(units) - 5, counter
+                assert result.metrics['caches']['checkpoint_archive']['hits'] > 0
+
+                # Same bytes as an uninterrupted diff of the same directories
+                single = DiffEngine(diff_tool.cache_manager).diff_directories(
+                    ready['extracted_dir1'], ready['extracted_dir2'], COMPARE_DIRS)
+                # Metadata differences come from the tar headers, next to the content diff
+                single['metadata_differences'] = result.diff_result['metadata_differences']
+                single['image1_name'] = "synthetic:1"
+                single['image2_name'] = "synthetic:2"
+                single_path = os.path.join(temp_dir, "single.json")
+                Utils.save_json(single, single_path)
+                with open(result.diff_json_path, 'rb') as f1, open(single_path, 'rb') as f2:
+                    assert f1.read() == f2.read(), "resumed diff.json differs from a full diff"
+            finally:
+                diff_tool.close()
+            assert not Checkpoint.is_unfinished(os.path.join(cache_dir, task_name))
+
+            # Killed while fetching the second directory of image 2
+            diff_tool = make_tool(cache_dir, base_url)
+            task_name = os.path.basename(diff_tool.cache_manager.task_cache_dir)
+            interrupt_after(diff_tool.docker_handler, '_fetch_directory', 3)
+            try:
+                diff_tool.compare("synthetic:1", "synthetic:2", COMPARE_DIRS)
+                assert False, "the acquisition should have failed"
+            except DiffError:
+                pass
+            finally:
+                diff_tool.close()
+            containers = count_containers(engine)
+            checkpoint = Checkpoint(os.path.join(cache_dir, task_name, "checkpoint"))
+            assert checkpoint.get_image(1) is not None and checkpoint.get_image(2) is None
+            assert len(checkpoint.get_directories(2)) == 1
+
+            diff_tool = make_tool(cache_dir, base_url, resume_task=task_name)
+            fetch_counter = interrupt_after(diff_tool.docker_handler, '_fetch_directory', 10)
+            try:
+                resumed = diff_tool.compare("synthetic:1", "synthetic:2", COMPARE_DIRS)
+            finally:
+                diff_tool.close()
+            assert count_containers(engine) == containers + 1, "only image 2 is fetched again"
+            assert fetch_counter['calls'] == 1, "only the unfinished directory is fetched again"
+            assert resumed.summary == result.summary
+
+            # Checkpoints are opt-in, a plain compare records nothing
+            diff_tool = make_tool(cache_dir, base_url, checkpoint=None)
+            try:
+                assert diff_tool.checkpoint is None
+                diff_tool.compare("synthetic:1", "synthetic:2", COMPARE_DIRS)
+                assert not os.path.exists(diff_tool.cache_manager.checkpoint_dir) or \
+                    not os.listdir(diff_tool.cache_manager.checkpoint_dir)
+            finally:
+                diff_tool.close()
+
+            # A task in use can not be resumed twice
+            diff_tool = make_tool(cache_dir, base_url, resume_task=task_name)
+            try:
+                make_tool(cache_dir, base_url, resume_task=task_name)
+                assert False, "the task is locked"
+            except RuntimeError:
+                pass
+            finally:
+                diff_tool.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+    print("✅ Checkpoint and resume test passed!")
+
+
+if __name__ == "__main__":
+    test_resume_diff()
+    print("\n🎉 All tests passed! Interrupted comparisons resume from their checkpoint.")
+    sys.exit(0)
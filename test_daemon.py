@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that the daemon keeps files of running jobs and removes dropped jobs
+"""
+import os
+import sys
+import json
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff.daemon import DiffDaemon
+
+
+def test_daemon_pins_manifests():
+    """
+    Test that an evicted manifest keeps its files until its job is done
+    """
+    print("Testing manifest pinning and job directory cleanup...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=200, members_per_jar=10, changed=0.2)
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("synthetic:1", pair['dir1'])
+        engine.add_image("synthetic:2", pair['dir2'])
+        server, base_url = serve_in_thread(engine)
+        config = {'docker': {'base_url': base_url, 'tls': False}, 'history': {'enabled': False}}
+        # One manifest only: acquiring image2 evicts image1 while the job still reads it
+        daemon = DiffDaemon(os.path.join(temp_dir, "cache"), config=config,
+                            daemon_options={'workers': 1, 'manifest_cache_size': 1, 'max_jobs': 1})
+        daemon.start()
+        try:
+            first = daemon.submit("synthetic:1", "synthetic:2", "/app")
+            assert first['done_event'].wait(60)
+            assert first['status'] == 'done', first.get('error')
+            # Text diffs read the files of both images after both were acquired
+            with open(first['diff_json_path'], 'r', encoding='utf-8') as f:
+                diff_json = json.load(f)
+            differences = diff_json['differences']
+            # Same pipeline as the CLI, the tar headers are compared too
+            assert 'metadata_differences' in diff_json
+            text_diffs = [diff['text_diff'] for diff in differences if 'text_diff' in diff]
+            assert text_diffs and all(text_diff['status'] == 'ok' for text_diff in text_diffs), text_diffs
+
+            # image1 was evicted during the job, its files went with the job
+            extracted = os.listdir(daemon.cache_manager.extracted_dir)
+            assert len(extracted) == 1, extracted
+
+            first_dir = first['task_dir']
+            assert os.path.isdir(first_dir)
+            second = daemon.submit("synthetic:2", "synthetic:2", "/app")
+            assert second['done_event'].wait(60)
+            assert second['status'] == 'done', second.get('error')
+            # max_jobs=1 drops the first job and its directory
+            assert daemon.get_job(first['id']) is None
+            assert not os.path.exists(first_dir), "Dropped job directory was kept"
+            assert os.path.isdir(second['task_dir'])
+
+            # The result of the first job is in the result cache shared with the CLI
+            third = daemon.submit("synthetic:1", "synthetic:2", "/app")
+            assert third['done_event'].wait(60)
+            assert third['status'] == 'done', third.get('error')
+            assert third['cached'] and third['summary'] == first['summary'], third
+        finally:
+            daemon.stop()
+            server.shutdown()
+            server.server_close()
+
+    print("✅ Manifests in use are kept and dropped jobs are removed")
+
+
+if __name__ == "__main__":
+    test_daemon_pins_manifests()
+    print("\n🎉 All tests passed! Daemon caches are safe for running jobs.")
+    sys.exit(0)
@@ -5,6 +5,7 @@ Test script to verify that directories with multiple children are expanded by de
 import os
 import sys
 import json
+import tempfile
 
 # Add the project root to Python path
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
@@ -74,7 +75,8 @@ def test_default_expand():
         }
         
         # Generate the HTML report
-        cache_manager = CacheManager()
+        cache_dir = tempfile.TemporaryDirectory()
+        cache_manager = CacheManager(cache_dir.name)
         html_generator = HTMLGenerator(cache_manager)
         report_path = html_generator.generate_report(diff_result)
         
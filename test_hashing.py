@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test script to verify configurable digest algorithms and the buffered/mmap hashing paths
+"""
+import os
+import sys
+import zlib
+import hashlib
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from docker_jar_diff import hashing
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.diff_engine import DiffEngine
+from docker_jar_diff.utils import Utils
+
+
+def test_hashing():
+    """
+    Test digests of every algorithm, both read paths and the algorithm recorded in results
+    """
+    print("Testing digest algorithms...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        small_data = os.urandom(3 * 1024 * 1024 + 7)
+        large_data = os.urandom(hashing.MMAP_THRESHOLD + 12345)
+        for name, data in (("small.bin", small_data), ("large.bin", large_data), ("empty.bin", b"")):
+            path = os.path.join(temp_dir, name)
+            with open(path, 'wb') as f:
+                f.write(data)
+            assert hashing.hash_file(path, 'md5') == hashlib.md5(data).hexdigest()
+            assert Utils.get_file_hash(path) == hashlib.sha256(data).hexdigest()
+            assert hashing.hash_file(path, 'blake2b') == hashlib.blake2b(data, digest_size=32).hexdigest()
+            assert hashing.hash_file(path, 'crc32') == f"{zlib.crc32(data) & 0xffffffff:08x}"
+            assert hashing.hash_file(path, 'crc32') == hashing.hash_bytes(data, 'crc32')
+
+        try:
+            hashing.validate_algorithm('sha3_999')
+            assert False, "unknown algorithm accepted"
+        except ValueError as e:
+            print(f"Rejected: {e}")
+
+        # Each algorithm gets its own blob store, digests are recorded with their algorithm
+        dir1 = os.path.join(temp_dir, "image1", "opt")
+        dir2 = os.path.join(temp_dir, "image2", "opt")
+        for directory, content in ((dir1, b"a" * 100), (dir2, b"b" * 100)):
+            os.makedirs(directory)
+            with open(os.path.join(directory, "model.bin"), 'wb') as f:
+                f.write(content)
+            with open(os.path.join(directory, "same.bin"), 'wb') as f:
+                f.write(b"same")
+
+        for algorithm in ('blake2b', 'crc32'):
+            cache_manager = CacheManager(os.path.join(temp_dir, "cache"), hash_algorithm=algorithm)
+            assert cache_manager.blob_store.blob_dir.endswith(f"blobs_{algorithm}")
+            result = DiffEngine(cache_manager).diff_directories(
+                os.path.dirname(dir1), os.path.dirname(dir2))
+            cache_manager.release()
+            assert result['digest_algorithm'] == algorithm
+            assert [diff['path'] for diff in result['differences']] == ['/opt/model.bin']
+            assert result['differences'][0]['item1']['digest'] == hashing.hash_bytes(b"a" * 100, algorithm)
+
+        # Checksums are never used to address shared blobs
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"), hash_algorithm='crc32')
+        assert cache_manager.blob_store.address_algorithm == 'blake2b'
+        cache_manager.release()
+
+    print("✅ Digest algorithms are configurable")
+
+
+if __name__ == "__main__":
+    test_hashing()
+    print("\n🎉 All tests passed! Hashing is working correctly.")
+    sys.exit(0)
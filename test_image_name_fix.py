@@ -5,6 +5,7 @@ Test script to verify image name and version display fix
 import os
 import json
 import sys
+import tempfile
 
 # Add the project root to Python path
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
@@ -29,7 +30,8 @@ def test_image_name_fix():
         }
         
         # Test the HTML generation
-        cache_manager = CacheManager()
+        cache_dir = tempfile.TemporaryDirectory()
+        cache_manager = CacheManager(cache_dir.name)
         from docker_jar_diff.html_generator import HTMLGenerator
         html_generator = HTMLGenerator(cache_manager)
         
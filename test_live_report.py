@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the live report page fed while the diff is running
+"""
+import os
+import re
+import sys
+import json
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff.html_generator import HTMLGenerator
+from docker_jar_diff.live_report import LiveReport
+from docker_jar_diff.main import DockerJarDiff
+
+COMPARE_DIRS = ["/app/data", "/app/lib"]
+
+
+def read_progress(data_dir):
+    with open(os.path.join(data_dir, "progress.js"), encoding='utf-8') as f:
+        match = re.fullmatch(r"liveReport\.progress\((.*)\);\n", f.read(), re.S)
+    return json.loads(match.group(1))
+
+
+def read_chunks(data_dir):
+    """Records of every chunk file, in chunk order"""
+    records = []
+    for name in sorted(os.listdir(data_dir)):
+        if not name.startswith("chunk_"):
+            continue
+        with open(os.path.join(data_dir, name), encoding='utf-8') as f:
+            match = re.fullmatch(r"liveReport\.addChunk\((\d+), \"(\w+)\", (.*)\);\n", f.read(), re.S)
+        assert int(match.group(1)) == int(name[6:12]), name
+        records.extend((match.group(2), record) for record in json.loads(match.group(3)))
+    return records
+
+
+def test_live_report_files():
+    """
+    Test batching of the data files and the final progress
+    """
+    print("Testing LiveReport data files...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        report_dir = os.path.join(temp_dir, "html_report")
+        live = LiveReport(report_dir, HTMLGenerator(None), {'batch_size': 3})
+        page_path = live.start({'image1': 'a:1', 'image2': 'a:2', 'compare_dirs': ['/app']})
+        with open(page_path, encoding='utf-8') as f:
+            assert '"data_dir": "live"' in f.read()
+        assert read_progress(live.data_dir)['chunks'] == 0
+
+        live.add([{'path': '/app/a', 'type': 'mode_diff'}], kind='metadata')
+        live.add([{'path': f'/app/{index}', 'type': 'content_diff'} for index in range(3)])
+        # Three queued records fill a batch
+        assert read_progress(live.data_dir)['chunks'] == 2
+        live.add([{'path': '/app/z', 'type': 'only_in_1'}])
+        live.update(units_done=1, units_total=2)
+        progress = read_progress(live.data_dir)
+        assert progress['chunks'] == 3 and progress['differences'] == 5 and progress['units_done'] == 1
+        live.finish(os.path.join(report_dir, "index.html"))
+        progress = read_progress(live.data_dir)
+        assert progress['done'] and progress['report'] == "index.html" and progress['error'] is None
+        assert [(kind, record['path']) for kind, record in read_chunks(live.data_dir)] == [
+            ('metadata', '/app/a'), ('content', '/app/0'), ('content', '/app/1'), ('content', '/app/2'),
+            ('content', '/app/z')]
+        assert not [name for name in os.listdir(live.data_dir) if name.endswith('.tmp')]
+    print("✅ LiveReport data files test passed!")
+
+
+def test_live_compare():
+    """
+    Test that the page shows differences before the diff is done, with and without checkpoints
+    """
+    print("Testing a live comparison...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=300, members_per_jar=20, changed=0.1)
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("synthetic:1", pair['dir1'])
+        engine.add_image("synthetic:2", pair['dir2'])
+        server, base_url = serve_in_thread(engine)
+        try:
+            for checkpoint in (True, False):
+                config = {'docker': {'base_url': base_url, 'tls': False}, 'cache': {'results': False},
+                          'checkpoint': {'enabled': checkpoint, 'units': 16}, 'live': {'batch_size': 1}}
+                diff_tool = DockerJarDiff(os.path.join(temp_dir, "cache"), config=config)
+                events = {}
+                seen = []
+                data_dir = os.path.join(diff_tool.cache_manager.html_report_dir, "live")
+                original = diff_tool.diff_engine.diff_unit
+
+                def diff_unit(*args):
+                    # What the page can load while the diff is still running
+                    seen.append(read_progress(data_dir))
+                    return original(*args)
+                diff_tool.diff_engine.diff_unit = diff_unit
+                try:
+                    result = diff_tool.compare("synthetic:1", "synthetic:2", COMPARE_DIRS, live=True,
+                                               progress=lambda event, **info: events.setdefault(event, info))
+                finally:
+                    diff_tool.close()
+
+                assert events['live_report']['path'] == os.path.join(os.path.dirname(result.report_path),
+                                                                     "live.html")
+                assert seen[0]['units_done'] == 0 and not seen[0]['done']
+                assert seen[-1]['units_done'] == len(seen) - 1 and seen[-1]['units_total'] == len(seen)
+                assert any(0 < progress['differences'] for progress in seen[:-1]), \
+                    "differences must be visible before the last unit"
+
+                progress = read_progress(data_dir)
+                assert progress['done'] and progress['report'] == "index.html"
+                # Every difference of the final result was streamed exactly once
+                streamed = sorted((record['path'], record['type']) for kind, record in read_chunks(data_dir))
+                expected = sorted((diff['path'], diff['type']) for diff in
+                                  result.diff_result['differences'] + result.diff_result['metadata_differences'])
+                assert streamed == expected, (len(streamed), len(expected))
+                assert progress['differences'] == len(expected)
+        finally:
+            server.shutdown()
+            server.server_close()
+    print("✅ Live comparison test passed!")
+
+
+if __name__ == "__main__":
+    test_live_report_files()
+    test_live_compare()
+    print("\n🎉 All tests passed! The live report shows differences while the diff runs.")
+    sys.exit(0)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that the external sort diff (--low-memory) gives the same result as the in-memory trees
+"""
+import os
+import sys
+import json
+import zipfile
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff.api import summarize_result
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.diff_engine import DiffEngine
+from docker_jar_diff.external_sort import ExternalSorter, diff_external
+from docker_jar_diff.main import DockerJarDiff
+
+COMPARE_DIRS = ["/app/data", "/app/lib"]
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def write_jar(path, members):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zipfile.ZipFile(path, 'w') as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+
+
+def add_edge_cases(dir1, dir2):
+    """Entries the synthetic pair does not have"""
+    # A directory only in the second image, with a jar and a nested directory
+    write_jar(os.path.join(dir2, "app", "lib", "plugins", "p.jar"), {"a/b.class": b"1", "c.txt": b"2"})
+    write_file(os.path.join(dir2, "app", "lib", "plugins", "conf", "p.properties"), b"x=1")
+    # A file in one image and a directory in the other
+    write_file(os.path.join(dir1, "app", "data", "mixed"), b"file")
+    write_file(os.path.join(dir2, "app", "data", "mixed", "inner.txt"), b"dir")
+    # A jar only in the first image, its members are listed after it
+    write_jar(os.path.join(dir1, "app", "lib", "gone.jar"), {"META-INF/MANIFEST.MF": b"Manifest-Version: 1.0\n"})
+    # Names that sort differently as strings and as path parts
+    write_file(os.path.join(dir1, "app", "data", "x", "y.txt"), b"1")
+    write_file(os.path.join(dir2, "app", "data", "x.y", "z.txt"), b"2")
+
+
+def per_file(engine, diffs):
+    """In-memory differences with a directory only one image has listed file by file, like the external diff"""
+    result = []
+    archives = tuple(diff['path'] + '/' for diff in diffs if diff['is_archive'])
+    for diff in diffs:
+        item = diff['item1'] if diff['type'] == 'only_in_1' else diff['item2'] if diff['type'] == 'only_in_2' else None
+        # Directories inside an archive come from its index, they stay whole
+        if item is not None and not diff['is_archive'] and 'size' not in item \
+                and not diff['path'].startswith(archives):
+            trees = (item, {}) if diff['type'] == 'only_in_1' else ({}, item)
+            result.extend(per_file(engine, engine._find_differences(*trees, diff['path'])))
+        else:
+            result.append(diff)
+    return result
+
+
+def test_sorter():
+    """
+    Test spilling and multi-pass merging against an in-memory sort
+    """
+    print("Testing ExternalSorter...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sorter = ExternalSorter(temp_dir, memory_limit=2000, fan_in=2)
+        keys = [f"d{index % 7}\x00f{index * 7919 % 1000}" for index in range(1000)]
+        for seq, key in enumerate(keys):
+            sorter.add(key, seq, {'size': seq})
+        assert len(sorter.runs) > 2, "a small ceiling spills runs"
+        records = list(sorter)
+        assert [record[0] for record in records] == sorted(keys)
+        assert all(keys[seq] == key and entry == {'size': seq} for key, seq, entry in records)
+        assert len(sorter.runs) <= 2, "runs are merged down to the fan-in"
+        sorter.close()
+        assert os.listdir(temp_dir) == []
+    print("✅ ExternalSorter test passed!")
+
+
+def test_same_differences():
+    """
+    Test that the external diff is byte-identical to diff_directories, one-sided directories file by file
+    """
+    print("Testing the external sort diff...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=400, members_per_jar=20, changed=0.1)
+        add_edge_cases(pair['dir1'], pair['dir2'])
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+        options = {'memory_mb': 0.01, 'merge_fan_in': 3, 'batch_size': 50}
+        for compare_dir in ("/app", COMPARE_DIRS, None):
+            expected = DiffEngine(cache_manager).diff_directories(pair['dir1'], pair['dir2'], compare_dir)
+            expected['differences'] = per_file(DiffEngine(cache_manager), expected['differences'])
+            engine = DiffEngine(cache_manager)
+            batches = []
+            result = diff_external(engine, pair['dir1'], pair['dir2'], compare_dir, temp_dir, options,
+                                   on_unit=lambda unit, diffs, done, total: batches.append((diffs, done, total)))
+            assert json.dumps(result, sort_keys=False) == json.dumps(expected, sort_keys=False), compare_dir
+            assert engine.metrics.phases['external_sort']['files'] > 2, "the runs were spilled to disk"
+            assert len(batches) > 1 and batches[-1][1] == batches[-1][2]
+            assert [diff for diffs, _, _ in batches for diff in diffs] == result['differences']
+            assert sorted(os.listdir(temp_dir)) == ["cache", "pair"], "the runs are removed"
+        paths = {diff['path'] for diff in result['differences']}
+        assert '/app/lib/plugins' not in paths and '/app/data/mixed' not in paths
+        assert {'/app/lib/plugins/p.jar', '/app/lib/plugins/p.jar/a', '/app/lib/plugins/p.jar/c.txt',
+                '/app/lib/plugins/conf/p.properties'} <= paths
+        cache_manager.release()
+    print("✅ External sort diff test passed!")
+
+
+def test_low_memory_compare():
+    """
+    Test compare(low_memory=True) end to end with streamed outputs
+    """
+    print("Testing compare with low_memory...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=300, members_per_jar=20, changed=0.1)
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("synthetic:1", pair['dir1'])
+        engine.add_image("synthetic:2", pair['dir2'])
+        server, base_url = serve_in_thread(engine)
+        try:
+            results = []
+            archive_caches = []
+            for low_memory in (False, True):
+                config = {'docker': {'base_url': base_url, 'tls': False}, 'cache': {'results': False},
+                          'low_memory': {'memory_mb': 0.01, 'archive_cache': 4}}
+                diff_tool = DockerJarDiff(os.path.join(temp_dir, f"cache_{low_memory}"), config=config)
+                try:
+                    results.append(diff_tool.compare(
+                        "synthetic:1", "synthetic:2", COMPARE_DIRS, low_memory=low_memory, formats=['jsonl'],
+                        progress=lambda event, **info: archive_caches.append(
+                            diff_tool.diff_engine.archive_index_cache.maxsize)
+                        if event == 'images_ready' or info.get('phase') == 'diff' else None))
+                    # The run had a small cache of its own, the engine's cache is unchanged
+                    assert diff_tool.diff_engine.archive_index_cache.maxsize == 1024
+                finally:
+                    diff_tool.close()
+            normal, low = results
+            # Acquisition fills the shared cache, only the diff of the low memory run has a small one
+            assert archive_caches == [1024, 1024, 1024, 1024, 4, 4], archive_caches
+            assert low.metrics['caches']['archive_index']['misses'] == \
+                normal.metrics['caches']['archive_index']['misses'], "prefetched jars are not indexed again"
+            assert 'external_sort' in low.metrics['phases'] and 'external_sort' not in normal.metrics['phases']
+            assert low.summary == normal.summary and low.total_differences > 0
+            strip = lambda diffs: json.dumps(diffs).replace(normal.task_dir, '').replace(low.task_dir, '')
+            assert strip(low.diff_result['differences']) == strip(normal.diff_result['differences'])
+            with open(low.output_paths['jsonl'], encoding='utf-8') as f:
+                assert sum(1 for _ in f) == low.total_differences
+        finally:
+            server.shutdown()
+            server.server_close()
+    print("✅ Low memory compare test passed!")
+
+
+def test_max_differences():
+    """
+    Test that only max_differences are read back from the spool, the others are counted and still streamed
+    """
+    print("Testing max_differences...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=300, members_per_jar=20, changed=0.1)
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+        options = {'memory_mb': 0.01, 'batch_size': 50}
+        full = diff_external(DiffEngine(cache_manager), pair['dir1'], pair['dir2'], "/app", temp_dir, options)
+        assert len(full['differences']) > 10 and 'omitted_differences' not in full
+        batches = []
+        options['max_differences'] = 10
+        capped = diff_external(DiffEngine(cache_manager), pair['dir1'], pair['dir2'], "/app", temp_dir, options,
+                               on_unit=lambda unit, diffs, done, total: batches.extend(diffs))
+        assert capped['differences'] == full['differences'][:10]
+        assert batches == full['differences'], "the outputs get every difference"
+        assert summarize_result(capped) == summarize_result(full)
+        cache_manager.release()
+    print("✅ max_differences test passed!")
+
+
+if __name__ == "__main__":
+    test_sorter()
+    test_same_differences()
+    test_low_memory_compare()
+    test_max_differences()
+    print("\n🎉 All tests passed! The external sort diff matches the in-memory diff.")
+    sys.exit(0)
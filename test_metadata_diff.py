@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the metadata diff built from the get_archive tar headers
+"""
+import os
+import sys
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from docker_jar_diff.main import DockerJarDiff
+from docker_jar_diff.metadata import diff_metadata, drop_covered
+
+
+def write_file(path, content, mode=0o644):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+    os.chmod(path, mode)
+
+
+def make_rootfs(root, version):
+    """Two versions of an app that differ in metadata more than in content"""
+    app = os.path.join(root, "app")
+    write_file(os.path.join(app, "bin", "entrypoint.sh"), "#!/bin/sh\nexec java -jar app.jar\n",
+               0o755 if version == 1 else 0o644)
+    write_file(os.path.join(app, "conf", "app.properties"), f"version={version}\n")
+    write_file(os.path.join(app, "lib", "a.txt"), "same\n")
+    write_file(os.path.join(app, "owned.txt"), "owned\n")
+    os.chown(os.path.join(app, "owned.txt"), 0 if version == 1 else 1000, 0)
+    os.symlink("conf/app.properties" if version == 1 else "conf/other.properties",
+               os.path.join(app, "current.properties"))
+    if version == 1:
+        write_file(os.path.join(app, "data"), "a file\n")
+    else:
+        os.makedirs(os.path.join(app, "data", "cache"))
+        write_file(os.path.join(app, "data", "cache", "x"), "x\n")
+        # Invisible to os.walk based trees
+        os.makedirs(os.path.join(app, "logs"))
+        os.symlink("lib", os.path.join(app, "lib-link"))
+
+
+def test_diff_metadata():
+    """
+    Test the metadata diff of two header indexes
+    """
+    print("Testing diff_metadata...")
+    entry = {'name': 'x', 'type': 'file', 'mode': '0644', 'uid': 0, 'gid': 0, 'uname': 'root',
+             'gname': 'root', 'size': 1, 'mtime': '2024-01-01T00:00:00', 'is_dir': False}
+    entries1 = {'/app': dict(entry, type='directory', mode='0755', size=None, is_dir=True),
+                '/app/x': entry,
+                '/app/old': dict(entry, type='directory', mode='0755', size=None, is_dir=True),
+                '/app/old/y': entry,
+                '/other/z': entry}
+    entries2 = {'/app': dict(entry, type='directory', mode='0755', size=None, is_dir=True),
+                '/app/x': dict(entry, mode='0600', uid=1000)}
+    diffs = diff_metadata(entries1, entries2, ['/app'])
+    assert [(diff['path'], diff['type']) for diff in diffs] == [
+        ('/app/old', 'only_in_1'), ('/app/x', 'mode_diff'), ('/app/x', 'owner_diff')], diffs
+    assert [diff['type'] for diff in diff_metadata(entries1, entries2, ['/app'], compare_owner=False)] == \
+        ['only_in_1', 'mode_diff']
+
+    # A directory the content diff reports as missing is not reported twice
+    assert drop_covered(diffs, [{'path': '/app/old', 'type': 'only_in_1'}]) == diffs[1:]
+    # Or file by file, as the low memory diff lists it
+    assert drop_covered(diffs, [{'path': '/app/old/sub/a.txt', 'type': 'only_in_1'}]) == diffs[1:]
+    assert drop_covered(diffs, [{'path': '/app/older/a.txt', 'type': 'only_in_1'}]) == diffs
+    print("✅ diff_metadata test passed!")
+
+
+def test_metadata_report():
+    """
+    Test the metadata diff next to the content diff, and --metadata-only
+    """
+    print("Testing the metadata diff of two images...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for version in (1, 2):
+            make_rootfs(os.path.join(temp_dir, f"rootfs{version}"), version)
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("meta:1", os.path.join(temp_dir, "rootfs1"))
+        engine.add_image("meta:2", os.path.join(temp_dir, "rootfs2"))
+        server, base_url = serve_in_thread(engine)
+        try:
+            config = {'docker': {'base_url': base_url, 'tls': False}}
+            results = {}
+            for metadata_only in (False, True):
+                diff_tool = DockerJarDiff(os.path.join(temp_dir, "cache"), config=config)
+                try:
+                    results[metadata_only] = diff_tool.compare("meta:1", "meta:2", "/app",
+                                                               metadata_only=metadata_only)
+                finally:
+                    diff_tool.close()
+
+            full, metadata_only = results[False], results[True]
+            found = {(diff['path'], diff['type']) for diff in full.metadata_differences}
+            print(sorted(found))
+            assert ('/app/bin/entrypoint.sh', 'mode_diff') in found
+            assert ('/app/owned.txt', 'owner_diff') in found
+            assert ('/app/current.properties', 'symlink_diff') in found
+            assert ('/app/data', 'type_mismatch') in found
+            assert ('/app/logs', 'only_in_2') in found
+            assert ('/app/lib-link', 'only_in_2') in found
+            assert full.summary['mode_diff'] == 1
+            assert full.summary['content_diff'] >= 1
+            with open(full.report_path, encoding='utf-8') as f:
+                assert 'metadata_differences' in f.read()
+
+            # Metadata only: nothing is extracted, missing files are reported here
+            assert metadata_only.diff_result['differences'] == []
+            assert metadata_only.diff_result['metadata_only']
+            only_found = {(diff['path'], diff['type']) for diff in metadata_only.metadata_differences}
+            assert found <= only_found
+            assert not os.path.exists(os.path.join(metadata_only.task_dir, "extracted", "meta_1", "app"))
+            assert 'extract' not in metadata_only.metrics['phases']
+        finally:
+            server.shutdown()
+            server.server_close()
+    print("✅ Metadata report test passed!")
+
+
+if __name__ == "__main__":
+    test_diff_metadata()
+    test_metadata_report()
+    print("\n🎉 All tests passed! Metadata differences are reported from the tar headers.")
+    sys.exit(0)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test script to verify per-phase metrics and cache hit rates
+"""
+import os
+import sys
+import json
+import zipfile
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.diff_engine import DiffEngine
+from docker_jar_diff.metrics import Metrics
+
+
+def _create_jar(jar_path, members):
+    os.makedirs(os.path.dirname(jar_path), exist_ok=True)
+    with zipfile.ZipFile(jar_path, 'w') as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+
+
+def test_metrics():
+    """
+    Test that phases, counters and archive cache hit rates are recorded and exported
+    """
+    print("Testing per-phase metrics...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dir1 = os.path.join(temp_dir, "image1")
+        dir2 = os.path.join(temp_dir, "image2")
+        members = {"com/acme/A.class": b"A" * 100, "com/acme/B.class": b"B" * 100}
+        # The same jar in both images is indexed once
+        _create_jar(os.path.join(dir1, "lib", "shared.jar"), members)
+        _create_jar(os.path.join(dir2, "lib", "shared.jar"), members)
+
+        metrics = Metrics()
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+        diff_engine = DiffEngine(cache_manager, metrics=metrics)
+        diff_engine.diff_directories(dir1, dir2)
+        cache_manager.release()
+
+        data = metrics.to_dict()
+        print(json.dumps(data, indent=2))
+        for phase in ('build_tree', 'archive_index', 'hash', 'find_differences', 'text_diff'):
+            assert phase in data['phases'], f"Missing phase {phase}"
+        assert data['phases']['build_tree']['files'] == 2
+        assert data['phases']['archive_index']['calls'] == 1
+        assert data['phases']['archive_index']['files'] == 2
+        assert data['caches']['archive_index'] == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+
+        metrics.labels['image1'] = 'app:"1.0"'
+        prometheus = metrics.to_prometheus()
+        assert 'docker_jar_diff_phase_seconds{phase="build_tree",image1="app:\\"1.0\\""}' in prometheus
+        assert 'docker_jar_diff_cache_hit_rate{cache="archive_index",image1="app:\\"1.0\\""} 0.5' in prometheus
+
+    print("✅ Metrics are recorded per phase")
+
+
+if __name__ == "__main__":
+    test_metrics()
+    print("\n🎉 All tests passed! Metrics are working correctly.")
+    sys.exit(0)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that several compare directories are fetched from one container per image
+"""
+import os
+import sys
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff.main import DockerJarDiff
+from docker_jar_diff.utils import Utils
+
+
+def test_multi_compare_dirs():
+    """
+    Test normalization, single container sessions and the merged diff result
+    """
+    print("Testing multiple compare directories...")
+
+    assert Utils.normalize_compare_dirs(['/app/lib', 'app/lib/', '/app/lib/sub', '/opt/agent']) == \
+        ['/app/lib', '/opt/agent']
+    assert Utils.normalize_compare_dirs(['/app', '/']) == ['/']
+    assert Utils.normalize_compare_dirs(None) == ['/']
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=300, members_per_jar=50, changed=0.1)
+        for index, image_dir in enumerate((pair['dir1'], pair['dir2']), start=1):
+            os.makedirs(os.path.join(image_dir, "opt", "agent"))
+            with open(os.path.join(image_dir, "opt", "agent", "agent.properties"), 'w') as f:
+                f.write(f"agent.version={index}\n")
+
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("synthetic:1", pair['dir1'])
+        engine.add_image("synthetic:2", pair['dir2'])
+        server, base_url = serve_in_thread(engine)
+        try:
+            diff_tool = DockerJarDiff(os.path.join(temp_dir, "cache"),
+                                      config={'docker': {'base_url': base_url, 'tls': False}})
+            try:
+                result = diff_tool.compare("synthetic:1", "synthetic:2",
+                                           ['/app/lib', '/opt/agent', '/app/lib/'], write_report=True)
+            finally:
+                diff_tool.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        creates = [path for method, path in engine.requests if path == '/containers/create']
+        archives = [path for method, path in engine.requests if path.endswith('/archive')]
+        assert len(creates) == 2, creates
+        assert len(archives) == 4, archives
+
+        assert result.compare_dirs == ['/app/lib', '/opt/agent']
+        assert result.compare_dir == '/'
+        paths = [diff['path'] for diff in result.diff_result['differences']]
+        print(paths)
+        assert '/opt/agent/agent.properties' in paths
+        assert any(path.startswith('/app/lib') for path in paths)
+        assert not any(path.startswith('/app/data') for path in paths)
+        assert os.path.exists(result.report_path)
+
+    print("✅ Several compare directories are merged into one result")
+
+
+if __name__ == "__main__":
+    test_multi_compare_dirs()
+    print("\n🎉 All tests passed! Multiple compare directories are working correctly.")
+    sys.exit(0)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that content normalizers hide build noise from the diff
+"""
+import os
+import sys
+import zipfile
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.diff_engine import DiffEngine
+from docker_jar_diff.normalizers import DEFAULT_NORMALIZE_OPTIONS, build_normalizers
+
+MANIFEST = ("Manifest-Version: 1.0\r\nBuilt-By: {user}\r\nBuild-Time: {time}\r\nBnd-LastModified: 17{time_digits}\r\n"
+            "Implementation-Version: {version}\r\n Continued-Value\r\n\r\n")
+CONFIG = {'builtin': DEFAULT_NORMALIZE_OPTIONS['builtin'] + ['xml_dates'],
+          'rules': [{'name': 'generated_header', 'glob': '*.conf', 'pattern': r'^# generated .*$'}]}
+
+
+def manifest(user, time, version="1.0"):
+    return MANIFEST.format(user=user, time=time, time_digits=time.replace(':', '')[-6:], version=version)
+
+
+def write_jar(path, members, date_time):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zipfile.ZipFile(path, 'w') as z:
+        for name, data in members.items():
+            z.writestr(zipfile.ZipInfo(name, date_time), data)
+
+
+def write_file(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def write_image(root, build):
+    """One build of the same sources, build 2 also changes a class of other.jar"""
+    user, time, date_time = (("alice", "2024-05-01T10:00:00Z", (2024, 5, 1, 10, 0, 0)) if build == 1
+                             else ("jenkins-agent", "2024-06-12T23:59:59Z", (2024, 6, 12, 23, 59, 58)))
+    pom = f"#Generated by Maven\n#{'Wed May 01' if build == 1 else 'Wed Jun 12'} 10:00:00 UTC 2024\nversion=1.0\n"
+    write_jar(os.path.join(root, "lib", "app.jar"), {
+        "META-INF/MANIFEST.MF": manifest(user, time),
+        "META-INF/maven/com.acme/app/pom.properties": pom,
+        "com/acme/App.class": b"app"
+    }, date_time)
+    write_jar(os.path.join(root, "lib", "other.jar"), {
+        "META-INF/MANIFEST.MF": manifest(user, time),
+        "com/acme/Other.class": b"other" if build == 1 else b"other, changed"
+    }, date_time)
+    write_file(os.path.join(root, "conf", "git.properties"),
+               f"#Generated\ngit.build.time={time}\ngit.build.user.name={user}\ngit.commit.id=abc123\n")
+    write_file(os.path.join(root, "conf", "report.xml"),
+               f'<?xml version="1.0"?>\n<!-- Generated on {time} -->\n<report generated="{time}"><a>1</a></report>\n')
+    write_file(os.path.join(root, "conf", "real.xml"), f'<config><timeout>{10 * build}</timeout></config>\n')
+    # Only the generated date is noise, the timeout is configuration
+    write_file(os.path.join(root, "conf", "server.xml"),
+               f'<Connector date="{time}" timeout="{30 * build}" connectionTimeout="20000"/>\n')
+    # Same members, only the zip timestamps differ: nothing is normalized, the jar stays a difference
+    write_jar(os.path.join(root, "lib", "plain.jar"), {"com/acme/Plain.class": b"plain"}, date_time)
+    write_file(os.path.join(root, "conf", "app.conf"), f"# generated by build {build} at {time}\nport=8080\n")
+
+
+def test_builtin_normalizers():
+    """
+    Test each built-in normalizer and user rules
+    """
+    print("Testing built-in normalizers...")
+    options = dict(DEFAULT_NORMALIZE_OPTIONS, **CONFIG)
+    normalizers = {normalizer.name: normalizer for normalizer in build_normalizers(options)}
+    assert list(normalizers) == ['manifest', 'pom_properties', 'git_properties', 'build_info', 'xml_dates',
+                                 'generated_header']
+    # xml_dates is opt-in
+    assert 'xml_dates' not in DEFAULT_NORMALIZE_OPTIONS['builtin']
+
+    manifest_normalizer = normalizers['manifest']
+    assert manifest_normalizer.matches("!/META-INF/MANIFEST.MF") and not manifest_normalizer.matches("/MANIFEST.MF")
+    normalized = manifest_normalizer.normalize(manifest("alice", "2024-05-01T10:00:00Z").encode())
+    assert normalized == manifest_normalizer.normalize(manifest("bob", "2025-01-01T00:00:00Z").encode())
+    assert normalized == b"Manifest-Version: 1.0\nImplementation-Version: 1.0\n Continued-Value\n\n", normalized
+    assert manifest_normalizer.normalize(manifest("a", "t", "1.0").encode()) != \
+        manifest_normalizer.normalize(manifest("a", "t", "1.1").encode())
+
+    assert normalizers['pom_properties'].normalize(b"#Generated by Maven\n#Wed May 01\nversion=1\n") == b"version=1\n"
+    assert normalizers['git_properties'].normalize(b"git.build.time=1\ngit.commit.id=2\n") == b"git.commit.id=2\n"
+    xml = normalizers['xml_dates']
+    assert xml.normalize(b'<!-- on 2024-05-01 --><a time="x" id="2024-05-01" ns:Date=\'2024-05-01T10:00Z\'/>') == \
+        b'<!-- on <date> --><a time="x" id="2024-05-01" ns:Date="<date>"/>'
+    # Whole attribute names only, and only date values
+    for attribute, before, after in (('connectionTimeout', '20000', '5'), ('timeout', '30', '999'),
+                                     ('runtime', 'a', 'b'), ('updateTime', '2024-05-01', '2024-06-01'),
+                                     ('generated', 'yes', 'no')):
+        assert xml.normalize(f'<a {attribute}="{before}"/>'.encode()) != \
+            xml.normalize(f'<a {attribute}="{after}"/>'.encode()), attribute
+    assert xml.normalize(b'<a generated="2024-05-01T10:00:00Z"/>') == \
+        xml.normalize(b'<a generated="2025-01-01T00:00:00Z"/>')
+    assert normalizers['generated_header'].normalize(b"# generated at 1\nport=1\n") == b"\nport=1\n"
+
+    assert build_normalizers(dict(options, enabled=False)) == []
+    for invalid in ({'builtin': ['nope']}, {'rules': [{'glob': '*'}]}, {'rules': [{'glob': '*', 'pattern': '('}]}):
+        try:
+            build_normalizers(dict(options, **invalid))
+            assert False, invalid
+        except ValueError:
+            pass
+    print("✅ Built-in normalizers test passed!")
+
+
+def test_noise_only_changes():
+    """
+    Test that noise-only files and jars are identical, real changes still show up
+    """
+    print("Testing noise-only changes...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dir1, dir2 = os.path.join(temp_dir, "image1"), os.path.join(temp_dir, "image2")
+        write_image(dir1, 1)
+        write_image(dir2, 2)
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+
+        engine = DiffEngine(cache_manager, normalize_options=CONFIG)
+        result = engine.diff_directories(dir1, dir2)
+        by_path = {diff['path']: diff for diff in result['differences']}
+        assert sorted(by_path) == ['/conf/real.xml', '/conf/server.xml', '/lib/other.jar', '/lib/plain.jar'], \
+            sorted(by_path)
+        archive_paths = [diff['path'] for diff in by_path['/lib/other.jar']['archive_diff']]
+        assert archive_paths == ['/lib/other.jar/com/acme/Other.class'], archive_paths
+        # A changed timeout shows up even with its date attribute masked
+        assert by_path['/conf/server.xml']['type'] == 'content_diff'
+        assert by_path['/lib/plain.jar']['type'] == 'content_diff' and 'archive_diff' not in by_path['/lib/plain.jar']
+        # app.jar, its MANIFEST.MF and pom.properties, other.jar's MANIFEST.MF, git.properties, report.xml, app.conf
+        assert result['compare_stats']['normalized'] == 7, result['compare_stats']
+
+        # Without xml_dates the generated dates of report.xml are a difference
+        default = DiffEngine(cache_manager).diff_directories(dir1, dir2)
+        assert '/conf/report.xml' in {diff['path'] for diff in default['differences']}
+        # Both jars of an image carry the same MANIFEST.MF, it is normalized once
+        assert engine.metrics.caches['normalize']['hits'] >= 2
+        # Cached archive indexes were normalized when they were built, a hit does not walk them again
+        calls = []
+        normalize_archive = engine._normalize_archive
+        engine._normalize_archive = lambda *args: calls.append(args) or normalize_archive(*args)
+        assert engine.diff_directories(dir1, dir2)['differences'] == result['differences']
+        assert calls == [], calls
+        assert 'normalize' in engine.get_result_options()
+
+        plain = DiffEngine(cache_manager, normalize_options={'enabled': False}).diff_directories(dir1, dir2)
+        paths = {diff['path'] for diff in plain['differences']}
+        assert {'/lib/app.jar', '/conf/git.properties', '/conf/report.xml', '/conf/app.conf'} <= paths
+        assert plain['compare_stats']['normalized'] == 0
+        cache_manager.release()
+    print("✅ Noise-only changes test passed!")
+
+
+if __name__ == "__main__":
+    test_builtin_normalizers()
+    test_noise_only_changes()
+    print("\n🎉 All tests passed! Build noise no longer shows up as differences.")
+    sys.exit(0)
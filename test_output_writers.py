@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the streaming JSONL, CSV and JUnit XML outputs of --format
+"""
+import os
+import csv
+import sys
+import json
+import tempfile
+import webbrowser
+import xml.etree.ElementTree as ET
+from click.testing import CliRunner
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff import config as config_module
+from docker_jar_diff.api import summarize_differences
+from docker_jar_diff.cli import docker_jar_diff
+from docker_jar_diff.config import load_config
+from docker_jar_diff.main import DockerJarDiff
+from docker_jar_diff.writers import ExpectedChanges, OutputWriters, iter_records
+
+COMPARE_DIRS = ["/app/data", "/app/lib"]
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_writers():
+    """
+    Test records, expected patterns and the three formats on a small diff
+    """
+    print("Testing output writers...")
+    differences = [
+        {'path': '/app/lib/a.jar', 'type': 'content_diff', 'item1': {'size': 1, 'digest': 'x'},
+         'item2': {'size': 2, 'digest': 'y'},
+         'archive_diff': [{'path': '/app/lib/a.jar/META-INF/MANIFEST.MF', 'type': 'content_diff',
+                           'item1': {'size': 1}, 'item2': {'size': 1},
+                           'text_diff': {'status': 'ok', 'added': 1, 'removed': 1}}]},
+        {'path': '/app/conf/<b>&"c"', 'type': 'only_in_1', 'item1': {'size': 3}, 'item2': None}
+    ]
+    records = list(iter_records(differences))
+    assert [(record['path'], record['archive']) for record in records] == [
+        ('/app/lib/a.jar', None), ('/app/lib/a.jar/META-INF/MANIFEST.MF', '/app/lib/a.jar'),
+        ('/app/conf/<b>&"c"', None)]
+    assert records[1]['lines_added'] == 1 and records[2]['size2'] is None
+
+    expected = ExpectedChanges(['*/MANIFEST.MF', 'only_in_2:/app/conf/*'])
+    assert [expected.match(record) for record in records] == [False, True, False]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        outputs = OutputWriters(['jsonl', 'csv', 'junit'], temp_dir, {'expected': ['*/MANIFEST.MF']})
+        outputs.open({'image1': 'a:1', 'image2': 'a:2', 'compare_dirs': ['/app']})
+        outputs.add(differences)
+        outputs.add([{'path': '/app/bin/run.sh', 'type': 'mode_diff', 'item1': {'mode': '0755', 'uid': 0, 'gid': 0},
+                      'item2': {'mode': '0644', 'uid': 0, 'gid': 0}}], kind='metadata')
+        # Streamed: the lines are on disk before the outputs are closed
+        assert len(read_jsonl(outputs.paths['jsonl'])) == 4
+        outputs.close()
+
+        lines = read_jsonl(outputs.paths['jsonl'])
+        assert [line['expected'] for line in lines] == [False, True, False, False]
+        assert lines[3]['source'] == 'metadata' and lines[3]['mode1'] == '0755' and lines[3]['owner2'] == '0:0'
+        with open(outputs.paths['csv'], encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f))
+        assert [row['path'] for row in rows] == [line['path'] for line in lines]
+
+        suite = ET.parse(outputs.paths['junit']).getroot().find('testsuite')
+        assert suite.get('tests') == '4' and suite.get('failures') == '3'
+        cases = suite.findall('testcase')
+        assert cases[2].get('name') == '/app/conf/<b>&"c"'
+        assert cases[1].find('failure') is None and cases[0].find('failure').get('type') == 'content_diff'
+        assert sorted(os.listdir(temp_dir)) == ['differences.csv', 'differences.jsonl', 'junit.xml']
+
+        # A failed diff leaves no JUnit report that would hide failures
+        outputs = OutputWriters(['jsonl', 'junit'], os.path.join(temp_dir, "failed"))
+        outputs.open({'image1': 'a:1', 'image2': 'a:2', 'compare_dirs': ['/app']})
+        outputs.add(differences)
+        outputs.abort()
+        assert os.listdir(os.path.join(temp_dir, "failed")) == ['differences.jsonl']
+
+        try:
+            OutputWriters(['yaml'], temp_dir)
+            assert False, "unknown formats are rejected"
+        except ValueError:
+            pass
+    print("✅ Output writers test passed!")
+
+
+def test_streaming_compare():
+    """
+    Test that a comparison streams every difference once, and a cached result too
+    """
+    print("Testing --format on a comparison...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=300, members_per_jar=20, changed=0.1)
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("synthetic:1", pair['dir1'])
+        engine.add_image("synthetic:2", pair['dir2'])
+        server, base_url = serve_in_thread(engine)
+        try:
+            config = {'docker': {'base_url': base_url, 'tls': False}, 'checkpoint': {'enabled': False, 'units': 16}}
+            output_dir = os.path.join(temp_dir, "out")
+            results = []
+            for attempt in range(2):
+                diff_tool = DockerJarDiff(os.path.join(temp_dir, "cache"), config=config)
+                seen = []
+                original = diff_tool.diff_engine.diff_unit
+
+                def diff_unit(*args):
+                    jsonl_path = os.path.join(output_dir, "differences.jsonl")
+                    seen.append(len(read_jsonl(jsonl_path)) if os.path.exists(jsonl_path) else 0)
+                    return original(*args)
+                diff_tool.diff_engine.diff_unit = diff_unit
+                try:
+                    result = diff_tool.compare("synthetic:1", "synthetic:2", COMPARE_DIRS,
+                                               formats=['jsonl', 'junit'], output_dir=output_dir,
+                                               expected=['mtime_diff:*'])
+                finally:
+                    diff_tool.close()
+                results.append(result)
+
+                lines = read_jsonl(result.output_paths['jsonl'])
+                assert len(lines) == result.total_differences, (len(lines), result.summary)
+                assert summarize_differences([{'type': line['type']} for line in lines]) == result.summary
+                suite = ET.parse(result.output_paths['junit']).getroot().find('testsuite')
+                unexpected = sum(1 for line in lines if line['type'] != 'mtime_diff')
+                assert int(suite.get('tests')) == len(lines) and int(suite.get('failures')) == unexpected
+                assert result.unexpected_differences == unexpected
+                if attempt == 0:
+                    assert not result.cached
+                    assert any(0 < count for count in seen), "records must be written while the diff runs"
+            assert results[1].cached, "the second run is served from the result cache"
+        finally:
+            server.shutdown()
+            server.server_close()
+    print("✅ Streaming comparison test passed!")
+
+
+def test_cli_exit_code():
+    """
+    Test that the diff command fails when an image can not be compared, and on unexpected differences if asked to
+    """
+    print("Testing the exit code of the diff command...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=50, members_per_jar=5, changed=0.2)
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("synthetic:1", pair['dir1'])
+        engine.add_image("synthetic:2", pair['dir2'])
+        server, base_url = serve_in_thread(engine)
+        # The CLI reads .config/config.json of the working directory
+        work_dir = os.path.join(temp_dir, "work")
+        os.makedirs(os.path.join(work_dir, ".config"))
+        with open(os.path.join(work_dir, ".config", "config.json"), 'w') as f:
+            json.dump({'docker': {'base_url': base_url, 'tls': False}, 'cache': {'results': False}}, f)
+        previous_dir = os.getcwd()
+        previous_config = config_module._config
+        previous_open = webbrowser.open
+        try:
+            os.chdir(work_dir)
+            load_config(reload=True)
+            webbrowser.open = lambda url: True
+            runner = CliRunner()
+
+            def run(*args):
+                return runner.invoke(docker_jar_diff, ['diff', *args, '-d', '/app', '-c', 'cache',
+                                                       '--format', 'junit', '-o', 'out'])
+
+            output = run("synthetic:1", "missing:1")
+            assert output.exit_code == 1 and isinstance(output.exception, SystemExit), output.output
+            assert not os.path.exists(os.path.join(work_dir, "out", "junit.xml"))
+            output = run("synthetic:1", "synthetic:2")
+            assert output.exit_code == 0, output.output
+            output = run("synthetic:1", "synthetic:2", '--fail-on-unexpected')
+            assert output.exit_code == 1 and isinstance(output.exception, SystemExit), output.output
+            assert "非预期差异" in output.output
+            output = run("synthetic:1", "synthetic:2", '--fail-on-unexpected', '--expect', '*')
+            assert output.exit_code == 0, output.output
+            output = runner.invoke(docker_jar_diff, ['diff', "synthetic:1", "synthetic:2", '--fail-on-unexpected'])
+            assert output.exit_code == 2, "--fail-on-unexpected needs --format"
+        finally:
+            webbrowser.open = previous_open
+            os.chdir(previous_dir)
+            config_module._config = previous_config
+            server.shutdown()
+            server.server_close()
+    print("✅ Exit code test passed!")
+
+
+if __name__ == "__main__":
+    test_writers()
+    test_streaming_compare()
+    test_cli_exit_code()
+    print("\n🎉 All tests passed! Differences are streamed to JSONL, CSV and JUnit XML.")
+    sys.exit(0)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the cross-release path history index and the history command
+"""
+import os
+import sys
+import json
+import zipfile
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from click.testing import CliRunner
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff import config as config_module
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.cli import docker_jar_diff
+from docker_jar_diff.config import load_config
+from docker_jar_diff.diff_engine import DiffEngine
+from docker_jar_diff.history import HistoryIndex, get_history_path, last_change
+from docker_jar_diff.main import DockerJarDiff
+
+
+def write_release(root, version, foo_class, config_text=None):
+    """An image tree with a jar whose Foo.class and a config file change between releases"""
+    lib_dir = os.path.join(root, "app", "lib")
+    os.makedirs(lib_dir, exist_ok=True)
+    # The jar is renamed every release, its members are still found by member path
+    with zipfile.ZipFile(os.path.join(lib_dir, f"foo-{version}.jar"), 'w') as z:
+        z.writestr("com/acme/Foo.class", foo_class)
+        z.writestr("com/acme/Bar.class", b"bar")
+    if config_text is not None:
+        os.makedirs(os.path.join(root, "app", "conf"), exist_ok=True)
+        with open(os.path.join(root, "app", "conf", "app.properties"), 'w') as f:
+            f.write(config_text)
+
+
+def test_history_index():
+    """
+    Test recording releases and querying files and archive members
+    """
+    print("Testing HistoryIndex...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+        engine = DiffEngine(cache_manager)
+        index = HistoryIndex(get_history_path(cache_manager.base_cache_dir))
+        releases = [("1.0", b"v1", "a=1"), ("1.1", b"v1", "a=2"), ("1.2", b"v2", "a=2"), ("1.3", b"v2", None)]
+        for version, foo_class, config_text in releases:
+            root = os.path.join(temp_dir, version)
+            write_release(root, version, foo_class, config_text)
+            count = index.record(f"app:{version}", f"sha256:{version}", "/app", engine, root)
+            assert count == (4 if config_text is not None else 3), count
+        # An image is only recorded once per directory
+        assert index.record("app:1.0", "sha256:1.0", ["/app/lib", "/app/conf"], engine,
+                            os.path.join(temp_dir, "1.0")) == 0
+        assert [image['name'] for image in index.images()] == ["app:1.0", "app:1.1", "app:1.2", "app:1.3"]
+        # Recording order unless an explicit release order is given
+        assert [image['name'] for image in index.images(["app:1.2", "sha256:1.0"])] == [
+            "app:1.2", "app:1.0", "app:1.1", "app:1.3"]
+        history = index.query("/app/conf/app.properties", ["app:1.1", "app:1.0", "app:1.2", "app:1.3"])
+        assert [(entry['name'], entry['change']) for entry in history] == [
+            ("app:1.1", 'added'), ("app:1.0", 'changed'), ("app:1.2", 'changed'), ("app:1.3", 'removed')]
+
+        history = index.query("/app/conf/app.properties")
+        assert [entry['change'] for entry in history] == ['added', 'changed', 'unchanged', 'removed']
+        assert last_change(history)['name'] == "app:1.3"
+
+        history = index.query("com/acme/Foo.class")
+        assert [entry['change'] for entry in history] == ['added', 'unchanged', 'changed', 'unchanged']
+        assert history[2]['locations'][0]['archive'] == "/app/lib/foo-1.2.jar"
+        assert last_change(history)['name'] == "app:1.2"
+
+        history = index.query("/app/lib/foo-1.1.jar!/com/acme/Bar.class")
+        assert [(entry['name'], entry['change']) for entry in history] == [
+            ("app:1.0", 'absent'), ("app:1.1", 'added'), ("app:1.2", 'removed'), ("app:1.3", 'absent')]
+        assert history[1]['locations'][0]['size'] == 3
+
+        # Images recorded for other directories say nothing about a path
+        other = os.path.join(temp_dir, "other")
+        os.makedirs(os.path.join(other, "usr"))
+        with open(os.path.join(other, "usr", "x"), 'w') as f:
+            f.write("x")
+        index.record("other:1", "sha256:other", "/usr", engine, other)
+        assert len(index.query("/app/conf/app.properties")) == 4
+        assert index.query("/nowhere") == []
+        cache_manager.release()
+    print("✅ HistoryIndex test passed!")
+
+
+def test_history_command():
+    """
+    Test that a comparison records both images and history answers without Docker
+    """
+    print("Testing the history command...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=200, members_per_jar=10, changed=0.2)
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("synthetic:1", pair['dir1'])
+        engine.add_image("synthetic:2", pair['dir2'])
+        server, base_url = serve_in_thread(engine)
+        cache_dir = os.path.join(temp_dir, "cache")
+        try:
+            config = {'docker': {'base_url': base_url, 'tls': False}}
+            # History is opt-in
+            diff_tool = DockerJarDiff(os.path.join(temp_dir, "plain"), config=config)
+            try:
+                assert diff_tool.history_index is None
+                assert 'history' not in diff_tool.compare("synthetic:1", "synthetic:2", "/app").metrics['phases']
+            finally:
+                diff_tool.close()
+            assert not os.path.exists(get_history_path(os.path.join(temp_dir, "plain")))
+
+            diff_tool = DockerJarDiff(cache_dir, config=dict(config, history={'enabled': True}))
+            try:
+                result = diff_tool.compare("synthetic:1", "synthetic:2", "/app")
+            finally:
+                diff_tool.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert result.metrics['phases']['history']['files'] > 0
+
+        changed = next(diff for diff in result.diff_result['differences'] if diff['type'] == 'content_diff'
+                       and not diff.get('is_archive'))
+        runner = CliRunner()
+        # The CLI reads .config/config.json of the working directory
+        work_dir = os.path.join(temp_dir, "work")
+        previous_dir = os.getcwd()
+        previous_config = config_module._config
+        try:
+            os.makedirs(os.path.join(work_dir, ".config"))
+            with open(os.path.join(work_dir, ".config", "config.json"), 'w') as f:
+                json.dump({}, f)
+            os.chdir(work_dir)
+            load_config(reload=True)
+
+            output = runner.invoke(docker_jar_diff, ['history', changed['path'], '-c', cache_dir, '--json'])
+            assert output.exit_code == 0, output.output
+            history = json.loads(output.output)
+            assert [(entry['name'], entry['change']) for entry in history] == [
+                ("synthetic:1", 'added'), ("synthetic:2", 'changed')]
+            assert history[0]['locations'][0]['digest'] != history[1]['locations'][0]['digest']
+
+            output = runner.invoke(docker_jar_diff, ['history', changed['path'], '-c', cache_dir])
+            assert "最近一次变化: synthetic:2" in output.output, output.output
+            output = runner.invoke(docker_jar_diff, ['history', '/app/none', '-c', os.path.join(temp_dir, "empty")])
+            assert output.exit_code != 0
+        finally:
+            os.chdir(previous_dir)
+            # Later tests of the session see the configuration they had before
+            config_module._config = previous_config
+    print("✅ History command test passed!")
+
+
+if __name__ == "__main__":
+    test_history_index()
+    test_history_command()
+    print("\n🎉 All tests passed! Path history is answered from the local index.")
+    sys.exit(0)
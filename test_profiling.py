@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test script to verify per-phase CPU and memory profiling
+"""
+import os
+import sys
+import json
+import pstats
+import zipfile
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.diff_engine import DiffEngine
+from docker_jar_diff.main import DockerJarDiff
+from docker_jar_diff.metrics import Metrics
+from docker_jar_diff.profiling import Profiler
+
+
+def test_profiling():
+    """
+    Test that each phase gets its own pstats dump and allocation report
+    """
+    print("Testing per-phase profiling...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dir1 = os.path.join(temp_dir, "image1")
+        dir2 = os.path.join(temp_dir, "image2")
+        for index, image_dir in enumerate((dir1, dir2)):
+            os.makedirs(os.path.join(image_dir, "lib"))
+            with zipfile.ZipFile(os.path.join(image_dir, "lib", "app.jar"), 'w') as z:
+                z.writestr("com/acme/A.class", b"A" * (100 + index))
+            with open(os.path.join(image_dir, "app.properties"), 'w') as f:
+                f.write(f"version={index}\n")
+
+        output_dir = os.path.join(temp_dir, "profile")
+        metrics = Metrics()
+        metrics.profiler = Profiler(output_dir)
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+        DiffEngine(cache_manager, metrics=metrics).diff_directories(dir1, dir2)
+        cache_manager.release()
+        metrics.profiler.save()
+
+        with open(os.path.join(output_dir, "profile_summary.json"), encoding='utf-8') as f:
+            summary = json.load(f)
+        print(json.dumps(summary['phases'], indent=2)[:2000])
+        for phase in ('build_tree', 'archive_index', 'find_differences'):
+            assert phase in summary['phases'], f"Missing phase {phase}"
+            assert os.path.exists(os.path.join(output_dir, f"{phase}.txt"))
+            stats = pstats.Stats(os.path.join(output_dir, f"{phase}.pstats"))
+            functions = {func[2] for func in stats.stats}
+            print(f"{phase}: {len(functions)} functions")
+        assert summary['phases']['archive_index']['calls'] == 2
+
+        # Nested phases are attributed to the innermost one only
+        build_tree_functions = {func[2] for func in pstats.Stats(os.path.join(output_dir, "build_tree.pstats")).stats}
+        archive_functions = {func[2] for func in pstats.Stats(os.path.join(output_dir, "archive_index.pstats")).stats}
+        assert '_build_archive_tree' in archive_functions
+        assert '_build_archive_tree' not in build_tree_functions
+        assert '_find_differences' in {func[2] for func in pstats.Stats(
+            os.path.join(output_dir, "find_differences.pstats")).stats}
+
+    print("✅ Profiles are written per phase")
+
+
+def test_profile_compare():
+    """
+    Test that jars indexed while the images are acquired show up in the profiles of compare()
+    """
+    print("Testing profiling of compare()...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        for index in (1, 2):
+            rootfs = os.path.join(temp_dir, f"rootfs{index}")
+            for directory in ("lib", "plugins"):
+                os.makedirs(os.path.join(rootfs, "app", directory))
+                with zipfile.ZipFile(os.path.join(rootfs, "app", directory, "app.jar"), 'w') as z:
+                    z.writestr("com/acme/A.class", b"A" * (100 + index))
+            engine.add_image(f"profiled:{index}", rootfs)
+        server, base_url = serve_in_thread(engine)
+        try:
+            config = {'docker': {'base_url': base_url, 'tls': False}, 'cache': {'results': False}}
+            diff_tool = DockerJarDiff(os.path.join(temp_dir, "cache"), config=config, profile=True)
+            # Allocation snapshots of a whole compare() are slow, the CPU profiles are what is tested
+            diff_tool.metrics.profiler.max_snapshots = 0
+            try:
+                result = diff_tool.compare("profiled:1", "profiled:2", ["/app/lib", "/app/plugins"])
+            finally:
+                diff_tool.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        for phase, function in (('archive_index', '_build_archive_tree'), ('extract', 'extract_stream')):
+            stats = pstats.Stats(os.path.join(result.profile_dir, f"{phase}.pstats"))
+            functions = {func[2] for func in stats.stats}
+            print(f"{phase}: {len(functions)} functions")
+            assert function in functions, f"{function} missing from the {phase} profile"
+        # One jar per image, indexed while acquired, build_tree found it in the cache
+        assert result.metrics['caches']['archive_index']['misses'] == 2, result.metrics['caches']
+    print("✅ compare() profiles the acquisition")
+
+
+if __name__ == "__main__":
+    test_profiling()
+    test_profile_compare()
+    print("\n🎉 All tests passed! Profiling is working correctly.")
+    sys.exit(0)
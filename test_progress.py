@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the byte and file progress of transfer, extraction, hashing and diffing
+"""
+import io
+import os
+import sys
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff import main as main_module
+from docker_jar_diff.main import DockerJarDiff
+from docker_jar_diff.sharding import diff_by_units
+from docker_jar_diff.progress import ProgressPrinter, ProgressTracker, format_task
+
+COMPARE_DIRS = ["/app/data", "/app/lib"]
+
+
+def test_tracker():
+    """
+    Test throttling, totals, ETA and the printer
+    """
+    print("Testing ProgressTracker...")
+    events = []
+    tracker = ProgressTracker(lambda event, **info: events.append((event, info['tasks'])), interval=3600)
+    task = tracker.task('extract', total_bytes=1000)
+    for _ in range(500):
+        task.advance(bytes=1, files=1)
+    # Only the first change is reported within the interval
+    assert len(events) == 1
+    snapshot = task.snapshot()
+    assert snapshot['bytes'] == 500 and snapshot['total_bytes'] == 1000 and snapshot['eta'] is not None
+    assert '剩余' in format_task(snapshot) and '[#####.....]' in format_task(snapshot, bar_width=10)
+
+    # A task found as it goes: its total grows
+    index = tracker.task('archive_index')
+    index.add_total(files=2)
+    index.advance(files=1)
+    assert index.snapshot()['total_files'] == 2
+
+    # Finishing is always reported, then the task is dropped
+    tracker.finish('extract')
+    event, tasks = events[-1]
+    assert event == 'progress' and [task['name'] for task in tasks] == ['extract', 'archive_index']
+    assert tasks[0]['done'] and tasks[0]['eta'] == 0.0
+    assert list(tracker.tasks) == ['archive_index']
+    assert tracker.task('extract') is not task, "a finished task starts over"
+
+    # Without a terminal, lines are printed every log_interval and when a task finishes
+    stream = io.StringIO()
+    printer = ProgressPrinter(stream, log_interval=3600)
+    printer.update([snapshot])
+    printer.update([snapshot])
+    printer.update(tasks)
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2 and '✓' in lines[1], lines
+    print("✅ ProgressTracker test passed!")
+
+
+def test_compare_progress():
+    """
+    Test that the progress events of a comparison add up to the metrics
+    """
+    print("Testing the progress of a comparison...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=300, members_per_jar=20, changed=0.1)
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("synthetic:1", pair['dir1'])
+        engine.add_image("synthetic:2", pair['dir2'])
+        server, base_url = serve_in_thread(engine)
+        try:
+            for stream in (True, False):
+                config = {'docker': {'base_url': base_url, 'tls': False}, 'cache': {'results': False},
+                          'acquire': {'stream': stream}, 'checkpoint': {'units': 16},
+                          'progress': {'interval': 0}}
+                finished = []
+                diff_tool = DockerJarDiff(os.path.join(temp_dir, f"cache_{stream}"), config=config)
+                # Progress does not change how the directories are diffed
+                main_module.diff_by_units = None
+                try:
+                    result = diff_tool.compare(
+                        "synthetic:1", "synthetic:2", COMPARE_DIRS,
+                        progress=lambda event, **info: finished.extend(
+                            task for task in info['tasks'] if task['done']) if event == 'progress' else None)
+                finally:
+                    main_module.diff_by_units = diff_by_units
+                    diff_tool.close()
+
+                by_name = {}
+                for task in finished:
+                    by_name.setdefault(task['name'], []).append(task)
+                phases = result.metrics['phases']
+                assert len(by_name['transfer']) == 2, "one transfer per image"
+                assert sum(task['bytes'] for task in by_name['transfer']) == phases['get_archive']['bytes']
+                assert sum(task['files'] for task in by_name['extract']) == phases['extract']['files']
+                if not stream:
+                    # A saved tar is the known total of its extraction
+                    assert all(task['total_bytes'] >= task['bytes'] > 0 for task in by_name['extract'])
+                else:
+                    assert sum(task['files'] for task in by_name['archive_index']) == \
+                        phases['archive_prefetch']['files']
+                diff_task, = by_name['diff']
+                assert diff_task['files'] == diff_task['total_files'] > 1
+                if 'hash' in phases:
+                    assert sum(task['bytes'] for task in by_name['hash']) == phases['hash']['bytes']
+                    # Files and bytes to hash are known ahead, for an ETA
+                    assert all(task['total_bytes'] and task['total_files'] for task in by_name['hash'])
+        finally:
+            server.shutdown()
+            server.server_close()
+    print("✅ Comparison progress test passed!")
+
+
+if __name__ == "__main__":
+    test_tracker()
+    test_compare_progress()
+    print("\n🎉 All tests passed! Progress is tracked in bytes and files with rate and ETA.")
+    sys.exit(0)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that finished comparisons are served from the result cache
+"""
+import os
+import sys
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff.main import DockerJarDiff
+from docker_jar_diff.result_cache import ResultCache
+
+
+def run_compare(cache_dir, base_url, use_cache=True, text_diff=None):
+    config = {'docker': {'base_url': base_url, 'tls': False}}
+    if text_diff:
+        config['text_diff'] = text_diff
+    diff_tool = DockerJarDiff(cache_dir, config=config)
+    try:
+        return diff_tool.compare("synthetic:1", "synthetic:2", "/app", use_cache=use_cache)
+    finally:
+        diff_tool.close()
+
+
+def count_containers(engine):
+    return len([path for method, path in engine.requests if path == '/containers/create'])
+
+
+def test_result_cache():
+    """
+    Test cache hits, --no-cache and automatic invalidation by key
+    """
+    print("Testing the result cache...")
+
+    key = ResultCache.make_key("sha256:a", "sha256:b", ["/app"], {'x': 1})
+    assert key == ResultCache.make_key("sha256:a", "sha256:b", ["/app"], {'x': 1})
+    assert key != ResultCache.make_key("sha256:b", "sha256:a", ["/app"], {'x': 1})
+    assert key != ResultCache.make_key("sha256:a", "sha256:b", ["/app/lib"], {'x': 1})
+    assert key != ResultCache.make_key("sha256:a", "sha256:b", ["/app"], {'x': 2})
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=200, members_per_jar=20, changed=0.1)
+        cache_dir = os.path.join(temp_dir, "cache")
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("synthetic:1", pair['dir1'])
+        engine.add_image("synthetic:2", pair['dir2'])
+        server, base_url = serve_in_thread(engine)
+        try:
+            first = run_compare(cache_dir, base_url)
+            assert not first.cached
+            assert count_containers(engine) == 2
+
+            second = run_compare(cache_dir, base_url)
+            print(second.timings)
+            assert second.cached
+            assert count_containers(engine) == 2, "a cache hit must not extract the images"
+            assert second.summary == first.summary
+            assert second.image1_id == first.image1_id
+            assert os.path.exists(second.report_path)
+            # Cached entries outlive the task directory of the first run
+            for path in (second.diff_json_path, second.report_path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    assert first.task_dir not in f.read(), path
+            assert all(diff.get('item1') is None or diff['item1'].get('path') is None
+                       for diff in second.diff_result['differences'])
+            assert second.metrics['caches']['result']['hits'] == 1
+
+            # --no-cache runs the whole pipeline again
+            third = run_compare(cache_dir, base_url, use_cache=False)
+            assert not third.cached
+            assert count_containers(engine) == 4
+
+            # Different options or a new image ID miss the cache
+            fourth = run_compare(cache_dir, base_url, text_diff={'context_lines': 1})
+            assert not fourth.cached
+            assert count_containers(engine) == 6
+
+            with open(os.path.join(pair['dir2'], "app", "added.txt"), 'w') as f:
+                f.write("new file\n")
+            engine.add_image("synthetic:2", pair['dir2'])
+            fifth = run_compare(cache_dir, base_url)
+            assert not fifth.cached
+            assert fifth.image2_id != first.image2_id
+            assert fifth.total_differences == first.total_differences + 1
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        # Entries expire by age like task directories
+        result_cache = ResultCache(os.path.join(cache_dir, "results"))
+        assert len(result_cache.evict(max_age=-1)) == 3
+
+    print("✅ Finished comparisons are served from the result cache")
+
+
+if __name__ == "__main__":
+    test_result_cache()
+    print("\n🎉 All tests passed! The result cache is working correctly.")
+    sys.exit(0)
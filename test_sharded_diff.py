@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that a sharded diff produces the same diff.json as a single process
+"""
+import os
+import sys
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff.main import DockerJarDiff
+from docker_jar_diff.diff_engine import DiffEngine
+from docker_jar_diff.sharding import plan_units, choose_units, assign_shards
+from docker_jar_diff.utils import Utils
+
+
+def test_plan_units():
+    """
+    Test that units only split directories present in both images
+    """
+    print("Testing shard unit planning...")
+    files1 = [('a', 'x', '1'), ('a', 'x', '2'), ('a', 'y'), ('b', 'z'), ('c',)]
+    files2 = [('a', 'x', '1'), ('a', 'y', '3'), ('b', 'z'), ('d', 'e')]
+
+    assert plan_units(files1, files2, 1) == {('a',): 5, ('b',): 2, ('c',): 1, ('d',): 1}
+    units = plan_units(files1, files2, 3)
+    # a/y is a file in one image and a directory in the other, it is one unit
+    assert units == {('a', 'x', '1'): 2, ('a', 'x', '2'): 1, ('a', 'y'): 2, ('b', 'z'): 2,
+                     ('c',): 1, ('d',): 1}, units
+
+    # Going deeper stops once no unit can be split any further
+    auto_units, depth = choose_units(files1, files2, 8)
+    assert auto_units == units and depth <= 4, (auto_units, depth)
+
+    for strategy in ('prefix', 'hash'):
+        assignments = assign_shards(units, 3, strategy)
+        assert [tuple(unit) for unit, _ in assignments] == sorted(units)
+        assert all(0 <= shard < 3 for _, shard in assignments)
+    prefix_shards = [shard for _, shard in assign_shards(units, 3)]
+    assert prefix_shards == sorted(prefix_shards), "prefix shards must be contiguous"
+    print("✅ Unit planning test passed!")
+
+
+def test_sharded_diff():
+    """
+    Test that diff --shards writes exactly the single-process diff.json
+    """
+    print("Testing the sharded diff...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=300, members_per_jar=20, changed=0.1)
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"))
+        engine.add_image("synthetic:1", pair['dir1'])
+        engine.add_image("synthetic:2", pair['dir2'])
+        server, base_url = serve_in_thread(engine)
+        try:
+            for compare_dir in ("/app", ["/app/data", "/app/lib"]):
+                config = {'docker': {'base_url': base_url, 'tls': False}}
+                diff_tool = DockerJarDiff(os.path.join(temp_dir, "cache"), config=config)
+                ready = {}
+                try:
+                    result = diff_tool.compare("synthetic:1", "synthetic:2", compare_dir, use_cache=False,
+                                               shards=3, progress=lambda event, **info: ready.update(info)
+                                               if event == 'images_ready' else None)
+                    assert result.total_differences > 0
+                    assert 'shard_plan' in result.metrics['phases']
+
+                    # Same extracted images and workspace, diffed in this process
+                    single = DiffEngine(diff_tool.cache_manager).diff_directories(
+                        ready['extracted_dir1'], ready['extracted_dir2'], compare_dir)
+                    # Metadata differences come from the tar headers, next to the content diff
+                    single['metadata_differences'] = result.diff_result['metadata_differences']
+                    single['image1_name'] = "synthetic:1"
+                    single['image2_name'] = "synthetic:2"
+                    single_path = os.path.join(temp_dir, "single.json")
+                    Utils.save_json(single, single_path)
+
+                    with open(result.diff_json_path, 'rb') as f1, open(single_path, 'rb') as f2:
+                        assert f1.read() == f2.read(), f"sharded diff.json differs for {compare_dir}"
+                finally:
+                    diff_tool.close()
+        finally:
+            server.shutdown()
+    print("✅ Sharded diff test passed!")
+
+
+if __name__ == "__main__":
+    test_plan_units()
+    test_sharded_diff()
+    print("\n🎉 All tests passed! Sharded diffs match single-process diffs.")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that archives are extracted and indexed while they are downloaded
+"""
+import os
+import sys
+import time
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from benchmarks.fake_docker import FakeDockerEngine, serve_in_thread
+from benchmarks.synthetic import generate_pair
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.diff_engine import DiffEngine
+from docker_jar_diff.docker_handler import DockerHandler
+from docker_jar_diff.metrics import Metrics
+
+
+def acquire_and_build(base_url, cache_dir, stream):
+    """Acquire one image and build its tree, returns (tree, metrics, index times, finish time)"""
+    metrics = Metrics()
+    cache_manager = CacheManager(cache_dir)
+    config = {'docker': {'base_url': base_url, 'tls': False}, 'acquire': {'stream': stream}}
+    handler = DockerHandler(cache_manager, config, progress=lambda event, **info: None, metrics=metrics)
+    engine = DiffEngine(cache_manager, metrics=metrics)
+    index_times = []
+
+    def archive_indexer(file_path):
+        index_times.append(time.monotonic())
+        engine.prefetch_archive(file_path)
+
+    handler.archive_indexer = archive_indexer
+    try:
+        image_info = handler.process_image("synthetic:1", "/app")
+        assert not image_info.get('error'), image_info
+        finished = time.monotonic()
+        misses_before = metrics.to_dict()['caches'].get('archive_index', {}).get('misses', 0)
+        tree = engine.build_tree(image_info['extracted_dir'], "/app")
+        misses_after = metrics.to_dict()['caches']['archive_index']['misses']
+        tar_saved = os.path.exists(os.path.join(image_info['image_cache_dir'], "image.tar"))
+    finally:
+        handler.cleanup()
+        cache_manager.release()
+    return tree, misses_after - misses_before, index_times, finished, tar_saved
+
+
+def strip_paths(tree):
+    """Tree without the absolute paths, which differ per task"""
+    if 'size' in tree and not isinstance(tree.get('size'), dict):
+        return {key: value for key, value in tree.items() if key != 'path'}
+    return {key: strip_paths(value) if isinstance(value, dict) else value for key, value in tree.items()}
+
+
+def test_streaming_acquisition():
+    """
+    Test that streamed extraction matches the tar path and overlaps jar indexing
+    """
+    print("Testing streamed acquisition...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pair = generate_pair(os.path.join(temp_dir, "pair"), entries=2000, members_per_jar=100,
+                             file_size=2048, changed=0)
+        engine = FakeDockerEngine(os.path.join(temp_dir, "engine"), bandwidth="2M", chunk_size=16 * 1024)
+        engine.add_image("synthetic:1", pair['dir1'])
+        server, base_url = serve_in_thread(engine)
+        try:
+            tree, build_misses, index_times, finished, tar_saved = acquire_and_build(
+                base_url, os.path.join(temp_dir, "cache"), stream=True)
+            jar_count = pair['spec']['jars']
+            assert len(index_times) == jar_count, (len(index_times), jar_count)
+            # Every jar was indexed during acquisition, build_tree only hits the cache
+            assert build_misses == 0
+            assert not tar_saved
+            # The first jar was indexed well before the download finished
+            print(f"first jar indexed {finished - index_times[0]:.2f}s before the end of the download")
+            assert finished - index_times[0] > 0.2
+
+            engine.bandwidth = None
+            plain_tree, plain_misses, plain_index_times, _, plain_tar_saved = acquire_and_build(
+                base_url, os.path.join(temp_dir, "cache_tar"), stream=False)
+            assert not plain_index_times
+            assert plain_tar_saved
+            assert plain_misses == jar_count
+            assert strip_paths(tree) == strip_paths(plain_tree)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    print("✅ Archives are extracted and indexed while they are downloaded")
+
+
+if __name__ == "__main__":
+    test_streaming_acquisition()
+    print("\n🎉 All tests passed! Streamed acquisition is working correctly.")
+    sys.exit(0)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Test script to verify bounded line diffs for changed text files
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from docker_jar_diff.diff_engine import DiffEngine, TextDiffPool
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.html_generator import HTMLGenerator
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def test_text_diff():
+    """
+    Test that changed config files get compact hunks and oversized files are skipped
+    """
+    print("Testing bounded text diffs for changed config files...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dir1 = os.path.join(temp_dir, "image1")
+        dir2 = os.path.join(temp_dir, "image2")
+
+        # Changed properties file
+        lines = [f"key{i}=value{i}\n" for i in range(50)]
+        _write(os.path.join(dir1, "app", "config", "application.properties"), ''.join(lines))
+        lines[25] = "key25=changed\n"
+        _write(os.path.join(dir2, "app", "config", "application.properties"), ''.join(lines))
+
+        # Changed file above the line cap
+        _write(os.path.join(dir1, "app", "config", "big.yml"), "a: 1\n" * 200)
+        _write(os.path.join(dir2, "app", "config", "big.yml"), "a: 2\n" * 200)
+
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+        diff_engine = DiffEngine(cache_manager, {'max_lines': 100})
+        diff_result = diff_engine.diff_directories(dir1, dir2)
+
+        diffs = {diff['path']: diff for diff in diff_result['differences']}
+        properties_diff = diffs['/app/config/application.properties']['text_diff']
+        print(f"Properties text diff: {properties_diff}")
+        assert properties_diff['status'] == 'ok'
+        assert properties_diff['added'] == 1 and properties_diff['removed'] == 1
+        assert len(properties_diff['hunks']) == 1
+        hunk = properties_diff['hunks'][0]
+        assert '-key25=value25' in hunk['lines'] and '+key25=changed' in hunk['lines']
+        assert hunk['old_start'] == 23 and hunk['old_lines'] == 7
+
+        big_diff = diffs['/app/config/big.yml']['text_diff']
+        assert big_diff['status'] == 'too_many_lines'
+        assert 'hunks' not in big_diff
+
+    print("✅ Text diffs are bounded and stored as compact hunks")
+
+
+def test_text_diff_timeout():
+    """
+    Test that a pathological diff is stopped at the per-file timeout
+    """
+    print("Testing the per-file text diff timeout...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dir1 = os.path.join(temp_dir, "image1")
+        dir2 = os.path.join(temp_dir, "image2")
+
+        # Low-entropy lines make SequenceMatcher quadratic, about 10s of CPU
+        generator = random.Random(1)
+        for directory in (dir1, dir2):
+            _write(os.path.join(directory, "app", "config", "slow.txt"),
+                   ''.join(generator.choice("ab") + "\n" for _ in range(8000)))
+        _write(os.path.join(dir1, "app", "config", "fast.properties"), "a=1\n")
+        _write(os.path.join(dir2, "app", "config", "fast.properties"), "a=2\n")
+
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+        diff_engine = DiffEngine(cache_manager, {'timeout': 1, 'workers': 1})
+        start = time.monotonic()
+        diff_result = diff_engine.diff_directories(dir1, dir2)
+        elapsed = time.monotonic() - start
+        print(f"Diff finished in {elapsed:.2f}s")
+
+        diffs = {diff['path']: diff for diff in diff_result['differences']}
+        assert diffs['/app/config/slow.txt']['text_diff']['status'] == 'timeout'
+        # The worker is killed and replaced, the next file still gets its diff
+        assert diffs['/app/config/fast.properties']['text_diff']['status'] == 'ok'
+        assert elapsed < 4, elapsed
+        cache_manager.release()
+
+    print("✅ Text diffs are stopped at the per-file timeout")
+
+
+def test_text_diff_run_budget():
+    """
+    Test that total_timeout covers a whole run diffed unit by unit
+    """
+    print("Testing the text diff total timeout of a run...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        generator = random.Random(1)
+        items = {}
+        for name in ("slow.txt", "fast.properties"):
+            for side in (1, 2):
+                path = os.path.join(temp_dir, f"image{side}", name)
+                text = (''.join(generator.choice("ab") + "\n" for _ in range(8000)) if name == "slow.txt"
+                        else f"a={side}\n")
+                _write(path, text)
+                items.setdefault(name, {})[f'item{side}'] = {'path': path}
+
+        def unit(name):
+            return [dict(items[name], type='content_diff', path='/' + name)]
+
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+        diff_engine = DiffEngine(cache_manager, {'timeout': 30, 'total_timeout': 1, 'workers': 1})
+        with diff_engine.text_diff_run():
+            slow, fast = unit("slow.txt"), unit("fast.properties")
+            diff_engine.attach_text_diffs(slow)
+            diff_engine.attach_text_diffs(fast)
+        assert slow[0]['text_diff']['status'] == 'timeout'
+        # The slow unit used up the budget of the run
+        assert fast[0]['text_diff']['status'] == 'timeout'
+
+        # Outside a run each call has its own total_timeout
+        fast = unit("fast.properties")
+        diff_engine.attach_text_diffs(fast)
+        assert fast[0]['text_diff']['status'] == 'ok'
+
+        # A run keeps its spawned workers for every call
+        started = []
+        start_worker = TextDiffPool._start_worker
+        TextDiffPool._start_worker = lambda pool, context: started.append(context.get_start_method()) or \
+            start_worker(pool, context)
+        try:
+            with diff_engine.text_diff_run():
+                for _ in range(3):
+                    fast = unit("fast.properties")
+                    diff_engine.attach_text_diffs(fast)
+                    assert fast[0]['text_diff']['status'] == 'ok'
+        finally:
+            TextDiffPool._start_worker = start_worker
+        assert started == ['spawn'], started
+        cache_manager.release()
+
+    print("✅ Text diff total timeout covers the whole run")
+
+
+def test_report_escapes_file_contents():
+    """
+    Test that file contents in the hunks can not close the report's script block
+    """
+    print("Testing that the report escapes file contents...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dir1 = os.path.join(temp_dir, "image1")
+        dir2 = os.path.join(temp_dir, "image2")
+        _write(os.path.join(dir1, "app", "index.xml"), "<page><script>a()</script></page>\n")
+        _write(os.path.join(dir2, "app", "index.xml"), "<page><script>b()</script><!-- x --></page>\n")
+
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+        diff_result = DiffEngine(cache_manager).diff_directories(dir1, dir2)
+        assert diff_result['differences'][0]['text_diff']['status'] == 'ok'
+        report_path = HTMLGenerator(cache_manager).generate_report(diff_result)
+        with open(report_path, 'r', encoding='utf-8') as f:
+            html_content = f.read()
+        data = html_content.split("const diffData = ", 1)[1].split(";\n", 1)[0]
+        assert '<' not in data and '>' not in data, data
+        assert '\\u003c/script\\u003e' in data
+        cache_manager.release()
+
+    print("✅ File contents are escaped in the report")
+
+
+if __name__ == "__main__":
+    test_text_diff()
+    test_text_diff_timeout()
+    test_text_diff_run_budget()
+    test_report_escapes_file_contents()
+    print("\n🎉 All tests passed! Text diff stage is working correctly.")
+    sys.exit(0)
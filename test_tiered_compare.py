@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the size / sample / full digest comparison tiers
+"""
+import os
+import sys
+import json
+import tempfile
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from docker_jar_diff.cache_manager import CacheManager
+from docker_jar_diff.diff_engine import DiffEngine
+from docker_jar_diff.metrics import Metrics
+
+MB = 1024 * 1024
+SAMPLE = 64 * 1024
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_tiered_compare():
+    """
+    Test that large files are decided by head/tail samples when possible
+    """
+    print("Testing tiered comparison...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dir1 = os.path.join(temp_dir, "image1")
+        dir2 = os.path.join(temp_dir, "image2")
+        big = bytes(range(256)) * (8 * MB // 256)
+        files = {
+            # name: (content1, content2)
+            "model_head.bin": (big, b"X" + big[1:]),
+            "model_middle.bin": (big, big[:4 * MB] + b"X" + big[4 * MB + 1:]),
+            "model_same.bin": (big, big),
+            "libfoo.so": (big, big[:-10]),
+            "small.txt": (b"hello\n", b"hallo\n"),
+        }
+        for name, (content1, content2) in files.items():
+            _write(os.path.join(dir1, "opt", name), content1)
+            _write(os.path.join(dir2, "opt", name), content2)
+
+        metrics = Metrics()
+        cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
+        result = DiffEngine(cache_manager, metrics=metrics).diff_directories(dir1, dir2)
+        cache_manager.release()
+
+        diffs = {diff['path']: diff for diff in result['differences']}
+        stats = result['compare_stats']
+        print(json.dumps(stats, indent=2))
+        assert diffs['/opt/model_head.bin']['type'] == 'content_diff'
+        assert diffs['/opt/model_head.bin']['compare_tier'] == 'sample'
+        assert diffs['/opt/model_middle.bin']['compare_tier'] == 'digest'
+        assert diffs['/opt/libfoo.so']['type'] == 'size_diff'
+        assert diffs['/opt/libfoo.so']['compare_tier'] == 'size'
+        assert diffs['/opt/small.txt']['compare_tier'] == 'digest'
+        assert '/opt/model_same.bin' not in diffs
+
+        assert stats['tiers'] == {'size': 1, 'known': 0, 'sample': 1, 'digest': 3}
+        # The head mismatch only reads the samples, libfoo.so is never read
+        expected_read = 4 * SAMPLE + 2 * (4 * SAMPLE + 2 * 8 * MB) + 2 * 6
+        assert stats['bytes_read'] == expected_read, stats['bytes_read']
+        # Saved: the full reads of model_head.bin, minus every sample read
+        assert stats['bytes_saved'] == 2 * 8 * MB - 3 * 4 * SAMPLE
+        assert metrics.to_dict()['phases']['sample_hash']['files'] == 6
+
+        # Digests computed during the comparison are kept in the file info
+        assert diffs['/opt/model_middle.bin']['item1']['digest']
+        assert diffs['/opt/model_head.bin']['item1']['digest'] is None
+
+    print("✅ Comparison stops at the cheapest conclusive tier")
+
+
+if __name__ == "__main__":
+    test_tiered_compare()
+    print("\n🎉 All tests passed! Tiered comparison is working correctly.")
+    sys.exit(0)
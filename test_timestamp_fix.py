@@ -59,7 +59,7 @@ def test_timestamp_preservation():
                         assert abs((zip_time - specific_time).total_seconds()) < 2, f"ZIP entry time doesn't match: {zip_time} vs {specific_time}"
             
             # Step 3: Use DiffEngine to process the ZIP file
-            cache_manager = CacheManager()
+            cache_manager = CacheManager(os.path.join(temp_dir, "cache"))
             diff_engine = DiffEngine(cache_manager)
             
             # Create a directory with the test JAR